@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput and latency of Brainiak's main endpoints, without Virtuoso, Elasticsearch or Redis.
+
+Brainiak is started against the stand-ins of benchmarks/standins.py, loaded with
+resources/ontologies/schema/*.ttl and synthetic instances, and each scenario
+is requested --requests times, --concurrency requests at a time:
+
+    pip install -r benchmarks/requirements.txt
+    PYTHONPATH=src python benchmarks/bench_endpoints.py --concurrency 10 --requests 500
+
+Results are saved as JSON (by default benchmarks/results/<commit>.json), so that runs
+can be compared across commits with --compare benchmarks/results/<other commit>.json.
+The stand-ins memoize their read responses, yet they share the machine with Brainiak:
+compare runs made on the same machine, with the same options.
+
+With --dataset, a directory written by benchmarks/generate_dataset.py is loaded too, and the
+dataset_* scenarios request the schema, listing, filtering and instances of its deepest class.
+
+Each write (instance_create, instance_edit, instance_delete) invalidates the memoized
+responses of the SPARQL stand-in, so the schema queries that follow it are evaluated again
+by rdflib, which is much slower than Virtuoso. To measure writes as in production, run
+them with the schema cache or the ontology index enabled:
+
+    PYTHONPATH=src python benchmarks/bench_endpoints.py --setting ENABLE_CACHE=True \
+        --scenarios instance_create instance_edit instance_delete
+
+With --replay, the backend calls recorded with BACKEND_RECORDING_FILEPATH (in production or
+in a previous run) are served by benchmarks/replay_server.py instead of the stand-ins, with
+their recorded latencies, so that the serial backend calls of each request cost what they did:
+
+    PYTHONPATH=src python benchmarks/bench_endpoints.py --setting BACKEND_RECORDING_FILEPATH="'/tmp/backend.jsonl'"
+    PYTHONPATH=src python benchmarks/bench_endpoints.py --replay /tmp/backend.jsonl
+
+Run both with the same options: requests which were not recorded fail (404), and so do the
+writes, whose instances get new ids on each run.
+"""
+import argparse
+import ast
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib
+import urllib2
+from functools import partial
+
+from tornado.httpclient import AsyncHTTPClient, HTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop
+
+import generate_dataset
+import replay_server
+import standins
+
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+CLIENT_ID = "default"
+STARTUP_TIMEOUT = 120  # seconds
+PAGES = 10
+
+TRIPLESTORE_CONFIG = u"""[default]
+
+app_name = {client_id}
+url      = http://127.0.0.1:{port}{path}
+"""
+
+STORED_QUERY = {
+    "sparql_template": u"SELECT ?person ?label WHERE { ?person a <%(class_uri)s> ; <http://www.w3.org/2000/01/rdf-schema#label> ?label } LIMIT 20",
+    "description": u"Instances of a class, stored by bench_endpoints"
+}
+
+
+def person(index):
+    return json.dumps({
+        "upper:name": u"Pessoa {0}".format(index),
+        "person:gender": "http://semantica.globo.com/person/Gender/Female",
+        "person:cityOfBirth": "http://semantica.globo.com/place/City/City0"
+    })
+
+
+class Scenario(object):
+    """
+    A request made --requests times. The path may use {index}, the number of the request,
+    {page} (cycling through the first PAGES pages) and {person} (cycling through the synthetic persons,
+    or through the given number of instances). Scenarios which change data are not warmed up,
+    so that each instance is changed once.
+    """
+
+    def __init__(self, name, method, path, body=None, changes_data=False, instances=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.changes_data = changes_data
+        self.instances = instances
+
+    def request(self, base_url, index, instances, timeout):
+        body = self.body(index) if callable(self.body) else self.body
+        path = self.path.format(index=index, page=index % PAGES + 1, person=index % (self.instances or instances))
+        return HTTPRequest(base_url + path, method=self.method, body=body,
+                           headers={"Content-Type": "application/json", "X-Brainiak-Client-Id": CLIENT_ID},
+                           request_timeout=timeout)
+
+
+SCENARIOS = [
+    Scenario("root", "GET", "/"),
+    Scenario("context", "GET", "/person/"),
+    Scenario("class_schema", "GET", "/person/Person/_schema"),
+    Scenario("collection", "GET", "/person/Person/?per_page=10&page={page}"),
+    Scenario("instance_get", "GET", "/person/Person/Person{person}"),
+    Scenario("instance_create", "PUT", "/person/Person/Bench{index}", person, changes_data=True),
+    Scenario("instance_edit", "PUT", "/person/Person/Bench{index}", person, changes_data=True),
+    Scenario("instance_delete", "DELETE", "/person/Person/Bench{index}", changes_data=True),
+    Scenario("suggest", "POST", "/_suggest",
+             json.dumps({"search": {"pattern": "Cidade", "target": "person:cityOfBirth"}})),
+    Scenario("stored_query", "GET",
+             "/_query/bench_query/_result?class_uri=http://semantica.globo.com/person/Person"),
+]
+DATASET_SCENARIOS = ("dataset_schema", "dataset_collection", "dataset_filter", "dataset_instance_get")
+
+
+def dataset_scenarios(manifest):
+    """
+    Scenarios on the class with most properties of a dataset written by generate_dataset.py, described by its manifest.
+    Its context is unknown to brainiak.prefixes, so its graph is given as graph_uri, class_prefix and instance_prefix.
+    """
+    collection = u"/{context}/{target_class}/".format(**manifest)
+    graph = urllib.urlencode([("graph_uri", manifest["graph"]), ("class_prefix", manifest["graph"])])
+    instance_prefix = u"{graph}{target_class}/".format(**manifest)
+    scenarios = [
+        Scenario("dataset_schema", "GET", collection + "_schema?" + graph),
+        Scenario("dataset_collection", "GET", collection + "?per_page=10&page={page}&" + graph),
+        Scenario("dataset_instance_get", "GET",
+                 collection + "Instance{person}?" + graph + "&" + urllib.urlencode({"instance_prefix": instance_prefix}),
+                 instances=manifest["target_instances"])
+    ]
+    if manifest["filter_property"]:
+        query = urllib.urlencode({"p": manifest["filter_property"], "o": manifest["filter_object"], "per_page": 10})
+        scenarios.insert(2, Scenario("dataset_filter", "GET", collection + "?" + query + "&" + graph))
+    return scenarios
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for(url, process):
+    started = time.time()
+    while time.time() - started < STARTUP_TIMEOUT:
+        if not process.is_alive():
+            raise RuntimeError(u"{0} exited while starting".format(process.name))
+        try:
+            urllib2.urlopen(url, timeout=5)
+            return
+        except urllib2.HTTPError:
+            return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(u"{0} did not answer at {1}".format(process.name, url))
+
+
+def parse_setting(option):
+    "NAME=VALUE, where VALUE is a Python literal (e.g. ENABLE_CACHE=True)"
+    name, _, value = option.partition("=")
+    try:
+        return name, ast.literal_eval(value)
+    except (SyntaxError, ValueError):
+        raise argparse.ArgumentTypeError(u"{0} is not NAME=<Python literal>".format(option))
+
+
+def serve_brainiak(port, standins_port, overrides, sparql_path=standins.SPARQL_PATH):
+    """
+    Run Brainiak (as brainiak.server.main does) with its settings pointing to the stand-ins
+    (or the replay server), and the given settings overrides.
+    Settings are changed before brainiak.server is imported, as several modules copy them.
+    """
+    from brainiak import settings
+
+    # errors reach the benchmark in the responses, there is no need for Tornado's console log
+    logging.getLogger().addHandler(logging.NullHandler())
+    config_file = tempfile.NamedTemporaryFile(suffix=".ini", delete=False)
+    config_file.write(TRIPLESTORE_CONFIG.format(client_id=CLIENT_ID, port=standins_port, path=sparql_path))
+    config_file.close()
+    settings.TRIPLESTORE_CONFIG_FILEPATH = config_file.name
+    settings.ELASTICSEARCH_ENDPOINT = "127.0.0.1:{0}".format(standins_port)
+    settings.NOTIFY_BUS = False
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+    from brainiak import event_bus
+    from brainiak.utils import cache
+    # there is no ActiveMQ either
+    event_bus.initialize = lambda: None
+    cache.redis_client = standins.FakeRedis()
+
+    from tornado.httpserver import HTTPServer
+    from brainiak.greenlet_tornado import greenlet_set_ioloop
+    from brainiak.server import application
+
+    HTTPServer(application).listen(port, address="127.0.0.1")
+    io_loop = IOLoop.instance()
+    greenlet_set_ioloop(io_loop)
+    io_loop.start()
+
+
+def percentile(ordered, fraction):
+    "Nearest-rank percentile of an ordered list"
+    return ordered[max(int(math.ceil(fraction * len(ordered))) - 1, 0)]
+
+
+def summarize(latencies, errors, seconds):
+    ordered = sorted(latencies)
+    milliseconds = lambda value: round(value * 1000, 2)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "requests_per_second": round(len(latencies) / seconds, 1) if seconds else 0,
+        "latency_ms": {
+            "mean": milliseconds(sum(ordered) / len(ordered)),
+            "p50": milliseconds(percentile(ordered, 0.5)),
+            "p95": milliseconds(percentile(ordered, 0.95)),
+            "p99": milliseconds(percentile(ordered, 0.99)),
+            "max": milliseconds(ordered[-1])
+        }
+    }
+
+
+def run(scenario, base_url, indexes, instances, concurrency, timeout):
+    """
+    Make the requests of scenario (one for each index), keeping concurrency of them running.
+    Return (latencies, number of errors, elapsed seconds).
+    """
+    io_loop = IOLoop.instance()
+    client = AsyncHTTPClient(io_loop, max_clients=concurrency, force_instance=True)
+    pending = iter(indexes)
+    latencies = []
+    errors = [0]
+    running = [0]
+
+    def start_next():
+        try:
+            index = next(pending)
+        except StopIteration:
+            if not running[0]:
+                io_loop.stop()
+            return
+        running[0] += 1
+        client.fetch(scenario.request(base_url, index, instances, timeout), partial(on_response, time.time()))
+
+    def on_response(started, response):
+        latencies.append(time.time() - started)
+        running[0] -= 1
+        if response.error is not None:
+            errors[0] += 1
+            if errors[0] == 1:
+                sys.stderr.write(u"{0}: {1} {2}\n".format(scenario.name, response.error, (response.body or "")[:2000]))
+        start_next()
+
+    started = time.time()
+    for _ in xrange(concurrency):
+        io_loop.add_callback(start_next)
+    io_loop.start()
+    elapsed = time.time() - started
+    client.close()
+    return latencies, errors[0], elapsed
+
+
+def prepare(base_url, timeout):
+    "Create what the scenarios read and do not create themselves"
+    request = HTTPRequest(base_url + "/_query/bench_query", method="PUT", body=json.dumps(STORED_QUERY),
+                          headers={"Content-Type": "application/json", "X-Brainiak-Client-Id": CLIENT_ID},
+                          request_timeout=timeout)
+    HTTPClient().fetch(request)
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"]).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, previous):
+    print
+    print "Compared to {0}:".format(previous["commit"])
+    for name, summary in results["scenarios"].items():
+        before = previous["scenarios"].get(name)
+        if before is None or not before["requests_per_second"]:
+            continue
+        throughput = summary["requests_per_second"] / before["requests_per_second"] - 1
+        p95 = summary["latency_ms"]["p95"] - before["latency_ms"]["p95"]
+        print "{0:<16} {1:+7.1%} req/s  {2:+9.2f} ms p95".format(name, throughput, p95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="requests per scenario before measuring")
+    parser.add_argument("--instances", type=int, default=1000, help="synthetic person:Person instances")
+    parser.add_argument("--dataset", help="directory written by generate_dataset.py, loaded besides the synthetic persons")
+    parser.add_argument("--scenarios", nargs="+", choices=[scenario.name for scenario in SCENARIOS] + list(DATASET_SCENARIOS),
+                        help="default: all (dataset_* only with --dataset)")
+    parser.add_argument("--setting", type=parse_setting, action="append", default=[], metavar="NAME=VALUE",
+                        help="override a brainiak.settings value, e.g. ENABLE_CACHE=True (Redis is a fake) or ONTOLOGY_INDEX=True")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds per request")
+    parser.add_argument("--output", help="JSON file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="JSON file of a previous run")
+    parser.add_argument("--replay", help="file recorded with BACKEND_RECORDING_FILEPATH, replayed instead of the stand-ins")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiplies the replayed latencies")
+    args = parser.parse_args()
+
+    scenarios = list(SCENARIOS)
+    manifest = None
+    if args.dataset:
+        with open(os.path.join(args.dataset, generate_dataset.MANIFEST_FILENAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+        scenarios.extend(dataset_scenarios(manifest))
+    selected = args.scenarios or [scenario.name for scenario in scenarios]
+
+    standins_port = free_port()
+    brainiak_port = free_port()
+    if args.replay:
+        backends = multiprocessing.Process(name="replay", target=replay_server.serve,
+                                           args=(standins_port, args.replay, args.speed))
+        sparql_path = replay_server.recorded_sparql_path(args.replay) or standins.SPARQL_PATH
+    else:
+        backends = multiprocessing.Process(name="stand-ins", target=standins.serve,
+                                           args=(standins_port, args.instances, standins.SCHEMA_DIRECTORY, args.dataset))
+        sparql_path = standins.SPARQL_PATH
+    processes = [
+        backends,
+        multiprocessing.Process(name="brainiak", target=serve_brainiak,
+                                args=(brainiak_port, standins_port, dict(args.setting), sparql_path))
+    ]
+    try:
+        processes[0].start()
+        wait_for("http://127.0.0.1:{0}{1}".format(standins_port, replay_server.STATUS_PATH if args.replay else "/"), processes[0])
+        processes[1].start()
+        base_url = "http://127.0.0.1:{0}".format(brainiak_port)
+        wait_for(base_url + "/healthcheck", processes[1])
+        prepare(base_url, args.timeout)
+
+        results = {
+            "commit": current_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+            "instances": args.instances,
+            "settings": dict(args.setting),
+            "dataset": manifest,
+            "replay": args.replay,
+            "scenarios": {}
+        }
+        print "{0:<16} {1:>8} {2:>7} {3:>9} {4:>9} {5:>9}".format("scenario", "req/s", "errors", "p50 ms", "p95 ms", "p99 ms")
+        for scenario in scenarios:
+            if scenario.name not in selected:
+                continue
+            if not scenario.changes_data and args.warmup:
+                run(scenario, base_url, xrange(args.warmup), args.instances, args.concurrency, args.timeout)
+            summary = summarize(*run(scenario, base_url, xrange(args.requests), args.instances, args.concurrency, args.timeout))
+            results["scenarios"][scenario.name] = summary
+            latency = summary["latency_ms"]
+            print "{0:<16} {1:>8} {2:>7} {3:>9} {4:>9} {5:>9}".format(
+                scenario.name, summary["requests_per_second"], summary["errors"],
+                latency["p50"], latency["p95"], latency["p99"])
+        if args.replay:
+            replayed = json.load(urllib2.urlopen("http://127.0.0.1:{0}{1}".format(standins_port, replay_server.STATUS_PATH)))
+            results["replayed"] = replayed
+            print
+            print "Replayed {replayed} backend calls, {not_recorded} requests were not recorded".format(**replayed)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    output = args.output or os.path.join(RESULTS_DIRECTORY, "{0}.json".format(results["commit"]))
+    if not os.path.isdir(os.path.dirname(os.path.abspath(output))):
+        os.makedirs(os.path.dirname(os.path.abspath(output)))
+    with open(output, "w") as output_file:
+        json.dump(results, output_file, indent=2, sort_keys=True)
+    print
+    print "Saved to {0}".format(output)
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(results, json.load(previous_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+Operations per second and bytes allocated by the hot functions which do not touch the network,
+on fixtures recorded from real requests, compared with a stored baseline:
+
+    PYTHONPATH=src python benchmarks/bench_hot_functions.py --check
+
+exits with status 1 if a function lost more than --threshold of its baseline ops/sec, or allocates
+more than --threshold above its baseline bytes per operation. Baselines depend on the machine, so none
+is committed: save one before changing the code, on the machine where the change is measured
+(at benchmarks/results/, which git ignores), as --check requires it:
+
+    PYTHONPATH=src python benchmarks/bench_hot_functions.py --save-baseline
+
+The fixtures (benchmarks/fixtures/hot_functions.json) are the arguments the functions received while
+Brainiak answered schema, collection, instance and create requests for person:Person, with the
+SPARQL queries answered by the stand-in of benchmarks/standins.py. To record them again:
+
+    pip install -r benchmarks/requirements.txt
+    PYTHONPATH=src python benchmarks/bench_hot_functions.py --record
+
+Python 2 has no tracemalloc, so allocations are measured as the deep size (sys.getsizeof of
+containers and of their items) of what each operation returns.
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import platform
+import sys
+import timeit
+from functools import partial
+from urlparse import urlparse
+
+from mock import patch
+from tornado.httpserver import HTTPRequest
+from tornado.httputil import HTTPHeaders
+
+from brainiak import log, prefixes
+from brainiak.collection import get_collection
+from brainiak.instance import create_instance, get_instance
+from brainiak.prefixes import MemorizeContext, SHORTEN
+from brainiak.schema import get_class
+from brainiak.utils import sparql
+from brainiak.utils.params import CLASS_PARAMS, INSTANCE_PARAMS, LIST_PARAMS, DefaultParamsDict, ParamDict
+
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_FILEPATH = os.path.join(BENCHMARKS_DIRECTORY, "fixtures", "hot_functions.json")
+BASELINE_FILEPATH = os.path.join(BENCHMARKS_DIRECTORY, "results", "hot_functions_baseline.json")
+THRESHOLD = 0.25
+MINIMUM_SECONDS = 0.3  # each measurement repeats an operation for at least this long
+REPEAT = 5
+RECORDED_INSTANCES = 200
+
+BASE_URL = "http://localhost:5100"
+PAYLOAD = {
+    "upper:name": u"Pessoa Gravada",
+    "person:fullName": u"Pessoa Gravada para Benchmark",
+    "person:gender": "http://semantica.globo.com/person/Gender/Female",
+    "person:cityOfBirth": "http://semantica.globo.com/place/City/City0"
+}
+
+# (name, URL, ParamDict keyword arguments, as given by the handler answering the URL)
+REQUESTS = [
+    ("schema", "/person/Person/_schema", lambda: dict(context_name="person", class_name="Person")),
+    ("collection", "/person/Person/?per_page=50&p=upper:name&sort_by=upper:name",
+     lambda: dict(context_name="person", class_name="Person",
+                  **(LIST_PARAMS + CLASS_PARAMS + DefaultParamsDict(direct_instances_only="0")))),
+    ("instance", "/person/Person/Person1?expand_uri=0",
+     lambda: dict(context_name="person", class_name="Person", instance_id="Person1", **INSTANCE_PARAMS)),
+    ("create", "/person/Person/Recorded",
+     lambda: dict(context_name="person", class_name="Person", instance_id="Recorded", **INSTANCE_PARAMS)),
+]
+
+# (module, name) of the functions whose arguments are recorded, as they are looked up by their callers
+RECORDED = [
+    (get_class, "convert_bindings_dict"),
+    (get_collection, "compress_keys_and_values"),
+    (get_collection, "merge_by_id"),
+    (get_collection, "cast_items_values"),
+    (create_instance, "create_explicit_triples"),
+]
+
+
+class RecordedHandler(object):
+    "What ParamDict reads of the tornado.web.RequestHandler answering url"
+
+    def __init__(self, url):
+        self.request = HTTPRequest("GET", url, headers=HTTPHeaders({"Host": urlparse(BASE_URL).netloc}))
+
+    def get_argument(self, name):
+        return self.request.arguments[name][-1].decode("utf-8")
+
+
+def make_params(name):
+    for request_name, url, kwargs in REQUESTS:
+        if request_name == name:
+            return ParamDict(RecordedHandler(url), **kwargs())
+    raise KeyError(name)
+
+
+def encode(value, params_names):
+    "JSON-friendly value, with MemorizeContext and ParamDict arguments replaced by what rebuilds them"
+    if isinstance(value, MemorizeContext):
+        return {"__memorize_context__": value._normalize_uri}
+    if isinstance(value, ParamDict):
+        return {"__params__": params_names[id(value)]}
+    if isinstance(value, (list, tuple)):
+        return [encode(item, params_names) for item in value]
+    if isinstance(value, dict):
+        return {key: encode(item, params_names) for key, item in value.items()}
+    return value
+
+
+def decode(value):
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if isinstance(value, dict):
+        if "__memorize_context__" in value:
+            return MemorizeContext(normalize_uri=value["__memorize_context__"])
+        if "__params__" in value:
+            return make_params(value["__params__"])
+        return {key: decode(item) for key, item in value.items()}
+    return value
+
+
+def uris_in(value, found):
+    if isinstance(value, basestring):
+        if value.startswith("http://"):
+            found.add(value)
+    elif isinstance(value, list):
+        for item in value:
+            uris_in(item, found)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            uris_in(key, found)
+            uris_in(item, found)
+    return found
+
+
+def record(filepath=FIXTURES_FILEPATH, instances=RECORDED_INSTANCES):
+    "Answer REQUESTS with the SPARQL stand-in, keeping the first arguments given to each RECORDED function"
+    import standins  # needs rdflib 4, see benchmarks/requirements.txt
+
+    sparql_standin, _ = standins.build_standins(instances)
+    # persons with two names, so that the collection listing has rows for merge_by_id to merge
+    sparql_standin.add(unicode(standins.PERSON), [
+        (standins.PERSON["Person/Person{0}".format(index)], standins.UPPER.name, standins.Literal(u"Apelido {0}".format(index)))
+        for index in xrange(0, instances, 3)])
+
+    def query_sparql(query, triplestore_config, async=True, **kwargs):
+        return json.loads(sparql_standin.execute(query))
+
+    fixtures = {}
+    params_names = {}
+
+    def recorder(name, function):
+        def wrapper(*args, **kwargs):
+            if name not in fixtures:
+                fixtures[name] = encode({"args": args, "kwargs": kwargs}, params_names)
+                fixtures[name] = json.loads(json.dumps(fixtures[name]))  # copied before the function changes them
+            return function(*args, **kwargs)
+        return wrapper
+
+    patchers = [patch("brainiak.triplestore.query_sparql", query_sparql),
+                patch("brainiak.utils.sparql.query_sparql", query_sparql)]
+    patchers.extend(patch.object(module, name, recorder(name, getattr(module, name))) for module, name in RECORDED)
+    for patcher in patchers:
+        patcher.start()
+    try:
+        sparql.load_label_properties()
+        params = {}
+        for name, url, kwargs in REQUESTS:
+            params[name] = make_params(name)
+            params_names[id(params[name])] = name
+        get_class.get_schema(params["schema"])
+        get_collection.filter_instances(params["collection"])
+        instance = get_instance.get_instance(params["instance"])
+        payload = prefixes.normalize_all_uris_recursively(PAYLOAD)
+        create_instance.create_instance(params["create"], payload, params["create"]["instance_uri"])
+    finally:
+        for patcher in patchers:
+            patcher.stop()
+
+    fixtures["normalize_all_uris_recursively"] = {"args": [instance], "kwargs": {"mode": SHORTEN}}
+    uris = sorted(uris_in(instance, uris_in(fixtures["convert_bindings_dict"], set())))
+    fixtures["shorten_uri"] = {"args": [uris], "kwargs": {}}
+    fixtures["expand_uri"] = {"args": [[prefixes.shorten_uri(uri) for uri in uris]], "kwargs": {}}
+    fixtures["ParamDict"] = {"args": [[name for name, url, kwargs in REQUESTS]], "kwargs": {}}
+
+    if not os.path.isdir(os.path.dirname(filepath)):
+        os.makedirs(os.path.dirname(filepath))
+    with open(filepath, "w") as fixtures_file:
+        json.dump(fixtures, fixtures_file, indent=1, sort_keys=True)
+    return fixtures
+
+
+def each(function, values):
+    "One operation of the functions of a single argument: a call for each recorded value"
+    return [function(value) for value in values]
+
+
+def build_params(names):
+    return [make_params(name) for name in names]
+
+
+# name: (function, whether it changes its arguments, so that each operation needs a copy of them)
+FUNCTIONS = [
+    ("prefixes.shorten_uri", partial(each, prefixes.shorten_uri), False),
+    ("prefixes.expand_uri", partial(each, prefixes.expand_uri), False),
+    ("prefixes.normalize_all_uris_recursively", prefixes.normalize_all_uris_recursively, False),
+    ("sparql.compress_keys_and_values", sparql.compress_keys_and_values, False),
+    ("sparql.create_explicit_triples", sparql.create_explicit_triples, False),
+    ("get_collection.merge_by_id", get_collection.merge_by_id, True),
+    ("get_collection.cast_items_values", get_collection.cast_items_values, False),
+    ("get_class.convert_bindings_dict", get_class.convert_bindings_dict, False),
+    ("params.ParamDict", build_params, False),
+]
+
+
+def fixture_key(name):
+    return name.rsplit(".", 1)[-1]
+
+
+def operation(function, mutates, args, kwargs):
+    "Return a callable making one operation, and how to prepare the arguments of the next one"
+    if not mutates:
+        return lambda: function(*args, **kwargs)
+    copies = []
+
+    def run():
+        return function(*copies.pop(), **kwargs)
+    run.prepare = lambda count: copies.extend(copy.deepcopy(args) for _ in xrange(count))
+    return run
+
+
+def deep_size(value, seen=None):
+    "Bytes of value and, if it is a container, of its keys and items (each object counted once)"
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key, seen) + deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in value)
+    return size
+
+
+def measure(function, mutates, args, kwargs):
+    "Return (operations per second, bytes allocated per operation)"
+    run = operation(function, mutates, args, kwargs)
+    prepare = getattr(run, "prepare", lambda count: None)
+
+    number = 1
+    while True:
+        prepare(number)
+        seconds = timeit.Timer(run).timeit(number)
+        if seconds >= MINIMUM_SECONDS:
+            break
+        number *= 2
+    best = seconds
+    for _ in xrange(REPEAT - 1):
+        prepare(number)
+        best = min(best, timeit.Timer(run).timeit(number))
+
+    prepare(1)
+    return number / best, deep_size(run())
+
+
+def run_all(fixtures, names=None):
+    results = {}
+    for name, function, mutates in FUNCTIONS:
+        if names and name not in names:
+            continue
+        fixture = fixtures[fixture_key(name)]
+        args, kwargs = decode(fixture["args"]), decode(fixture["kwargs"])
+        ops_per_second, bytes_per_operation = measure(function, mutates, args, kwargs)
+        results[name] = {"ops_per_second": round(ops_per_second, 1), "bytes_per_operation": bytes_per_operation}
+    return results
+
+
+def regressions(results, baseline, threshold=THRESHOLD):
+    "Names of the functions slower (or allocating more) than their baseline, beyond threshold"
+    flagged = []
+    for name, result in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        slower = result["ops_per_second"] < previous["ops_per_second"] * (1 - threshold)
+        allocates_more = result["bytes_per_operation"] > previous["bytes_per_operation"] * (1 + threshold)
+        if slower or allocates_more:
+            flagged.append(name)
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--record", action="store_true", help="record the fixtures again (needs the stand-ins)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="tolerated fraction, default %(default)s")
+    parser.add_argument("--baseline", default=BASELINE_FILEPATH)
+    parser.add_argument("--functions", nargs="+", choices=[name for name, function, mutates in FUNCTIONS])
+    args = parser.parse_args()
+    if args.check and not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error("--check needs a baseline saved on this machine, and there is none at {0}: "
+                     "run with --save-baseline before changing the code".format(args.baseline))
+
+    # what log.initialize() would do, without writing to LOG_FILEPATH and to syslog
+    log.logger = logging.getLogger("brainiak")
+    log.logger.addHandler(logging.NullHandler())
+    log.logger.propagate = False
+
+    if args.record:
+        record()
+    with open(FIXTURES_FILEPATH) as fixtures_file:
+        fixtures = json.load(fixtures_file)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["functions"]
+
+    results = run_all(fixtures, args.functions)
+    flagged = regressions(results, baseline, args.threshold)
+
+    print "{0:<42} {1:>12} {2:>10} {3:>12} {4:>8}".format("function", "ops/s", "bytes/op", "baseline", "change")
+    for name, result in sorted(results.items()):
+        previous = baseline.get(name)
+        change = "{0:+.0%}".format(result["ops_per_second"] / previous["ops_per_second"] - 1) if previous else ""
+        print "{0:<42} {1:>12} {2:>10} {3:>12} {4:>8}{5}".format(
+            name, result["ops_per_second"], result["bytes_per_operation"],
+            previous["ops_per_second"] if previous else "", change, "  REGRESSION" if name in flagged else "")
+
+    if args.save_baseline:
+        if not os.path.isdir(os.path.dirname(args.baseline)):
+            os.makedirs(os.path.dirname(args.baseline))
+        with open(args.baseline, "w") as baseline_file:
+            json.dump({"python": platform.python_version(), "functions": results}, baseline_file,
+                      indent=2, sort_keys=True)
+        print
+        print "Baseline saved to {0}".format(args.baseline)
+
+    if args.check and flagged:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Cost of translating a message with _(), before and after catalogs were loaded once.
+Run from the repository root (the catalogs are read from ./locale):
+
+    PYTHONPATH=src python benchmarks/bench_i18n.py
+"""
+import timeit
+
+from tornado import locale
+
+from brainiak.utils import i18n
+
+
+NUMBER = 2000
+MESSAGE = u"There were no search results."
+
+
+def translate_loading_catalogs(word, lang="pt"):
+    "How utils.i18n.translate used to work: catalogs loaded from disk at every call"
+    language = i18n.mapping.get(lang) or lang
+    locale.load_gettext_translations(directory=i18n.LOCALE_DIRECTORY, domain=i18n.LOCALE_DOMAIN)
+    user_locale = locale.get(language)
+    return user_locale.translate(word)
+
+
+def measure(function):
+    seconds = min(timeit.repeat(lambda: function(MESSAGE, lang="pt"), number=NUMBER, repeat=3))
+    return seconds / NUMBER * 1e6
+
+
+def main():
+    i18n.load_translations()
+    assert translate_loading_catalogs(MESSAGE) == i18n.translate(MESSAGE, lang="pt")
+    before = measure(translate_loading_catalogs)
+    after = measure(i18n.translate)
+    print(u"loading catalogs at every call: {0:10.2f} us/call".format(before))
+    print(u"catalogs loaded once, memoized: {0:10.2f} us/call".format(after))
+    print(u"speedup: {0:.0f}x".format(before / after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Size and parse time of the same SPARQL results (an instance listing) in each format of triplestore.RESULT_FORMATS:
+
+    PYTHONPATH=src python benchmarks/bench_result_formats.py
+"""
+import time
+
+import ujson as json
+
+from brainiak.utils.sparql_stream import BindingsParser, parse_result
+
+
+ROWS = 50000
+PREDICATES = 20
+CHUNK_SIZE = 64 * 1024
+BASE = "http://semantica.globo.com/base/"
+
+
+def build_rows(rows=ROWS):
+    for index in xrange(rows):
+        yield (BASE + "Pessoa_%d" % (index // PREDICATES),
+               BASE + "predicado_%d" % (index % PREDICATES),
+               u"valor %d" % index,
+               u"Pessoa %d" % (index // PREDICATES))
+
+
+def as_json(rows):
+    bindings = [{"subject": {"type": "uri", "value": subject},
+                 "predicate": {"type": "uri", "value": predicate},
+                 "object": {"type": "literal", "value": object_, "xml:lang": "pt"},
+                 "label": {"type": "literal", "value": label}} for subject, predicate, object_, label in rows]
+    return json.dumps({"head": {"vars": ["subject", "predicate", "object", "label"]},
+                       "results": {"bindings": bindings}}).encode("utf-8")
+
+
+def as_tsv(rows):
+    lines = [u"?subject\t?predicate\t?object\t?label"]
+    lines.extend(u'<{0}>\t<{1}>\t"{2}"@pt\t"{3}"'.format(*row) for row in rows)
+    return u"\n".join(lines).encode("utf-8") + "\n"
+
+
+def as_csv(rows):
+    lines = [u"subject,predicate,object,label"]
+    lines.extend(u",".join(row) for row in rows)
+    return u"\r\n".join(lines).encode("utf-8") + "\r\n"
+
+
+def parse_json(body):
+    return json.loads(body)["results"]["bindings"]
+
+
+def parse_json_streamed(body):
+    parser = BindingsParser()
+    bindings = []
+    for index in xrange(0, len(body), CHUNK_SIZE):
+        bindings.extend(parser.feed(body[index:index + CHUNK_SIZE]))
+    return bindings
+
+
+def measure(function, body):
+    timings = []
+    for attempt in range(3):
+        time_i = time.time()
+        bindings = function(body)
+        timings.append(time.time() - time_i)
+    assert len(bindings) == ROWS
+    return min(timings)
+
+
+def main():
+    rows = list(build_rows())
+    bodies = {"json": as_json(rows), "tsv": as_tsv(rows), "csv": as_csv(rows)}
+    results = [
+        ("json (ujson.loads)", "json", parse_json),
+        ("json (streamed)", "json", parse_json_streamed),
+        ("tsv", "tsv", lambda body: parse_result(body, "tsv")["results"]["bindings"]),
+        ("csv", "csv", lambda body: parse_result(body, "csv")["results"]["bindings"]),
+    ]
+    print(u"{0} rows".format(ROWS))
+    for name, result_format, function in results:
+        size = len(bodies[result_format])
+        print(u"{0:20} {1:8.2f} MB {2:8.3f}s".format(name, size / 1e6, measure(function, bodies[result_format])))
+
+
+if __name__ == "__main__":
+    main()
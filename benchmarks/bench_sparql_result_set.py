@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Memory used by SPARQL results of an instance listing (subject, predicate, object, label, graph),
+as the parsed result dict and as a triplestore.SparqlResultSet:
+
+    PYTHONPATH=src python benchmarks/bench_sparql_result_set.py
+
+Besides the size of each structure, the peak memory of building a SparqlResultSet
+is measured (in a new process for each way, as the peak of a process never decreases):
+
+    whole      the whole body is loaded, parsed as a result dict and then converted
+    streamed   the columns are filled as the chunks of the body arrive (query_sparql(result_set=True))
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import ujson as json
+
+from brainiak.triplestore import ResultSetStream, SparqlResultSet
+
+
+ROWS = 50000
+PREDICATES = 20
+CHUNK_SIZE = 64 * 1024
+WAYS = ("whole", "streamed")
+
+
+def build_response(rows=ROWS):
+    bindings = []
+    for index in xrange(rows):
+        bindings.append({
+            "subject": {"type": "uri", "value": "http://semantica.globo.com/base/Pessoa_%d" % (index // PREDICATES)},
+            "predicate": {"type": "uri", "value": "http://semantica.globo.com/base/predicado_%d" % (index % PREDICATES)},
+            "object": {"type": "literal", "value": "valor %d" % index, "xml:lang": "pt"},
+            "label": {"type": "literal", "value": "Pessoa %d" % (index // PREDICATES)},
+            "graph": {"type": "uri", "value": "http://semantica.globo.com/base/"}
+        })
+    return json.dumps({"head": {"vars": ["subject", "predicate", "object", "label", "graph"]},
+                       "results": {"bindings": bindings}})
+
+
+def deep_size(value, seen=None):
+    "Bytes of value and of everything it references, counting shared objects once"
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key, seen) + deep_size(item, seen) for key, item in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deep_size(item, seen) for item in value)
+    elif hasattr(value, "__slots__"):
+        size += sum(deep_size(getattr(value, name), seen) for name in value.__slots__)
+    elif hasattr(value, "__dict__"):
+        size += deep_size(value.__dict__, seen)
+    return size
+
+
+def peak_memory():
+    """
+    Peak resident memory of this process, in bytes. On Linux, VmHWM is read instead of ru_maxrss,
+    which keeps the peak of the process forked from this benchmark before it ran the measurement.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def build_result_set(filename, way):
+    with open(filename, "rb") as body_file:
+        if way == "whole":
+            return SparqlResultSet.from_result_dict(json.loads(body_file.read()))
+        stream = ResultSetStream()
+        for chunk in iter(lambda: body_file.read(CHUNK_SIZE), ""):
+            stream(chunk)
+        return stream.result()
+
+
+def measure(filename, way):
+    "Print the rows and the memory and time it takes to build the result set, as run in a new process"
+    before = peak_memory()
+    time_i = time.time()
+    result_set = build_result_set(filename, way)
+    print(json.dumps({"rows": len(result_set), "peak": peak_memory() - before, "time": time.time() - time_i}))
+
+
+def main():
+    body = build_response()
+    result_dict = json.loads(body)
+    time_i = time.time()
+    result_set = SparqlResultSet.from_result_dict(result_dict)
+    conversion = time.time() - time_i
+
+    dict_size = deep_size(result_dict)
+    result_set_size = deep_size(result_set)
+    print(u"{0} rows ({1:.1f} MB of JSON)".format(ROWS, len(body) / 1e6))
+    print(u"result dict:     {0:8.1f} MB".format(dict_size / 1e6))
+    print(u"SparqlResultSet: {0:8.1f} MB (built in {1:.2f}s)".format(result_set_size / 1e6, conversion))
+    print(u"reduction: {0:.1f}x".format(float(dict_size) / result_set_size))
+
+    body_file, filename = tempfile.mkstemp(suffix=".json")
+    try:
+        os.write(body_file, body)
+        os.close(body_file)
+        del body, result_dict, result_set
+        print(u"peak memory to build the SparqlResultSet:")
+        for way in WAYS:
+            output = subprocess.check_output([sys.executable, __file__, "--measure", way, filename])
+            measured = json.loads(output)
+            print(u"  {0:9} {1:8.1f} MB ({2} rows in {3:.2f}s)".format(
+                way, measured["peak"] / 1e6, measured["rows"], measured["time"]))
+    finally:
+        os.remove(filename)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--measure"]:
+        measure(sys.argv[3], sys.argv[2])
+    else:
+        main()
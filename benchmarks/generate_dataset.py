@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic ontology and instances, to measure how Brainiak scales with the shape and size of the data.
+
+The ontology is a tree of classes (--depth levels below the root, --fan-out subclasses each),
+each class declaring --properties properties, which cycle through datatype (string, integer,
+date, boolean), object, enumeration (owl:oneOf) and owl:unionOf ranges. Some properties get
+cardinality restrictions, and properties of the same kind are chained by rdfs:subPropertyOf.
+Instances belong to the leaf classes and have values for all the properties of their class
+and of its superclasses:
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/generate_dataset.py --depth 4 --fan-out 3 --properties 20 --instances 10000
+
+The output directory is laid out as resources/ontologies/schema (each .ttl or .nt file is loaded
+into the graph named in the .graph file next to it), and dataset.json describes what was generated.
+It is loaded by the stand-ins of benchmarks/bench_endpoints.py, which then measures the
+dataset_* scenarios:
+
+    PYTHONPATH=src python benchmarks/bench_endpoints.py --dataset benchmarks/datasets/synthetic
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+
+from rdflib import BNode, Graph, Literal, Namespace, RDF, RDFS, URIRef, XSD
+from rdflib.collection import Collection
+from rdflib.namespace import OWL
+
+
+DATASETS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets")
+URI_PREFIX = "http://semantica.globo.com/"
+MANIFEST_FILENAME = "dataset.json"
+FORMATS = {"turtle": ".ttl", "nt": ".nt"}
+
+STRING = "string"
+INTEGER = "integer"
+DATE = "date"
+BOOLEAN = "boolean"
+OBJECT = "object"
+ENUMERATION = "enumeration"
+UNION = "union"
+KINDS = (STRING, INTEGER, DATE, BOOLEAN, OBJECT, ENUMERATION, UNION)
+DATATYPES = {STRING: XSD.string, INTEGER: XSD.integer, DATE: XSD.date, BOOLEAN: XSD.boolean}
+FIRST_DATE = datetime.date(2000, 1, 1)
+
+LABELS = {
+    "pt": {"class": u"Classe {0}", "property": u"Propriedade {0}", "value": u"Valor {0}", "comment": u"Gerada para testes de escala"},
+    "en": {"class": u"Class {0}", "property": u"Property {0}", "value": u"Value {0}", "comment": u"Generated for scaling tests"},
+}
+
+
+def label(lang, key, name=u""):
+    text = LABELS.get(lang, LABELS["en"])[key].format(name)
+    return Literal(text, lang=lang)
+
+
+class SyntheticDataset(object):
+    """
+    The classes, properties and instances generated for a set of parameters.
+    The same parameters (including seed) always generate the same dataset.
+    """
+
+    def __init__(self, context="synthetic", depth=3, fan_out=3, properties=10, restrictions=0.5,
+                 enumeration_size=5, union_size=2, subproperty_chain=2, languages=("pt", "en"),
+                 instances=1000, seed=0):
+        self.context = context
+        self.graph = URI_PREFIX + context + "/"
+        self.namespace = Namespace(self.graph)
+        self.depth = depth
+        self.fan_out = fan_out
+        self.properties_per_class = properties
+        self.restrictions = restrictions
+        self.enumeration_size = enumeration_size
+        self.union_size = union_size
+        self.subproperty_chain = subproperty_chain
+        self.languages = list(languages)
+        self.instances = instances
+        self.seed = seed
+        self.kinds = [kind for kind in KINDS
+                      if not (kind == ENUMERATION and enumeration_size < 1) and not (kind == UNION and union_size < 2)]
+
+        self.classes = []         # names, parents before children
+        self.parent = {}
+        self.children = {}
+        self._build_classes()
+        self.leaves = [name for name in self.classes if not self.children[name]]
+        self.properties = {}      # class name: [property dicts]
+        self._build_properties(random.Random(seed))
+
+    def _build_classes(self):
+        level = ["Class"]
+        self.parent["Class"] = None
+        for depth in xrange(self.depth + 1):
+            next_level = []
+            for name in level:
+                self.classes.append(name)
+                self.children[name] = []
+                if depth == self.depth:
+                    continue
+                for index in xrange(self.fan_out):
+                    child = "{0}{1}{2}".format(name, "_" if depth else "", index)
+                    self.children[name].append(child)
+                    self.parent[child] = name
+                    next_level.append(child)
+            level = next_level
+
+    def _build_properties(self, rng):
+        for name in self.classes:
+            properties = []
+            for index in xrange(self.properties_per_class):
+                kind = self.kinds[index % len(self.kinds)]
+                round_ = index // len(self.kinds)
+                property_ = {
+                    "name": "p{0}Of{1}".format(index, name),
+                    "kind": kind,
+                    "domain": name,
+                    "required": rng.random() < self.restrictions,
+                    "single": kind != STRING and rng.random() < self.restrictions,
+                    "super": None
+                }
+                if 0 < round_ <= self.subproperty_chain:
+                    property_["super"] = properties[index - len(self.kinds)]["name"]
+                if kind == OBJECT:
+                    property_["range"] = [rng.choice(self.classes)]
+                elif kind == UNION:
+                    property_["range"] = rng.sample(self.classes, min(self.union_size, len(self.classes)))
+                elif kind == ENUMERATION:
+                    property_["range"] = ["Enumeration{0}Of{1}".format(index, name)]
+                properties.append(property_)
+            self.properties[name] = properties
+
+    def ancestors(self, name):
+        "name and its superclasses, from name to the root"
+        result = []
+        while name is not None:
+            result.append(name)
+            name = self.parent[name]
+        return result
+
+    def first_leaf(self, name):
+        while self.children[name]:
+            name = self.children[name][0]
+        return name
+
+    def instance_count(self, leaf):
+        "Instances are spread over the leaves: instance i belongs to leaf i % len(leaves)"
+        position = self.leaves.index(leaf)
+        return max(self.instances - position + len(self.leaves) - 1, 0) // len(self.leaves)
+
+    def instance_uri(self, leaf, index):
+        return URIRef(self.namespace["{0}/Instance{1}".format(leaf, index)])
+
+    def enumerated_value(self, enumeration, index):
+        return URIRef(self.namespace["{0}/Value{1}".format(enumeration, index)])
+
+    def _labels(self, key, name):
+        return [label(lang, key, name) for lang in self.languages]
+
+    def ontology(self):
+        "rdflib.Graph with the classes, properties, restrictions and enumerations"
+        graph = Graph()
+        graph.bind(self.context, self.namespace)
+        graph.bind("owl", OWL)
+        for name in self.classes:
+            klass = self.namespace[name]
+            graph.add((klass, RDF.type, OWL.Class))
+            graph.add((klass, RDFS.subClassOf, self.namespace[self.parent[name]] if self.parent[name] else OWL.Thing))
+            for title in self._labels("class", name):
+                graph.add((klass, RDFS.label, title))
+            for property_ in self.properties[name]:
+                self._add_property(graph, klass, property_)
+        return graph
+
+    def _add_property(self, graph, klass, property_):
+        predicate = self.namespace[property_["name"]]
+        kind = property_["kind"]
+        object_property = kind in (OBJECT, ENUMERATION, UNION)
+        graph.add((predicate, RDF.type, OWL.ObjectProperty if object_property else OWL.DatatypeProperty))
+        graph.add((predicate, RDFS.domain, klass))
+        for title in self._labels("property", property_["name"]):
+            graph.add((predicate, RDFS.label, title))
+        graph.add((predicate, RDFS.comment, label(self.languages[0] if self.languages else "en", "comment")))
+        if property_["super"]:
+            graph.add((predicate, RDFS.subPropertyOf, self.namespace[property_["super"]]))
+
+        if kind in DATATYPES:
+            range_ = DATATYPES[kind]
+        elif kind == UNION:
+            range_ = BNode()
+            members = BNode()
+            graph.add((range_, RDF.type, OWL.Class))
+            graph.add((range_, OWL.unionOf, members))
+            Collection(graph, members, [self.namespace[name] for name in property_["range"]])
+        else:
+            range_ = self.namespace[property_["range"][0]]
+        graph.add((predicate, RDFS.range, range_))
+
+        if kind == ENUMERATION:
+            enumeration = property_["range"][0]
+            graph.add((range_, RDF.type, OWL.Class))
+            for title in self._labels("class", enumeration):
+                graph.add((range_, RDFS.label, title))
+            values = [self.enumerated_value(enumeration, index) for index in xrange(self.enumeration_size)]
+            for index, value in enumerate(values):
+                graph.add((value, RDF.type, range_))
+                for title in self._labels("value", index):
+                    graph.add((value, RDFS.label, title))
+            one_of, members = BNode(), BNode()
+            graph.add((one_of, OWL.oneOf, members))
+            Collection(graph, members, values)
+            self._add_restriction(graph, klass, predicate, OWL.allValuesFrom, one_of)
+
+        restricted_range = range_ if kind != UNION else self.namespace[property_["range"][0]]
+        if property_["required"]:
+            self._add_restriction(graph, klass, predicate, OWL.allValuesFrom, restricted_range,
+                                  OWL.minQualifiedCardinality, 1)
+        if property_["single"]:
+            self._add_restriction(graph, klass, predicate, OWL.allValuesFrom, restricted_range,
+                                  OWL.maxQualifiedCardinality, 1)
+
+    def _add_restriction(self, graph, klass, predicate, range_predicate, range_, cardinality=None, value=None):
+        restriction = BNode()
+        graph.add((klass, RDFS.subClassOf, restriction))
+        graph.add((restriction, RDF.type, OWL.Restriction))
+        graph.add((restriction, OWL.onProperty, predicate))
+        graph.add((restriction, range_predicate, range_))
+        if cardinality is not None:
+            graph.add((restriction, cardinality, Literal(value, datatype=XSD.nonNegativeInteger)))
+
+    def instance_triples(self):
+        "Triples of each instance, grouped by subject, generated lazily"
+        for index in xrange(self.instances):
+            leaf = self.leaves[index % len(self.leaves)]
+            number = index // len(self.leaves)
+            subject = self.instance_uri(leaf, number)
+            yield subject, RDF.type, self.namespace[leaf]
+            yield subject, RDFS.label, Literal(u"{0} {1}".format(leaf, number))
+            for name in self.ancestors(leaf):
+                for property_ in self.properties[name]:
+                    for object_ in self._values(property_, index):
+                        yield subject, self.namespace[property_["name"]], object_
+
+    def _values(self, property_, index):
+        kind = property_["kind"]
+        if kind == STRING:
+            languages = self.languages[:1] if property_["single"] else self.languages
+            return [label(lang, "value", index) for lang in languages] or [Literal(u"{0}".format(index))]
+        if kind == INTEGER:
+            return [Literal(index, datatype=XSD.integer)]
+        if kind == DATE:
+            return [Literal((FIRST_DATE + datetime.timedelta(days=index % 10000)).isoformat(), datatype=XSD.date)]
+        if kind == BOOLEAN:
+            return [Literal("true" if index % 2 else "false", datatype=XSD.boolean)]
+        if kind == ENUMERATION:
+            return [self.enumerated_value(property_["range"][0], index % self.enumeration_size)]
+        range_ = property_["range"][index % len(property_["range"])]
+        leaf = self.first_leaf(range_)
+        count = self.instance_count(leaf)
+        return [self.instance_uri(leaf, index % count)] if count else []
+
+    def manifest(self):
+        "What bench_endpoints needs to request the generated data"
+        target = self.leaves[0]
+        filter_property = None
+        for name in reversed(self.ancestors(target)):
+            enumerations = [property_ for property_ in self.properties[name] if property_["kind"] == ENUMERATION]
+            if enumerations:
+                filter_property = enumerations[0]
+                break
+        return {
+            "context": self.context,
+            "graph": self.graph,
+            "classes": len(self.classes),
+            "properties": sum(len(properties) for properties in self.properties.values()),
+            "instances": self.instances,
+            "target_class": target,
+            "target_class_properties": sum(len(self.properties[name]) for name in self.ancestors(target)),
+            "target_class_depth": len(self.ancestors(target)) - 1,
+            "target_instances": self.instance_count(target),
+            "filter_property": unicode(self.namespace[filter_property["name"]]) if filter_property else None,
+            "filter_object": unicode(self.enumerated_value(filter_property["range"][0], 0)) if filter_property else None,
+            "parameters": {
+                "depth": self.depth,
+                "fan_out": self.fan_out,
+                "properties": self.properties_per_class,
+                "restrictions": self.restrictions,
+                "enumeration_size": self.enumeration_size,
+                "union_size": self.union_size,
+                "subproperty_chain": self.subproperty_chain,
+                "languages": self.languages,
+                "seed": self.seed
+            }
+        }
+
+
+def write_triples(output_file, triples, format_):
+    """
+    Write triples as N-Triples, or as Turtle with the triples of each subject grouped,
+    without holding them in memory (instance datasets may have millions of triples).
+    """
+    previous = None
+    for subject, predicate, object_ in triples:
+        if format_ == "nt":
+            output_file.write(u"{0} {1} {2} .\n".format(subject.n3(), predicate.n3(), object_.n3()).encode("utf-8"))
+            continue
+        if subject == previous:
+            output_file.write(u" ;\n    {0} {1}".format(predicate.n3(), object_.n3()).encode("utf-8"))
+        else:
+            if previous is not None:
+                output_file.write(" .\n\n")
+            output_file.write(u"{0} {1} {2}".format(subject.n3(), predicate.n3(), object_.n3()).encode("utf-8"))
+        previous = subject
+    if format_ != "nt" and previous is not None:
+        output_file.write(" .\n")
+
+
+def write_dataset(dataset, directory, format_="turtle"):
+    "Write the ontology and the instances of dataset into directory, laid out as resources/ontologies/schema"
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    extension = FORMATS[format_]
+    with open(os.path.join(directory, "prefixes.ttl"), "w") as prefixes_file:
+        prefixes_file.write("@prefix {0}: <{1}> .\n".format(dataset.context, dataset.graph))
+    files = {
+        dataset.context + extension: lambda output_file: output_file.write(dataset.ontology().serialize(format=format_)),
+        dataset.context + "_instances" + extension: lambda output_file: write_triples(output_file, dataset.instance_triples(), format_)
+    }
+    for filename, write in sorted(files.items()):
+        with open(os.path.join(directory, filename), "w") as output_file:
+            write(output_file)
+        with open(os.path.join(directory, filename + ".graph"), "w") as graph_file:
+            graph_file.write(dataset.graph + "\n")
+    with open(os.path.join(directory, MANIFEST_FILENAME), "w") as manifest_file:
+        json.dump(dataset.manifest(), manifest_file, indent=2, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", default=os.path.join(DATASETS_DIRECTORY, "synthetic"), help="directory")
+    parser.add_argument("--context", default="synthetic", help="graph is {0}<context>/".format(URI_PREFIX))
+    parser.add_argument("--depth", type=int, default=3, help="levels of subclasses below the root class")
+    parser.add_argument("--fan-out", type=int, default=3, help="subclasses of each non-leaf class")
+    parser.add_argument("--properties", type=int, default=10, help="properties declared by each class")
+    parser.add_argument("--restrictions", type=float, default=0.5,
+                        help="fraction of properties with cardinality restrictions")
+    parser.add_argument("--enumeration-size", type=int, default=5, help="values of each enumeration (0: no enumerations)")
+    parser.add_argument("--union-size", type=int, default=2, help="classes of each owl:unionOf range (0: no unions)")
+    parser.add_argument("--subproperty-chain", type=int, default=2, help="length of rdfs:subPropertyOf chains")
+    parser.add_argument("--languages", nargs="+", default=["pt", "en"], help="languages of labels and string values")
+    parser.add_argument("--instances", type=int, default=1000, help="instances, spread over the leaf classes")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="turtle")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(context=args.context, depth=args.depth, fan_out=args.fan_out,
+                               properties=args.properties, restrictions=args.restrictions,
+                               enumeration_size=args.enumeration_size, union_size=args.union_size,
+                               subproperty_chain=args.subproperty_chain, languages=args.languages,
+                               instances=args.instances, seed=args.seed)
+    write_dataset(dataset, args.output, args.format)
+    manifest = dataset.manifest()
+    print "{0} classes, {1} properties, {2} instances written to {3}".format(
+        manifest["classes"], manifest["properties"], manifest["instances"], args.output)
+    print "{0}: {1} properties ({2} levels deep), {3} instances".format(
+        manifest["target_class"], manifest["target_class_properties"], manifest["target_class_depth"],
+        manifest["target_instances"])
+
+
+if __name__ == "__main__":
+    main()
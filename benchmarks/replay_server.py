@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Replay the backend calls recorded by Brainiak (see brainiak.utils.recording), with their original latencies.
+
+Record a day of traffic (or a benchmark run) by setting BACKEND_RECORDING_FILEPATH, then
+serve the recording instead of Virtuoso and Elasticsearch:
+
+    PYTHONPATH=src python benchmarks/replay_server.py /tmp/brainiak_backend.jsonl --port 8890
+
+Each request is answered with the status and body recorded for the same request, after
+the recorded latency (multiplied by --speed, e.g. 0 to answer at once). Requests are matched
+by their query and format (triplestore) or method, path and body (Elasticsearch); requests
+recorded several times get their recorded responses in turn. Calls which failed without a
+response (status 599) are replayed by closing the connection.
+
+Requests which were not recorded are answered with 404 and counted: the count is
+returned by GET /_replay/status, and printed when the server is interrupted.
+bench_endpoints.py runs Brainiak against this server with --replay.
+
+This module does not import brainiak, so that it may run in its own process.
+"""
+import argparse
+import logging
+import time
+import urlparse
+from collections import defaultdict
+
+import ujson as json
+from tornado.ioloop import IOLoop
+from tornado.web import Application, RequestHandler, asynchronous
+
+
+TRIPLESTORE = u"triplestore"
+ELASTICSEARCH = u"elasticsearch"
+STATUS_PATH = "/_replay/status"
+NO_RESPONSE = 599
+
+NOT_RECORDED_MESSAGE = u"Request not found in the recording"
+
+
+def _relative_url(url):
+    parts = urlparse.urlsplit(url)
+    return parts.path + ("?" + parts.query if parts.query else "")
+
+
+def request_key(entry):
+    "Return the key of a recorded call, as computed by Replay.key for the replayed request"
+    if entry["backend"] == TRIPLESTORE:
+        return (TRIPLESTORE, entry["query"], entry["format"])
+    return (ELASTICSEARCH, entry["method"], _relative_url(entry["url"]), entry.get("body") or u"")
+
+
+def recorded_sparql_path(filepath):
+    "Return the path of the first triplestore call of a recording (the path Brainiak must use), or None"
+    with open(filepath) as recording_file:
+        for line in recording_file:
+            if line.strip():
+                entry = json.loads(line)
+                if entry["backend"] == TRIPLESTORE:
+                    return urlparse.urlsplit(entry["url"]).path
+    return None
+
+
+class Replay(object):
+    "The recorded calls, by request, each request's responses being replayed in turn"
+
+    def __init__(self, entries):
+        self.responses = defaultdict(list)
+        self.sparql_paths = set()
+        for entry in entries:
+            self.responses[request_key(entry)].append(entry)
+            if entry["backend"] == TRIPLESTORE:
+                self.sparql_paths.add(urlparse.urlsplit(entry["url"]).path.rstrip("/"))
+        self._next = defaultdict(int)
+        self.replayed = 0
+        self.not_recorded = 0
+
+    @classmethod
+    def from_file(cls, filepath):
+        with open(filepath) as recording_file:
+            return cls(json.loads(line) for line in recording_file if line.strip())
+
+    def next_response(self, key):
+        "Return the next recorded call of the request, or None if it was not recorded"
+        responses = self.responses.get(key)
+        if not responses:
+            self.not_recorded += 1
+            return None
+        index = self._next[key]
+        self._next[key] = (index + 1) % len(responses)
+        self.replayed += 1
+        return responses[index]
+
+    def status(self):
+        return {"requests": len(self.responses), "calls": sum(len(calls) for calls in self.responses.values()),
+                "replayed": self.replayed, "not_recorded": self.not_recorded}
+
+
+class ReplayHandler(RequestHandler):
+
+    SUPPORTED_METHODS = ("GET", "POST", "PUT", "DELETE", "HEAD")
+
+    def initialize(self, replay, speed):
+        self.replay = replay
+        self.speed = speed
+
+    def key(self):
+        if self.request.path.rstrip("/") in self.replay.sparql_paths:
+            # as sent by brainiak.triplestore, urlencoded in the body
+            return (TRIPLESTORE, self.get_argument("query", u"", strip=False), self.get_argument("format", u"", strip=False))
+        return (ELASTICSEARCH, self.request.method, self.request.uri, self.request.body.decode("utf-8"))
+
+    @asynchronous
+    def get(self):
+        if self.request.path == STATUS_PATH:
+            self.set_header("Content-Type", "application/json")
+            self.finish(json.dumps(self.replay.status()))
+            return
+        entry = self.replay.next_response(self.key())
+        if entry is None:
+            self.set_status(404)
+            self.finish(NOT_RECORDED_MESSAGE)
+            return
+        delay = entry["latency"] * self.speed
+        if delay > 0:
+            IOLoop.instance().add_timeout(time.time() + delay, lambda: self.respond(entry))
+        else:
+            self.respond(entry)
+
+    post = put = delete = head = get
+
+    def respond(self, entry):
+        if entry["status"] == NO_RESPONSE:
+            self.request.connection.stream.close()
+            return
+        self.set_status(entry["status"], reason="Replayed")
+        if entry["backend"] == TRIPLESTORE:
+            self.set_header("Content-Type", entry["format"])
+        else:
+            self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.finish(entry["response"])
+
+
+def make_application(replay, speed=1.0):
+    return Application([(r"/.*", ReplayHandler, {"replay": replay, "speed": speed})])
+
+
+def serve(port, filepath, speed=1.0):
+    # the requests which were not recorded are counted, there is no need for Tornado's console log
+    logging.getLogger().addHandler(logging.NullHandler())
+    replay = Replay.from_file(filepath)
+    make_application(replay, speed).listen(port, address="127.0.0.1")
+    try:
+        IOLoop.instance().start()
+    finally:
+        print "Replayed {replayed} calls, {not_recorded} requests were not recorded".format(**replay.status())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("recording", help="file written with BACKEND_RECORDING_FILEPATH")
+    parser.add_argument("--port", type=int, default=8890)
+    parser.add_argument("--speed", type=float, default=1.0, help="multiplies the recorded latencies")
+    args = parser.parse_args()
+    serve(args.port, args.recording, args.speed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,667 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-ins for the services Brainiak depends on, so that it can be benchmarked
+(see bench_endpoints.py) without Virtuoso, Elasticsearch or Redis:
+
+- SparqlStandIn: an rdflib dataset answering Brainiak's SPARQL, including the
+  Virtuoso dialect of its updates (INSERT DATA INTO, DELETE FROM, MODIFY GRAPH)
+- ElasticSearchStandIn: in-memory documents answering the requests of brainiak.search_engine
+- FakeRedis: the part of redis.StrictRedis used by brainiak.utils.cache, kept in a dict
+
+Both servers share one Tornado application (see make_application and serve):
+SPARQL at /sparql-auth and Elasticsearch at every other path.
+The SPARQL stand-in needs rdflib 4 (SPARQL 1.1), see benchmarks/requirements.txt.
+
+This module does not import brainiak, so that it may run in its own process.
+"""
+import fnmatch
+import glob
+import logging
+import os
+import re
+import time
+import urllib
+from collections import OrderedDict
+
+import ujson as json
+from rdflib import BNode, ConjunctiveGraph, Literal, Namespace, RDF, RDFS, URIRef, XSD
+from rdflib.paths import MulPath
+from rdflib.plugins import sparql as rdflib_sparql
+from rdflib.store import TripleAddedEvent
+from tornado.ioloop import IOLoop
+from tornado.web import Application, RequestHandler
+
+
+SCHEMA_DIRECTORY = "resources/ontologies/schema"
+# namespaces registered in Virtuoso along with the ontologies
+PREFIXES_FILENAME = "prefixes.ttl"
+SPARQL_PATH = "/sparql-auth"
+
+# graphs named in FROM clauses are looked up among the loaded ones, never fetched
+rdflib_sparql.SPARQL_LOAD_GRAPHS = False
+
+_evaluate_path = MulPath.eval
+
+
+def _evaluate_path_from_bound_end(path, graph, subj=None, obj=None, first=True):
+    """
+    As in Virtuoso, transitive patterns without a bound end have no answers
+    (rdflib would otherwise try every node of the dataset, e.g. in get_class.QUERY_CARDINALITIES).
+    """
+    if subj is None and obj is None:
+        return iter(())
+    return _evaluate_path(path, graph, subj, obj, first)
+
+
+MulPath.eval = _evaluate_path_from_bound_end
+
+JSON_FORMAT = "application/sparql-results+json"
+TSV_FORMAT = "text/tab-separated-values"
+CSV_FORMAT = "text/csv"
+
+# Virtuoso pragmas (e.g. DEFINE input:inference <ruleset>), which rdflib does not know
+DEFINE_PATTERN = re.compile(r"^\s*DEFINE\s+[\w:\-]+\s+(<[^>]*>|\"[^\"]*\"|'[^']*'|\S+)\s*$",
+                            re.IGNORECASE | re.MULTILINE)
+INSERT_DATA_INTO_PATTERN = re.compile(r"\bINSERT\s+DATA\s+INTO\s+<([^>]*)>\s*(\{.*\})\s*$",
+                                      re.IGNORECASE | re.DOTALL)
+DELETE_FROM_PATTERN = re.compile(r"\bDELETE\s+FROM\s+<([^>]*)>\s*(\{.*?\})\s*WHERE\s*(\{.*\})\s*$",
+                                 re.IGNORECASE | re.DOTALL)
+MODIFY_GRAPH_PATTERN = re.compile(r"\bMODIFY\s+GRAPH\s+<([^>]*)>\s*DELETE\s*(\{.*?\})\s*INSERT\s*(\{.*?\})\s*WHERE\s*(\{.*\})\s*$",
+                                  re.IGNORECASE | re.DOTALL)
+# Virtuoso extensions to SPARQL, rewritten by to_sparql_11:
+# projected expressions without parentheses (SELECT COUNT(?s) AS ?total)
+PROJECTION_PATTERN = re.compile(r"\b\w+\s*\((?:[^()]|\([^()]*\))*\)\s+AS\s+\?\w+", re.IGNORECASE)
+# commas between projected variables (SELECT ?label, ?subject)
+SELECT_CLAUSE_PATTERN = re.compile(r"\bSELECT\b[^{]*?(?=\bWHERE\b|\bFROM\b|\{)", re.IGNORECASE | re.DOTALL)
+# transitive triple patterns (?class rdfs:subClassOf ?super OPTION(TRANSITIVE, t_min (0))), as property paths
+# (the order of the steps, t_step, is lost)
+TRANSITIVE_PATTERN = re.compile(r"(\S+)(\s+\S+)\s+OPTION\s*\(\s*TRANSITIVE((?:[^()]|\([^()]*\))*)\)", re.IGNORECASE)
+MINIMUM_STEPS_PATTERN = re.compile(r"\bt_min\s*\(\s*(\d+)\s*\)", re.IGNORECASE)
+# other options of triple patterns (OPTION(inference "ruleset")), ignored
+OPTION_PATTERN = re.compile(r"\s+OPTION\s*\((?:[^()]|\([^()]*\))*\)", re.IGNORECASE)
+# OR and AND, besides || and &&, skipping strings and IRIs
+OPERATOR_PATTERN = re.compile(r"(\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'|<[^<>\s]*>)|\b(OR|AND)\b")
+# Virtuoso matches untagged literals with langMatches(lang(?x), ""), rdflib does not
+UNTAGGED_PATTERN = re.compile(r"\blangMatches\s*\(\s*(lang\s*\(\s*\?\w+\s*\))\s*,\s*(\"\"|'')\s*\)", re.IGNORECASE)
+UPDATE_PATTERN = re.compile(r"^\s*(INSERT|DELETE|MODIFY|CLEAR|DROP|LOAD|CREATE|WITH)\b",
+                            re.IGNORECASE | re.MULTILINE)
+
+# read responses are kept until an update, so that the stand-in costs little next to Brainiak
+MAX_MEMOIZED_RESPONSES = 10000
+
+PERSON = Namespace("http://semantica.globo.com/person/")
+PLACE = Namespace("http://semantica.globo.com/place/")
+UPPER = Namespace("http://semantica.globo.com/upper/")
+GENDERS = (URIRef(PERSON["Gender/Male"]), URIRef(PERSON["Gender/Female"]))
+CITIES_PER_PERSON = 10
+
+# prefixes which Virtuoso knows beforehand, so that queries and some .ttl files do not declare them
+# (besides the ones of PREFIXES_FILENAME)
+VIRTUOSO_PREFIXES = {
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+    "owl": "http://www.w3.org/2002/07/owl#",
+    "xsd": "http://www.w3.org/2001/XMLSchema#",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "foaf": "http://xmlns.com/foaf/0.1/",
+    "skos": "http://www.w3.org/2004/02/skos/core#"
+}
+PREFIX_DECLARATION_PATTERN = re.compile(r"@prefix\s+([\w\-]*):\s*<([^>]*)>")
+TURTLE_PREFIXES = u"".join(u"@prefix {0}: <{1}> .\n".format(prefix, uri) for prefix, uri in VIRTUOSO_PREFIXES.items())
+
+
+class SparqlError(Exception):
+    pass
+
+
+def _parenthesize_projection(match):
+    if match.string[:match.start()].rstrip().endswith(u"("):
+        return match.group()
+    return u"({0})".format(match.group())
+
+
+def _transitive_path(match):
+    predicate, object_, options = match.groups()
+    minimum = MINIMUM_STEPS_PATTERN.search(options)
+    return u"{0}{1}{2}".format(predicate, u"+" if minimum and int(minimum.group(1)) > 0 else u"*", object_)
+
+
+def _operator(match):
+    if match.group(1):
+        return match.group(1)
+    return u"||" if match.group(2).upper() == u"OR" else u"&&"
+
+
+def to_sparql_11(query):
+    "Rewrite the Virtuoso extensions to SPARQL which Brainiak uses (see the patterns above)"
+    query = DEFINE_PATTERN.sub(u"", query)
+    query = TRANSITIVE_PATTERN.sub(_transitive_path, query)
+    query = SELECT_CLAUSE_PATTERN.sub(lambda match: match.group().replace(u",", u" "), query)
+    query = PROJECTION_PATTERN.sub(_parenthesize_projection, query)
+    query = OPTION_PATTERN.sub(u"", query)
+    query = UNTAGGED_PATTERN.sub(u'(\\1 = "")', query)
+    return OPERATOR_PATTERN.sub(_operator, query)
+
+
+def as_virtuoso_literal(term):
+    "Virtuoso has no booleans, they are integers"
+    if term.datatype == XSD.boolean:
+        return Literal(int(term.toPython()), datatype=XSD.integer)
+    return term
+
+
+def term_to_json(term):
+    if isinstance(term, URIRef):
+        return {"type": "uri", "value": unicode(term)}
+    if isinstance(term, BNode):
+        return {"type": "bnode", "value": unicode(term)}
+    term = as_virtuoso_literal(term)
+    item = {"type": "literal", "value": unicode(term)}
+    if term.language:
+        item["xml:lang"] = term.language
+    elif term.datatype:
+        # as Virtuoso does
+        item["type"] = "typed-literal"
+        item["datatype"] = unicode(term.datatype)
+    return item
+
+
+def term_to_tsv(term):
+    if term is None:
+        return u""
+    if isinstance(term, URIRef):
+        return u"<{0}>".format(term)
+    if isinstance(term, BNode):
+        return u"_:{0}".format(term)
+    term = as_virtuoso_literal(term)
+    value = unicode(term).replace(u"\\", u"\\\\").replace(u'"', u'\\"')
+    value = value.replace(u"\t", u"\\t").replace(u"\n", u"\\n").replace(u"\r", u"\\r")
+    if term.language:
+        return u'"{0}"@{1}'.format(value, term.language)
+    if term.datatype:
+        return u'"{0}"^^<{1}>'.format(value, term.datatype)
+    return u'"{0}"'.format(value)
+
+
+def term_to_csv(term):
+    if term is None:
+        return u""
+    value = unicode(as_virtuoso_literal(term) if isinstance(term, Literal) else term)
+    if any(character in value for character in u',"\r\n'):
+        return u'"{0}"'.format(value.replace(u'"', u'""'))
+    return value
+
+
+def serialize_select(variables, rows, result_format):
+    "Serialize SELECT results as Virtuoso does for the given format (one of the *_FORMAT)"
+    names = [unicode(variable) for variable in variables]
+    if result_format == TSV_FORMAT:
+        lines = [u"\t".join(u"?" + name for name in names)]
+        lines.extend(u"\t".join(term_to_tsv(term) for term in row) for row in rows)
+        return (u"\n".join(lines) + u"\n").encode("utf-8")
+    if result_format == CSV_FORMAT:
+        lines = [u",".join(names)]
+        lines.extend(u",".join(term_to_csv(term) for term in row) for row in rows)
+        return (u"\r\n".join(lines) + u"\r\n").encode("utf-8")
+    bindings = [dict((name, term_to_json(term)) for name, term in zip(names, row) if term is not None)
+                for row in rows]
+    return json.dumps({"head": {"link": [], "vars": names},
+                       "results": {"distinct": False, "ordered": True, "bindings": bindings}})
+
+
+def callret(message):
+    "The response of Virtuoso to updates: a single binding of callret-0"
+    return json.dumps({"head": {"link": [], "vars": ["callret-0"]},
+                       "results": {"distinct": False, "ordered": True,
+                                   "bindings": [{"callret-0": {"type": "literal", "value": message}}]}})
+
+
+class SparqlStandIn(object):
+    """
+    An rdflib dataset whose graphs are named as in Virtuoso. Queries are answered as
+    Virtuoso would answer Brainiak's, with two known differences: DEFINE pragmas are
+    ignored (so there is no inference) and the "(or less)" counts of updates are estimates.
+    """
+
+    def __init__(self):
+        self.dataset = ConjunctiveGraph()
+        self.prefixes = dict(VIRTUOSO_PREFIXES)
+        self.added = 0
+        self.responses = {}
+        self.dataset.store.dispatcher.subscribe(TripleAddedEvent, self._on_added)
+
+    def _on_added(self, event):
+        self.added += 1
+
+    def load_ontologies(self, directory=SCHEMA_DIRECTORY):
+        """
+        Load each .ttl or .nt file into the graph named in the .graph file next to it
+        (e.g. person.ttl.graph), and register the prefixes of PREFIXES_FILENAME
+        """
+        prefixes_filepath = os.path.join(directory, PREFIXES_FILENAME)
+        if os.path.exists(prefixes_filepath):
+            with open(prefixes_filepath) as prefixes_file:
+                self.prefixes.update(PREFIX_DECLARATION_PATTERN.findall(prefixes_file.read()))
+        filepaths = glob.glob(os.path.join(directory, "*.ttl")) + glob.glob(os.path.join(directory, "*.nt"))
+        for filepath in sorted(filepaths):
+            graph_filepath = filepath + ".graph"
+            if not os.path.exists(graph_filepath):
+                continue
+            with open(graph_filepath) as graph_file:
+                graph_uri = graph_file.read().strip()
+            context = self.dataset.get_context(URIRef(graph_uri))
+            if filepath.endswith(".nt"):
+                context.parse(filepath, format="nt")
+                continue
+            with open(filepath) as ttl_file:
+                data = TURTLE_PREFIXES + ttl_file.read().decode("utf-8")
+            context.parse(data=data, format="turtle")
+        self.responses.clear()
+
+    def add(self, graph_uri, triples):
+        context = self.dataset.get_context(URIRef(graph_uri))
+        context.addN((subject, predicate, object_, context) for subject, predicate, object_ in triples)
+        self.responses.clear()
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def execute(self, query, result_format=JSON_FORMAT):
+        "Return the response body of query in result_format"
+        key = (query, result_format)
+        response = self.responses.get(key)
+        if response is not None:
+            return response
+
+        query = to_sparql_11(query)
+        if UPDATE_PATTERN.search(query):
+            self.responses.clear()
+            return self._update(query)
+
+        response = self._query(query, result_format)
+        if len(self.responses) >= MAX_MEMOIZED_RESPONSES:
+            self.responses.clear()
+        self.responses[key] = response
+        return response
+
+    def _query(self, query, result_format):
+        try:
+            result = self.dataset.query(query, initNs=self.prefixes)
+        except Exception as e:
+            raise SparqlError(u"{0}: {1}\n{2}".format(e.__class__.__name__, e, query))
+        if result.type == "ASK":
+            return json.dumps({"head": {"link": []}, "boolean": bool(result.askAnswer)})
+        if result.type == "SELECT":
+            return serialize_select(result.vars, result, result_format)
+        return result.serialize(format="nt")
+
+    def _run_update(self, update):
+        try:
+            self.dataset.update(update, initNs=self.prefixes)
+        except Exception as e:
+            raise SparqlError(u"{0}: {1}\n{2}".format(e.__class__.__name__, e, update))
+
+    def _update(self, query):
+        match = INSERT_DATA_INTO_PATTERN.search(query)
+        if match is not None:
+            prologue = query[:match.start()]
+            graph_uri, triples = match.groups()
+            added = self.added
+            self._run_update(u"{0} INSERT DATA {{ GRAPH <{1}> {2} }}".format(prologue, graph_uri, triples))
+            return callret(u"Insert into <{0}>, {1} (or less) triples -- done".format(graph_uri, self.added - added))
+
+        match = DELETE_FROM_PATTERN.search(query)
+        if match is not None:
+            prologue = query[:match.start()]
+            graph_uri, template, where = match.groups()
+            context = self.dataset.get_context(URIRef(graph_uri))
+            size = len(context)
+            self._run_update(u"{0} WITH <{1}> DELETE {2} WHERE {3}".format(prologue, graph_uri, template, where))
+            deleted = size - len(context)
+            if not deleted:
+                return callret(u"Delete from <{0}>, 0 triples -- nothing to do".format(graph_uri))
+            return callret(u"Delete from <{0}>, {1} (or less) triples -- done".format(graph_uri, deleted))
+
+        match = MODIFY_GRAPH_PATTERN.search(query)
+        if match is not None:
+            prologue = query[:match.start()]
+            graph_uri, delete_template, insert_template, where = match.groups()
+            context = self.dataset.get_context(URIRef(graph_uri))
+            size = len(context)
+            added = self.added
+            self._run_update(u"{0} WITH <{1}> DELETE {2} INSERT {3} WHERE {4}".format(
+                prologue, graph_uri, delete_template, insert_template, where))
+            inserted = self.added - added
+            deleted = max(size + inserted - len(context), 0)
+            return callret(u"Modify <{0}>, delete {1} (or less) and insert {2} (or less) triples -- done".format(
+                graph_uri, deleted, inserted))
+
+        self._run_update(query)
+        return callret(u"Commit -- done")
+
+
+def synthetic_instances(count):
+    """
+    Return {graph_uri: triples} with count person:Person instances (person/Person/Person0, ...),
+    born in count // CITIES_PER_PERSON place:City instances (place/City/City0, ...), at least one.
+    """
+    cities = []
+    city_count = max(count // CITIES_PER_PERSON, 1)
+    for index in xrange(city_count):
+        city = URIRef(PLACE["City/City{0}".format(index)])
+        cities.extend([(city, RDF.type, PLACE.City),
+                       (city, RDFS.label, Literal(u"Cidade {0}".format(index)))])
+    persons = []
+    for index in xrange(count):
+        person = URIRef(PERSON["Person/Person{0}".format(index)])
+        name = Literal(u"Pessoa {0}".format(index))
+        persons.extend([(person, RDF.type, PERSON.Person),
+                        (person, RDFS.label, name),
+                        (person, UPPER.name, name),
+                        (person, PERSON.fullName, Literal(u"Pessoa de Teste {0}".format(index))),
+                        (person, PERSON.gender, GENDERS[index % 2]),
+                        (person, PERSON.cityOfBirth, URIRef(PLACE["City/City{0}".format(index % city_count)]))])
+    return {unicode(PLACE): cities, unicode(PERSON): persons}
+
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def analyze(text):
+    "Tokens of text, as the standard analyzer of Elasticsearch (without stopwords) returns them"
+    tokens = []
+    for position, match in enumerate(WORD_PATTERN.finditer(text), 1):
+        tokens.append({"token": match.group().lower(), "start_offset": match.start(),
+                       "end_offset": match.end(), "type": "<ALPHANUM>", "position": position})
+    return {"tokens": tokens}
+
+
+def _query_terms(query):
+    "The lowercased words searched by wildcard and query_string clauses (anywhere in query)"
+    terms = []
+    if isinstance(query, dict):
+        for key, value in query.items():
+            if key == "wildcard":
+                terms.extend(value.values())
+            elif key == "query_string":
+                terms.append(value["query"])
+            else:
+                terms.extend(_query_terms(value))
+    elif isinstance(query, list):
+        for item in query:
+            terms.extend(_query_terms(item))
+    return [term.strip(u'"*').replace(u"*", u" ").lower() for term in terms if term.strip(u'"*')]
+
+
+def _source_matches(source, terms):
+    for value in source.values():
+        values = value if isinstance(value, list) else [value]
+        for item in values:
+            if isinstance(item, basestring) and any(term in item.lower() for term in terms):
+                return True
+    return False
+
+
+class ElasticSearchStandIn(object):
+    """
+    Documents kept by (index, type) and id. Searches filter by index, type and by the words of
+    any wildcard or query_string clause found in the query (matching substrings of any field),
+    which is enough for Brainiak's suggest and stored queries; scores are all 1.
+    """
+
+    def __init__(self):
+        self.documents = {}
+
+    def index(self, index_name, type_name, document_id, source):
+        "Store a document, returning whether it is new"
+        documents = self.documents.setdefault((index_name, type_name), OrderedDict())
+        created = document_id not in documents
+        documents[document_id] = source
+        return created
+
+    def get(self, index_name, type_name, document_id):
+        return self.documents.get((index_name, type_name), {}).get(document_id)
+
+    def delete(self, index_name, type_name, document_id):
+        return self.documents.get((index_name, type_name), {}).pop(document_id, None) is not None
+
+    def search(self, index_patterns, type_name, body):
+        terms = _query_terms(body.get("query", {}))
+        types = [clause["type"]["value"] for clause in body.get("filter", {}).get("or", []) if "type" in clause]
+        fields = body.get("fields")
+        hits = []
+        for (index_name, document_type), documents in sorted(self.documents.items()):
+            if not any(fnmatch.fnmatch(index_name, pattern) for pattern in index_patterns):
+                continue
+            if (type_name and document_type != type_name) or (types and document_type not in types):
+                continue
+            for document_id, source in documents.items():
+                if terms and not _source_matches(source, terms):
+                    continue
+                hit = {"_index": index_name, "_type": document_type, "_id": document_id, "_score": 1.0}
+                if fields is None:
+                    hit["_source"] = source
+                else:
+                    hit["fields"] = dict((field, source[field]) for field in fields if field in source)
+                hits.append(hit)
+        start = int(body.get("from", 0))
+        size = int(body.get("size", 10))
+        return {"took": 1, "timed_out": False,
+                "hits": {"total": len(hits), "max_score": 1.0, "hits": hits[start:start + size]}}
+
+
+class FakeRedis(object):
+    "The part of the redis.StrictRedis interface used by brainiak.utils.cache, kept in a dict"
+
+    def __init__(self):
+        self.data = {}
+        self.expire_at = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _expire(self, key):
+        if key in self.expire_at and self.expire_at[key] <= time.time():
+            del self.expire_at[key]
+            del self.data[key]
+
+    def get(self, key):
+        self._expire(key)
+        value = self.data.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.data[key] = value.encode("utf-8") if isinstance(value, unicode) else str(value)
+        self.expire_at.pop(key, None)
+        return True
+
+    def setex(self, key, ttl, value):
+        self.set(key, value)
+        self.expire_at[key] = time.time() + ttl
+        return True
+
+    def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            for item in (key if isinstance(key, (list, tuple)) else [key]):
+                if self.data.pop(item, None) is not None:
+                    deleted += 1
+                self.expire_at.pop(item, None)
+        return deleted
+
+    def keys(self, pattern="*"):
+        return [key for key in list(self.data) if fnmatch.fnmatchcase(key, pattern)]
+
+    def flushall(self):
+        self.data.clear()
+        self.expire_at.clear()
+        return True
+
+    def ping(self):
+        return True
+
+    def info(self, section=None):
+        if section == "keyspace":
+            return {"db0": {"keys": len(self.data), "expires": len(self.expire_at)}}
+        return {"redis_version": "fake", "process_id": os.getpid(), "role": "master",
+                "used_memory_human": "-", "used_memory_peak_human": "-",
+                "keyspace_hits": self.hits, "keyspace_misses": self.misses}
+
+
+class SparqlHandler(RequestHandler):
+
+    def initialize(self, sparql):
+        self.sparql = sparql
+
+    def get(self):
+        query = self.get_argument("query")
+        result_format = self.get_argument("format", JSON_FORMAT)
+        try:
+            response = self.sparql.execute(query, result_format)
+        except SparqlError as e:
+            self.set_status(400)
+            self.set_header("Content-Type", "text/plain")
+            self.finish(u"Virtuoso 37000 Error SP030: SPARQL compiler: {0}".format(e))
+            return
+        content_type = result_format if result_format in (TSV_FORMAT, CSV_FORMAT) else JSON_FORMAT
+        self.set_header("Content-Type", content_type)
+        self.finish(response)
+
+    post = get
+
+
+class ElasticSearchHandler(RequestHandler):
+
+    SUPPORTED_METHODS = ("GET", "POST", "PUT", "DELETE", "HEAD")
+
+    def initialize(self, search):
+        self.search = search
+
+    def _path(self):
+        return [urllib.unquote(part).decode("utf-8") for part in self.request.path.strip("/").split("/")]
+
+    def _body(self):
+        return json.loads(self.request.body) if self.request.body else {}
+
+    def _reply(self, response, status=200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json; charset=UTF-8")
+        self.finish(json.dumps(response))
+
+    def _search(self, parts, body):
+        index_patterns = (parts[0] if len(parts) > 1 else "*").split(",")
+        type_name = parts[1] if len(parts) == 3 else None
+        return self.search.search(index_patterns, type_name, body)
+
+    def get(self):
+        parts = self._path()
+        if parts == ["_analyze"]:
+            return self._reply(analyze(self.get_argument("text", u"")))
+        if parts[-1] == "_search":
+            return self._reply(self._search(parts, self._body()))
+        if len(parts) == 3:
+            index_name, type_name, document_id = parts
+            source = self.search.get(index_name, type_name, document_id)
+            response = {"_index": index_name, "_type": type_name, "_id": document_id,
+                        "exists": source is not None, "found": source is not None}
+            if source is None:
+                return self._reply(response, 404)
+            response.update({"_version": 1, "_source": source})
+            return self._reply(response)
+        self._reply({"ok": True, "status": 200})
+
+    def post(self):
+        parts = self._path()
+        if parts[-1] == "_search":
+            return self._reply(self._search(parts, self._body()))
+        if parts == ["_msearch"]:
+            return self._reply({"responses": self._msearch()})
+        if parts == ["_bulk"]:
+            return self._reply({"took": 1, "items": self._bulk()})
+        if parts[-1] == "_mget":
+            index_name, type_name = parts[:2]
+            docs = []
+            for document_id in self._body()["ids"]:
+                source = self.search.get(index_name, type_name, document_id)
+                doc = {"_index": index_name, "_type": type_name, "_id": document_id,
+                       "exists": source is not None, "found": source is not None}
+                if source is not None:
+                    doc["_source"] = source
+                docs.append(doc)
+            return self._reply({"docs": docs})
+        self.put()
+
+    def put(self):
+        index_name, type_name, document_id = self._path()
+        created = self.search.index(index_name, type_name, document_id, self._body())
+        self._reply({"ok": True, "created": created, "_index": index_name, "_type": type_name,
+                     "_id": document_id, "_version": 1}, 201 if created else 200)
+
+    def delete(self):
+        index_name, type_name, document_id = self._path()
+        found = self.search.delete(index_name, type_name, document_id)
+        self._reply({"ok": True, "found": found, "_index": index_name, "_type": type_name,
+                     "_id": document_id}, 200 if found else 404)
+
+    def _lines(self):
+        return [json.loads(line) for line in self.request.body.splitlines() if line.strip()]
+
+    def _msearch(self):
+        lines = self._lines()
+        responses = []
+        for header, body in zip(lines[::2], lines[1::2]):
+            index_patterns = header.get("index", "*").split(",")
+            responses.append(self.search.search(index_patterns, header.get("type"), body))
+        return responses
+
+    def _bulk(self):
+        lines = self._lines()
+        items = []
+        while lines:
+            action, meta = lines.pop(0).items()[0]
+            key = (meta["_index"], meta["_type"], meta["_id"])
+            if action == "delete":
+                found = self.search.delete(*key)
+                status = 200 if found else 404
+            else:
+                status = 201 if self.search.index(*(key + (lines.pop(0),))) else 200
+            items.append({action: {"_index": key[0], "_type": key[1], "_id": key[2], "ok": True, "status": status}})
+        return items
+
+
+def make_application(sparql, search):
+    return Application([
+        (SPARQL_PATH + "/?", SparqlHandler, {"sparql": sparql}),
+        (r"/.*", ElasticSearchHandler, {"search": search}),
+    ])
+
+
+def build_standins(instances, schema_directory=SCHEMA_DIRECTORY, dataset_directory=None):
+    """
+    Return a SparqlStandIn loaded with the ontologies and the given number of synthetic persons,
+    and an ElasticSearchStandIn with the cities among them indexed as Brainiak's suggest expects.
+    A dataset_directory written by generate_dataset.py is loaded as well.
+    """
+    sparql = SparqlStandIn()
+    sparql.load_ontologies(schema_directory)
+    if dataset_directory:
+        sparql.load_ontologies(dataset_directory)
+    search = ElasticSearchStandIn()
+    for graph_uri, triples in synthetic_instances(instances).items():
+        sparql.add(graph_uri, triples)
+        for subject, predicate, object_ in triples:
+            if predicate == RDFS.label and graph_uri == unicode(PLACE):
+                search.index("semantica.place", unicode(PLACE.City), unicode(subject),
+                             {unicode(RDFS.label): unicode(object_)})
+    return sparql, search
+
+
+def serve(port, instances, schema_directory=SCHEMA_DIRECTORY, dataset_directory=None):
+    # errors reach the benchmark in the responses, there is no need for Tornado's console log
+    logging.getLogger().addHandler(logging.NullHandler())
+    sparql, search = build_standins(instances, schema_directory, dataset_directory)
+    make_application(sparql, search).listen(port, address="127.0.0.1")
+    IOLoop.instance().start()
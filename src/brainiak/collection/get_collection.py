@@ -220,7 +220,8 @@ class Query(object):
 
 def query_filter_instances(query_params):
     query = Query(query_params).to_string()
-    query_response = triplestore.query_sparql(query, query_params.triplestore_config)
+    # a page may have many rows, which repeat the same URIs: they are kept column-wise
+    query_response = triplestore.query_sparql(query, query_params.triplestore_config, result_set=True)
     return query_response
 
 
@@ -273,11 +274,11 @@ def filter_instances(query_params):
     for p, o, index in extract_po_tuples(query_params):
         keymap[o[1:]] = shorten_uri(p)
 
-    result_dict = query_filter_instances(query_params)
-    if not result_dict or not result_dict['results']['bindings']:
+    result_set = query_filter_instances(query_params)
+    if not result_set:
         return None
 
-    items_list = compress_keys_and_values(result_dict,
+    items_list = compress_keys_and_values(result_set,
                                           keymap=keymap,
                                           ignore_keys=["total"],
                                           do_expand_uri=query_params['expand_uri'] == u"1")
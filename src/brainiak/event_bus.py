@@ -1,9 +1,19 @@
+import os
+import Queue
+import threading
+
+import stomp
+import ujson as json
+from stomp.exception import ConnectFailedException, NotConnectedException
 
 from dad.event import SemanticEvent
 from dad.mom import Middleware, MiddlewareError
 
 from brainiak import settings
 from brainiak.log import get_logger
+from brainiak.utils import cache
+from brainiak.utils.config_parser import get_triplestore_config
+from brainiak.utils.sparql import get_labels
 from brainiak.utils.resources import LazyObject
 
 
@@ -11,25 +21,119 @@ class NotificationFailure(Exception):
     pass
 
 
+class NotificationQueueFull(Exception):
+    pass
+
+
 logger = LazyObject(get_logger)
 middleware = None
+subscriber = None
+notification_queue = None
+
+# Functions called with the event dict whenever an invalidation event arrives.
+# In-process caches register here so they are purged along with Redis.
+invalidation_callbacks = []
 
 
 def initialize():
-    global middleware
+    global middleware, notification_queue
     try:
         middleware = Middleware(host=settings.EVENT_BUS_HOST, port=settings.EVENT_BUS_PORT)
     except MiddlewareError as e:
         logger.error(e)
         if settings.NOTIFY_BUS:
             raise NotificationFailure("Initialization failed")
+    else:
+        if settings.EVENT_BUS_SUBSCRIBE:
+            # ActiveMQ composite destination: besides the original queues,
+            # every event is also published to the invalidation topic
+            middleware.destination = u"{0},topic://{1}".format(Middleware.destination,
+                                                               settings.EVENT_BUS_INVALIDATION_TOPIC)
+
+    if settings.EVENT_BUS_ASYNC:
+        notification_queue = NotificationQueue(
+            publish,
+            prepare=lambda batch: resolve_object_titles(batch, async=False),
+            max_size=settings.EVENT_BUS_QUEUE_MAX_SIZE,
+            batch_size=settings.EVENT_BUS_BATCH_SIZE,
+            max_retries=settings.EVENT_BUS_MAX_RETRIES,
+            backoff=settings.EVENT_BUS_RETRY_BACKOFF,
+            max_backoff=settings.EVENT_BUS_RETRY_MAX_BACKOFF,
+            spool_filepath=settings.EVENT_BUS_SPOOL_FILEPATH)
+        notification_queue.start()
+
 
+def publish(event):
+    middleware.notify(event)
+    logger.info(u"BUS NOTIFICATION\n%s" % event)
+
+
+def resolve_object_titles(events, triplestore_config=None, async=True):
+    """
+    Add the "title" to object property values ({"@id": uri}) in the
+    instance_data of the given events, querying all labels of a triplestore at once.
+    Labels are looked up at the triplestore_config of each event (set by notify_bus),
+    or else at the given triplestore_config, by default at the default triplestore section.
+    """
+    # events grouped by the triplestore where their labels are, in order (a TriplestoreConfig is not hashable)
+    groups = []
+    for event in events:
+        instance_data = event.arguments.get("instance_data") or {}
+        objects = []
+        for value in instance_data.values():
+            values = value if isinstance(value, list) else [value]
+            objects.extend(v for v in values if isinstance(v, dict) and "@id" in v and "title" not in v)
+        if not objects:
+            continue
+        event_config = getattr(event, "triplestore_config", None) or triplestore_config
+        for config, group_objects in groups:
+            if config is event_config:
+                group_objects.extend(objects)
+                break
+        else:
+            groups.append((event_config, objects))
+
+    for config, objects in groups:
+        _resolve_titles(objects, config, async)
+
+
+def _resolve_titles(objects, triplestore_config, async):
+    try:
+        if triplestore_config is None:
+            triplestore_config = get_triplestore_config()
+        labels = get_labels(set(item["@id"] for item in objects), triplestore_config, async=async)
+    except Exception as e:
+        # notifying without titles is better than not notifying at all
+        logger.error(u"BUS NOTIFICATION: could not resolve object titles due to %r" % e)
+        return
 
-def notify_bus(**kw):
+    for item in objects:
+        if item["@id"] in labels:
+            item["title"] = labels[item["@id"]]
+
+
+def notify_bus(triplestore_config=None, **kw):
+    """
+    Notify the event bus of a SemanticEvent built with the given arguments.
+    Object titles are resolved at the triplestore_config of the request, either at once
+    or in batch by the notification queue (events spooled because the queue was full
+    are read back without it, so theirs are resolved at the default section).
+    """
     event = SemanticEvent(**kw)
+    if notification_queue is not None:
+        # an attribute, not an argument, so it is not published
+        event.triplestore_config = triplestore_config
+        try:
+            notification_queue.put(event)
+        except NotificationQueueFull as e:
+            logger.error(e)
+            if settings.NOTIFY_BUS:
+                raise NotificationFailure("Notification failed")
+        return
+
+    resolve_object_titles([event], triplestore_config)
     try:
-        middleware.notify(event)
-        logger.info(u"BUS NOTIFICATION\n%s" % event)
+        publish(event)
     except MiddlewareError as e:
         logger.error(e)
         if settings.NOTIFY_BUS:
@@ -38,5 +142,259 @@ def notify_bus(**kw):
 
 def status():
     msg = middleware.status()
+    if notification_queue is not None:
+        msg += u"<br>Notification queue: {0} pending | {1} spooled".format(
+            notification_queue.pending(), notification_queue.spooled())
     logger.info(msg)
     return msg
+
+
+class NotificationQueue(object):
+    """
+    Outbound queue of SemanticEvents, flushed to the event bus by a
+    background thread, so that requests do not wait for ActiveMQ.
+
+    - Events are sent in batches of up to batch_size events per flush,
+      after prepare (if given) is called with the batch
+    - A failed batch is retried max_retries times, with exponential backoff
+    - At most max_size events are kept in memory (back-pressure): when the
+      queue is full, put() spools the event to disk, if spool_filepath is
+      defined, or raises NotificationQueueFull
+    - Events which could not be sent after all retries are spooled to disk
+      (if spool_filepath is defined) and resent before newer events once the
+      broker is back, otherwise they are dropped and logged
+    """
+
+    def __init__(self, publish, prepare=None, max_size=10000, batch_size=100, max_retries=3,
+                 backoff=0.5, max_backoff=30, spool_filepath=None):
+        self.publish = publish
+        self.prepare = prepare
+        self.queue = Queue.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.spool_filepath = spool_filepath
+        self._spool_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except Queue.Full:
+            if self.spool_filepath:
+                self.spool([event])
+            else:
+                raise NotificationQueueFull(u"Notification queue is full ({0} events)".format(self.queue.maxsize))
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="event_bus_flusher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.flush(timeout=1)
+            except Exception as e:
+                # the flusher must outlive any failure, or no further event would be sent
+                logger.error(u"BUS NOTIFICATION: flush failed due to %r" % e)
+                self._stopped.wait(self.backoff)
+
+    def next_batch(self, timeout=None):
+        batch = []
+        try:
+            batch.append(self.queue.get(block=timeout is not None, timeout=timeout))
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except Queue.Empty:
+            pass
+        return batch
+
+    def flush(self, timeout=None):
+        """
+        Send the spooled events, if any, followed by the next batch of queued events.
+        Return True if all of them were sent.
+        """
+        spooled, spooled_lines = self.unspool()
+        batch = spooled + self.next_batch(timeout)
+        if not batch:
+            self.discard_spooled(spooled_lines)
+            return True
+        if self.prepare is not None:
+            try:
+                self.prepare(batch)
+            except Exception as e:
+                # sending the events as they are is better than not sending them
+                logger.error(u"BUS NOTIFICATION: could not prepare batch due to %r" % e)
+        sent = self.send(batch)
+        # the spooled events were either sent or spooled again by send
+        self.discard_spooled(spooled_lines)
+        return sent
+
+    def backoff_delay(self, attempt):
+        return min(self.max_backoff, self.backoff * (2 ** attempt))
+
+    def send(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                while batch:
+                    self.publish(batch[0])
+                    batch.pop(0)
+                return True
+            except Exception as e:
+                logger.error(e)
+                if attempt < self.max_retries:
+                    self._stopped.wait(self.backoff_delay(attempt))
+
+        if self.spool_filepath:
+            try:
+                self.spool(batch)
+                return False
+            except (IOError, OSError) as e:
+                logger.error(e)
+        for event in batch:
+            logger.error(u"BUS NOTIFICATION DROPPED\n%s" % event)
+        return False
+
+    def spool(self, events):
+        with self._spool_lock:
+            with open(self.spool_filepath, "a") as spool_file:
+                for event in events:
+                    spool_file.write(event.to_json() + "\n")
+
+    def spooled(self):
+        if not self.spool_filepath:
+            return 0
+        with self._spool_lock:
+            try:
+                with open(self.spool_filepath) as spool_file:
+                    return sum(1 for line in spool_file)
+            except IOError:
+                return 0
+
+    def unspool(self):
+        """
+        Return the spooled events and the number of lines read from the spool file.
+        The lines stay in the file until discard_spooled is called, after the events were sent.
+        """
+        if not self.spool_filepath:
+            return [], 0
+        with self._spool_lock:
+            try:
+                with open(self.spool_filepath) as spool_file:
+                    lines = spool_file.readlines()
+            except IOError:
+                return [], 0
+        events = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                events.append(SemanticEvent(**json.loads(line)))
+            except (ValueError, TypeError) as e:
+                logger.error(u"BUS NOTIFICATION DROPPED: invalid spooled event %r due to %r" % (line, e))
+        return events, len(lines)
+
+    def discard_spooled(self, count):
+        "Remove the first count lines of the spool file, keeping the events spooled after them"
+        if not count:
+            return
+        with self._spool_lock:
+            with open(self.spool_filepath) as spool_file:
+                lines = spool_file.readlines()[count:]
+            if lines:
+                with open(self.spool_filepath, "w") as spool_file:
+                    spool_file.writelines(lines)
+            else:
+                os.remove(self.spool_filepath)
+
+
+def on_invalidation(callback):
+    """
+    Register a callback to be called with each invalidation event (a dict
+    with the keys of SemanticEvent: instance, klass, graph and action).
+    """
+    invalidation_callbacks.append(callback)
+    return callback
+
+
+def invalidate_cache(event):
+    """
+    Purge cache entries affected by a SemanticEvent, no matter which node
+    (or external loader) originated it.
+    If the event refers to an instance, only the instance keys are purged.
+    Otherwise, the event is considered a class change.
+    """
+    instance_uri = event.get("instance")
+    class_uri = event.get("klass")
+    graph_uri = event.get("graph")
+
+    if instance_uri:
+        cache.purge_an_instance(instance_uri)
+    elif class_uri and graph_uri:
+        cache.purge_a_class(graph_uri, class_uri)
+
+    for callback in invalidation_callbacks:
+        callback(event)
+
+
+class CacheInvalidationListener(stomp.ConnectionListener):
+    """
+    STOMP listener which invalidates local and shared (Redis) cache entries
+    according to the SemanticEvents received from the event bus.
+    """
+
+    def on_message(self, headers, message):
+        try:
+            event = json.loads(message)
+        except ValueError:
+            logger.error(u"BUS INVALIDATION: could not decode message\n%s" % message)
+            return
+
+        if not isinstance(event, dict):
+            logger.error(u"BUS INVALIDATION: unexpected message\n%s" % message)
+            return
+
+        logger.info(u"BUS INVALIDATION\n%s" % event)
+        try:
+            invalidate_cache(event)
+        except Exception as e:
+            # the listener runs in the STOMP receiver thread, which must not die
+            logger.error(u"BUS INVALIDATION: failed due to %r" % e)
+
+    def on_error(self, headers, message):
+        logger.error(u"BUS INVALIDATION: broker error\n%s" % message)
+
+
+def subscribe():
+    """
+    Start the subscriber mode: consume SemanticEvents published to
+    settings.EVENT_BUS_INVALIDATION_TOPIC and invalidate the cache accordingly.
+    Failures are logged, but do not prevent Brainiak from starting,
+    as cache entries still expire by TTL.
+    """
+    global subscriber
+    destination = u"/topic/{0}".format(settings.EVENT_BUS_INVALIDATION_TOPIC)
+    try:
+        connection = stomp.Connection(host_and_ports=[(settings.EVENT_BUS_HOST, settings.EVENT_BUS_PORT)])
+        connection.set_listener("cache_invalidation", CacheInvalidationListener())
+        connection.start()
+        connection.connect()
+        connection.subscribe(destination=destination, ack="auto")
+    except (ConnectFailedException, NotConnectedException) as e:
+        logger.error(u"ActiveMQ at {0}:{1} subscription to {2} failed due to {3}.".format(
+            settings.EVENT_BUS_HOST, settings.EVENT_BUS_PORT, destination, e.__class__.__name__))
+        return None
+    subscriber = connection
+    return connection
@@ -33,6 +33,8 @@ This allows you to write code as if it were synchronous, and not worry about cal
 You also don't have to use any special patterns, such as writing everything as a generator.
 """
 
+import time
+
 import greenlet
 import tornado.httpclient
 from tornado.ioloop import IOLoop
@@ -43,6 +45,7 @@ from functools import wraps
 
 # singleton objects
 _io_loop = None
+_scheduler = None
 
 # Use cURL
 AsyncHTTPClient.configure("tornado.curl_httpclient.CurlAsyncHTTPClient")
@@ -56,6 +59,16 @@ def greenlet_set_ioloop(io_loop=None):
         _io_loop = io_loop
 
 
+def greenlet_set_scheduler(scheduler=None):
+    """
+    Set an object which decides when the methods wrapped by greenlet_asynchronous start:
+    scheduler.submit(handler, start) must call start() (now or later) or raise an HTTPError,
+    and scheduler.done(handler) is called when the method returns or raises.
+    """
+    global _scheduler
+    _scheduler = scheduler
+
+
 def greenlet_fetch(request, **kwargs):
     """
     Uses the tornado AsyncHTTPClient to execute a request, but blocks until the request
@@ -86,6 +99,62 @@ def greenlet_fetch(request, **kwargs):
     return response
 
 
+def greenlet_fetch_hedged(request, hedged_request, delay, **kwargs):
+    """
+    Like greenlet_fetch, but if the request is still pending after delay seconds,
+    hedged_request (e.g. the same request to another replica) is also sent.
+    The first successful response is returned (response.request tells which one it was);
+    if both requests fail, the error of the last one to finish is raised.
+
+    Only use it for idempotent requests, since both of them may be executed.
+    """
+    gr = greenlet.getcurrent()
+    assert gr.parent is not None, "greenlet_fetch_hedged() can only be called (possibly indirectly) from a RequestHandler method wrapped by the greenlet_asynchronous decorator."
+
+    io_loop = _io_loop or IOLoop.instance()
+    http_client = tornado.httpclient.AsyncHTTPClient(io_loop=_io_loop)
+    state = {"finished": False, "in_flight": 1, "timeout": None}
+
+    def callback(response):
+        state["in_flight"] -= 1
+        if state["finished"]:
+            return
+        if response.error and state["in_flight"] > 0:
+            # the other request may still succeed
+            return
+        state["finished"] = True
+        if state["timeout"] is not None:
+            io_loop.remove_timeout(state["timeout"])
+        gr.switch(response)
+
+    def hedge():
+        state["timeout"] = None
+        if not state["finished"]:
+            state["in_flight"] += 1
+            http_client.fetch(hedged_request, callback, **kwargs)
+
+    http_client.fetch(request, callback, **kwargs)
+    state["timeout"] = io_loop.add_timeout(time.time() + delay, hedge)
+
+    response = gr.parent.switch()
+    response.rethrow()
+    return response
+
+
+def greenlet_sleep(seconds):
+    """
+    Pause the current greenlet for the given seconds, while the IOLoop serves other requests.
+
+    Like greenlet_fetch, it must be called from a method wrapped by greenlet_asynchronous.
+    """
+    gr = greenlet.getcurrent()
+    assert gr.parent is not None, "greenlet_sleep() can only be called (possibly indirectly) from a RequestHandler method wrapped by the greenlet_asynchronous decorator."
+
+    io_loop = _io_loop or IOLoop.instance()
+    io_loop.add_timeout(time.time() + seconds, lambda: gr.switch())
+    gr.parent.switch()
+
+
 def greenlet_asynchronous(wrapped_method):
     """
     Decorator that allows you to make async calls as if they were synchronous, by pausing the callstack and resuming it later.
@@ -100,12 +169,29 @@ def greenlet_asynchronous(wrapped_method):
     @wraps(wrapped_method)
     def wrapper(self, *args, **kwargs):
 
+        scheduler = _scheduler
+
         def greenlet_base_func():
-            wrapped_method(self, *args, **kwargs)
-            self.finish()
+            try:
+                wrapped_method(self, *args, **kwargs)
+                self.finish()
+            finally:
+                if scheduler is not None:
+                    scheduler.done(self)
 
         gr = greenlet.greenlet(greenlet_base_func)
-        gr.switch()
+        # a profiled request (see brainiak.utils.profiling) is only profiled while its greenlet runs
+        request_profile = getattr(self, "request_profile", None)
+        if request_profile is not None:
+            request_profile.follow(gr)
+
+        def start():
+            gr.switch()
+
+        if scheduler is None:
+            start()
+        else:
+            scheduler.submit(self, start)
 
     return wrapper
 
@@ -20,8 +20,8 @@ from brainiak.collection.json_schema import schema as collection_schema
 from brainiak.context.get_context import list_classes
 from brainiak.context.json_schema import schema as context_schema
 from brainiak.event_bus import NotificationFailure, notify_bus
-from brainiak.greenlet_tornado import greenlet_asynchronous
-from brainiak.instance.create_instance import create_instance
+from brainiak.greenlet_tornado import greenlet_asynchronous, greenlet_sleep
+from brainiak.instance.create_instance import create_instance, build_instance_data
 from brainiak.instance.delete_instance import delete_instance
 from brainiak.instance.edit_instance import edit_instance, instance_exists
 from brainiak.instance.get_instance import get_instance
@@ -31,16 +31,17 @@ from brainiak.root.get_root import list_all_contexts
 from brainiak.root.json_schema import schema as root_schema
 from brainiak.schema import get_class as schema_resource
 from brainiak.schema.get_class import SchemaNotFound
+from brainiak.schema import ontology_index
 from brainiak.search.search import do_search
 from brainiak.suggest.json_schema import schema as suggest_schema
 from brainiak.search.json_schema import schema as search_schema
 from brainiak.stored_query.collection import get_stored_queries
-from brainiak.stored_query.crud import store_query, get_stored_query, delete_stored_query, validate_headers
-from brainiak.stored_query.execution import execute_query
+from brainiak.stored_query.crud import store_query, get_stored_query, get_cached_stored_query, delete_stored_query, validate_headers
+from brainiak.stored_query.execution import execute_query, memoize_query, stream_query, NDJSON_CONTENT_TYPE
 from brainiak.stored_query.json_schema import query_crud_schema
-from brainiak.suggest.json_schema import SUGGEST_PARAM_SCHEMA
-from brainiak.suggest.suggest import do_suggest
-from brainiak.utils import cache
+from brainiak.suggest.json_schema import SUGGEST_PARAM_SCHEMA, SUGGEST_BATCH_PARAM_SCHEMA
+from brainiak.suggest.suggest import do_suggest, do_suggest_batch
+from brainiak.utils import admission, cache, circuit_breaker, profiling
 from brainiak.utils.cache import memoize, build_instance_key
 from brainiak.utils.i18n import _
 from brainiak.utils.json import validate_json_schema, get_json_request_as_dict
@@ -56,6 +57,11 @@ logger = LazyObject(get_logger)
 
 custom_decorator.wrapper = greenlet_asynchronous
 
+# Status codes unknown to httplib, which tornado can't send without a reason
+EXTRA_HTTP_REASONS = {
+    429: "Too Many Requests"
+}
+
 
 class ListServiceParams(ParamDict):
     """Customize parameters for services with pagination"""
@@ -91,10 +97,41 @@ class BrainiakRequestHandler(CorsMixin, RequestHandler):
 
     def __init__(self, *args, **kwargs):
         super(BrainiakRequestHandler, self).__init__(*args, **kwargs)
+        # cProfile of this request, if it was asked with _profile=1 (see brainiak.utils.profiling)
+        self.request_profile = None
+        self._profile_checked = False
+
+    def prepare(self):
+        super(BrainiakRequestHandler, self).prepare()
+        # prepare is called again by write_error
+        if self._profile_checked:
+            return
+        self._profile_checked = True
+        if self.get_argument(profiling.PROFILE_ARGUMENT, "0") != "0":
+            profiling.check_authorization(self.request)
+            self.request_profile = profiling.RequestProfile()
+            self.request_profile.start()
+
+    def finish(self, chunk=None):
+        if self.request_profile is not None:
+            request_profile, self.request_profile = self.request_profile, None
+            request_profile.stop()
+            # the response is replaced by the profile, keeping its status code
+            status_code = self.get_status()
+            self.clear()
+            self.set_status(status_code)
+            self.set_header("Content-Type", "text/plain; charset=UTF-8")
+            chunk = request_profile.report()
+        return super(BrainiakRequestHandler, self).finish(chunk)
 
     def compute_etag(self):
         return None
 
+    def set_status(self, status_code, reason=None):
+        if reason is None and status_code in EXTRA_HTTP_REASONS:
+            reason = EXTRA_HTTP_REASONS[status_code]
+        super(BrainiakRequestHandler, self).set_status(status_code, reason)
+
     def get_cache_path(self):
         raise Exception(u"Method get_cache_path should be overwritten for caching & purging purposes")
 
@@ -180,6 +217,7 @@ class BrainiakRequestHandler(CorsMixin, RequestHandler):
         notify_bus(instance=self.query_params["instance_uri"],
                    klass=self.query_params["class_uri"],
                    graph=self.query_params["graph_uri"],
+                   triplestore_config=self.query_params.triplestore_config,
                    **kwargs)
 
     def write_error(self, status_code, **kwargs):
@@ -424,11 +462,11 @@ class CollectionHandler(BrainiakRequestHandler):
 
         self.query_params["instance_uri"] = instance_uri
         self.query_params["instance_id"] = instance_id
-        self.query_params["expand_object_properties"] = "1"
-
-        instance_data = get_instance(self.query_params)
 
         if settings.NOTIFY_BUS:
+            # The payload is built from the data just validated and inserted,
+            # instead of reading the instance back from the triplestore
+            instance_data = build_instance_data(self.query_params, instance_data, schema)
             self._notify_bus(action="POST", instance_data=instance_data)
 
         self.finalize(201)
@@ -721,6 +759,33 @@ class SuggestHandler(BrainiakRequestHandler):
             # A call to finalize() was removed from here! -- rodsenra 2013/04/25
 
 
+class SuggestBatchHandler(BrainiakRequestHandler):
+
+    @greenlet_asynchronous
+    def post(self):
+        valid_params = PAGING_PARAMS
+
+        with safe_params(valid_params):
+            self.query_params = ParamDict(self, **valid_params)
+
+            raw_body_params = get_json_request_as_dict(self.request.body)
+            body_params = normalize_all_uris_recursively(raw_body_params)
+            if '@context' in body_params:
+                del body_params['@context']
+
+            validate_json_schema(body_params, SUGGEST_BATCH_PARAM_SCHEMA)
+
+        response = do_suggest_batch(self.query_params, body_params)
+        if self.query_params['expand_uri'] == "0":
+            response = normalize_all_uris_recursively(response, mode=SHORTEN)
+        self.finalize(response)
+
+    def finalize(self, response):
+        self.set_header("Cache-control", "private")
+        self.set_header("max-age", "0")
+        self.write(response)
+
+
 class SearchJsonSchemaHandler(BrainiakRequestHandler):
 
     def get(self, context_name, class_name):
@@ -796,6 +861,43 @@ class CacheStatusHandler(BrainiakRequestHandler):
         self.write(response)
 
 
+class AdmissionStatusHandler(BrainiakRequestHandler):
+
+    def get(self):
+        response = admission.status()
+        self.write(response or _(u"There are no admission controlled requests"))
+
+
+class CircuitBreakerStatusHandler(BrainiakRequestHandler):
+
+    def get(self):
+        response = circuit_breaker.status()
+        self.write(response or _(u"There are no circuit breakers in use"))
+
+
+class OntologyIndexStatusHandler(BrainiakRequestHandler):
+
+    def get(self):
+        response = ontology_index.status()
+        self.write(response or _(u"There are no ontology indexes loaded"))
+
+
+class ProfileStatusHandler(BrainiakRequestHandler):
+
+    @greenlet_asynchronous
+    def get(self):
+        profiling.check_authorization(self.request)
+        try:
+            seconds = float(self.get_argument("seconds", settings.PROFILE_DEFAULT_SECONDS))
+        except ValueError:
+            seconds = -1
+        if not 0 < seconds <= settings.PROFILE_MAX_SECONDS:
+            raise HTTPError(400, log_message=_(u"Argument seconds must be a number greater than 0 and up to {0}.").format(settings.PROFILE_MAX_SECONDS))
+
+        self.set_header("Content-Type", "text/plain; charset=UTF-8")
+        self.write(profiling.sample(seconds, greenlet_sleep))
+
+
 class EventBusStatusHandler(BrainiakRequestHandler):
 
     def get(self):
@@ -885,7 +987,7 @@ class StoredQueryExecutionHandler(BrainiakRequestHandler):
 
     @greenlet_asynchronous
     def get(self, query_id):
-        stored_query = get_stored_query(query_id)
+        stored_query = get_cached_stored_query(query_id)
         if stored_query is None:
             not_found_message = _("The stored query with id '{0}' was not found during execution attempt").format(query_id)
             raise HTTPError(404,
@@ -895,11 +997,26 @@ class StoredQueryExecutionHandler(BrainiakRequestHandler):
 
         with safe_params(valid_params):
             self.query_params = QueryExecutionParamDict(self)
-            response = execute_query(query_id, stored_query, self.query_params)
+            if NDJSON_CONTENT_TYPE in self.request.headers.get("Accept", ""):
+                self.set_header("Content-Type", NDJSON_CONTENT_TYPE)
+                stream_query(query_id, stored_query, self.query_params, self.write_items)
+                return
+            if stored_query.get("cache_ttl"):
+                client_id = self.request.headers.get(CLIENT_ID_HEADER, "")
+                response = memoize_query(query_id, stored_query, self.query_params, client_id)
+                self.add_cache_headers(response['meta'])
+                response = response['body']
+            else:
+                response = execute_query(query_id, stored_query, self.query_params)
 
         # return result
         return self.finalize(response)
 
+    def write_items(self, items):
+        "Send items as newline delimited JSON, as soon as they are available"
+        self.write(u"".join(json.dumps(item) + u"\n" for item in items))
+        self.flush()
+
 
 class UnmatchedHandler(BrainiakRequestHandler):
 
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 from tornado.web import HTTPError
 from brainiak import triplestore
+from brainiak.instance.get_instance import build_meta_properties
 from brainiak.schema.get_class import get_cached_schema
+from brainiak.type_mapper import MAP_RDF_EXPANDED_TYPE_TO_PYTHON
 from brainiak.utils.i18n import _
 from brainiak.utils.sparql import create_explicit_triples, create_instance_uri, create_implicit_triples, \
     extract_instance_id, join_triples, join_prefixes, is_insert_response_successful, InstanceError,\
-    are_there_label_properties_in
+    are_there_label_properties_in, unpack_tuples, is_reserved_attribute, get_predicate_datatype
 
 
 def create_instance(query_params, instance_data, instance_uri=None):
@@ -53,3 +55,53 @@ INSERT DATA INTO <%(graph_uri)s>
 def query_create_instances(query_params):
     query = QUERY_INSERT_TRIPLES % query_params
     return triplestore.query_sparql(query, query_params.triplestore_config)
+
+
+def build_instance_data(query_params, instance_data, class_object):
+    """
+    Build the representation of the instance query_params["instance_uri"], just created, out of
+    the (already validated) data used to create its triples, without querying the triplestore.
+    The result has the same shape of get_instance with expand_object_properties=1
+    (meta properties and values converted to the types of the schema),
+    except that object properties are {"@id": uri}, without "title".
+    Their labels are resolved later on, in batch (see event_bus.resolve_object_titles).
+    """
+    properties = class_object["properties"]
+    items = {}
+    for (predicate_uri, object_value) in unpack_tuples(instance_data.copy()):
+        if is_reserved_attribute(predicate_uri) or predicate_uri not in properties:
+            continue
+
+        predicate_datatype = get_predicate_datatype(class_object, predicate_uri)
+        if predicate_datatype is None:  # ObjectProperty
+            if isinstance(object_value, dict):
+                object_value = object_value["@id"]
+            object_value = {"@id": object_value}
+        else:
+            object_value = _convert_to_python(object_value, predicate_datatype)
+
+        if properties[predicate_uri].get("type") == "array":
+            items.setdefault(predicate_uri, []).append(object_value)
+        elif predicate_uri in items:
+            previous_value = items[predicate_uri]
+            if not isinstance(previous_value, list):
+                items[predicate_uri] = [previous_value]
+            items[predicate_uri].append(object_value)
+        else:
+            items[predicate_uri] = object_value
+
+    include_meta_properties = query_params.get("meta_properties") is None or query_params.get("meta_properties") == "1"
+    if include_meta_properties:
+        instance = build_meta_properties(query_params, class_object)
+    else:
+        instance = {}
+    instance.update(items)
+    return instance
+
+
+def _convert_to_python(object_value, predicate_datatype):
+    "Convert a value, validated against predicate_datatype, as get_instance converts the values read from the triplestore"
+    python_type = MAP_RDF_EXPANDED_TYPE_TO_PYTHON.get(predicate_datatype)
+    if python_type is None or python_type == bool:
+        return object_value
+    return python_type(object_value)
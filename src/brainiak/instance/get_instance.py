@@ -120,19 +120,8 @@ def assemble_instance_json(query_params, query_result_dict, class_schema):
                              class_schema)
 
     if include_meta_properties:
-        class_url = build_class_url(query_params)
-        instance_uri = query_params['instance_uri']
-        instance_prefix, instance_id = split_prefix_and_id_from_uri(instance_uri)
-        query_params.resource_url = u"{0}/{1}".format(class_url, instance_id)
-        instance = {
-            "_base_url": query_params.base_url,
-            "_instance_prefix": instance_prefix,
-            "_resource_id": instance_id,
-            "@id": instance_uri,
-            "@type": query_params["class_uri"],
-            "_type_title": class_schema["title"]
-        }
-
+        instance = build_meta_properties(query_params, class_schema)
+        query_params.resource_url = u"{0}/{1}".format(build_class_url(query_params), instance["_resource_id"])
         check_and_clean_rdftype(instance['@type'], items)
     else:
         instance = {}
@@ -140,6 +129,20 @@ def assemble_instance_json(query_params, query_result_dict, class_schema):
     instance.update(items)
     return instance
 
+
+def build_meta_properties(query_params, class_schema):
+    "The meta properties (@id, @type, _base_url, ...) of the instance query_params['instance_uri']"
+    instance_uri = query_params['instance_uri']
+    instance_prefix, instance_id = split_prefix_and_id_from_uri(instance_uri)
+    return {
+        "_base_url": query_params.base_url,
+        "_instance_prefix": instance_prefix,
+        "_resource_id": instance_id,
+        "@id": instance_uri,
+        "@type": query_params["class_uri"],
+        "_type_title": class_schema["title"]
+    }
+
 # Note: we will filter (remove) blank nodes using Python code due to a problem
 # on filtering using isBlank when inference is enabled at Virtuoso. We've
 # reported the bug to the DB team and we expect soon an answer from OpenLink.
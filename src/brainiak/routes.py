@@ -10,7 +10,11 @@ ROUTES = [
     URLSpec(r'/_query/(?P<query_id>[\w\-]+)/_result/?', StoredQueryExecutionHandler),
     URLSpec(r'/_status/?$', StatusHandler),
     URLSpec(r'/_status/activemq/?', EventBusStatusHandler),
+    URLSpec(r'/_status/admission/?', AdmissionStatusHandler),
     URLSpec(r'/_status/cache/?', CacheStatusHandler),
+    URLSpec(r'/_status/circuit_breakers/?', CircuitBreakerStatusHandler),
+    URLSpec(r'/_status/ontology_index/?', OntologyIndexStatusHandler),
+    URLSpec(r'/_status/profile/?', ProfileStatusHandler),
     URLSpec(r'/_status/virtuoso/?', VirtuosoStatusHandler),
     URLSpec(r'/_version/?', VersionHandler),
 
@@ -22,6 +26,7 @@ ROUTES = [
 
     # TEXTUAL search
     URLSpec(r'/_suggest/?', SuggestHandler),
+    URLSpec(r'/_suggest/_batch/?', SuggestBatchHandler),
     URLSpec(r'/(?P<context_name>[\w\-]+)/(?P<class_name>[\w\-]+)/_search/?', SearchHandler),
     # resources that represents CONCEPTS
     URLSpec(r'/(?P<context_name>[\w\-]+)/(?P<class_name>[\w\-]+)/_schema/?', ClassHandler),
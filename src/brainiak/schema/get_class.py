@@ -3,6 +3,7 @@
 from brainiak import triplestore, settings
 from brainiak.log import get_logger
 from brainiak.prefixes import MemorizeContext
+from brainiak.schema.ontology_index import get_ontology_index
 from brainiak.suggest.json_schema import SUGGEST_PARAM_SCHEMA
 from brainiak.type_mapper import DATATYPE_PROPERTY, OBJECT_PROPERTY, _MAP_EXPAND_XSD_TO_JSON_TYPE
 from brainiak.utils.i18n import _
@@ -141,6 +142,9 @@ def build_class_schema_query(params):
 
 
 def query_class_schema(query_params):
+    index = get_ontology_index(query_params)
+    if index is not None:
+        return index.class_schema(query_params["class_uri"], query_params["graph_uri"], query_params.get("lang"))
     query = build_class_schema_query(query_params)
     return triplestore.query_sparql(query, query_params.triplestore_config)
 
@@ -230,11 +234,21 @@ WHERE {
 
 
 def query_cardinalities(query_params):
+    index = get_ontology_index(query_params)
+    if index is not None:
+        return index.cardinalities(index.superclasses(query_params["class_uri"]))
     query = QUERY_CARDINALITIES % query_params
     return triplestore.query_sparql(query, query_params.triplestore_config)
 
 
 def query_predicates(query_params, superclasses):
+    index = get_ontology_index(query_params)
+    if index is not None:
+        response = index.predicates(superclasses, query_params.get("lang"))
+        if not response['results']['bindings']:
+            response = index.predicates(superclasses)
+        return response
+
     response = _query_predicate_with_lang(query_params, superclasses)
 
     if not response['results']['bindings']:
@@ -340,6 +354,9 @@ def _query_predicate_without_lang(query_params, superclasses):
 def query_superclasses(query_params):
     uniqueness_property = settings.ANNOTATION_PROPERTY_HAS_UNIQUE_VALUE
     query_params.set_aux_param('uniqueness_property', uniqueness_property)
+    index = get_ontology_index(query_params)
+    if index is not None:
+        return index.superclasses(query_params["class_uri"])
     result_dict = _query_superclasses(query_params)
     superclasses = filter_values(result_dict, "class")
     return superclasses
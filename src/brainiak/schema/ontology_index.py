@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import deque
+
+from brainiak import settings, triplestore
+from brainiak.log import get_logger
+from brainiak.type_mapper import DATATYPE_PROPERTY, OBJECT_PROPERTY
+from brainiak.utils.config_parser import get_triplestore_config
+from brainiak.utils.resources import LazyObject
+
+
+__doc__ = """
+In-memory index of the ontology of a triplestore (classes, class hierarchy,
+predicates by domain, ranges, restrictions, labels by language and
+subproperties), built from a few bulk SPARQL queries.
+
+Once an index is loaded for a triplestore.ini section (settings.ONTOLOGY_INDEX),
+schema assembly and suggest range resolution answer from it, without
+per-request Virtuoso reasoning (OPTION TRANSITIVE).  The answers have the same
+shape as the SPARQL results they replace, so the code which consumes them
+is the same with or without the index.
+
+The index is rebuilt in background by refresh(), e.g. when an ontology change
+event is received from the event bus.
+"""
+
+logger = LazyObject(get_logger)
+
+OWL_CLASS = u"http://www.w3.org/2002/07/owl#Class"
+RDF_PROPERTY = u"http://www.w3.org/1999/02/22-rdf-syntax-ns#Property"
+ONTOLOGY_TYPES = (OWL_CLASS, OBJECT_PROPERTY, DATATYPE_PROPERTY, RDF_PROPERTY)
+
+
+QUERY_INDEX_CLASSES = u"""
+SELECT DISTINCT ?class ?graph
+WHERE {
+    GRAPH ?graph { ?class a owl:Class }
+    FILTER (!isBlank(?class))
+}
+"""
+
+QUERY_INDEX_CLASS_LABELS = u"""
+SELECT DISTINCT ?class ?graph ?label ?comment
+WHERE {
+    ?class a owl:Class .
+    GRAPH ?graph { ?class rdfs:label ?label } .
+    OPTIONAL { GRAPH ?graph { ?class rdfs:comment ?comment } }
+    FILTER (!isBlank(?class))
+}
+"""
+
+QUERY_INDEX_SUBCLASSES = u"""
+SELECT DISTINCT ?class ?super_class
+WHERE {
+    ?class rdfs:subClassOf ?super_class .
+    FILTER (!isBlank(?class) && !isBlank(?super_class))
+}
+"""
+
+QUERY_INDEX_RESTRICTIONS = u"""
+SELECT DISTINCT ?class ?predicate ?min ?max ?range
+WHERE {
+    ?class rdfs:subClassOf ?s .
+    ?s owl:onProperty ?predicate .
+    FILTER (!isBlank(?class))
+    OPTIONAL { ?s owl:minQualifiedCardinality ?min } .
+    OPTIONAL { ?s owl:maxQualifiedCardinality ?max } .
+    OPTIONAL {
+        { ?s owl:onClass ?range }
+        UNION { ?s owl:onDataRange ?range }
+        UNION { ?s owl:allValuesFrom ?range }
+    }
+}
+"""
+
+QUERY_INDEX_PROPERTIES = u"""
+SELECT DISTINCT ?predicate ?type ?title ?predicate_comment ?super_property ?unique_value
+WHERE {
+    ?predicate rdf:type ?type .
+    FILTER (?type in (owl:ObjectProperty, owl:DatatypeProperty)) .
+    ?predicate rdfs:label ?title .
+    OPTIONAL { ?predicate rdfs:comment ?predicate_comment }
+    OPTIONAL { ?predicate rdfs:subPropertyOf ?super_property } .
+    OPTIONAL { ?predicate %(uniqueness_property)s ?unique_value } .
+}
+"""
+
+QUERY_INDEX_DOMAINS = u"""
+SELECT DISTINCT ?predicate ?predicate_graph ?domain_class
+WHERE {
+    {
+      GRAPH ?predicate_graph { ?predicate rdfs:domain ?domain_class } .
+    } UNION {
+      GRAPH ?predicate_graph { ?predicate rdfs:domain ?blank } .
+      ?blank a owl:Class .
+      ?blank owl:unionOf ?enumeration .
+      OPTIONAL { ?enumeration rdf:rest ?list_node OPTION(TRANSITIVE, t_min (0)) } .
+      OPTIONAL { ?list_node rdf:first ?domain_class } .
+    }
+    FILTER (BOUND(?domain_class) && !isBlank(?domain_class))
+}
+"""
+
+QUERY_INDEX_RANGES = u"""
+SELECT DISTINCT ?predicate ?range
+WHERE {
+    { ?predicate rdfs:range ?range . }
+    UNION {
+      ?predicate rdfs:range ?blank .
+      ?blank a owl:Class .
+      ?blank owl:unionOf ?enumeration .
+      OPTIONAL { ?enumeration rdf:rest ?list_node OPTION(TRANSITIVE, t_min (0)) } .
+      OPTIONAL { ?list_node rdf:first ?range } .
+    }
+    FILTER (BOUND(?range) && !isBlank(?range))
+}
+"""
+
+
+def lang_matches(tag, lang):
+    "Python version of SPARQL langMatches(tag, lang), for simple language ranges"
+    tag = (tag or u"").lower()
+    lang = (lang or u"").lower()
+    if not lang:
+        return not tag
+    if lang == u"*":
+        return bool(tag)
+    return tag == lang or tag.startswith(lang + u"-")
+
+
+def matches_lang_or_untagged(tag, lang):
+    "Equivalent to QUERY_FILTER_LABEL_BY_LANGUAGE (no filtering if lang is not given)"
+    if not lang:
+        return True
+    return lang_matches(tag, lang) or lang_matches(tag, u"")
+
+
+def _value(row, key):
+    item = row.get(key)
+    return item["value"] if item else None
+
+
+def _lang(row, key):
+    item = row.get(key)
+    return item.get("xml:lang", u"") if item else u""
+
+
+def _uri(value):
+    return {u"type": u"uri", u"value": value}
+
+
+def _literal(value, lang=u""):
+    literal = {u"type": u"literal", u"value": value}
+    if lang:
+        literal[u"xml:lang"] = lang
+    return literal
+
+
+def _result(bindings):
+    "Wrap bindings in the format of a SPARQL JSON result"
+    return {u"results": {u"bindings": bindings}}
+
+
+class OntologyIndex(object):
+
+    def __init__(self):
+        self.class_graphs = {}  # class -> set of graphs declaring it as owl:Class
+        self.class_labels = {}  # class -> [(label, lang, graph, comment, comment_lang)]
+        self.parents = {}
+        self.children = {}
+        self.restrictions = {}  # class -> [row of QUERY_INDEX_RESTRICTIONS]
+        self.properties = {}  # predicate -> {"types", "titles", "comments", "super_properties", "unique_values"}
+        self.domains = {}  # class -> [(predicate, predicate_graph)]
+        self.ranges = {}  # predicate -> [range]
+        self.subproperties = {}  # property -> set of direct subproperties
+        self._ancestors = {}
+        self._descendants = {}
+        self.loaded_at = None
+
+    @classmethod
+    def load(cls, triplestore_config):
+        "Build an index from bulk (synchronous) queries to the given triplestore"
+        def query(sparql):
+            # the rows (see SparqlResultSet.__iter__) share their strings, and so do the index entries built from them
+            return triplestore.query_sparql(sparql, triplestore_config, async=False, result_set=True,
+                                            result_format=settings.ONTOLOGY_INDEX_RESULT_FORMAT)
+
+        index = cls()
+        uniqueness_property = settings.ANNOTATION_PROPERTY_HAS_UNIQUE_VALUE
+        index.add_classes(query(QUERY_INDEX_CLASSES))
+        index.add_class_labels(query(QUERY_INDEX_CLASS_LABELS))
+        index.add_subclasses(query(QUERY_INDEX_SUBCLASSES))
+        index.add_restrictions(query(QUERY_INDEX_RESTRICTIONS))
+        index.add_properties(query(QUERY_INDEX_PROPERTIES % {"uniqueness_property": uniqueness_property}))
+        index.add_domains(query(QUERY_INDEX_DOMAINS))
+        index.add_ranges(query(QUERY_INDEX_RANGES))
+        index.compute_closures()
+        return index
+
+    # Loading
+
+    def add_classes(self, bindings):
+        for row in bindings:
+            self.class_graphs.setdefault(_value(row, "class"), set()).add(_value(row, "graph"))
+
+    def add_class_labels(self, bindings):
+        for row in bindings:
+            label = (_value(row, "label"), _lang(row, "label"), _value(row, "graph"),
+                     _value(row, "comment"), _lang(row, "comment"))
+            self.class_labels.setdefault(_value(row, "class"), []).append(label)
+
+    def add_subclasses(self, bindings):
+        for row in bindings:
+            klass, super_class = _value(row, "class"), _value(row, "super_class")
+            self.parents.setdefault(klass, set()).add(super_class)
+            self.children.setdefault(super_class, set()).add(klass)
+
+    def add_restrictions(self, bindings):
+        for row in bindings:
+            restriction = dict((key, value) for key, value in row.items() if key != "class")
+            self.restrictions.setdefault(_value(row, "class"), []).append(restriction)
+
+    def add_properties(self, bindings):
+        for row in bindings:
+            predicate = self.properties.setdefault(_value(row, "predicate"), {
+                "types": set(), "titles": set(), "comments": set(), "super_properties": set(), "unique_values": set()
+            })
+            predicate["types"].add(_value(row, "type"))
+            predicate["titles"].add((_value(row, "title"), _lang(row, "title")))
+            if "predicate_comment" in row:
+                predicate["comments"].add((_value(row, "predicate_comment"), _lang(row, "predicate_comment")))
+            if "super_property" in row:
+                super_property = _value(row, "super_property")
+                predicate["super_properties"].add(super_property)
+                self.subproperties.setdefault(super_property, set()).add(_value(row, "predicate"))
+            if "unique_value" in row:
+                predicate["unique_values"].add(_value(row, "unique_value"))
+
+    def add_domains(self, bindings):
+        for row in bindings:
+            domain = (_value(row, "predicate"), _value(row, "predicate_graph"))
+            self.domains.setdefault(_value(row, "domain_class"), []).append(domain)
+
+    def add_ranges(self, bindings):
+        for row in bindings:
+            self.ranges.setdefault(_value(row, "predicate"), []).append(_value(row, "range"))
+
+    def compute_closures(self):
+        classes = set(self.class_graphs) | set(self.parents) | set(self.children)
+        self._ancestors = dict((klass, self._walk(klass, self.parents)) for klass in classes)
+        self._descendants = dict((klass, self._walk(klass, self.children)) for klass in classes)
+        self.loaded_at = time.time()
+
+    @staticmethod
+    def _walk(start, edges):
+        "Breadth-first transitive closure (including start), closest nodes first"
+        visited = [start]
+        seen = set(visited)
+        queue = deque(visited)
+        while queue:
+            node = queue.popleft()
+            for neighbour in sorted(edges.get(node, ())):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    visited.append(neighbour)
+                    queue.append(neighbour)
+        return visited
+
+    # Lookups
+
+    def has_class(self, class_uri, graph_uri=None):
+        graphs = self.class_graphs.get(class_uri, ())
+        return graph_uri in graphs if graph_uri is not None else bool(graphs)
+
+    def ancestors(self, class_uri):
+        return self._ancestors.get(class_uri, [class_uri])
+
+    def descendants(self, class_uri):
+        return self._descendants.get(class_uri, [class_uri])
+
+    def subproperties_closure(self, property_uri):
+        "All (direct or indirect) subproperties of property_uri, excluding itself"
+        return self._walk(property_uri, self.subproperties)[1:]
+
+    def predicates_by_domain(self, class_uri):
+        return [predicate for predicate, graph in self.domains.get(class_uri, [])]
+
+    # Replacements for SPARQL queries (same result format)
+
+    def class_schema(self, class_uri, graph_uri, lang=None):
+        "Equivalent of get_class.QUERY_CLASS_SCHEMA"
+        bindings = []
+        if not self.has_class(class_uri, graph_uri):
+            return _result(bindings)
+        for label, label_lang, graph, comment, comment_lang in self.class_labels.get(class_uri, []):
+            if graph != graph_uri or not matches_lang_or_untagged(label_lang, lang):
+                continue
+            row = {u"title": _literal(label, label_lang)}
+            if comment is not None and matches_lang_or_untagged(comment_lang, lang):
+                row[u"comment"] = _literal(comment, comment_lang)
+            if row not in bindings:
+                bindings.append(row)
+        return _result(bindings)
+
+    def superclasses(self, class_uri):
+        "Equivalent of get_class.QUERY_SUPERCLASS: the class and its ancestors which are owl:Class"
+        return [klass for klass in self.ancestors(class_uri) if self.has_class(klass)]
+
+    def cardinalities(self, classes):
+        "Equivalent of get_class.QUERY_CARDINALITIES (without enumerated values), for a class and its superclasses"
+        bindings = []
+        for klass in classes:
+            for restriction in self.restrictions.get(klass, []):
+                if restriction not in bindings:
+                    bindings.append(restriction)
+        return _result(bindings)
+
+    def predicates(self, classes, lang=None):
+        """
+        Equivalent of get_class.QUERY_PREDICATE_WITH_LANG (or QUERY_PREDICATE_WITHOUT_LANG, if lang is not given):
+        predicates whose domain is one of the given classes.
+        """
+        bindings = []
+        for domain_class in classes:
+            for predicate_uri, predicate_graph in self.domains.get(domain_class, []):
+                predicate = self.properties.get(predicate_uri)
+                if predicate is None:
+                    continue
+                for row in self._predicate_rows(predicate_uri, predicate, predicate_graph, domain_class, lang):
+                    bindings.append(row)
+        return _result(bindings)
+
+    def _predicate_rows(self, predicate_uri, predicate, predicate_graph, domain_class, lang):
+        titles = [title for title in predicate["titles"] if matches_lang_or_untagged(title[1], lang)]
+        comments = [comment for comment in predicate["comments"] if matches_lang_or_untagged(comment[1], lang)] or [None]
+        super_properties = sorted(predicate["super_properties"]) or [None]
+        unique_values = sorted(predicate["unique_values"]) or [None]
+        types = [type_ for type_ in predicate["types"] if type_ in (OBJECT_PROPERTY, DATATYPE_PROPERTY)]
+
+        for range_uri in self.ranges.get(predicate_uri, []):
+            range_labels = self._range_labels(range_uri, lang) or [(None, None, None)]
+            for type_ in types:
+                for title, title_lang in sorted(titles):
+                    for comment in comments:
+                        for super_property in super_properties:
+                            for unique_value in unique_values:
+                                for range_label, range_label_lang, range_graph in range_labels:
+                                    row = {
+                                        u"predicate": _uri(predicate_uri),
+                                        u"predicate_graph": _uri(predicate_graph),
+                                        u"domain_class": _uri(domain_class),
+                                        u"range": _uri(range_uri),
+                                        u"type": _uri(type_),
+                                        u"title": _literal(title, title_lang)
+                                    }
+                                    if comment is not None:
+                                        row[u"predicate_comment"] = _literal(*comment)
+                                    if super_property is not None:
+                                        row[u"super_property"] = _uri(super_property)
+                                    if unique_value is not None:
+                                        row[u"unique_value"] = _literal(unique_value)
+                                    if range_graph is not None:
+                                        row[u"range_graph"] = _uri(range_graph)
+                                        row[u"range_label"] = _literal(range_label, range_label_lang)
+                                    yield row
+
+    def _range_labels(self, class_uri, lang):
+        labels = []
+        for label, label_lang, graph, comment, comment_lang in self.class_labels.get(class_uri, []):
+            if matches_lang_or_untagged(label_lang, lang) and (label, label_lang, graph) not in labels:
+                labels.append((label, label_lang, graph))
+        return labels
+
+    def predicate_ranges(self, target, lang=None):
+        """
+        Equivalent of suggest.QUERY_PREDICATE_RANGES: the classes (and their subclasses)
+        in the range of the target predicate, with their labels and graphs.
+        """
+        bindings = []
+        for root_range in self.ranges.get(target, []):
+            for range_uri in self.descendants(root_range):
+                labels = [(label, label_lang) for label, label_lang, graph, comment, comment_lang
+                          in self.class_labels.get(range_uri, [])
+                          if matches_lang_or_untagged(label_lang, lang)]
+                for range_graph in sorted(self.class_graphs.get(range_uri, ())):
+                    for label, label_lang in sorted(set(labels)):
+                        row = {
+                            u"range": _uri(range_uri),
+                            u"range_label": _literal(label, label_lang),
+                            u"range_graph": _uri(range_graph)
+                        }
+                        if row not in bindings:
+                            bindings.append(row)
+        return _result(bindings)
+
+    def status(self):
+        return u"Ontology index | {0} classes | {1} predicates | loaded at {2}".format(
+            len(self.class_graphs), len(self.properties),
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.loaded_at)) if self.loaded_at else u"-")
+
+
+# Indexes are shared across requests, by triplestore.ini section (identified by app_name)
+_indexes = {}
+_refreshing = set()
+_lock = threading.Lock()
+reload_callbacks = []
+
+
+def on_reload(callback):
+    "Register a callback to be called (without arguments) whenever an index is (re)loaded"
+    reload_callbacks.append(callback)
+    return callback
+
+
+def index_key(triplestore_config):
+    return triplestore_config.get("app_name") or triplestore_config.get("url")
+
+
+def get_ontology_index(query_params):
+    "Return the loaded index of the request's triplestore section, or None"
+    if not settings.ONTOLOGY_INDEX:
+        return None
+    triplestore_config = getattr(query_params, "triplestore_config", None)
+    if not triplestore_config:
+        return None
+    return _indexes.get(index_key(triplestore_config))
+
+
+def load(section="default"):
+    "Build (synchronously) the index of a triplestore.ini section"
+    triplestore_config = get_triplestore_config(section)
+    time_i = time.time()
+    index = OntologyIndex.load(triplestore_config)
+    _indexes[index_key(triplestore_config)] = index
+    logger.info(u"Ontology index of section {0} loaded in {1:.2f}s: {2}".format(
+        section, time.time() - time_i, index.status()))
+    for callback in reload_callbacks:
+        callback()
+    return index
+
+
+def initialize():
+    "Load the indexes of settings.ONTOLOGY_INDEX_SECTIONS; on failure, SPARQL queries are used instead"
+    for section in settings.ONTOLOGY_INDEX_SECTIONS:
+        try:
+            load(section)
+        except Exception as e:
+            logger.error(u"Could not load the ontology index of section {0}: {1}".format(section, e))
+
+
+def refresh(section="default"):
+    "Rebuild the index of a section in a background thread, keeping the current one meanwhile"
+    with _lock:
+        if section in _refreshing:
+            return False
+        _refreshing.add(section)
+
+    def run():
+        try:
+            load(section)
+        except Exception as e:
+            logger.error(u"Could not refresh the ontology index of section {0}: {1}".format(section, e))
+        finally:
+            with _lock:
+                _refreshing.discard(section)
+
+    thread = threading.Thread(target=run, name="ontology_index_refresh")
+    thread.daemon = True
+    thread.start()
+    return True
+
+
+def is_ontology_change(event):
+    """
+    Return True if an event bus event (dict with instance, klass, graph and action)
+    changed classes or properties: the instance is a class or a property,
+    or the event refers to a class as a whole.
+    """
+    instance_uri = event.get("instance")
+    class_uri = event.get("klass")
+    if class_uri in ONTOLOGY_TYPES or (class_uri and not instance_uri):
+        return True
+    return any(index.has_class(instance_uri) or instance_uri in index.properties for index in _indexes.values())
+
+
+def on_ontology_change(event):
+    "Event bus invalidation callback: refresh the indexes when the ontology changes"
+    if settings.ONTOLOGY_INDEX and is_ontology_change(event):
+        for section in settings.ONTOLOGY_INDEX_SECTIONS:
+            refresh(section)
+
+
+def status():
+    return u"<br>".join(u"{0}: {1}".format(key, _indexes[key].status()) for key in sorted(_indexes))
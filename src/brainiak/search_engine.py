@@ -1,13 +1,17 @@
 import json
+import re
 import time
 import urllib
 
 from tornado.httpclient import HTTPRequest
 from tornado.httpclient import HTTPError as ClientHTTPError
 
-from brainiak import log
-from brainiak.greenlet_tornado import greenlet_fetch
+from brainiak import log, settings
+from brainiak.greenlet_tornado import greenlet_fetch, greenlet_fetch_hedged
 from brainiak.settings import ELASTICSEARCH_ENDPOINT
+from brainiak.utils.cache import LRUCache
+from brainiak.utils.circuit_breaker import get_circuit_breaker, is_backend_failure
+from brainiak.utils.recording import ELASTICSEARCH, get_recorder
 
 
 REQUEST_LOG_FORMAT = u"ELASTICSEARCH - {method} - {url} - {status} - [time: {time_diff}] - REQUEST BODY - {request_body} - RESPONSE BODY - {response_body}"
@@ -27,12 +31,47 @@ def run_search(body, indexes=None):
         "body": unicode(json.dumps(body))
     }
 
-    response = _get_response(request_params)
+    # searches are idempotent: a duplicate may be answered by another copy of the shards
+    response = _get_response(request_params, hedge=True)
 
     if response is not None:
         return json.loads(response.body)
 
 
+def run_msearch(searches):
+    """
+    Send several searches in one _msearch request.
+    searches is a list of (body, indexes) pairs, where indexes may be None,
+    and the responses are returned in the same order.
+    Failed searches come as dicts with an "error" key.
+    """
+    if not searches:
+        return []
+
+    lines = []
+    for body, indexes in searches:
+        lines.append({"index": ",".join(indexes) if indexes is not None else "semantica.*"})
+        lines.append(body)
+
+    request_params = {
+        "url": unicode("http://{0}/_msearch".format(ELASTICSEARCH_ENDPOINT)),
+        "method": "POST",
+        "headers": {u"Content-Type": u"application/x-www-form-urlencoded"},
+        "body": _build_bulk_body(lines)
+    }
+
+    response = _get_response(request_params, hedge=True)
+    if response is None:
+        # the whole request was answered with 404, so each search failed
+        return [{"error": u"HTTP 404: Not Found"} for search in searches]
+    return json.loads(response.body)["responses"]
+
+
+def _build_bulk_body(lines):
+    # newline delimited JSON, which must also end with a newline
+    return u"".join(unicode(json.dumps(line)) + u"\n" for line in lines)
+
+
 def _build_elasticsearch_request_url(indexes):
     request_url = "http://" + ELASTICSEARCH_ENDPOINT + "/"
 
@@ -46,8 +85,30 @@ def _build_elasticsearch_request_url(indexes):
     return request_url
 
 
-def run_analyze(target):
-    request_url = _build_elasticsearch_analyze_url(target)
+analyze_cache = LRUCache(settings.ES_ANALYZE_CACHE_SIZE)
+
+MAX_TOKEN_LENGTH = 255
+WORD_REGEX = re.compile(r"\w+", re.UNICODE)
+
+
+def run_analyze(target, analyzer=None):
+    """
+    Tokenize target the way Elasticsearch does when indexing.
+    Results are kept in analyze_cache, as autocomplete prefixes repeat a lot.
+    """
+    if settings.ES_ANALYZE_LOCALLY and analyzer in (None, "default", "standard"):
+        return local_analyze(target)
+
+    key = (analyzer, target)
+    response = analyze_cache.get(key)
+    if response is None:
+        response = _remote_analyze(target, analyzer)
+        analyze_cache.set(key, response)
+    return response
+
+
+def _remote_analyze(target, analyzer=None):
+    request_url = _build_elasticsearch_analyze_url(target, analyzer)
     request_params = {
         "url": unicode(request_url),
         "method": "GET",
@@ -58,13 +119,44 @@ def run_analyze(target):
     return json.loads(response.body)
 
 
-def _build_elasticsearch_analyze_url(target):
+def local_analyze(target, stopwords=None):
+    """
+    Emulate the standard analyzer: split on word boundaries, lowercase
+    and drop stopwords. The response has the same shape as /_analyze.
+    """
+    if stopwords is None:
+        stopwords = settings.ES_ANALYZE_STOPWORDS
+    if not isinstance(target, unicode):
+        target = target.decode("utf-8")
+
+    tokens = []
+    position = 0
+    for match in WORD_REGEX.finditer(target):
+        token = match.group().lower()
+        if len(token) > MAX_TOKEN_LENGTH:
+            continue
+        position += 1
+        if token in stopwords:
+            continue
+        tokens.append({
+            u"token": token,
+            u"start_offset": match.start(),
+            u"end_offset": match.end(),
+            u"type": u"<NUM>" if token.isdigit() else u"<ALPHANUM>",
+            u"position": position
+        })
+    return {u"tokens": tokens}
+
+
+def _build_elasticsearch_analyze_url(target, analyzer=None):
     if isinstance(target, unicode):
         target = urllib.quote_plus(target.encode('utf-8'))
     else:
         target = urllib.quote_plus(target)
 
     request_url = "http://{0}/_analyze?text={1}".format(ELASTICSEARCH_ENDPOINT, target)
+    if analyzer is not None:
+        request_url += "&analyzer={0}".format(urllib.quote_plus(analyzer))
     return request_url
 
 
@@ -98,6 +190,66 @@ def get_instance(index_name, type_name, instance_id):
         return json.loads(response.body)
 
 
+def get_instances(index_name, type_name, instance_ids):
+    """
+    Fetch several documents in one _mget request.
+    Return a dict from id to document, or to None if it was not found.
+    """
+    if not instance_ids:
+        return {}
+
+    request_url = "http://{0}/{1}/{2}/_mget".format(
+        ELASTICSEARCH_ENDPOINT, index_name, type_name)
+
+    request_params = {
+        "url": unicode(request_url),
+        "method": "POST",
+        "body": unicode(json.dumps({"ids": list(instance_ids)}))
+    }
+
+    response = _get_response(request_params)
+
+    instances = dict.fromkeys(instance_ids)
+    if response is not None:
+        for doc in json.loads(response.body)["docs"]:
+            # ES 0.90 uses "exists", later versions "found"
+            if doc.get("found", doc.get("exists")):
+                instances[doc["_id"]] = doc
+    return instances
+
+
+def run_bulk(actions):
+    """
+    Apply several writes in one _bulk request.
+    actions is a list of (action, index_name, type_name, instance_id, entry)
+    tuples, where action is "index" or "delete" (whose entry is ignored).
+    Raise ElasticSearchException if any of them failed.
+    """
+    if not actions:
+        return []
+
+    lines = []
+    for action, index_name, type_name, instance_id, entry in actions:
+        lines.append({action: {"_index": index_name, "_type": type_name, "_id": instance_id}})
+        if action != "delete":
+            lines.append(entry)
+
+    request_params = {
+        "url": unicode("http://{0}/_bulk".format(ELASTICSEARCH_ENDPOINT)),
+        "method": "POST",
+        "body": _build_bulk_body(lines)
+    }
+
+    response = _get_response(request_params)
+    if response is None:
+        raise ElasticSearchException(u"Bulk request failed: HTTP 404: Not Found")
+    items = json.loads(response.body)["items"]
+    errors = [item.values()[0]["error"] for item in items if "error" in item.values()[0]]
+    if errors:
+        raise ElasticSearchException(u"Bulk request failed: {0}".format(u"; ".join(unicode(error) for error in errors)))
+    return items
+
+
 def get_all_instances_from_type(index_name, type_name, offset, per_page):
     request_url = "http://{0}/{1}/{2}/_search".format(
         ELASTICSEARCH_ENDPOINT, index_name, type_name)
@@ -137,12 +289,24 @@ def delete_instance(index_name, type_name, instance_id):
     return response is not None
 
 
-def _do_request(request_params):
+def _do_request(request_params, hedge_url=None, hedge_delay=None):
     request = HTTPRequest(**request_params)
+    recorder = get_recorder()
     time_i = time.time()
-    response = greenlet_fetch(request)
+    try:
+        if hedge_url is not None:
+            hedged_request = HTTPRequest(**dict(request_params, url=hedge_url))
+            response = greenlet_fetch_hedged(request, hedged_request, hedge_delay)
+        else:
+            response = greenlet_fetch(request)
+    except ClientHTTPError as e:
+        if recorder is not None:
+            _record(recorder, request_params, e.code, getattr(e.response, "body", None), time_i, time.time() - time_i)
+        raise
     time_f = time.time()
     time_diff = time_f - time_i
+    if recorder is not None:
+        _record(recorder, request_params, response.code, response.body, time_i, time_diff)
 
     request_params["status"] = response.code
     request_params["time_diff"] = time_diff
@@ -155,14 +319,46 @@ def _do_request(request_params):
     return response
 
 
-def _get_response(request_params):
+def _record(recorder, request_params, status, response_body, time_i, time_diff):
+    recorded_request = {
+        "method": request_params["method"],
+        "url": request_params["url"],
+        "body": request_params.get("body", u"")
+    }
+    recorder.record(ELASTICSEARCH, recorded_request, status, response_body or "", time_i, time_diff)
+
+
+def _hedge_url(url):
+    """
+    The url of the same request to settings.ELASTICSEARCH_HEDGE_ENDPOINT, or None if there is
+    no other endpoint configured (a duplicate sent to the same node would only add to its load).
+    """
+    endpoint = settings.ELASTICSEARCH_HEDGE_ENDPOINT
+    prefix = u"http://{0}/".format(ELASTICSEARCH_ENDPOINT)
+    if not endpoint or endpoint == ELASTICSEARCH_ENDPOINT or not url.startswith(prefix):
+        return None
+    return u"http://{0}/{1}".format(endpoint, url[len(prefix):])
+
+
+def _get_response(request_params, hedge=False):
+    breaker = get_circuit_breaker(u"elasticsearch")
+    breaker.before_call()
     try:
-        response = _do_request(request_params)
-        return response
-    except ClientHTTPError as e:
+        hedge_url = _hedge_url(request_params["url"]) if hedge else None
+        hedge_delay = breaker.hedge_delay() if hedge_url is not None else None
+        if hedge_delay is None:
+            hedge_url = None
+        response = _do_request(request_params, hedge_url, hedge_delay)
+    except Exception as e:
+        # whatever the error, the breaker must be told, or a half-open circuit would wait for this call forever
+        if is_backend_failure(e):
+            breaker.on_failure()
+        else:
+            breaker.on_success()
+        if isinstance(e, ClientHTTPError) and e.code == 404:
+            return None
         # Throwing explictly tornado.httpclient.ClientHTTPError so that
         #   handler can detect it as a backend service error
-        if e.code == 404:
-            return None
-        else:
-            raise e
+        raise
+    breaker.on_success(request_params.get("time_diff"))
+    return response
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import signal
 import sys
 import traceback
 
@@ -8,11 +9,16 @@ from tornado.options import define, options, parse_command_line
 from tornado.web import Application as TornadoApplication
 
 from brainiak import log, settings
-from brainiak.greenlet_tornado import greenlet_set_ioloop
+from brainiak.greenlet_tornado import greenlet_set_ioloop, greenlet_set_scheduler
 from brainiak.routes import ROUTES
 from brainiak import event_bus
+from brainiak.schema import ontology_index
+from brainiak.suggest import suggest
+from brainiak.utils.admission import admission_controller
 from brainiak.utils.cache import flushall
-from brainiak.utils.sparql import load_label_properties
+from brainiak.utils.config_parser import reload_triplestore_configs
+from brainiak.utils.i18n import load_translations, reload_translations
+from brainiak.utils.sparql import load_label_properties, on_ontology_change
 
 
 server = None
@@ -25,8 +31,18 @@ class Application(TornadoApplication):
     def __init__(self, debug=False):
         try:
             log.initialize()
+            load_translations()
             event_bus.initialize()
+            if settings.EVENT_BUS_SUBSCRIBE:
+                event_bus.subscribe()
             load_label_properties()
+            event_bus.on_invalidation(on_ontology_change)
+            event_bus.on_invalidation(suggest.on_ontology_change)
+            if settings.ONTOLOGY_INDEX:
+                ontology_index.initialize()
+                event_bus.on_invalidation(ontology_index.on_ontology_change)
+            if settings.ADMISSION_CONTROL:
+                greenlet_set_scheduler(admission_controller)
             # Wipeout all entries to avoid inconsistencies due to algorithmic changes between releases
 
             flushall()
@@ -39,6 +55,17 @@ class Application(TornadoApplication):
 application = Application()
 
 
+def reload_configuration():
+    "Parse triplestore.ini and read the translation catalogs again, without restarting"
+    try:
+        reload_triplestore_configs()
+        reload_translations()
+    except Exception as e:
+        log.logger.error(u"Failed to reload configuration: {0}".format(e))
+    else:
+        log.logger.info(u"Configuration reloaded")
+
+
 def main():  # pragma: no cover
     define("port", default=settings.SERVER_PORT, help="Run app on the given port", type=int)
     parse_command_line()
@@ -47,6 +74,7 @@ def main():  # pragma: no cover
     server.listen(options.port)
     io_loop = IOLoop.instance()
     greenlet_set_ioloop(io_loop)
+    signal.signal(signal.SIGHUP, lambda signum, frame: io_loop.add_callback_from_signal(reload_configuration))
     io_loop.start()
 
 
@@ -7,8 +7,48 @@ REDIS_ENDPOINT = 'localhost'
 REDIS_PORT = 6379
 
 TRIPLESTORE_CONFIG_FILEPATH = 'src/brainiak/triplestore.ini'
+# triplestore.ini is parsed once; it is parsed again if modified (checked at most every this many seconds) or on SIGHUP
+TRIPLESTORE_CONFIG_CHECK_INTERVAL = 5
+# Read (SELECT/ASK) queries routing among the "replicas" of a triplestore.ini section
+TRIPLESTORE_REPLICA_STRATEGY = "least_outstanding"  # or "ewma"
+TRIPLESTORE_REPLICA_EWMA_WEIGHT = 0.3
+TRIPLESTORE_REPLICA_MAX_FAILURES = 3
+TRIPLESTORE_REPLICA_EJECTION_SECONDS = 30
+# Results parsed while they arrive (e.g. of stored queries) are aborted beyond these sizes, 0: unlimited
+SPARQL_RESULT_MAX_ROWS = 0
+SPARQL_RESULT_MAX_BYTES = 0
+# Format of bulk SPARQL results (see triplestore.RESULT_FORMATS): "tsv" is smaller and faster to parse than "json",
+# if the triplestore writes SPARQL 1.1 TSV; stored queries may also use "csv", which only keeps values
+STORED_QUERY_RESULT_FORMAT = "json"
+ONTOLOGY_INDEX_RESULT_FORMAT = "json"
+
+# Backends (triplestore per client-id, Elasticsearch) fail fast after consecutive failures
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+CIRCUIT_BREAKER_RECOVERY_SECONDS = 10  # before a probe request is let through
+# Duplicate idempotent reads (SELECT/ASK, _search) still pending after the backend's p95 latency
+HEDGED_REQUESTS = False
+HEDGE_MIN_DELAY = 0.05  # seconds
+
+# Per client-id admission control (see brainiak.utils.admission), overridable in triplestore.ini sections
+ADMISSION_CONTROL = False
+ADMISSION_MAX_CONCURRENT = 0  # 0: unlimited
+ADMISSION_RATE_LIMIT = 0  # requests per second, 0: unlimited
+ADMISSION_RATE_BURST = 0  # defaults to ADMISSION_RATE_LIMIT
+ADMISSION_MAX_QUEUE = 100
+
+# In-memory ontology index (see brainiak.schema.ontology_index), loaded at startup for these triplestore.ini sections
+ONTOLOGY_INDEX = False
+ONTOLOGY_INDEX_SECTIONS = ["default"]
+# rdfs:subPropertyOf closures (e.g. of rdfs:label), reloaded in bulk after this many seconds
+SUBPROPERTIES_CACHE_TTL = 3600
+# Ranges of /_suggest target predicates, shared across requests
+SUGGEST_RANGES_CACHE_TTL = 3600
+# Stored query definitions used by /_query/<id>/_result; writes through other nodes are seen after this many seconds
+STORED_QUERY_CACHE_TTL = 60
 
 ELASTICSEARCH_ENDPOINT = 'localhost:9200'
+# Another node serving the same indexes, where hedged searches are sent (see HEDGED_REQUESTS); None: no hedging
+ELASTICSEARCH_HEDGE_ENDPOINT = None
 
 DEFAULT_LANG = "pt"
 
@@ -25,6 +65,17 @@ URI_PREFIX = "http://semantica.globo.com/"
 EVENT_BUS_HOST = 'localhost'
 EVENT_BUS_PORT = 61613
 NOTIFY_BUS = True
+# Subscriber mode: consume events from other nodes to invalidate the cache
+EVENT_BUS_SUBSCRIBE = False
+EVENT_BUS_INVALIDATION_TOPIC = "brainiak.invalidation"
+# Asynchronous notification: events are queued and sent by a background thread
+EVENT_BUS_ASYNC = False
+EVENT_BUS_QUEUE_MAX_SIZE = 10000
+EVENT_BUS_BATCH_SIZE = 100
+EVENT_BUS_MAX_RETRIES = 3
+EVENT_BUS_RETRY_BACKOFF = 0.5  # seconds, doubled at each retry
+EVENT_BUS_RETRY_MAX_BACKOFF = 30
+EVENT_BUS_SPOOL_FILEPATH = None  # e.g. '/tmp/brainiak_event_bus.spool'
 
 DEFAULT_RULESET_URI = "http://semantica.globo.com/ruleset"
 
@@ -38,5 +89,22 @@ ENABLE_CACHE = False
 REDIS_PASSWORD = None
 LOG_LEVEL = logging.WARN
 ES_ANALYZER = "default"
+# Results of /_analyze, kept in an in-process LRU keyed by (analyzer, text); 0 disables it
+ES_ANALYZE_CACHE_SIZE = 10000
+# Tokenize locally, emulating the standard analyzer, instead of calling /_analyze for the default analyzer
+ES_ANALYZE_LOCALLY = False
+ES_ANALYZE_STOPWORDS = []
+
+# Append each triplestore and Elasticsearch call (request, response and latency) to this file,
+# to be replayed by benchmarks/replay_server.py (see brainiak.utils.recording)
+BACKEND_RECORDING_FILEPATH = None  # e.g. '/tmp/brainiak_backend.jsonl'
+
+# /_status/profile and the _profile=1 argument need this token in the X-Brainiak-Profile-Token header
+# (see brainiak.utils.profiling); profiling is disabled while it is None
+PROFILE_TOKEN = None
+PROFILE_SAMPLING_INTERVAL = 0.005  # seconds of CPU time between the stack samples of /_status/profile
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_MAX_SECONDS = 60
+PROFILE_STATS_LIMIT = 100  # functions listed in the response of _profile=1
 
 ANNOTATION_PROPERTY_HAS_UNIQUE_VALUE = "base:tem_valor_unico"
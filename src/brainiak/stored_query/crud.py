@@ -1,8 +1,11 @@
 import re
+import time
 
+from brainiak import settings
 from brainiak.search_engine import save_instance, get_instance,\
     delete_instance
 from brainiak.stored_query import ES_INDEX_NAME, ES_TYPE_NAME
+from brainiak.utils import cache
 
 from brainiak.utils.params import CLIENT_ID_HEADER
 
@@ -19,6 +22,9 @@ MISSING_CLIENT_ID_MESSAGE = u"Missing X-Brainiak-Client-Id in headers"
 QUERY_CREATED_BY_OTHER_CLIENT_ID_MESSAGE = u"You tried to modify or delete a stored query created by other client_id"
 QUERY_NOT_FOUND_WHEN_DELETING = u"The query with id '{0}' was not found and, therefore, not deleted."
 
+# query_id: (stored_query, time it was fetched)
+_stored_queries_cache = {}
+
 
 def store_query(entry, query_id, client_id):
     if not _allowed_query(entry["sparql_template"]):
@@ -28,9 +34,11 @@ def store_query(entry, query_id, client_id):
     if stored_query:
         validate_client_id(client_id, stored_query)
         save_instance(entry, ES_INDEX_NAME, ES_TYPE_NAME, query_id)
+        forget_stored_query(query_id)
         return 200
     else:
         save_instance(entry, ES_INDEX_NAME, ES_TYPE_NAME, query_id)
+        forget_stored_query(query_id)
         return 201
 
 
@@ -48,6 +56,27 @@ def get_stored_query(query_id):
         return stored_query
 
 
+def get_cached_stored_query(query_id):
+    """
+    Same as get_stored_query, kept locally for settings.STORED_QUERY_CACHE_TTL seconds
+    or until the query is modified or deleted through this node.
+    """
+    cached = _stored_queries_cache.get(query_id)
+    if cached is not None and time.time() - cached[1] <= settings.STORED_QUERY_CACHE_TTL:
+        return cached[0]
+
+    stored_query = get_stored_query(query_id)
+    if stored_query is not None:
+        _stored_queries_cache[query_id] = (stored_query, time.time())
+    return stored_query
+
+
+def forget_stored_query(query_id):
+    _stored_queries_cache.pop(query_id, None)
+    if settings.ENABLE_CACHE:
+        cache.purge_query_results(query_id)
+
+
 def stored_query_exists(query_id):
     return get_stored_query(query_id) is not None
 
@@ -57,6 +86,7 @@ def delete_stored_query(query_id, client_id):
     if stored_query:
         validate_client_id(client_id, stored_query)
         delete_instance(ES_INDEX_NAME, ES_TYPE_NAME, query_id)
+        forget_stored_query(query_id)
     else:
         raise HTTPError(404, log_message=QUERY_NOT_FOUND_WHEN_DELETING.format(query_id))
 
@@ -1,46 +1,216 @@
+import base64
 import copy
+import re
 
 from tornado.web import HTTPError
 
-from brainiak import log
-from brainiak.triplestore import query_sparql
+from brainiak import log, settings
+from brainiak.triplestore import query_sparql_bindings
+from brainiak.utils.cache import LRUCache, build_key_for_query_result, memoize
 from brainiak.utils.i18n import _
 from brainiak.utils.sparql import compress_keys_and_values
 
 
 QUERY_EXECUTION_LOG_FORMAT = "Stored Query [{query_id}] - app {app_name} - {url} - {query}"
 
+STREAM_FAILURE_LOG_FORMAT = u"Stored Query [{query_id}] - streaming failed after {rows} rows: {error}"
+
 NO_RESULTS_MESSAGE_FORMAT = "The query returned no results. SPARQL endpoint [{0}]\n  Query: {1}"
 
+TEMPLATE_PARAM_PATTERN = re.compile(r"%(?:%|\((?P<name>[^)]*)\))")
+TEMPLATES_CACHE_SIZE = 1000
+
+PAGINATION_ARGUMENTS = ("page", "per_page", "cursor")
+
+# PREFIX, BASE and Virtuoso's DEFINE declarations, which must precede the outer SELECT
+PROLOGUE_PATTERN = re.compile(r'^\s*(?:(?:PREFIX\s+[\w\-.]*:\s*<[^>]*>|BASE\s+<[^>]*>|DEFINE\s+\S+\s+(?:"[^"]*"|<[^>]*>|\S+))\s*)*',
+                              re.IGNORECASE | re.UNICODE)
+DATASET_PATTERN = re.compile(r'\bFROM\s+(?:NAMED\s+)?<[^>]*>', re.IGNORECASE | re.UNICODE)
+SELECT_PATTERN = re.compile(r'SELECT\b', re.IGNORECASE)
+LIMIT_OFFSET_PATTERN = re.compile(r'\b(?:LIMIT|OFFSET)\s+\d+\s*$', re.IGNORECASE)
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+INVALID_CURSOR_MESSAGE = u"Invalid cursor '{0}'"
+NOT_A_SELECT_MESSAGE = u"Only SELECT stored queries can be paginated"
+
 
 def execute_query(query_id, stored_query, querystring_params):
     query = get_query(stored_query, querystring_params)
+    page = get_page(querystring_params)
+    if page is not None:
+        offset, per_page = page
+        # one more row tells if there is a next page
+        query = paginate_query(query, offset, per_page + 1)
+
+    _log_execution(query_id, query, querystring_params)
+
+    # bindings are compressed as they are parsed, so the whole response is never held at once
+    items = []
+    query_sparql_bindings(query, querystring_params.triplestore_config,
+                          lambda bindings: items.extend(compress_keys_and_values({"results": {"bindings": bindings}})),
+                          result_format=settings.STORED_QUERY_RESULT_FORMAT)
+
+    response = {"items": items}
+    if page is not None:
+        offset, per_page = page
+        response["per_page"] = per_page
+        if len(items) > per_page:
+            del items[per_page:]
+            response["next_cursor"] = encode_cursor(offset + per_page)
+
+    if not items:
+        # TODO explain in which instance of Virtuoso the query was executed?
+        response["warning"] = NO_RESULTS_MESSAGE_FORMAT.format(querystring_params.triplestore_config["url"], query)
+    return response
+
+
+def stream_query(query_id, stored_query, querystring_params, write_items):
+    """
+    Execute the stored query, calling write_items with each group of compressed items
+    parsed while the triplestore response is still arriving, instead of building the whole result.
+
+    The last item written is {"end": true, "rows": <number of rows>} if the whole result was sent.
+    If the query fails once items were written (e.g. the result exceeds its limits or the triplestore
+    fails), the response status can not tell it anymore: the last item is {"error": <message>} instead.
+    """
+    query = get_query(stored_query, querystring_params)
+    page = get_page(querystring_params)
+    if page is not None:
+        query = paginate_query(query, *page)
+
+    _log_execution(query_id, query, querystring_params)
+
+    written = []
 
+    def write_bindings(bindings):
+        written.append(len(bindings))
+        write_items(compress_keys_and_values({"results": {"bindings": bindings}}))
+
+    try:
+        rows = query_sparql_bindings(query, querystring_params.triplestore_config, write_bindings,
+                                     result_format=settings.STORED_QUERY_RESULT_FORMAT)
+    except Exception as e:
+        if not written:
+            raise
+        message = getattr(e, "log_message", None) or unicode(e)
+        log.logger.error(STREAM_FAILURE_LOG_FORMAT.format(query_id=query_id, rows=sum(written), error=message))
+        write_items([{"error": message}])
+        return
+    write_items([{"end": True, "rows": rows}])
+
+
+def _log_execution(query_id, query, querystring_params):
     # TODO extract_method?
     request_dict = copy.copy(querystring_params.triplestore_config)
     request_dict.update({"query_id": query_id})
     request_dict.update({"query": query})
     log.logger.info(QUERY_EXECUTION_LOG_FORMAT.format(**request_dict))
 
-    result_dict = query_sparql(query,
-                               querystring_params.triplestore_config)
-    items = compress_keys_and_values(result_dict)
-    if not items:
-        message = NO_RESULTS_MESSAGE_FORMAT.format(querystring_params.triplestore_config["url"], query)
-        return {
-            "items": [],
-            # TODO explain in which instance of Virtuoso the query was executed?
-            "warning": message}
-    return {"items": items}
+
+def get_page(querystring_params):
+    """
+    Return (offset, per_page) if page, per_page or cursor were given in the querystring, None otherwise.
+    A cursor (the next_cursor of a previous page) takes precedence over page.
+    """
+    if not any(key in querystring_params.arguments for key in PAGINATION_ARGUMENTS):
+        return None
+
+    per_page = int(querystring_params.get("per_page", settings.DEFAULT_PER_PAGE))
+    if "cursor" in querystring_params.arguments:
+        offset = decode_cursor(querystring_params.arguments["cursor"])
+    else:
+        # ParamDict pages start at 0
+        offset = int(querystring_params.get("page", settings.DEFAULT_PAGE)) * per_page
+    return offset, per_page
+
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode("offset:{0}".format(offset))
+
+
+def decode_cursor(cursor):
+    try:
+        name, offset = base64.urlsafe_b64decode(str(cursor)).split(":")
+        offset = int(offset)
+    except (TypeError, ValueError):
+        raise HTTPError(400, log_message=INVALID_CURSOR_MESSAGE.format(cursor))
+    if name != "offset" or offset < 0:
+        raise HTTPError(400, log_message=INVALID_CURSOR_MESSAGE.format(cursor))
+    return offset
+
+
+def paginate_query(query, offset, limit):
+    """
+    Restrict the rows of a SELECT query. LIMIT and OFFSET are appended to it, so ORDER BY keeps applying,
+    unless the query has its own LIMIT or OFFSET: then it is wrapped in an outer SELECT,
+    with its prologue and FROM clauses moved outside.
+    """
+    prologue = PROLOGUE_PATTERN.match(query).group()
+    body = query[len(prologue):]
+    if not SELECT_PATTERN.match(body):
+        raise HTTPError(400, log_message=NOT_A_SELECT_MESSAGE)
+
+    modifiers = u"LIMIT {0} OFFSET {1}".format(limit, offset)
+    if not LIMIT_OFFSET_PATTERN.search(body):
+        return u"{0}\n{1}".format(query.rstrip(), modifiers)
+
+    where_start = body.find("{")
+    head = body[:where_start] if where_start >= 0 else body
+    dataset = DATASET_PATTERN.findall(head)
+    inner = DATASET_PATTERN.sub(u"", head) + body[len(head):]
+    return u"{0}SELECT * {1} WHERE {{\n{{ {2} }}\n}}\n{3}".format(prologue, u" ".join(dataset), inner.strip(), modifiers)
+
+
+class QueryTemplate(object):
+    """
+    A sparql_template parsed once, knowing which querystring params it requires.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self.required_params = []
+        for match in TEMPLATE_PARAM_PATTERN.finditer(template):
+            name = match.group("name")
+            if name is not None and name not in self.required_params:
+                self.required_params.append(name)
+
+    def render(self, arguments):
+        for name in self.required_params:
+            if name not in arguments:
+                missing_key_message = _("Missing key '{0}' in querystring.\n  Template: {1}").format(name, self.template)
+                raise HTTPError(400, log_message=missing_key_message)
+        return self.template % arguments
+
+
+_templates = LRUCache(TEMPLATES_CACHE_SIZE)
+
+
+def get_query_template(template):
+    query_template = _templates.get(template)
+    if query_template is None:
+        query_template = QueryTemplate(template)
+        _templates.set(template, query_template)
+    return query_template
+
+
+def memoize_query(query_id, stored_query, querystring_params, client_id):
+    """
+    Execute the stored query, keeping its result in the cache for stored_query["cache_ttl"] seconds.
+    Return the result with its cache metadata, as memoize does.
+    """
+    key = build_key_for_query_result(query_id,
+                                     stored_query["sparql_template"],
+                                     querystring_params.arguments,
+                                     client_id)
+    return memoize(querystring_params,
+                   lambda: execute_query(query_id, stored_query, querystring_params),
+                   key=key,
+                   ttl=stored_query["cache_ttl"])
 
 
 def get_query(stored_query, querystring_params):
     # template existence is validated in stored query creation/modification
-    template = stored_query["sparql_template"]
-    try:
-        # .arguments is a dict with decoded querystring params
-        query = template % querystring_params.arguments
-        return query
-    except KeyError as key_error:
-        missing_key_message = _("Missing key '{0}' in querystring.\n  Template: {1}").format(key_error.args[0], template)
-        raise HTTPError(400, log_message=missing_key_message)
+    query_template = get_query_template(stored_query["sparql_template"])
+    # .arguments is a dict with decoded querystring params
+    return query_template.render(querystring_params.arguments)
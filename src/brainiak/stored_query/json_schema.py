@@ -5,7 +5,8 @@ query_crud_schema = {
     "properties": {
         "sparql_template": {"type": "string"},
         "description": {"type": "string"},
-        "response_fields": {"type": "array"}
+        "response_fields": {"type": "array"},
+        "cache_ttl": {"type": "integer", "minimum": 1}
     }
 }
 
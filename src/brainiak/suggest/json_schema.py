@@ -86,6 +86,24 @@ SUGGEST_PARAM_SCHEMA = {
     }
 }
 
+SUGGEST_BATCH_MAX_SIZE = 50
+
+SUGGEST_BATCH_PARAM_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "description": "Describe the parameters given to the batch suggest primitive",
+    "type": "object",
+    "required": ["suggests"],
+    "additionalProperties": False,
+    "properties": {
+        "suggests": {
+            "type": "array",
+            "minItems": 1,
+            "maxItems": SUGGEST_BATCH_MAX_SIZE,
+            "items": dict((key, value) for key, value in SUGGEST_PARAM_SCHEMA.items() if key != "$schema")
+        }
+    }
+}
+
 
 def schema():
     base = {
@@ -151,6 +169,12 @@ def schema():
                 "rel": "suggest",
                 "schema": SUGGEST_PARAM_SCHEMA
             },
+            {
+                "href": "/_suggest/_batch",
+                "method": "POST",
+                "rel": "suggest_batch",
+                "schema": SUGGEST_BATCH_PARAM_SCHEMA
+            },
             {
                 "href": "/{context_id}/{collection_id}",
                 "method": "GET",
@@ -1,3 +1,4 @@
+import time
 from copy import copy
 
 from tornado.web import HTTPError
@@ -5,7 +6,9 @@ from tornado.web import HTTPError
 from brainiak import settings, triplestore
 from brainiak.prefixes import uri_to_slug, safe_slug_to_prefix, shorten_uri
 from brainiak.schema.get_class import get_cached_schema
-from brainiak.search_engine import run_search, run_analyze
+from brainiak.schema import ontology_index
+from brainiak.schema.ontology_index import get_ontology_index, index_key, is_ontology_change
+from brainiak.search_engine import run_search, run_msearch, run_analyze
 from brainiak.utils import resources
 from brainiak.utils.i18n import _
 from brainiak.utils.sparql import is_result_empty, add_language_support, \
@@ -18,12 +21,83 @@ def raise_no_results(msg):
 
 def do_suggest(query_params, suggest_params):
     search_params = suggest_params["search"]
-    range_result = _get_predicate_ranges(query_params, search_params)
-    if is_result_empty(range_result):
-        message = _(u"Either the predicate {0} does not exists or it does not have any rdfs:range defined in the triplestore")
-        message = message.format(search_params["target"])
+    range_result = _get_target_ranges(query_params, search_params)
+
+    analyze_response = run_analyze(search_params["pattern"])
+    tokens = analyze_response["tokens"]
+
+    request_body, indexes = _build_suggest_search(query_params, suggest_params, range_result, tokens)
+    elasticsearch_result = run_search(request_body, indexes=indexes)
+    if elasticsearch_result is None:
+        message = _(u"There were no search results.")
         raise_no_results(message)
 
+    return _build_suggest_response(query_params, suggest_params, elasticsearch_result)
+
+
+def do_suggest_batch(query_params, batch_params):
+    """
+    Several suggests answered at once: the ranges of all targets are resolved in one pass,
+    patterns analyzed once each and all searches sent in one _msearch.
+    A suggest that can not be answered gets {"error": message} instead of its result.
+    """
+    suggests = batch_params["suggests"]
+    results = [None] * len(suggests)
+
+    targets = set(suggest_params["search"]["target"] for suggest_params in suggests)
+    ranges_by_target = get_cached_predicates_ranges(query_params, targets)
+
+    tokens_by_pattern = {}
+    for pattern in set(suggest_params["search"]["pattern"] for suggest_params in suggests):
+        tokens_by_pattern[pattern] = run_analyze(pattern)["tokens"]
+
+    searches = []
+    positions = []
+    for position, suggest_params in enumerate(suggests):
+        search_params = suggest_params["search"]
+        range_result = ranges_by_target[search_params["target"]]
+        if is_result_empty(range_result):
+            results[position] = {"error": _no_ranges_message(search_params["target"])}
+            continue
+        try:
+            request_body, indexes = _build_suggest_search(
+                query_params, suggest_params, range_result, tokens_by_pattern[search_params["pattern"]])
+        except HTTPError as e:
+            results[position] = {"error": e.log_message}
+            continue
+        searches.append((request_body, indexes))
+        positions.append(position)
+
+    for position, elasticsearch_result in zip(positions, run_msearch(searches)):
+        if "error" in elasticsearch_result:
+            results[position] = {"error": _search_error_message(elasticsearch_result["error"])}
+        else:
+            results[position] = _build_suggest_response(query_params, suggests[position], elasticsearch_result)
+
+    return {"items": results}
+
+
+def _search_error_message(error):
+    "Elasticsearch reports the error of a search as a string or, in newer versions, as an object"
+    if isinstance(error, dict):
+        error = error.get("reason") or error.get("type")
+    return unicode(error) if error else _(u"There were no search results.")
+
+
+def _no_ranges_message(target):
+    message = _(u"Either the predicate {0} does not exists or it does not have any rdfs:range defined in the triplestore")
+    return message.format(target)
+
+
+def _get_target_ranges(query_params, search_params):
+    range_result = get_cached_predicate_ranges(query_params, search_params)
+    if is_result_empty(range_result):
+        raise_no_results(_no_ranges_message(search_params["target"]))
+    return range_result
+
+
+def _build_suggest_search(query_params, suggest_params, range_result, tokens):
+    search_params = suggest_params["search"]
     classes = _validate_class_restriction(query_params, range_result)
     graphs = _validate_graph_restriction(query_params, range_result)
     indexes = ["semantica." + uri_to_slug(graph) for graph in graphs]
@@ -44,9 +118,6 @@ def do_suggest(query_params, suggest_params):
     #     search_fields,
     #     response_fields)
 
-    analyze_response = run_analyze(search_params["pattern"])
-    tokens = analyze_response["tokens"]
-
     request_body = _build_body_query_compatible_with_uatu_and_es_19_in_envs(
         query_params,
         tokens,
@@ -65,12 +136,11 @@ def do_suggest(query_params, suggest_params):
     # [1] http://www.elasticsearch.org/guide/en/elasticsearch/reference/current/search-request-sort.html
     assert not "sort" in request_body  # Read comments above
 
-    elasticsearch_result = run_search(request_body, indexes=indexes)
-    if elasticsearch_result is None:
-        message = _(u"There were no search results.")
-        raise_no_results(message)
+    return request_body, indexes
 
-    class_fields = response_params.get("class_fields", [])
+
+def _build_suggest_response(query_params, suggest_params, elasticsearch_result):
+    class_fields = suggest_params.get("response", {}).get("class_fields", [])
 
     total_items = elasticsearch_result["hits"]["total"]
     if total_items:
@@ -129,10 +199,128 @@ def _build_predicate_ranges_query(query_params, search_params):
 
 
 def _get_predicate_ranges(query_params, search_params):
+    index = get_ontology_index(query_params)
+    if index is not None:
+        return index.predicate_ranges(search_params["target"], query_params.get("lang"))
     query = _build_predicate_ranges_query(query_params, search_params)
     return triplestore.query_sparql(query, query_params.triplestore_config)
 
 
+QUERY_PREDICATES_RANGES = u"""
+SELECT DISTINCT ?target ?range ?range_label ?range_graph {
+  {
+    ?target rdfs:range ?root_range .
+    FILTER (?target IN (%(targets)s))
+    FILTER (!isBlank(?root_range))
+    ?range rdfs:subClassOf ?root_range OPTION(TRANSITIVE, t_min (0)) .
+    ?range rdfs:label ?range_label .
+    GRAPH ?range_graph { ?range a owl:Class } .
+  }
+  UNION {
+    ?target rdfs:range ?blank .
+    FILTER (?target IN (%(targets)s))
+    ?blank a owl:Class .
+    ?blank owl:unionOf ?enumeration .
+    OPTIONAL {
+        ?enumeration rdf:rest ?list_node OPTION(TRANSITIVE, t_min (0)) .
+        ?list_node rdf:first ?root_range .
+        FILTER (!isBlank(?root_range)) .
+        ?range rdfs:subClassOf ?root_range OPTION(TRANSITIVE, t_min (0)) .
+        ?range rdfs:label ?range_label .
+        GRAPH ?range_graph { ?range a owl:Class } .
+    }
+  }
+  %(lang_filter_range_label)s
+}
+"""
+
+
+def _build_predicates_ranges_query(query_params, targets):
+    params = add_language_support(query_params, "range_label")[0]
+    params["targets"] = u", ".join(u"<{0}>".format(target) for target in sorted(targets))
+    return QUERY_PREDICATES_RANGES % params
+
+
+def _get_predicates_ranges(query_params, targets):
+    """
+    Same as _get_predicate_ranges for several targets at once, in a single query:
+    {target: range_result}, with an empty result for the targets without ranges.
+    """
+    index = get_ontology_index(query_params)
+    if index is not None:
+        lang = query_params.get("lang")
+        return dict((target, index.predicate_ranges(target, lang)) for target in targets)
+
+    query = _build_predicates_ranges_query(query_params, targets)
+    query_result = triplestore.query_sparql(query, query_params.triplestore_config)
+    bindings_by_target = dict((target, []) for target in targets)
+    for binding in query_result["results"]["bindings"]:
+        row = dict(binding)
+        target = row.pop("target")["value"]
+        bindings_by_target[target].append(row)
+    return dict((target, {u"results": {u"bindings": bindings}})
+                for target, bindings in bindings_by_target.items())
+
+
+# Ranges of target predicates, by (target, lang, triplestore section): {key: (range_result, stored_at)}
+_predicate_ranges_cache = {}
+
+
+def get_cached_predicate_ranges(query_params, search_params):
+    """
+    Same as _get_predicate_ranges, but shared across requests for settings.SUGGEST_RANGES_CACHE_TTL seconds,
+    or until the ontology changes. The classes, graphs and indexes of each request are derived from it.
+    """
+    triplestore_config = getattr(query_params, "triplestore_config", None) or {}
+    key = (search_params["target"], query_params.get("lang"), index_key(triplestore_config))
+    cached = _predicate_ranges_cache.get(key)
+    if cached is not None and time.time() - cached[1] <= settings.SUGGEST_RANGES_CACHE_TTL:
+        return cached[0]
+
+    range_result = _get_predicate_ranges(query_params, search_params)
+    if not is_result_empty(range_result):
+        _predicate_ranges_cache[key] = (range_result, time.time())
+    return range_result
+
+
+def get_cached_predicates_ranges(query_params, targets):
+    """
+    Same as get_cached_predicate_ranges for several targets: {target: range_result}.
+    The targets not cached are resolved together, by _get_predicates_ranges.
+    """
+    triplestore_config = getattr(query_params, "triplestore_config", None) or {}
+    lang = query_params.get("lang")
+    now = time.time()
+    ranges_by_target = {}
+    missing = []
+    for target in targets:
+        cached = _predicate_ranges_cache.get((target, lang, index_key(triplestore_config)))
+        if cached is not None and now - cached[1] <= settings.SUGGEST_RANGES_CACHE_TTL:
+            ranges_by_target[target] = cached[0]
+        else:
+            missing.append(target)
+
+    if missing:
+        for target, range_result in _get_predicates_ranges(query_params, missing).items():
+            if not is_result_empty(range_result):
+                _predicate_ranges_cache[(target, lang, index_key(triplestore_config))] = (range_result, time.time())
+            ranges_by_target[target] = range_result
+    return ranges_by_target
+
+
+def clear_predicate_ranges_cache():
+    _predicate_ranges_cache.clear()
+
+
+def on_ontology_change(event):
+    "Event bus invalidation callback: forget the cached ranges if the ontology changed"
+    if is_ontology_change(event):
+        clear_predicate_ranges_cache()
+
+
+ontology_index.on_reload(clear_predicate_ranges_cache)
+
+
 QUERY_SUBPROPERTIES = u"""
 DEFINE input:inference <%(ruleset)s>
 SELECT DISTINCT ?property WHERE {
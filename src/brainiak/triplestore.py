@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 import copy
+from collections import OrderedDict
+from io import BytesIO
+import re
 import time
 import urllib
 
@@ -8,13 +11,16 @@ from requests.auth import HTTPDigestAuth
 import ujson as json
 from simplejson import JSONDecodeError
 
-from tornado.httpclient import HTTPRequest
+from tornado.httpclient import HTTPRequest, HTTPResponse
 from tornado.httpclient import HTTPError as ClientHTTPError
 from tornado.web import HTTPError
 
-from brainiak import log
-from brainiak.greenlet_tornado import greenlet_fetch
-from brainiak.utils.config_parser import parse_section
+from brainiak import log, settings
+from brainiak.greenlet_tornado import greenlet_fetch, greenlet_fetch_hedged
+from brainiak.utils.circuit_breaker import get_circuit_breaker, is_backend_failure
+from brainiak.utils.config_parser import AUTH_OPTIONS, NON_REQUEST_OPTIONS, get_triplestore_config
+from brainiak.utils.recording import TRIPLESTORE, RecordingCallback, get_recorder
+from brainiak.utils.sparql_stream import ResultLimitExceeded, get_parser, parse_result
 
 
 JSON_DECODE_ERROR_MESSAGE = "Could not decode JSON:\n  {0}"
@@ -24,33 +30,62 @@ DEFAULT_VIRTUOSO_REQUEST_HEADERS = {
     "Content-Type": "application/x-www-form-urlencoded"
 }
 DEFAULT_RESPONSE_FORMAT = "application/sparql-results+json"
+# result formats which may be requested to query_sparql: TSV keeps types and is more compact than JSON,
+# CSV is the most compact but only keeps values (see brainiak.utils.sparql_stream)
+RESULT_FORMATS = {
+    "json": DEFAULT_RESPONSE_FORMAT,
+    "tsv": "text/tab-separated-values",
+    "csv": "text/csv"
+}
 DEFAULT_HTTP_METHOD = "POST"
+# bytes read at a time from streamed synchronous responses
+STREAMING_CHUNK_SIZE = 64 * 1024
+
+RESULT_LIMIT_EXCEEDED_MESSAGE = u"{0}. Paginate the query (e.g. with LIMIT and OFFSET) to get it in parts."
+INCOMPLETE_RESULT_MESSAGE = u"The triplestore response ended before the end of the result ({0} rows read)."
 
 
-def do_run_query(request_params, async):
+def do_run_query(request_params, async, hedge_url=None, hedge_delay=None, hedge_streaming_callback=None):
+    """
+    Run the query. If hedge_url is given (async only), the same request is also sent
+    to hedge_url when no response arrived after hedge_delay seconds,
+    with hedge_streaming_callback (if given) instead of the request's streaming_callback.
+    """
     # app_name (from triplestore.ini) can't be passed forward to tornado.httpclient.HTTPRequest .
     # It raises an exception
     # Similarly, there are parameters that make requests.request fail
-    request_params.pop("app_name", None)
+    for option in NON_REQUEST_OPTIONS:
+        request_params.pop(option, None)
 
     time_i = time.time()
     if async:
         request = HTTPRequest(**request_params)
         try:
-            response = greenlet_fetch(request)
+            if hedge_url is not None:
+                hedged_params = dict(request_params, url=hedge_url)
+                if hedge_streaming_callback is not None:
+                    hedged_params["streaming_callback"] = hedge_streaming_callback
+                hedged_request = HTTPRequest(**hedged_params)
+                response = greenlet_fetch_hedged(request, hedged_request, hedge_delay)
+            else:
+                response = greenlet_fetch(request)
         except ClientHTTPError as e:
             if e.code == 401:
                 raise HTTPError(e.code, message=UNAUTHORIZED_MESSAGE)
             else:
                 raise e
     else:
-        request_params.pop("auth_mode", None)
-        request_params.pop("auth_username", None)
-        request_params.pop("auth_password", None)
+        for option in AUTH_OPTIONS:
+            request_params.pop(option, None)
+        streaming_callback = request_params.pop("streaming_callback", None)
+        if streaming_callback is not None:
+            request_params["stream"] = True
 
         response = requests.request(**request_params)
         if response.status_code == 401:
             raise HTTPError(401, message=UNAUTHORIZED_MESSAGE)
+        if streaming_callback is not None:
+            _stream_response(response, streaming_callback)
 
     time_f = time.time()
     diff = time_f - time_i
@@ -58,6 +93,19 @@ def do_run_query(request_params, async):
     return response, diff
 
 
+def _stream_response(response, streaming_callback):
+    "Call streaming_callback with each chunk of a requests response, like tornado does"
+    try:
+        if response.status_code >= 400:
+            raise ClientHTTPError(response.status_code, response.reason)
+        for chunk in response.iter_content(STREAMING_CHUNK_SIZE):
+            # as with pycurl, returning 0 aborts the transfer
+            if streaming_callback(chunk) == 0:
+                break
+    finally:
+        response.close()
+
+
 def log_request(log_params):
     """
         Just logs the request
@@ -68,13 +116,18 @@ def log_request(log_params):
     log.logger.info(log_msg)
 
 
-def _process_json_triplestore_response(response, async=True):
+def _process_json_triplestore_response(response, async=True, result_format="json"):
     """
         Returns a python dict with triplestore response.
         Unifying tornado and requests response.
     """
+    if result_format != "json":
+        if not async and response.status_code >= 400:
+            raise ClientHTTPError(response.status_code, response.text)
+        return parse_result(response.body if async else response.content, result_format)
     if async:
-        result_dict = json.loads(unicode(response.body))
+        # the UTF-8 body is decoded by ujson itself, without a unicode copy of it
+        result_dict = json.loads(response.body)
     else:
         try:
             result_dict = response.json()
@@ -83,37 +136,203 @@ def _process_json_triplestore_response(response, async=True):
     return result_dict
 
 
-def query_sparql(query, triplestore_config, async=True):
+def query_sparql(query, triplestore_config, async=True, streaming_callback=None, result_set=False,
+                 result_format="json"):
     """
     Simple interface that given a SPARQL query string returns a string representing a SPARQL results bindings
     in JSON format. For now it only works with Virtuoso, but in futurw we intend to support other databases
     that are SPARQL 1.1 complaint (including SPARQL result bindings format).
-    """
-    request_params = _build_request_params(query, triplestore_config, async)
-    log_params = copy.copy(request_params)
 
-    response, time_diff = do_run_query(request_params, async)
+    If streaming_callback is given, it is called with each chunk of the response body
+    as it arrives, and None is returned (see also query_sparql_bindings).
+    If result_set is True (and no streaming_callback is given), a SparqlResultSet is returned
+    instead of the result dict, its columns being filled as the response arrives.
+    result_format (one of RESULT_FORMATS) is the format requested to the triplestore,
+    SELECT results being returned the same way whatever the format.
+    """
+    request_params = _build_request_params(query, triplestore_config, async, result_format)
+    recorder = get_recorder()
+    result_stream = hedged_stream = None
+    if result_set and streaming_callback is None:
+        # instead of loading the whole body and then building the columns
+        result_stream = streaming_callback = ResultSetStream(result_format)
+    if streaming_callback is not None:
+        if recorder is not None:
+            streaming_callback = RecordingCallback(streaming_callback)
+        request_params["streaming_callback"] = streaming_callback
+
+    breaker = get_circuit_breaker(u"triplestore:{0}".format(triplestore_config.get("app_name") or triplestore_config["url"]))
+    breaker.before_call()
+
+    replica_pool = replica = recorded_request = None
+    try:
+        read_query = not is_update_query(query)
+        replica_pool = get_replica_pool(triplestore_config) if read_query else None
+        replica = replica_pool.acquire() if replica_pool is not None else None
+        if replica is not None:
+            request_params["url"] = replica.url
+
+        hedge_url = hedge_delay = hedge_callback = None
+        # a streamed body can not be taken from two concurrent responses, unless each one has its own result set
+        if async and replica is not None and (streaming_callback is None or result_stream is not None):
+            hedge_delay = breaker.hedge_delay()
+            alternative = replica_pool.alternative(replica) if hedge_delay is not None else None
+            if alternative is not None:
+                hedge_url = alternative.url
+                if result_stream is not None:
+                    hedged_stream = hedge_callback = ResultSetStream(result_format)
+                    if recorder is not None:
+                        hedge_callback = RecordingCallback(hedged_stream)
+
+        log_params = copy.copy(request_params)
+        if recorder is not None:
+            recorded_request = {"method": request_params["method"], "url": request_params["url"],
+                                "query": unicode(query), "format": RESULT_FORMATS[result_format]}
+            started = time.time()
+
+        response, time_diff = do_run_query(request_params, async, hedge_url, hedge_delay, hedge_callback)
+    except Exception as e:
+        if result_stream is not None:
+            result_stream.restore_error_body(e)
+        if recorded_request is not None:
+            _record_error(recorder, recorded_request, e, streaming_callback, started)
+        # a response aborted by its streaming_callback (see BindingsStream) tells nothing about the backend
+        failed = is_backend_failure(e) and getattr(streaming_callback, "exceeded", None) is None
+        if replica is not None:
+            replica_pool.release(replica, failed=failed)
+        if failed:
+            breaker.on_failure()
+        else:
+            breaker.on_success()
+        raise
+
+    answered_by_hedge = hedge_url is not None and response.request.url == hedge_url
+    if answered_by_hedge and hedged_stream is not None:
+        result_stream, streaming_callback = hedged_stream, hedge_callback
+
+    if recorder is not None:
+        _record_response(recorder, recorded_request, response, async, streaming_callback, started, time_diff)
+
+    failed = not async and response.status_code >= 500
+    if replica is not None:
+        # when the hedged request won, the latency is not the replica's
+        replica_pool.release(replica, None if answered_by_hedge else time_diff, failed=failed)
+    if failed:
+        breaker.on_failure()
+    else:
+        breaker.on_success(time_diff)
 
     log_params["query"] = unicode(query)
     log_params["time_diff"] = time_diff
     log_request(log_params)
 
-    result_dict = _process_json_triplestore_response(response, async)
-    return result_dict
+    if result_stream is not None:
+        return result_stream.result()
+    if streaming_callback is not None:
+        return None
+    return _process_json_triplestore_response(response, async, result_format)
+
+
+def _record_response(recorder, recorded_request, response, async, streaming_callback, started, time_diff):
+    if streaming_callback is not None:
+        body = streaming_callback.body()
+    else:
+        body = response.body if async else response.content
+    status = response.code if async else response.status_code
+    recorder.record(TRIPLESTORE, recorded_request, status, body, started, time_diff)
+
+
+def _record_error(recorder, recorded_request, exception, streaming_callback, started):
+    "Record a failed query, with the status 599 if no response was received (as tornado does)"
+    if streaming_callback is not None:
+        body = streaming_callback.body()
+    else:
+        body = getattr(getattr(exception, "response", None), "body", None) or ""
+    recorder.record(TRIPLESTORE, recorded_request, getattr(exception, "code", 599), body,
+                    started, time.time() - started)
+
+
+class BindingsStream(object):
+    """
+    A streaming_callback for query_sparql, which parses the bindings of the response
+    as they arrive and calls consumer with each list of them.
+    The response is aborted as soon as max_rows or max_bytes are exceeded; exceeded tells why.
+    Once closed, incomplete tells if the response ended before the end of the result.
+    """
+
+    def __init__(self, consumer, max_rows=0, max_bytes=0, result_format="json"):
+        self.consumer = consumer
+        self.parser = get_parser(result_format, max_rows=max_rows, max_bytes=max_bytes)
+        self.exceeded = None
+        self.incomplete = False
+
+    def __call__(self, chunk):
+        self._parse(self.parser.feed, chunk)
+        if self.exceeded is not None:
+            return 0
+
+    def close(self):
+        "Handle the end of the response (the last line of TSV and CSV results)"
+        if self.exceeded is None:
+            self._parse(self.parser.close)
+            self.incomplete = self.exceeded is None and not self.parser.finished
+
+    def _parse(self, method, *args):
+        if self.exceeded is not None:
+            return
+        try:
+            bindings = method(*args)
+        except ResultLimitExceeded as e:
+            self.exceeded = e
+            return
+        if bindings:
+            self.consumer(bindings)
+
+
+def query_sparql_bindings(query, triplestore_config, consumer, async=True, max_rows=None, max_bytes=None,
+                          result_format="json"):
+    """
+    Run a SELECT query, calling consumer with each list of bindings parsed while the response
+    is still arriving, instead of loading the whole response. Return the number of bindings.
+
+    If the result has more than max_rows bindings or max_bytes bytes (by default settings.SPARQL_RESULT_MAX_ROWS
+    and settings.SPARQL_RESULT_MAX_BYTES, 0 meaning unlimited), the response is aborted and HTTPError 400 raised.
+    If the response ends before the end of the result (e.g. the connection was closed), HTTPError 500 is raised,
+    as the bindings consumed so far are not the whole result.
+    result_format is as in query_sparql.
+    """
+    if max_rows is None:
+        max_rows = settings.SPARQL_RESULT_MAX_ROWS
+    if max_bytes is None:
+        max_bytes = settings.SPARQL_RESULT_MAX_BYTES
+    stream = BindingsStream(consumer, max_rows, max_bytes, result_format)
+    try:
+        query_sparql(query, triplestore_config, async, streaming_callback=stream, result_format=result_format)
+    except Exception:
+        if stream.exceeded is None:
+            raise
+    stream.close()
+    if stream.exceeded is not None:
+        raise HTTPError(400, log_message=RESULT_LIMIT_EXCEEDED_MESSAGE.format(stream.exceeded))
+    if stream.incomplete:
+        raise HTTPError(500, log_message=INCOMPLETE_RESULT_MESSAGE.format(stream.parser.rows_read))
+    return stream.parser.rows_read
+
 
 # This is based on virtuoso_connector app, used by App Semantica, so QA2 Virtuoso Analyser works
 format_post = u"POST - %(url)s - %(user_ip)s - %(auth_username)s [tempo: %(time_diff)s] - QUERY - %(query)s"
 
 
-def _build_request_params(query, triplestore_config, async):
+def _build_request_params(query, triplestore_config, async, result_format="json"):
     """
         This function creates a dict according to the param async.
         If True, a dict with args for tornado.httpclient.HTTPRequest is created.
         If False, a dict with args for requests.request interface is created.
+        A TriplestoreConfig (see get_triplestore_config) provides its prebuilt request options and credentials.
     """
     body_params = {
         "query": unicode(query).encode("utf-8"),
-        "format": DEFAULT_RESPONSE_FORMAT
+        "format": RESULT_FORMATS[result_format]
     }
 
     body_string = urllib.urlencode(body_params)
@@ -124,20 +343,19 @@ def _build_request_params(query, triplestore_config, async):
         "headers": DEFAULT_VIRTUOSO_REQUEST_HEADERS,
     }
 
-    request_params.update(triplestore_config)
+    request_params.update(getattr(triplestore_config, "request_options", triplestore_config))
     if async:
         request_params.update(body_dict)
     else:
         request_params.update({
             "data": body_params,
             "url": triplestore_config["url"]})
-        if "auth_mode" in triplestore_config and \
-           "auth_username" in triplestore_config and  \
-           "auth_password" in triplestore_config:
+        auth_credentials = getattr(triplestore_config, "auth_credentials", None)
+        if auth_credentials is None and all(option in triplestore_config for option in AUTH_OPTIONS):
+            auth_credentials = (triplestore_config["auth_username"], triplestore_config["auth_password"])
+        if auth_credentials is not None:
             # Considering all DIGEST authencations
-            auth_credentials = HTTPDigestAuth(triplestore_config["auth_username"],
-                                              triplestore_config["auth_password"])
-            request_params.update({"auth": auth_credentials})
+            request_params.update({"auth": HTTPDigestAuth(*auth_credentials)})
 
     return request_params
 
@@ -146,13 +364,392 @@ class VirtuosoException(Exception):
     pass
 
 
+class Column(object):
+    """
+    The terms bound to a variable, as parallel lists of values and types (None where unbound).
+    Datatypes and languages are kept only for the rows which have them.
+    """
+    __slots__ = ("values", "types", "datatypes", "langs")
+
+    def __init__(self, length=0):
+        self.values = [None] * length
+        self.types = [None] * length
+        self.datatypes = {}
+        self.langs = {}
+
+    def term(self, index):
+        "Return the term of a row as in SPARQL JSON results, or None if unbound"
+        value = self.values[index]
+        if value is None:
+            return None
+        term = {"type": self.types[index], "value": value}
+        if index in self.datatypes:
+            term["datatype"] = self.datatypes[index]
+        if index in self.langs:
+            term["xml:lang"] = self.langs[index]
+        return term
+
+
+class SparqlResultSet(object):
+    """
+    SPARQL SELECT results stored column-wise: instead of a dict per term of each binding,
+    each variable has a Column and repeated strings (URIs, types, languages) are shared.
+
+    It can be used wherever a result dict is expected (result_set["results"]["bindings"]
+    builds the bindings once, when first accessed), but the helpers of brainiak.utils.sparql
+    and the methods below read the columns directly.
+
+    >>> result_set = SparqlResultSet.from_result_dict({"head": {"vars": ["s", "o"]}, "results": {"bindings": [
+    ...     {"s": {"type": "uri", "value": "http://a"}, "o": {"type": "literal", "value": "A", "xml:lang": "en"}},
+    ...     {"s": {"type": "uri", "value": "http://a"}, "o": {"type": "literal", "value": "B"}},
+    ...     {"s": {"type": "uri", "value": "http://b"}}]}})
+    >>> result_set.values("o")
+    ['A', 'B', None]
+    >>> result_set.group_by("s", "o")
+    OrderedDict([('http://a', [('A',), ('B',)]), ('http://b', [(None,)])])
+    >>> result_set.row(0)["o"]
+    {'xml:lang': 'en', 'type': 'literal', 'value': 'A'}
+    """
+
+    def __init__(self, vars=(), boolean=None):
+        self.vars = []
+        self.columns = {}
+        self.boolean = boolean
+        self._length = 0
+        self._strings = {}
+        self._result_dict = None
+        for var in vars:
+            self._add_column(var)
+
+    @classmethod
+    def from_result_dict(cls, result_dict):
+        result_set = cls(result_dict.get("head", {}).get("vars", []), result_dict.get("boolean"))
+        for binding in result_dict.get("results", {}).get("bindings", []):
+            result_set.append(binding)
+        return result_set
+
+    def add_vars(self, vars):
+        "Add a column to each of the given variables (e.g. those in the head of the results) which has none"
+        for var in vars:
+            if var not in self.columns:
+                self._add_column(var)
+
+    def _add_column(self, var):
+        self.vars.append(var)
+        column = self.columns[var] = Column(self._length)
+        return column
+
+    def _share(self, string):
+        return self._strings.setdefault(string, string)
+
+    def append(self, binding):
+        "Add a binding (a dict of variable to term, as in SPARQL JSON results)"
+        index = self._length
+        share = self._share
+        self._result_dict = None
+        for column in self.columns.itervalues():
+            column.values.append(None)
+            column.types.append(None)
+        self._length += 1
+        for var, term in binding.iteritems():
+            column = self.columns.get(var) or self._add_column(var)
+            column.values[index] = share(term["value"])
+            column.types[index] = share(term["type"])
+            if "datatype" in term:
+                column.datatypes[index] = share(term["datatype"])
+            if "xml:lang" in term:
+                column.langs[index] = share(term["xml:lang"])
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return (self.row(index) for index in xrange(self._length))
+
+    def row(self, index):
+        "Return a binding as in SPARQL JSON results"
+        row = {}
+        for var, column in self.columns.iteritems():
+            term = column.term(index)
+            if term is not None:
+                row[var] = term
+        return row
+
+    def values(self, var):
+        "Return the values of a variable, None where unbound"
+        column = self.columns.get(var)
+        if column is None:
+            return [None] * self._length
+        return column.values
+
+    def project(self, *vars):
+        "Return the values of the given variables, as a tuple for each row"
+        if not vars:
+            return [()] * self._length
+        return zip(*[self.values(var) for var in vars])
+
+    def distinct(self, *vars):
+        "Like project, without repeated tuples (in the order of their first row)"
+        seen = set()
+        result = []
+        for values in self.project(*vars):
+            if values not in seen:
+                seen.add(values)
+                result.append(values)
+        return result
+
+    def group_by(self, key, *vars):
+        """
+        Return an OrderedDict of each value bound to key (e.g. the subject variable) to
+        the values of the given variables in its rows, as in project
+        """
+        groups = OrderedDict()
+        for key_value, values in zip(self.values(key), self.project(*vars)):
+            if key_value is not None:
+                groups.setdefault(key_value, []).append(values)
+        return groups
+
+    def to_result_dict(self):
+        result_dict = {"head": {"vars": list(self.vars)}}
+        if self.boolean is not None:
+            result_dict["boolean"] = self.boolean
+        else:
+            result_dict["results"] = {"bindings": list(self)}
+        return result_dict
+
+    # result dict compatibility
+
+    def _as_result_dict(self):
+        if self._result_dict is None:
+            self._result_dict = self.to_result_dict()
+        return self._result_dict
+
+    def __getitem__(self, key):
+        return self._as_result_dict()[key]
+
+    def __contains__(self, key):
+        return key in self._as_result_dict()
+
+    def get(self, key, default=None):
+        return self._as_result_dict().get(key, default)
+
+
+class ResultSetStream(BindingsStream):
+    """
+    A streaming_callback for query_sparql(result_set=True), which appends the bindings
+    of the response to a SparqlResultSet as they arrive.
+    The chunks are kept only until the bindings are found, so that a response which has none
+    (e.g. an ASK result or an error) can still be read whole.
+    """
+
+    def __init__(self, result_format="json"):
+        self.result_set = SparqlResultSet()
+        self.result_format = result_format
+        self.chunks = []
+        super(ResultSetStream, self).__init__(self._append, result_format=result_format)
+
+    def __call__(self, chunk):
+        if self.chunks is not None:
+            self.chunks.append(chunk)
+        return super(ResultSetStream, self).__call__(chunk)
+
+    def _append(self, bindings):
+        if self.chunks is not None:
+            self.chunks = None
+            self.result_set.add_vars(self.parser.vars or [])
+        for binding in bindings:
+            self.result_set.append(binding)
+
+    def body(self):
+        return "".join(self.chunks or [])
+
+    def result(self):
+        "Return the SparqlResultSet, once the response is over"
+        self.close()
+        if not self.parser.bindings_found:
+            return SparqlResultSet.from_result_dict(_parse_body(self.body(), self.result_format))
+        if self.incomplete:
+            raise HTTPError(500, log_message=INCOMPLETE_RESULT_MESSAGE.format(self.parser.rows_read))
+        self.result_set.add_vars(self.parser.vars or [])
+        return self.result_set
+
+    def restore_error_body(self, exception):
+        "Give the body streamed to the callback back to the response of a failed query, as it tells why"
+        response = getattr(exception, "response", None)
+        if isinstance(response, HTTPResponse) and not response.body and self.chunks:
+            exception.response = HTTPResponse(response.request, response.code, response.headers,
+                                              BytesIO(self.body()), reason=response.reason)
+
+
+def _parse_body(body, result_format):
+    "Return the result dict of a whole response body"
+    if result_format != "json":
+        return parse_result(body, result_format)
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise ClientHTTPError(400, JSON_DECODE_ERROR_MESSAGE.format(body.decode("utf-8", "replace")))
+
+
+UPDATE_QUERY_PATTERN = re.compile(r"\b(INSERT|DELETE|MODIFY|CLEAR|DROP|LOAD|CREATE|ADD|COPY|MOVE)\b", re.IGNORECASE | re.UNICODE)
+
+
+def is_update_query(query):
+    """
+    Return True if the query might be a SPARUL (update) query, which must be run by the primary endpoint.
+    False positives are harmless: the primary endpoint also answers SELECT/ASK queries.
+    """
+    return UPDATE_QUERY_PATTERN.search(query) is not None
+
+
+class Replica(object):
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.latency = None  # exponentially weighted moving average, in seconds
+        self.consecutive_failures = 0
+        self.ejected_until = 0
+
+    def is_healthy(self, now):
+        return self.ejected_until <= now
+
+
+class ReplicaPool(object):
+    """
+    Choose among the read replicas of a triplestore section, either by the
+    least number of outstanding requests or by the lowest latency (EWMA).
+    Replicas which fail max_failures consecutive times are passively ejected
+    from the pool during ejection_seconds.
+    """
+
+    STRATEGIES = ("least_outstanding", "ewma")
+
+    def __init__(self, urls, strategy="least_outstanding", ewma_weight=0.3,
+                 max_failures=3, ejection_seconds=30):
+        if strategy not in self.STRATEGIES:
+            raise VirtuosoException(u"Unknown replica strategy {0}".format(strategy))
+        self.replicas = [Replica(url) for url in urls]
+        self.strategy = strategy
+        self.ewma_weight = ewma_weight
+        self.max_failures = max_failures
+        self.ejection_seconds = ejection_seconds
+
+    def _cost(self, replica):
+        if self.strategy == "ewma":
+            # replicas without measurements are tried first
+            latency = replica.latency or 0
+            return (latency * (replica.outstanding + 1), replica.outstanding)
+        return (replica.outstanding, replica.latency or 0)
+
+    def acquire(self):
+        """
+        Return the best healthy replica, marking it as having one more outstanding request,
+        or None if all replicas are ejected.
+        """
+        now = time.time()
+        healthy = [replica for replica in self.replicas if replica.is_healthy(now)]
+        if not healthy:
+            return None
+        replica = min(healthy, key=self._cost)
+        replica.outstanding += 1
+        return replica
+
+    def alternative(self, replica):
+        "Return the best healthy replica other than the given one, without acquiring it, or None"
+        now = time.time()
+        others = [other for other in self.replicas if other is not replica and other.is_healthy(now)]
+        if not others:
+            return None
+        return min(others, key=self._cost)
+
+    def release(self, replica, time_diff=None, failed=False):
+        replica.outstanding = max(0, replica.outstanding - 1)
+        if failed:
+            replica.consecutive_failures += 1
+            if replica.consecutive_failures >= self.max_failures:
+                replica.ejected_until = time.time() + self.ejection_seconds
+                log.logger.error(REPLICA_EJECTED_MESSAGE.format(replica.url, self.ejection_seconds))
+        else:
+            replica.consecutive_failures = 0
+            if time_diff is not None:
+                if replica.latency is None:
+                    replica.latency = time_diff
+                else:
+                    replica.latency = self.ewma_weight * time_diff + (1 - self.ewma_weight) * replica.latency
+
+    def status(self):
+        now = time.time()
+        messages = []
+        for replica in self.replicas:
+            info = {
+                "state": u"HEALTHY" if replica.is_healthy(now) else u"EJECTED",
+                "url": replica.url,
+                "outstanding": replica.outstanding,
+                "latency": u"-" if replica.latency is None else u"{0:.1f}ms".format(replica.latency * 1000),
+                "failures": replica.consecutive_failures,
+                "strategy": self.strategy
+            }
+            messages.append(REPLICA_STATUS_MESSAGE % info)
+        return messages
+
+
+REPLICA_EJECTED_MESSAGE = u"Virtuoso replica {0} ejected for {1} seconds after consecutive failures"
+REPLICA_STATUS_MESSAGE = u"Virtuoso replica [%(strategy)s] | %(state)s | %(url)s | outstanding: %(outstanding)s | latency: %(latency)s | failures: %(failures)s"
+
+# Replica pools are kept across requests, indexed by their URLs
+_replica_pools = {}
+
+
+def get_replica_pool(triplestore_config):
+    """
+    Return the ReplicaPool of the comma-separated URLs in the "replicas"
+    option of a triplestore.ini section, or None if there are no replicas.
+    """
+    replicas = triplestore_config.get("replicas")
+    if not replicas:
+        return None
+    urls = tuple(url.strip() for url in replicas.split(",") if url.strip())
+    pool = _replica_pools.get(urls)
+    if pool is None:
+        pool = ReplicaPool(urls,
+                           strategy=settings.TRIPLESTORE_REPLICA_STRATEGY,
+                           ewma_weight=settings.TRIPLESTORE_REPLICA_EWMA_WEIGHT,
+                           max_failures=settings.TRIPLESTORE_REPLICA_MAX_FAILURES,
+                           ejection_seconds=settings.TRIPLESTORE_REPLICA_EJECTION_SECONDS)
+        _replica_pools[urls] = pool
+    return pool
+
+
 VIRTUOSO_FAILURE_MESSAGE = u"Virtuoso connection %(type)s | FAILED | %(endpoint)s | %(error)s"
 VIRTUOSO_SUCCESS_MESSAGE = u'Virtuoso connection %(type)s | SUCCEED | %(endpoint)s'
 
 
 def status():
 
-    endpoint_dict = parse_section()
+    # a plain copy, since the credentials of the shared TriplestoreConfig must not be used by not-authenticated checks
+    config = dict(get_triplestore_config())
+    replica_pool = get_replica_pool(config)
+
+    # the primary and each replica are checked directly, bypassing the replica routing
+    config.pop("replicas", None)
+    urls = [config["url"]]
+    if replica_pool is not None:
+        urls.extend(replica.url for replica in replica_pool.replicas)
+
+    messages = []
+    for url in urls:
+        endpoint_dict = copy.copy(config)
+        endpoint_dict["url"] = url
+        messages.append(_endpoint_status(endpoint_dict))
+
+    if replica_pool is not None:
+        messages.extend(replica_pool.status())
+
+    return u"<br>".join(messages)
+
+
+def _endpoint_status(endpoint_dict):
     unauthorized_endpoint_dict = copy.copy(endpoint_dict)
 
     query = u"""
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import time
+from collections import deque
+
+from tornado import stack_context
+from tornado.ioloop import IOLoop
+from tornado.web import HTTPError
+
+from brainiak import log, settings
+from brainiak.utils.config_parser import ConfigParserNoSectionError, get_triplestore_config
+from brainiak.utils.i18n import _
+from brainiak.utils.params import CLIENT_ID_HEADER
+
+
+__doc__ = """
+Per client-id admission control of the requests handled by greenlet_asynchronous methods.
+
+All client-ids share the same IOLoop and triplestore budget. To keep one
+client from starving the others, each client-id (X-Brainiak-Client-Id,
+i.e. a triplestore.ini section) has:
+
+    max_concurrent  requests running at the same time (unlimited if 0)
+    rate_limit      requests per second, as a token bucket (unlimited if 0)
+    rate_burst      token bucket size (defaults to rate_limit)
+    max_queue       requests waiting for a free slot
+
+Requests above the rate limit are rejected with 429, and requests which
+do not fit in the queue with 503.  The defaults come from settings.ADMISSION_*,
+and each triplestore.ini section may override them:
+
+    [default]
+    app_name       = Brainiak
+    ...
+    max_concurrent = 20
+    rate_limit     = 50
+    rate_burst     = 100
+    max_queue      = 200
+"""
+
+LIMIT_OPTIONS = ("max_concurrent", "rate_limit", "rate_burst", "max_queue")
+
+ADMISSION_STATUS_MESSAGE = u"Admission %(client_id)s | running: %(running)s/%(max_concurrent)s | " + \
+    u"queued: %(queued)s/%(max_queue)s | admitted: %(admitted)s | throttled: %(throttled)s | shed: %(shed)s"
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.time()
+
+    def take(self):
+        "Return True and consume a token if there is one available"
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class ClientScheduler(object):
+
+    def __init__(self, client_id, max_concurrent=0, rate_limit=0, rate_burst=0, max_queue=0):
+        self.client_id = client_id
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.bucket = TokenBucket(rate_limit, rate_burst or rate_limit) if rate_limit else None
+        self.running = 0
+        self.queue = deque()
+        self.metrics = {"admitted": 0, "throttled": 0, "shed": 0}
+
+    def submit(self, start):
+        """
+        Call start() now if there is a free slot, or later if it fits in the queue.
+        Raise HTTPError 429 if the rate limit is exceeded, or 503 if the queue is full.
+        """
+        if self.bucket is not None and not self.bucket.take():
+            self.metrics["throttled"] += 1
+            raise HTTPError(429, log_message=_(u"Rate limit exceeded for client-id {0}").format(self.client_id))
+
+        if not self.max_concurrent or self.running < self.max_concurrent:
+            self._start(start)
+        elif len(self.queue) < self.max_queue:
+            # keep the request's stack context, so its exceptions are handled by its own handler
+            self.queue.append(stack_context.wrap(start))
+        else:
+            self.metrics["shed"] += 1
+            raise HTTPError(503, log_message=_(u"Too many pending requests for client-id {0}").format(self.client_id))
+
+    def _start(self, start):
+        self.running += 1
+        self._admit(start)
+
+    def _admit(self, start):
+        self.metrics["admitted"] += 1
+        start()
+
+    def done(self):
+        if self.queue:
+            start = self.queue.popleft()
+            # the slot is handed over to the queued request, so that no request submitted
+            # meanwhile takes it; start it from the IOLoop, not from the finishing request's greenlet
+            IOLoop.instance().add_callback(self._admit, start)
+        else:
+            self.running -= 1
+
+    def status(self):
+        info = dict(self.metrics,
+                    client_id=self.client_id,
+                    running=self.running,
+                    max_concurrent=self.max_concurrent or u"-",
+                    queued=len(self.queue),
+                    max_queue=self.max_queue)
+        return ADMISSION_STATUS_MESSAGE % info
+
+
+def get_limits(client_id):
+    "Return the limits of a client-id: settings.ADMISSION_* overridden by its triplestore.ini section"
+    limits = {
+        "max_concurrent": settings.ADMISSION_MAX_CONCURRENT,
+        "rate_limit": settings.ADMISSION_RATE_LIMIT,
+        "rate_burst": settings.ADMISSION_RATE_BURST,
+        "max_queue": settings.ADMISSION_MAX_QUEUE
+    }
+    config = get_triplestore_config(client_id)
+    for option in LIMIT_OPTIONS:
+        if option in config:
+            limits[option] = float(config[option]) if option.startswith("rate") else int(config[option])
+    return limits
+
+
+class AdmissionController(object):
+    "Scheduler for greenlet_asynchronous (see greenlet_set_scheduler)"
+
+    def __init__(self):
+        self.schedulers = {}
+
+    def get_scheduler(self, client_id):
+        scheduler = self.schedulers.get(client_id)
+        if scheduler is None:
+            try:
+                limits = get_limits(client_id)
+            except ConfigParserNoSectionError:
+                # the request will be answered with 404 by ParamDict, but it still needs a slot
+                if client_id == "default":
+                    raise
+                return self.get_scheduler("default")
+            scheduler = ClientScheduler(client_id, **limits)
+            self.schedulers[client_id] = scheduler
+            log.logger.info(u"Admission control of client-id {0}: {1}".format(client_id, limits))
+        return scheduler
+
+    def submit(self, handler, start):
+        client_id = handler.request.headers.get(CLIENT_ID_HEADER, "default")
+        scheduler = self.get_scheduler(client_id)
+        # set before submitting: a request may be started and finished within submit
+        handler._admission_scheduler = scheduler
+        try:
+            scheduler.submit(start)
+        except HTTPError:
+            handler._admission_scheduler = None
+            raise
+
+    def done(self, handler):
+        scheduler = getattr(handler, "_admission_scheduler", None)
+        if scheduler is not None:
+            handler._admission_scheduler = None
+            scheduler.done()
+
+    def status(self):
+        return u"<br>".join(self.schedulers[client_id].status() for client_id in sorted(self.schedulers))
+
+
+admission_controller = AdmissionController()
+
+
+def status():
+    return admission_controller.status()
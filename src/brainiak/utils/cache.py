@@ -1,5 +1,6 @@
 import md5
 import traceback
+from collections import OrderedDict
 from email.utils import formatdate
 
 import redis
@@ -39,11 +40,60 @@ build_key_for_class = lambda query_params: u"{0}@@{1}##class".format(query_param
 # # Instance-related
 # # graph_uri@@class_uri@@instance_uri##instance
 
+
+# # Stored query results
+# _query@@query_id@@template_md5@@sorted_arguments@@client_id##query
+def build_key_for_query_result(query_id, template, arguments, client_id):
+    template_version = md5.new(template.encode("utf-8")).hexdigest()
+    arguments = u"&".join(u"{0}={1}".format(key, arguments[key]) for key in sorted(arguments))
+    return u"_query@@{0}@@{1}@@{2}@@{3}##query".format(query_id, template_version, arguments, client_id)
+
+
 # # Properties-related
 # # graph@@predicate##range
 # # graph@@predicate##subproperty
 
 
+class LRUCache(object):
+    """
+    Bounded in-process cache, evicting the least recently used key.
+    Unlike the functions below it does not touch Redis.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+
 class CacheError(redis.exceptions.RedisError):
     pass
 
@@ -81,7 +131,7 @@ def _fresh_retrieve(function, params):
     return fresh_json
 
 
-def memoize(params, function, function_arguments=None, key=False):
+def memoize(params, function, function_arguments=None, key=False, ttl=TIME_TO_LIVE_IN_SECS):
     if settings.ENABLE_CACHE:
         key = key or params.request.uri
         cached_json = retrieve(key)
@@ -89,7 +139,7 @@ def memoize(params, function, function_arguments=None, key=False):
             fresh_json = _fresh_retrieve(function, function_arguments)
             if fresh_json is not None:
                 value = ujson.dumps(fresh_json)
-                create(key, value)
+                create(key, value, ttl)
                 fresh_json['meta']['cache'] = 'MISS'
                 return fresh_json
             else:
@@ -154,9 +204,9 @@ def update_if_present(key, value):
 
 
 @safe_redis
-def create(key, value):
+def create(key, value, ttl=TIME_TO_LIVE_IN_SECS):
     if value is not None:
-        return redis_client.setex(key, TIME_TO_LIVE_IN_SECS, value)
+        return redis_client.setex(key, ttl, value)
 
 
 @safe_redis
@@ -243,6 +293,16 @@ def purge_an_instance(instance_uri):
     purge(pattern)
 
 
+def purge_a_class(graph_uri, class_uri):
+    pattern = build_key_for_class({"graph_uri": graph_uri, "class_uri": class_uri})
+    log.logger.debug(_(u"CacheDebug: Delete cache keys related to pattern {0}".format(pattern)))
+    purge(pattern)
+
+
+def purge_query_results(query_id):
+    purge(u"_query@@{0}@@".format(query_id))
+
+
 def purge_all_instances():
     purge("*##instance")
 
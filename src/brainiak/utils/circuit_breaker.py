@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+import time
+from collections import deque
+
+import requests
+from tornado.httpclient import HTTPError as ClientHTTPError
+from tornado.web import HTTPError
+
+from brainiak import log, settings
+
+
+__doc__ = """
+Circuit breakers for the backends used by Brainiak (triplestore, Elasticsearch).
+
+While a backend keeps failing, waiting for each request to time out only
+piles up stuck greenlets. A CircuitBreaker counts consecutive failures of a
+backend and, after failure_threshold of them, opens: requests fail fast with
+CircuitOpenError (503) during recovery_seconds. After that, a single probe
+request is let through (half-open): its success closes the circuit, its
+failure opens it again. A probe which does not finish within recovery_seconds
+is given up, and another one is let through.
+
+How to use:
+
+    breaker = get_circuit_breaker("elasticsearch")
+    breaker.before_call()  # raises CircuitOpenError if open
+    try:
+        response = do_request()
+    except Exception as e:
+        breaker.on_failure() if is_backend_failure(e) else breaker.on_success()
+        raise
+    breaker.on_success()
+"""
+
+
+CLOSED = u"CLOSED"
+OPEN = u"OPEN"
+HALF_OPEN = u"HALF_OPEN"
+
+CIRCUIT_OPEN_MESSAGE = u"Backend {0} is unavailable (circuit breaker is open). Try again in {1:.0f} seconds."
+CIRCUIT_STATUS_MESSAGE = u"Circuit breaker %(name)s | %(state)s | calls: %(calls)s | failures: %(failures)s | " + \
+    u"rejections: %(rejections)s | consecutive failures: %(consecutive_failures)s | p95: %(p95)s"
+
+
+class CircuitOpenError(HTTPError):
+
+    def __init__(self, name, retry_in):
+        super(CircuitOpenError, self).__init__(503, log_message=CIRCUIT_OPEN_MESSAGE.format(name, retry_in))
+
+
+def is_backend_failure(exception):
+    """
+    Return True if the exception means the backend is unavailable or broken
+    (connection errors, timeouts and HTTP 5xx), not that the request is invalid.
+    """
+    if isinstance(exception, ClientHTTPError):
+        return exception.code >= 500
+    return isinstance(exception, requests.RequestException)
+
+
+class LatencyTracker(object):
+    "Keep the latest latencies of a backend, to compute percentiles"
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def record(self, latency):
+        self.samples.append(latency)
+
+    def percentile(self, percent, min_samples=20):
+        "Return the given percentile, or None if there are less than min_samples"
+        if len(self.samples) < min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100.0))
+        return ordered[index]
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, name, failure_threshold=5, recovery_seconds=10):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = CLOSED
+        self.opened_at = None
+        self.probing = False
+        self.probe_started_at = None
+        self.consecutive_failures = 0
+        self.latencies = LatencyTracker()
+        self.metrics = {"calls": 0, "successes": 0, "failures": 0, "rejections": 0}
+
+    def before_call(self):
+        "Raise CircuitOpenError if the call must not be done"
+        if self.state == OPEN:
+            elapsed = time.time() - self.opened_at
+            if elapsed < self.recovery_seconds:
+                self._reject(self.recovery_seconds - elapsed)
+            self.state = HALF_OPEN
+            self.probing = False
+
+        if self.state == HALF_OPEN:
+            now = time.time()
+            # a probe which never finished (e.g. its greenlet was lost) must not keep the circuit half-open
+            if self.probing and now - self.probe_started_at < self.recovery_seconds:
+                self._reject(self.recovery_seconds - (now - self.probe_started_at))
+            self.probing = True
+            self.probe_started_at = now
+
+        self.metrics["calls"] += 1
+
+    def _reject(self, retry_in):
+        self.metrics["rejections"] += 1
+        raise CircuitOpenError(self.name, retry_in)
+
+    def on_success(self, latency=None):
+        self.metrics["successes"] += 1
+        if latency is not None:
+            self.latencies.record(latency)
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            log.logger.info(u"Circuit breaker {0} closed".format(self.name))
+        self.state = CLOSED
+        self.probing = False
+
+    def on_failure(self):
+        self.metrics["failures"] += 1
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                log.logger.error(u"Circuit breaker {0} opened after {1} consecutive failures".format(
+                    self.name, self.consecutive_failures))
+            self.state = OPEN
+            self.opened_at = time.time()
+            self.probing = False
+
+    def hedge_delay(self):
+        """
+        Delay after which an idempotent request should be duplicated:
+        the 95th percentile of the latest latencies (at least settings.HEDGE_MIN_DELAY),
+        or None if hedging is disabled or there are not enough measurements yet.
+        """
+        if not settings.HEDGED_REQUESTS:
+            return None
+        p95 = self.latencies.percentile(95)
+        if p95 is None:
+            return None
+        return max(p95, settings.HEDGE_MIN_DELAY)
+
+    def status(self):
+        p95 = self.latencies.percentile(95, min_samples=1)
+        info = dict(self.metrics,
+                    name=self.name,
+                    state=self.state,
+                    consecutive_failures=self.consecutive_failures,
+                    p95=u"-" if p95 is None else u"{0:.1f}ms".format(p95 * 1000))
+        return CIRCUIT_STATUS_MESSAGE % info
+
+
+circuit_breakers = {}
+
+
+def get_circuit_breaker(name):
+    breaker = circuit_breakers.get(name)
+    if breaker is None:
+        breaker = CircuitBreaker(name,
+                                 failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                                 recovery_seconds=settings.CIRCUIT_BREAKER_RECOVERY_SECONDS)
+        circuit_breakers[name] = breaker
+    return breaker
+
+
+def status():
+    return u"<br>".join(circuit_breakers[name].status() for name in sorted(circuit_breakers))
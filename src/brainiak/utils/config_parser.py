@@ -1,6 +1,18 @@
-from brainiak import settings
+import os
+import time
 from ConfigParser import ConfigParser, NoSectionError
 
+from brainiak import settings
+from brainiak.log import get_logger
+from brainiak.utils.resources import LazyObject
+
+logger = LazyObject(get_logger)
+
+
+# triplestore.ini options which are not HTTP request parameters
+NON_REQUEST_OPTIONS = ("app_name", "replicas", "max_concurrent", "rate_limit", "rate_burst", "max_queue")
+AUTH_OPTIONS = ("auth_mode", "auth_username", "auth_password")
+
 
 class ConfigParserNoSectionError(Exception):
     pass
@@ -14,3 +26,85 @@ def parse_section(filename=settings.TRIPLESTORE_CONFIG_FILEPATH, section="defaul
     except NoSectionError:
         raise ConfigParserNoSectionError(u"There is no {0} section in the file {1}".format(section, filename))
     return config_dict
+
+
+class TriplestoreConfig(dict):
+    """
+    The options of a triplestore.ini section, along with what is needed to query it
+    and would otherwise be built for each query:
+    request_options (the options which are HTTP request parameters) and
+    auth_credentials (the (username, password) of synchronous requests, or None).
+    A digest auth handler is stateful (nonce counts), so one is built per request.
+    """
+
+    def __init__(self, options):
+        super(TriplestoreConfig, self).__init__(options)
+        self.request_options = dict((key, value) for key, value in options
+                                    if key not in NON_REQUEST_OPTIONS)
+        if all(option in self for option in AUTH_OPTIONS):
+            self.auth_credentials = (self["auth_username"], self["auth_password"])
+        else:
+            self.auth_credentials = None
+
+
+class TriplestoreConfigRegistry(object):
+    """
+    The sections of triplestore.ini, parsed once and indexed by client-id.
+    The file is parsed again when its modification time changes (checked at most
+    every settings.TRIPLESTORE_CONFIG_CHECK_INTERVAL seconds) or on reload (e.g. on SIGHUP).
+    """
+
+    def __init__(self, filename=settings.TRIPLESTORE_CONFIG_FILEPATH):
+        self.filename = filename
+        self.sections = None
+        self.modified_at = None
+        self.checked_at = 0
+
+    def _modification_time(self):
+        try:
+            return os.path.getmtime(self.filename)
+        except OSError:
+            return None
+
+    def reload(self):
+        modified_at = self._modification_time()
+        parser = ConfigParser()
+        if not parser.read(self.filename) and self.sections is not None:
+            raise IOError(u"Could not read {0}".format(self.filename))
+        self.sections = dict((section, TriplestoreConfig(parser.items(section)))
+                             for section in parser.sections())
+        self.modified_at = modified_at
+        self.checked_at = time.time()
+
+    def _check(self):
+        now = time.time()
+        if now - self.checked_at < settings.TRIPLESTORE_CONFIG_CHECK_INTERVAL:
+            return
+        self.checked_at = now
+        if self._modification_time() != self.modified_at:
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(u"Failed to reload {0}, keeping the previous configuration: {1}".format(self.filename, e))
+
+    def get(self, section="default"):
+        if self.sections is None:
+            self.reload()
+        else:
+            self._check()
+        try:
+            return self.sections[section]
+        except KeyError:
+            raise ConfigParserNoSectionError(u"There is no {0} section in the file {1}".format(section, self.filename))
+
+
+triplestore_configs = TriplestoreConfigRegistry()
+
+
+def get_triplestore_config(section="default"):
+    "Return the TriplestoreConfig of a triplestore.ini section (client-id), shared by all requests"
+    return triplestore_configs.get(section)
+
+
+def reload_triplestore_configs():
+    triplestore_configs.reload()
@@ -1,4 +1,9 @@
+import gettext
+import weakref
+
+import greenlet
 from tornado import locale
+
 from brainiak import settings
 
 
@@ -6,13 +11,93 @@ mapping = {
     "pt": "pt_BR"
 }
 
+LOCALE_DIRECTORY = "locale"
+LOCALE_DOMAIN = "brainiak"
+
+# translated messages are kept until this many are known, e.g. to bound messages formatted before _()
+MAX_MEMOIZED_MESSAGES = 10000
+
+_loaded = False
+_locales = {}
+_messages = {}
+# language of the request served by each request greenlet, see set_request_language
+_request_languages = weakref.WeakKeyDictionary()
+
+
+def load_translations(directory=LOCALE_DIRECTORY):
+    """
+    Load the gettext catalogs. Called once, at startup or at the first translation,
+    and again through reload_translations.
+    """
+    global _loaded
+    locale.load_gettext_translations(directory=directory, domain=LOCALE_DOMAIN)
+    _locales.clear()
+    _messages.clear()
+    _loaded = True
+
+
+def reload_translations(directory=LOCALE_DIRECTORY):
+    "Read the catalogs from disk again, e.g. after deploying new .mo files"
+    # both gettext and tornado keep what they have already built
+    gettext._translations.clear()
+    if hasattr(locale.Locale, "_cache"):
+        locale.Locale._cache.clear()
+    load_translations(directory)
+
+
+def get_locale(lang):
+    """
+    Return the tornado Locale of lang. Languages which have no catalog (nor are English,
+    the language of the messages) get the Locale of settings.DEFAULT_LANG.
+    Locales are cached by their code, so whatever clients send as ?lang= the cache does not grow.
+    """
+    if not _loaded:
+        load_translations()
+    code = _supported_code(lang) or _supported_code(settings.DEFAULT_LANG)
+    user_locale = _locales.get(code)
+    if user_locale is None:
+        user_locale = _locales[code] = locale.get(code)
+    return user_locale
+
+
+def _supported_code(lang):
+    "Return the code of the supported locale which matches lang (e.g. pt_BR for pt-br), or None"
+    lang = (mapping.get(lang) or lang or u"").replace("-", "_")
+    language = lang.split("_")[0].lower()
+    supported = sorted(locale.get_supported_locales())
+    for code in supported:
+        if code.lower() == lang.lower():
+            return code
+    for code in supported:
+        if code.split("_")[0].lower() == language:
+            return code
+    return None
+
+
+def set_request_language(lang):
+    """
+    Make _() translate to lang, instead of settings.DEFAULT_LANG, for the rest of the current request.
+    Only effective inside request greenlets (see greenlet_asynchronous).
+    """
+    current = greenlet.getcurrent()
+    if current.parent is not None:
+        _request_languages[current] = lang
+
+
+def get_request_language():
+    return _request_languages.get(greenlet.getcurrent())
+
 
 def translate(word, lang=None):
-    lang = lang or settings.DEFAULT_LANG
-    language = mapping.get(lang) or lang
-    locale.load_gettext_translations(directory="locale", domain="brainiak")
-    user_locale = locale.get(language)
-    return user_locale.translate(word)
+    lang = lang or get_request_language() or settings.DEFAULT_LANG
+    key = (lang, word)
+    try:
+        return _messages[key]
+    except KeyError:
+        message = get_locale(lang).translate(word)
+        if len(_messages) < MAX_MEMOIZED_MESSAGES:
+            _messages[key] = message
+        return message
 
 
 _ = translate
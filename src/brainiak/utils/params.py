@@ -9,9 +9,9 @@ from tornado.web import HTTPError
 
 from brainiak import settings
 from brainiak.prefixes import expand_uri, safe_slug_to_prefix, extract_prefix, _MAP_PREFIX_TO_SLUG
-from brainiak.utils.i18n import _
+from brainiak.utils.i18n import _, set_request_language
 from brainiak.utils.sparql import PATTERN_O, PATTERN_P, find_graph_from_class, find_graph_and_class_from_instance
-from brainiak.utils.config_parser import ConfigParserNoSectionError, parse_section
+from brainiak.utils.config_parser import ConfigParserNoSectionError, get_triplestore_config
 
 
 CLIENT_ID_HEADER = "X-Brainiak-Client-Id"
@@ -63,6 +63,9 @@ DEFAULT_PARAMS = optionals('lang', 'graph_uri', 'expand_uri')
 
 NON_ARGUMENT_PARAMS = ('context_name', 'class_name', 'instance_id')
 
+# URL arguments handled by BrainiakRequestHandler itself, which services never see
+HANDLER_ARGUMENTS = ('_profile',)
+
 PAGING_PARAMS = DefaultParamsDict(page=settings.DEFAULT_PAGE,
                                   per_page=settings.DEFAULT_PER_PAGE,
                                   do_item_count="0")
@@ -169,16 +172,17 @@ class ParamDict(dict):
         # Override params with arguments passed in the handler's request object
         self._override_with(handler)
         self._post_override()
+        set_request_language(self.get("lang"))
 
     def _make_arguments_dict(self, handler):
         query_string = unquote(self.request.query)
         query_dict = parse_qs(query_string, keep_blank_values=True)
-        return {key: handler.get_argument(key) for key in query_dict}
+        return {key: handler.get_argument(key) for key in query_dict if key not in HANDLER_ARGUMENTS}
 
     def _set_triplestore_config(self, request):
         auth_client_id = request.headers.get(CLIENT_ID_HEADER, 'default')
         try:
-            self.triplestore_config = parse_section(section=auth_client_id)
+            self.triplestore_config = get_triplestore_config(auth_client_id)
         except ConfigParserNoSectionError:
             raise HTTPError(404, _(u"Client-Id provided at '{0}' ({1}) is not known").format(CLIENT_ID_HEADER, auth_client_id))
 
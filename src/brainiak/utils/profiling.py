@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import cProfile
+import hmac
+import pstats
+import signal
+import StringIO
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+import greenlet
+from tornado.web import HTTPError
+
+from brainiak import settings
+
+
+__doc__ = """
+On-demand profiling of a running Brainiak, protected by settings.PROFILE_TOKEN,
+which must be sent in the X-Brainiak-Profile-Token header.
+
+- GET /_status/profile?seconds=N samples, every settings.PROFILE_SAMPLING_INTERVAL
+  seconds of CPU time, the stack of the greenlet running in the IOLoop thread (a request
+  greenlet, or the IOLoop itself). The response has the collapsed stacks, one
+  "frame;frame;frame count" line per distinct stack, as read by flamegraph.pl.
+
+- Any request with the _profile=1 argument is answered with the cProfile stats
+  of that request instead of its response (the status code is kept). Only the
+  request's own greenlet is profiled if greenlet provides settrace; otherwise,
+  what other requests run meanwhile is profiled too.
+
+How to use:
+
+    curl -H "X-Brainiak-Profile-Token: $TOKEN" "http://localhost:5100/_status/profile?seconds=30" > stacks.txt
+    flamegraph.pl stacks.txt > flamegraph.svg
+    curl -H "X-Brainiak-Profile-Token: $TOKEN" "http://localhost:5100/person/Person?_profile=1"
+"""
+
+
+PROFILE_TOKEN_HEADER = "X-Brainiak-Profile-Token"
+PROFILE_ARGUMENT = "_profile"
+PROFILE_SORT_BY = "cumulative"
+
+PROFILING_DISABLED_MESSAGE = u"Profiling is disabled (Brainiak's settings.PROFILE_TOKEN is not set)"
+PROFILING_FORBIDDEN_MESSAGE = u"Profiling requires a valid {0} header".format(PROFILE_TOKEN_HEADER)
+PROFILER_BUSY_MESSAGE = u"Another profile is being sampled. Try again in {0:.0f} seconds."
+
+
+class ProfilingForbiddenError(HTTPError):
+
+    def __init__(self, message=PROFILING_FORBIDDEN_MESSAGE):
+        super(ProfilingForbiddenError, self).__init__(403, log_message=message)
+
+
+class ProfilerBusyError(HTTPError):
+
+    def __init__(self, retry_in):
+        super(ProfilerBusyError, self).__init__(409, log_message=PROFILER_BUSY_MESSAGE.format(retry_in))
+
+
+def check_authorization(request):
+    "Raise ProfilingForbiddenError unless the request has the PROFILE_TOKEN"
+    token = settings.PROFILE_TOKEN
+    if not token:
+        raise ProfilingForbiddenError(PROFILING_DISABLED_MESSAGE)
+    given = request.headers.get(PROFILE_TOKEN_HEADER, "")
+    if not hmac.compare_digest(str(given), str(token)):
+        raise ProfilingForbiddenError()
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return "{0}:{1}".format(frame.f_globals.get("__name__", code.co_filename), code.co_name)
+
+
+def collapse(frame):
+    "Return the stack of a frame as semicolon separated names, outermost first"
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+class SamplingProfiler(object):
+    """
+    Count the stacks of the main thread (Brainiak's IOLoop), sampled by a SIGPROF handler
+    every interval seconds of CPU time, so that idle time is not sampled.
+    The interrupted frame is that of the running greenlet, so request greenlets
+    have their own stacks, starting at greenlet_asynchronous.
+    It must be started and stopped from the main thread.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self.samples = 0
+        self._previous_handler = None
+
+    def start(self):
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        # system calls interrupted by a sample are restarted, instead of failing with EINTR
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+
+    def _sample(self, signum, frame):
+        self.stacks[collapse(frame)] += 1
+        self.samples += 1
+
+    def collapsed(self):
+        "The collapsed stacks, most sampled first"
+        ordered = sorted(self.stacks.items(), key=lambda item: (-item[1], item[0]))
+        return "".join("{0} {1}\n".format(stack, count) for stack, count in ordered)
+
+
+_sampling_lock = threading.Lock()
+_sampling_until = 0
+
+
+def sample(seconds, sleep, interval=None):
+    """
+    Sample the main thread during the given seconds, while sleep(seconds)
+    lets the IOLoop serve requests (see greenlet_sleep), and return the collapsed stacks.
+    Raise ProfilerBusyError if another sampling is in progress.
+    """
+    global _sampling_until
+    if interval is None:
+        interval = settings.PROFILE_SAMPLING_INTERVAL
+    if not _sampling_lock.acquire(False):
+        raise ProfilerBusyError(max(0, _sampling_until - time.time()))
+    try:
+        _sampling_until = time.time() + seconds
+        profiler = SamplingProfiler(interval)
+        profiler.start()
+        try:
+            sleep(seconds)
+        finally:
+            profiler.stop()
+        return profiler.collapsed()
+    finally:
+        _sampling_lock.release()
+
+
+# profiles of the requests served by each request greenlet, see RequestProfile.follow
+_followed = weakref.WeakKeyDictionary()
+
+
+def _trace_switches(event, args):
+    if event in ("switch", "throw"):
+        origin, target = args
+        profile = _followed.get(origin)
+        if profile is not None:
+            profile.profiler.disable()
+        profile = _followed.get(target)
+        if profile is not None:
+            profile.profiler.enable()
+
+
+class RequestProfile(object):
+    "cProfile of a single request (see the _profile argument)"
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.greenlet = None
+
+    def start(self):
+        self.profiler.enable()
+
+    def follow(self, request_greenlet):
+        """
+        Profile only while request_greenlet runs, if greenlet supports settrace.
+        Called by greenlet_asynchronous with the greenlet of the request, before it starts.
+        """
+        if not hasattr(greenlet, "settrace"):
+            return
+        self.profiler.disable()
+        self.greenlet = request_greenlet
+        if not _followed:
+            greenlet.settrace(_trace_switches)
+        _followed[request_greenlet] = self
+
+    def stop(self):
+        self.profiler.disable()
+        if self.greenlet is not None:
+            _followed.pop(self.greenlet, None)
+            if not _followed:
+                greenlet.settrace(None)
+
+    def report(self, limit=None):
+        "The stats, sorted by cumulative time, of the limit (default settings.PROFILE_STATS_LIMIT) first functions"
+        if limit is None:
+            limit = settings.PROFILE_STATS_LIMIT
+        stream = StringIO.StringIO()
+        try:
+            stats = pstats.Stats(self.profiler, stream=stream)
+        except TypeError:
+            # nothing was profiled
+            return ""
+        stats.sort_stats(PROFILE_SORT_BY).print_stats(limit)
+        return stream.getvalue()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import ujson as json
+
+from brainiak import log, settings
+
+
+__doc__ = """
+Recording of the calls made to the backends (triplestore, Elasticsearch).
+
+Mocked backends can not reproduce the latency of many serial backend calls.
+When settings.BACKEND_RECORDING_FILEPATH is defined, each call made by
+triplestore.query_sparql and search_engine._do_request is appended to that
+file as a JSON line, with its request, response and latency:
+
+    {"backend": "triplestore", "started": 1400000000.0, "latency": 0.012,
+     "method": "POST", "url": "http://localhost:8890/sparql-auth",
+     "query": "SELECT ...", "format": "application/sparql-results+json",
+     "status": 200, "response": "{\\"head\\": ...}"}
+
+Elasticsearch calls have a "body" instead of "query" and "format".
+benchmarks/replay_server.py serves a recording with the original latencies,
+so that a real day of traffic can be replayed offline (see troubleshoot.rst).
+
+How to use:
+
+    recorder = get_recorder()  # None if recording is disabled
+    started = time.time()
+    response = do_request(request)
+    if recorder is not None:
+        recorder.record(TRIPLESTORE, request, response.code, response.body, started, time.time() - started)
+"""
+
+
+TRIPLESTORE = u"triplestore"
+ELASTICSEARCH = u"elasticsearch"
+
+RECORDING_ERROR_MESSAGE = u"Could not record backend call to {0}: {1}"
+
+
+class BackendRecorder(object):
+    "Append backend calls to a file, one JSON line each (safe to use from several threads)"
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._lock = threading.Lock()
+
+    def record(self, backend, request, status, response, started, latency):
+        """
+        request is a dict with the method, url and, for the triplestore, query and format
+        or, for Elasticsearch, body. response is the response body (str or unicode).
+        """
+        entry = {
+            "backend": backend,
+            "started": started,
+            "latency": latency,
+            "status": status,
+            "response": _to_unicode(response)
+        }
+        for key, value in request.items():
+            entry[key] = _to_unicode(value)
+        line = json.dumps(entry) + "\n"
+        try:
+            with self._lock:
+                with open(self.filepath, "a") as recording_file:
+                    recording_file.write(line)
+        except IOError as e:
+            log.logger.error(RECORDING_ERROR_MESSAGE.format(self.filepath, e))
+
+
+def _to_unicode(value):
+    if isinstance(value, str):
+        return value.decode("utf-8", "replace")
+    return value
+
+
+def read_recording(filepath):
+    "Return the recorded calls of a file, in the order they were made"
+    with open(filepath) as recording_file:
+        return [json.loads(line) for line in recording_file if line.strip()]
+
+
+_recorder = None
+
+
+def get_recorder():
+    "Return the BackendRecorder of settings.BACKEND_RECORDING_FILEPATH, or None if recording is disabled"
+    global _recorder
+    filepath = settings.BACKEND_RECORDING_FILEPATH
+    if not filepath:
+        return None
+    if _recorder is None or _recorder.filepath != filepath:
+        _recorder = BackendRecorder(filepath)
+    return _recorder
+
+
+class RecordingCallback(object):
+    """
+    Wrap a streaming_callback, keeping the chunks it is called with so that a streamed
+    response can be recorded. Other attributes (e.g. BindingsStream.exceeded) are the callback's.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.chunks = []
+
+    def __call__(self, chunk):
+        self.chunks.append(chunk)
+        return self.callback(chunk)
+
+    def __getattr__(self, name):
+        return getattr(self.callback, name)
+
+    def body(self):
+        return "".join(self.chunks)
@@ -1,14 +1,18 @@
 # coding: utf-8
 import re
+import threading
+import time
 import uuid
 
 import dateutil.parser
+import greenlet
 import ujson as json
 
-from brainiak import triplestore
+from brainiak import settings, triplestore
 from brainiak.log import get_logger
 from brainiak.prefixes import expand_uri, is_compressed_uri, is_uri, normalize_all_uris_recursively
-from brainiak.triplestore import query_sparql
+from brainiak.schema.ontology_index import is_ontology_change
+from brainiak.triplestore import SparqlResultSet, query_sparql
 from brainiak.type_mapper import MAP_RDF_EXPANDED_TYPE_TO_PYTHON
 from brainiak.utils.resources import LazyObject
 from brainiak.utils import config_parser
@@ -34,6 +38,8 @@ IGNORED_DATATYPES = [XML_LITERAL, XSD_STRING]
 
 
 def get_super_properties(bindings):
+    if isinstance(bindings, SparqlResultSet):
+        return dict((key, value) for key, value in bindings.project('super_property', 'predicate') if key is not None)
     super_properties = {}
     for item in bindings:
         if 'super_property' in item:
@@ -126,6 +132,8 @@ def filter_values(result_dict, key):
     >>> filter_values(result_dict, 'inexistent_key')
     []
     """
+    if isinstance(result_dict, SparqlResultSet):
+        return [value for value in result_dict.values(key) if value is not None]
     return [item[key]['value'] for item in result_dict['results']['bindings'] if item.get(key)]
 
 
@@ -157,6 +165,9 @@ def bindings_to_dict(key_name, bindings):
                                  u'range': {u'type': u'uri', u'value': u'http://www.w3.org/1999/02/22-rdf-syntax-ns#XMLLiteral'},
                                  u'type': {u'type': u'uri', u'value': u'http://www.w3.org/2002/07/owl#DatatypeProperty'}}
     """
+    if isinstance(bindings, SparqlResultSet):
+        return dict((value, bindings.row(index)) for index, value in enumerate(bindings.values(key_name))
+                    if value is not None)
     bindings_by_predicate = {}
     for record in bindings['results']['bindings']:
         key_item = record.get(key_name, None)
@@ -196,6 +207,8 @@ def compress_keys_and_values(result_dict, keymap={}, ignore_keys=[], context=Non
     [{'key': 'foaf:value'}]
 
     """
+    if isinstance(result_dict, SparqlResultSet):
+        return _compress_result_set(result_dict, keymap, ignore_keys, context, do_expand_uri)
     result_list = []
     for item in result_dict['results']['bindings']:
         row = {}
@@ -212,10 +225,31 @@ def compress_keys_and_values(result_dict, keymap={}, ignore_keys=[], context=Non
     return result_list
 
 
+def _compress_result_set(result_set, keymap, ignore_keys, context, do_expand_uri):
+    "compress_keys_and_values of a SparqlResultSet, column by column"
+    result_list = [{} for index in xrange(len(result_set))]
+    for key in result_set.vars:
+        if key in ignore_keys:
+            continue
+        column = result_set.columns[key]
+        effective_key = keymap.get(key, key)
+        shorten = context and effective_key != '@id' and not do_expand_uri
+        if do_expand_uri:
+            effective_key = expand_uri(effective_key)
+        for row, value, type_ in zip(result_list, column.values, column.types):
+            if value is not None:
+                if type_ == 'uri' and shorten:
+                    value = context.shorten_uri(value)
+                row[effective_key] = value
+    return result_list
+
+
 def is_result_empty(result_dict):
     """
     Return True if result_dict['results']['bindings'] has no items, False otherwise.
     """
+    if isinstance(result_dict, SparqlResultSet):
+        return not len(result_dict)
     return not result_dict['results']['bindings']
 
 
@@ -708,10 +742,10 @@ def extract_po_tuples(query_string_dict):
     return sorted(po_list)
 
 
-QUERY_SUBPROPERTIES = u"""
+QUERY_ALL_SUBPROPERTIES = u"""
 DEFINE input:inference <%(ruleset)s>
-SELECT DISTINCT ?property WHERE {
-  ?property rdfs:subPropertyOf <%(property)s>
+SELECT DISTINCT ?property ?super_property WHERE {
+  ?property rdfs:subPropertyOf ?super_property
 }
 """
 
@@ -719,23 +753,101 @@ SELECT DISTINCT ?property WHERE {
 LABEL_PROPERTIES = [RDFS_LABEL]
 
 
+def _subproperties_closure(super_property, subproperties_by_property):
+    closure = []
+    pending = list(subproperties_by_property.get(super_property, []))
+    while pending:
+        property_ = pending.pop(0)
+        if property_ not in closure:
+            closure.append(property_)
+            pending.extend(subproperties_by_property.get(property_, []))
+    return closure
+
+
+class SubPropertiesCache(object):
+    """
+    Subproperties (rdfs:subPropertyOf closure) of all properties, loaded by a single
+    inference query, so looking up the subproperties of a property is a dict access.
+    The closures are reloaded in a background thread when older than ttl seconds,
+    or after expire(), and the previous ones are served meanwhile.
+    LABEL_PROPERTIES is updated (in place) whenever the closures are loaded.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.subproperties = None
+        self.loaded_at = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def refresh(self, async=False):
+        query = QUERY_ALL_SUBPROPERTIES % {"ruleset": settings.DEFAULT_RULESET_URI}
+        result_dict = query_sparql(query, config_parser.get_triplestore_config(), async=async)
+        direct_subproperties = {}
+        for item in result_dict['results']['bindings']:
+            direct_subproperties.setdefault(item['super_property']['value'], []).append(item['property']['value'])
+        self.subproperties = dict((property_, _subproperties_closure(property_, direct_subproperties))
+                                  for property_ in direct_subproperties)
+        self.loaded_at = time.time()
+
+        label_properties = [RDFS_LABEL] + [p for p in self.subproperties.get(RDFS_LABEL, []) if p != RDFS_LABEL]
+        LABEL_PROPERTIES[:] = normalize_all_uris_recursively(label_properties)
+
+    def refresh_in_background(self):
+        "Reload the closures in a background thread, unless they are already being reloaded"
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                # keep serving the previous closures until the next attempt
+                self.loaded_at = time.time()
+                logger.error(_(u"Could not reload subproperties: {0}").format(e))
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        thread = threading.Thread(target=run, name="subproperties_refresh")
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def expire(self):
+        self.loaded_at = 0
+
+    def get(self, super_property):
+        if self.subproperties is None:
+            # there is nothing to serve meanwhile (the load at startup failed): load them now,
+            # without blocking the IOLoop if called by a request greenlet
+            self.refresh(async=greenlet.getcurrent().parent is not None)
+        elif time.time() - self.loaded_at > self.ttl:
+            self.refresh_in_background()
+        return list(self.subproperties.get(super_property, []))
+
+
+subproperties_cache = SubPropertiesCache(settings.SUBPROPERTIES_CACHE_TTL)
+
+
 def get_subproperties(super_property):
-    params = {
-        "ruleset": "http://semantica.globo.com/ruleset",
-        "property": super_property
-    }
-    query = QUERY_SUBPROPERTIES % params
-    result_dict = query_sparql(query,
-                               config_parser.parse_section(),
-                               async=False)
-    subproperties = filter_values(result_dict, "property")
-    return subproperties
+    return subproperties_cache.get(super_property)
 
 
 def load_label_properties():
-    global LABEL_PROPERTIES
-    LABEL_PROPERTIES += get_subproperties(RDFS_LABEL)
-    normalize_all_uris_recursively(LABEL_PROPERTIES)
+    """
+    (Re)load the subproperties of all properties and LABEL_PROPERTIES.
+    Called at startup, and it may be called again at runtime.
+    """
+    subproperties_cache.refresh()
+
+
+def on_ontology_change(event):
+    "Event bus invalidation callback: reload the subproperties at next use if the ontology changed"
+    if is_ontology_change(event):
+        subproperties_cache.expire()
 
 
 def are_there_label_properties_in(instance_data):
@@ -750,6 +862,33 @@ def are_there_label_properties_in(instance_data):
     return False
 
 
+QUERY_LABELS = u"""
+SELECT DISTINCT ?uri ?label {
+  ?uri rdfs:label ?label .
+  FILTER (?uri IN (%(uris)s))
+}
+"""
+
+
+def get_labels(uris, triplestore_config, lang=None, async=True):
+    """
+    Return a dict mapping each URI (of the given ones) to its rdfs:label, using a single query.
+    If there is more than one label, the one in the given language (default: settings.DEFAULT_LANG) is chosen.
+    """
+    if not uris:
+        return {}
+    lang = lang or settings.DEFAULT_LANG
+    query = QUERY_LABELS % {"uris": u", ".join(u"<{0}>".format(uri) for uri in uris)}
+    result_dict = query_sparql(query, triplestore_config, async=async)
+    labels = {}
+    for item in result_dict['results']['bindings']:
+        uri = item["uri"]["value"]
+        label = item["label"]
+        if uri not in labels or label.get("xml:lang") == lang:
+            labels[uri] = label["value"]
+    return labels
+
+
 QUERY_FIND_GRAPH_FROM_CLASS = u"""
 SELECT DISTINCT ?graph
 WHERE {GRAPH ?graph { <%(class_uri)s> a owl:Class }}
@@ -759,7 +898,7 @@ WHERE {GRAPH ?graph { <%(class_uri)s> a owl:Class }}
 def find_graph_from_class(class_uri):
     query = QUERY_FIND_GRAPH_FROM_CLASS % {'class_uri': class_uri}
     result_dict = query_sparql(query,
-                               config_parser.parse_section(),
+                               config_parser.get_triplestore_config(),
                                async=False)
     graphs = filter_values(result_dict, 'graph')
     try:
@@ -777,7 +916,7 @@ WHERE {GRAPH ?graph { ?class a owl:Class. <%(instance_uri)s> a ?class . }}
 def find_graph_and_class_from_instance(instance_uri):
     query = QUERY_FIND_GRAPH_AND_CLASS_FROM_INSTANCE % {'instance_uri': instance_uri}
     result_dict = query_sparql(query,
-                               config_parser.parse_section(),
+                               config_parser.get_triplestore_config(),
                                async=False)
     graphs = filter_values(result_dict, 'graph')
     classes = filter_values(result_dict, 'class')
@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental parsing of SPARQL results, in JSON (application/sparql-results+json), TSV or CSV,
+so that bindings can be handled while the triplestore is still sending them.
+"""
+import codecs
+import csv
+import re
+
+import ujson as json
+
+
+# characters that change the parser state; anything else is skipped at once
+SPECIAL_CHARACTERS = re.compile(r'[{}\[\]"\\]')
+# possible end of a binding: the end of its last term and its own, before the next binding or the end of the bindings
+BINDING_END_PATTERN = re.compile(r'\}\s*\}(?=\s*[,\]])')
+MAX_BINDING_END_ATTEMPTS = 4
+
+
+class ResultLimitExceeded(Exception):
+    pass
+
+
+class BindingsParser(object):
+    """
+    Feed it the chunks of a SPARQL JSON response, as they arrive, and get back
+    the bindings (dicts like those in result_dict["results"]["bindings"]) completed by each chunk.
+
+    >>> parser = BindingsParser()
+    >>> parser.feed('{"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri", "va')
+    []
+    >>> parser.feed('lue": "http://a"}}, {"s": {"type": "uri", "value": "http://b"}}]}}')
+    [{u's': {u'type': u'uri', u'value': u'http://a'}}, {u's': {u'type': u'uri', u'value': u'http://b'}}]
+    >>> parser.finished
+    True
+    >>> parser.vars
+    [u's']
+
+    If max_rows or max_bytes are given (0 means unlimited), feed raises ResultLimitExceeded
+    as soon as the response has more bindings or bytes than that.
+    """
+
+    # depth of the bindings array in {"results": {"bindings": [...]}}, as of the vars array in {"head": {"vars": [...]}}
+    BINDINGS_DEPTH = 2
+
+    def __init__(self, max_rows=0, max_bytes=0):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = u""
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped_position = None
+        self._string_start = None
+        self._last_string = None
+        self._in_bindings = False
+        self._item_start = None
+        self._in_vars = False
+        self.vars = None
+        self.bindings_found = False
+        self.finished = False
+        self.bytes_read = 0
+        self.rows_read = 0
+
+    def feed(self, chunk):
+        if isinstance(chunk, str):
+            self.bytes_read += len(chunk)
+            chunk = self._decoder.decode(chunk)
+        else:
+            self.bytes_read += len(chunk.encode("utf-8"))
+        if self.max_bytes and self.bytes_read > self.max_bytes:
+            raise ResultLimitExceeded(u"The result has more than {0} bytes".format(self.max_bytes))
+        self._buffer += chunk
+        items = []
+        batch_failed = False
+        while True:
+            if self._between_bindings():
+                bindings = self._parse_complete_bindings()
+                batch_failed = not bindings
+                self._count(items, bindings)
+            if not self._scan(items, stop_after_binding=not batch_failed):
+                return items
+
+    def _count(self, items, bindings):
+        items.extend(bindings)
+        self.rows_read += len(bindings)
+        if self.max_rows and self.rows_read > self.max_rows:
+            raise ResultLimitExceeded(u"The result has more than {0} rows".format(self.max_rows))
+
+    def _between_bindings(self):
+        return self._in_bindings and self._item_start is None and not self._in_string \
+            and self._depth == self.BINDINGS_DEPTH + 1
+
+    def _parse_complete_bindings(self):
+        """
+        Parse at once (by ujson) the bindings at the start of the buffer, up to the last one completed.
+        The end of a binding ("}}" followed by "," or "]") can also be found inside literals,
+        so the last few ends are tried; if none of them parses, _scan finds the bindings.
+        """
+        buffer = self._buffer
+        ends = [match.end() for match in BINDING_END_PATTERN.finditer(buffer)]
+        for end in ends[:-MAX_BINDING_END_ATTEMPTS - 1:-1]:
+            try:
+                bindings = json.loads(u"[" + buffer[:end].lstrip(u" \t\r\n,") + u"]")
+            except ValueError:
+                continue
+            self._cut(end)
+            return bindings
+        return []
+
+    def _scan(self, items, stop_after_binding=True):
+        """
+        Find the bindings in the buffer character by character, appending them to items.
+        Return True if the scan stopped at the start of the bindings array or after a binding
+        (if stop_after_binding), so the following ones may be parsed at once.
+        """
+        buffer = self._buffer
+        for match in SPECIAL_CHARACTERS.finditer(buffer, self._position):
+            index = match.start()
+            character = match.group()
+            if self._in_string:
+                if index == self._escaped_position:
+                    continue
+                if character == u'\\':
+                    self._escaped_position = index + 1
+                elif character == u'"':
+                    self._in_string = False
+                    self._escaped_position = None
+                    if self._item_start is None:
+                        self._last_string = buffer[self._string_start + 1:index]
+                        if self._in_vars:
+                            self.vars.append(self._last_string)
+            elif character == u'"':
+                self._in_string = True
+                self._string_start = index
+            elif character in u'{[':
+                if character == u'[' and self._depth == self.BINDINGS_DEPTH and self._last_string == u"bindings" \
+                        and not self.bindings_found:
+                    self._in_bindings = self.bindings_found = True
+                    self._depth += 1
+                    self._cut(index + 1)
+                    return True
+                elif character == u'[' and self._depth == self.BINDINGS_DEPTH and self._last_string == u"vars" \
+                        and self.vars is None:
+                    self._in_vars = True
+                    self.vars = []
+                elif character == u'{' and self._in_bindings and self._depth == self.BINDINGS_DEPTH + 1:
+                    self._item_start = index
+                self._depth += 1
+            elif character in u'}]':
+                self._depth -= 1
+                if self._item_start is not None and self._depth == self.BINDINGS_DEPTH + 1:
+                    self._count(items, [json.loads(buffer[self._item_start:index + 1])])
+                    self._item_start = None
+                    if stop_after_binding:
+                        self._cut(index + 1)
+                        return True
+                elif self._in_bindings and self._depth == self.BINDINGS_DEPTH:
+                    self._in_bindings = False
+                    self.finished = True
+                elif self._in_vars and self._depth == self.BINDINGS_DEPTH:
+                    self._in_vars = False
+
+        self._discard_parsed(buffer)
+        return False
+
+    def _cut(self, start):
+        "Discard the buffer before start, which is outside of any string or binding"
+        self._buffer = self._buffer[start:]
+        self._position = 0
+        self._string_start = self._escaped_position = None
+
+    def _discard_parsed(self, buffer):
+        "Keep only what may still be needed: the current binding or string"
+        if self._item_start is not None:
+            keep_from = self._item_start
+        elif self._in_string:
+            keep_from = self._string_start
+        else:
+            keep_from = len(buffer)
+
+        self._buffer = buffer[keep_from:]
+        self._position = len(buffer) - keep_from
+        if self._item_start is not None:
+            self._item_start -= keep_from
+        if self._string_start is not None:
+            self._string_start -= keep_from
+        if self._escaped_position is not None:
+            self._escaped_position -= keep_from
+
+    def close(self):
+        "Return the bindings not returned by feed, once the response is over (none, in JSON results)"
+        return []
+
+
+XSD = u"http://www.w3.org/2001/XMLSchema#"
+# unquoted TSV numbers and booleans (Turtle abbreviations)
+TSV_ABBREVIATIONS = [
+    (re.compile(r'^[+-]?\d+$'), XSD + u"integer"),
+    (re.compile(r'^[+-]?\d*\.\d+$'), XSD + u"decimal"),
+    (re.compile(r'^[+-]?(?:\d+\.?\d*|\.\d+)[eE][+-]?\d+$'), XSD + u"double"),
+    (re.compile(r'^(?:true|false)$'), XSD + u"boolean"),
+]
+ESCAPE_PATTERN = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+ESCAPES = {u"t": u"\t", u"n": u"\n", u"r": u"\r", u"b": u"\b", u"f": u"\f"}
+IRI_PATTERN = re.compile(r'^[A-Za-z][A-Za-z0-9+.\-]*:\S*$')
+
+# parsed terms are shared by the rows which repeat them, up to this many terms of at most this length
+MAX_SHARED_TERMS = 100000
+MAX_SHARED_TERM_LENGTH = 256
+
+
+def _unescape(match):
+    code = match.group(1) or match.group(2)
+    if code:
+        return unichr(int(code, 16))
+    return ESCAPES.get(match.group(3), match.group(3))
+
+
+def parse_tsv_term(text):
+    """
+    Return the term (as in SPARQL JSON results) of a SPARQL 1.1 TSV field, or None if unbound
+
+    >>> parse_tsv_term(u'"Rio"@pt') == {"type": "literal", "value": u"Rio", "xml:lang": u"pt"}
+    True
+    >>> parse_tsv_term(u'42') == {"type": "typed-literal", "value": u"42", "datatype": XSD + u"integer"}
+    True
+    """
+    if not text:
+        return None
+    first = text[0]
+    if first == u"<" and text[-1] == u">":
+        return {"type": "uri", "value": text[1:-1]}
+    if first == u'"':
+        end = text.rfind(u'"')
+        value = text[1:end]
+        if u"\\" in value:
+            value = ESCAPE_PATTERN.sub(_unescape, value)
+        suffix = text[end + 1:]
+        if suffix.startswith(u"@"):
+            return {"type": "literal", "value": value, "xml:lang": suffix[1:]}
+        if suffix.startswith(u"^^<"):
+            return {"type": "typed-literal", "value": value, "datatype": suffix[3:-1]}
+        return {"type": "literal", "value": value}
+    if text.startswith(u"_:"):
+        return {"type": "bnode", "value": text[2:]}
+    for pattern, datatype in TSV_ABBREVIATIONS:
+        if pattern.match(text):
+            return {"type": "typed-literal", "value": text, "datatype": datatype}
+    return {"type": "literal", "value": text}
+
+
+def parse_csv_term(text):
+    """
+    Return the term of a SPARQL 1.1 CSV field, or None if empty. CSV results carry no types:
+    IRIs are told from literals by their syntax, and datatypes and languages are lost.
+    """
+    if not text:
+        return None
+    if text.startswith(u"_:"):
+        return {"type": "bnode", "value": text[2:]}
+    if IRI_PATTERN.match(text):
+        return {"type": "uri", "value": text}
+    return {"type": "literal", "value": text}
+
+
+def split_tsv_records(text):
+    "Return the complete records (lines) of TSV text and the remaining text"
+    records = text.split(u"\n")
+    return [record.rstrip(u"\r") for record in records[:-1]], records[-1]
+
+
+def split_tsv_fields(record):
+    return record.split(u"\t")
+
+
+def split_csv_records(text):
+    "Return the complete records of CSV text and the remaining text"
+    # newlines within quoted fields do not end records; "" (an escaped quote) keeps the count even
+    records = []
+    start = scanned = quotes = 0
+    position = text.find(u"\n")
+    while position != -1:
+        quotes += text.count(u'"', scanned, position)
+        scanned = position
+        if quotes % 2 == 0:
+            records.append(text[start:position].rstrip(u"\r"))
+            start = scanned = position + 1
+            quotes = 0
+        position = text.find(u"\n", position + 1)
+    return records, text[start:]
+
+
+def split_csv_fields(record):
+    if u'"' not in record:
+        return record.split(u",")
+    row = next(csv.reader([record.encode("utf-8")]))
+    return [field.decode("utf-8") for field in row]
+
+
+class TabularBindingsParser(object):
+    """
+    Parser of SPARQL 1.1 tabular results, with the interface of BindingsParser:
+    feed it the chunks of the response and get back the bindings of the complete lines,
+    then call close to get the last one. vars is set once the header line is read.
+    The format is given by split_records (text -> complete records, remaining text),
+    split_fields (record -> fields) and parse_term (field -> term or None).
+    """
+
+    def __init__(self, split_records, split_fields, parse_term, max_rows=0, max_bytes=0):
+        self.split_records = split_records
+        self.split_fields = split_fields
+        self.parse_term = parse_term
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = u""
+        self._terms = {}
+        self.vars = None
+        self.bindings_found = False
+        self.finished = False
+        self.bytes_read = 0
+        self.rows_read = 0
+
+    def feed(self, chunk):
+        if isinstance(chunk, str):
+            self.bytes_read += len(chunk)
+            chunk = self._decoder.decode(chunk)
+        else:
+            self.bytes_read += len(chunk.encode("utf-8"))
+        if self.max_bytes and self.bytes_read > self.max_bytes:
+            raise ResultLimitExceeded(u"The result has more than {0} bytes".format(self.max_bytes))
+        records, self._buffer = self.split_records(self._buffer + chunk)
+        return self._parse_records(records)
+
+    def close(self):
+        records = [self._buffer] if self._buffer.strip() else []
+        self._buffer = u""
+        items = self._parse_records(records)
+        self.finished = self.vars is not None
+        return items
+
+    def _parse_records(self, records):
+        items = []
+        for record in records:
+            fields = self.split_fields(record)
+            if self.vars is None:
+                self.vars = [field.strip().strip(u'"').lstrip(u"?$") for field in fields]
+                self.bindings_found = True
+                continue
+            binding = {}
+            for var, field in zip(self.vars, fields):
+                term = self._term(field)
+                if term is not None:
+                    binding[var] = term
+            items.append(binding)
+            self.rows_read += 1
+            if self.max_rows and self.rows_read > self.max_rows:
+                raise ResultLimitExceeded(u"The result has more than {0} rows".format(self.max_rows))
+        return items
+
+    def _term(self, field):
+        term = self._terms.get(field)
+        if term is None:
+            term = self.parse_term(field)
+            if len(field) <= MAX_SHARED_TERM_LENGTH and len(self._terms) < MAX_SHARED_TERMS:
+                self._terms[field] = term
+        return term
+
+
+class TSVBindingsParser(TabularBindingsParser):
+    """
+    Parser of SPARQL 1.1 TSV results (text/tab-separated-values), whose fields are
+    terms in Turtle syntax, so types, datatypes and languages are kept.
+
+    >>> parser = TSVBindingsParser()
+    >>> [binding["label"]["xml:lang"] for binding in parser.feed('?s\\t?label\\n<http://a>\\t"A"@en\\n<http://b>')]
+    [u'en']
+    >>> parser.vars
+    [u's', u'label']
+    >>> parser.close() == [{"s": {"type": "uri", "value": u"http://b"}}]
+    True
+    """
+
+    def __init__(self, max_rows=0, max_bytes=0):
+        super(TSVBindingsParser, self).__init__(split_tsv_records, split_tsv_fields, parse_tsv_term,
+                                                max_rows=max_rows, max_bytes=max_bytes)
+
+
+class CSVBindingsParser(TabularBindingsParser):
+    """
+    Parser of SPARQL 1.1 CSV results (text/csv): only values are sent, see parse_csv_term.
+    """
+
+    def __init__(self, max_rows=0, max_bytes=0):
+        super(CSVBindingsParser, self).__init__(split_csv_records, split_csv_fields, parse_csv_term,
+                                                max_rows=max_rows, max_bytes=max_bytes)
+
+
+PARSERS = {
+    "json": BindingsParser,
+    "tsv": TSVBindingsParser,
+    "csv": CSVBindingsParser
+}
+
+
+def get_parser(result_format="json", max_rows=0, max_bytes=0):
+    return PARSERS[result_format](max_rows=max_rows, max_bytes=max_bytes)
+
+
+def parse_result(body, result_format):
+    "Return the result dict ({'head': {'vars': ...}, 'results': {'bindings': ...}}) of a whole TSV or CSV response"
+    parser = get_parser(result_format)
+    bindings = parser.feed(body)
+    bindings.extend(parser.close())
+    return {"head": {"vars": parser.vars or []}, "results": {"bindings": bindings}}
@@ -44,7 +44,8 @@ class BusNotificationTestCase(TornadoAsyncHTTPTestCase, QueryTestCase):
             "klass": "http://tatipedia.org/Place",
             "graph": u"http://somegraph.org/",
             "action": "PUT",
-            "instance_data": ANY
+            "instance_data": ANY,
+            "triplestore_config": ANY
         }
 
         actual_new_york = self.fetch('/anything/Place/new_york?class_prefix=http://tatipedia.org/&instance_prefix=http://tatipedia.org/&graph_uri=http://somegraph.org/',
@@ -69,7 +70,8 @@ class BusNotificationTestCase(TornadoAsyncHTTPTestCase, QueryTestCase):
             "instance": "http://tatipedia.org/new_york",
             "klass": "http://tatipedia.org/Place",
             "graph": "http://somegraph.org/",
-            "action": "DELETE"
+            "action": "DELETE",
+            "triplestore_config": ANY
         }
 
         deleted_new_york = self.fetch(
@@ -97,7 +99,8 @@ class BusNotificationTestCase(TornadoAsyncHTTPTestCase, QueryTestCase):
             "graph": "http://somegraph.org/",
             "action": "POST",
             "instance": ANY,
-            "instance_data": ANY
+            "instance_data": ANY,
+            "triplestore_config": ANY
         }
         response = self.fetch('/tpedia/SoccerClub/?class_prefix=http://tatipedia.org/&graph_uri=http://somegraph.org/', method='POST', body=json.dumps(CSA_FOOTBALL_TEAM))
         self.assertEqual(response.code, 201)
@@ -6,6 +6,7 @@ from mock import patch, PropertyMock
 from brainiak import settings
 from brainiak.collection import get_collection
 from brainiak.collection.get_collection import Query
+from brainiak.triplestore import SparqlResultSet
 from tests.mocks import Params
 from tests.sparql import QueryTestCase
 from tests.utils import URLTestCase
@@ -983,7 +984,7 @@ class FilterInstancesQueryTestCase(QueryTestCase):
         self.assertEqual(len(computed_bindings), 2)
         self.assertEqual(sorted(computed_bindings), sorted(expected_bindings))
 
-    @patch("brainiak.collection.get_collection.query_filter_instances", return_value={"results": {"bindings": []}})
+    @patch("brainiak.collection.get_collection.query_filter_instances", return_value=SparqlResultSet())
     @patch("brainiak.collection.get_collection.query_count_filter_instances", return_value={"results": {"bindings": []}})
     @patch("brainiak.collection.get_collection.class_exists", return_value=True)
     def test_filter_instances_result_is_empty_raises_404(self, mocked_class_exists, mocked_query_count, mocked_query):
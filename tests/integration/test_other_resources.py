@@ -141,3 +141,47 @@ class LifecheckTestCase(TornadoAsyncHTTPTestCase):
         response = self.fetch('/_status/', method='GET')
         self.assertEqual(response.code, 200)
         self.assertEqual(response.body, "Virtuoso FAILED\nActiveMQ FAILED")
+
+
+class ProfileStatusTestCase(TornadoAsyncHTTPTestCase):
+
+    TOKEN_HEADERS = {"X-Brainiak-Profile-Token": "secret"}
+
+    @patch("brainiak.handlers.logger")
+    @patch("brainiak.utils.profiling.settings.PROFILE_TOKEN", None)
+    def test_profile_is_disabled_by_default(self, log):
+        response = self.fetch('/_status/profile?seconds=1', method='GET', headers=self.TOKEN_HEADERS)
+        self.assertEqual(response.code, 403)
+
+    @patch("brainiak.handlers.logger")
+    @patch("brainiak.utils.profiling.settings.PROFILE_TOKEN", "secret")
+    def test_profile_requires_token(self, log):
+        response = self.fetch('/_status/profile?seconds=1', method='GET')
+        self.assertEqual(response.code, 403)
+
+    @patch("brainiak.handlers.logger")
+    @patch("brainiak.utils.profiling.settings.PROFILE_TOKEN", "secret")
+    def test_profile_with_invalid_seconds(self, log):
+        response = self.fetch('/_status/profile?seconds=3600', method='GET', headers=self.TOKEN_HEADERS)
+        self.assertEqual(response.code, 400)
+
+    @patch("brainiak.utils.profiling.settings.PROFILE_TOKEN", "secret")
+    def test_profile_returns_collapsed_stacks(self):
+        with patch("brainiak.utils.profiling.SamplingProfiler.collapsed", return_value="a;b 2\n"):
+            response = self.fetch('/_status/profile?seconds=0.1', method='GET', headers=self.TOKEN_HEADERS)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers["Content-Type"], "text/plain; charset=UTF-8")
+        self.assertEqual(response.body, "a;b 2\n")
+
+    @patch("brainiak.utils.profiling.settings.PROFILE_TOKEN", "secret")
+    def test_request_profile_replaces_response(self):
+        response = self.fetch('/_version?_profile=1', method='GET', headers=self.TOKEN_HEADERS)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers["Content-Type"], "text/plain; charset=UTF-8")
+        self.assertIn("Ordered by: cumulative time", response.body)
+
+    @patch("brainiak.handlers.logger")
+    @patch("brainiak.utils.profiling.settings.PROFILE_TOKEN", "secret")
+    def test_request_profile_requires_token(self, log):
+        response = self.fetch('/_version?_profile=1', method='GET')
+        self.assertEqual(response.code, 403)
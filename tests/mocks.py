@@ -167,3 +167,74 @@ class Params(dict):
     def __init__(self, params):
         self.triplestore_config = triplestore_config
         self.update(params)
+
+
+class InMemoryBroker(object):
+    """
+    Stand-in for ActiveMQ: messages sent by any connection are delivered
+    synchronously to the listeners of the connections subscribed to the
+    destination. Composite destinations (e.g. /queue/a,b,topic://c) are
+    resolved the way ActiveMQ does.
+    """
+
+    def __init__(self):
+        self.subscriptions = {}
+        self.sent = []
+
+    def Connection(self, host_and_ports=None, **kw):
+        return InMemoryConnection(self)
+
+    def resolve(self, destination):
+        first, _, rest = destination.partition(",")
+        default_type = first.split("/")[1]
+        destinations = [first]
+        for item in rest.split(",") if rest else []:
+            if "://" in item:
+                type_, name = item.split("://")
+                destinations.append(u"/{0}/{1}".format(type_, name))
+            else:
+                destinations.append(u"/{0}/{1}".format(default_type, item))
+        return destinations
+
+    def publish(self, body, destination):
+        self.sent.append((destination, body))
+        for effective_destination in self.resolve(destination):
+            for connection in self.subscriptions.get(effective_destination, []):
+                connection.deliver(effective_destination, body)
+
+
+class InMemoryConnection(object):
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.listeners = {}
+        self.connected = False
+
+    def set_listener(self, name, listener):
+        self.listeners[name] = listener
+
+    def start(self):
+        pass
+
+    def connect(self, *args, **kw):
+        self.connected = True
+
+    def disconnect(self, *args, **kw):
+        self.connected = False
+
+    def begin(self, *args, **kw):
+        pass
+
+    def abort(self, *args, **kw):
+        pass
+
+    def subscribe(self, destination, **kw):
+        self.broker.subscriptions.setdefault(destination, []).append(self)
+
+    def send(self, message, destination, **kw):
+        self.broker.publish(message, destination)
+
+    def deliver(self, destination, body):
+        headers = {"destination": destination}
+        for listener in self.listeners.values():
+            listener.on_message(headers, body)
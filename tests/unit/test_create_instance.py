@@ -4,7 +4,11 @@ import unittest
 from mock import patch
 from tornado.web import HTTPError
 
-from brainiak.instance.create_instance import create_instance
+from dad.event import SemanticEvent
+
+from brainiak.event_bus import resolve_object_titles
+from brainiak.instance.create_instance import create_instance, build_instance_data
+from brainiak.instance.get_instance import assemble_instance_json
 from brainiak.utils.params import ParamDict
 from tests.mocks import MockHandler, mock_schema
 
@@ -26,3 +30,84 @@ class TestCaseInstanceCreateResource(unittest.TestCase):
             create_instance(params, instance_data, "http://uri-teste")
             expected = ["The property (http://www.w3.org/2000/01/rdf-schema#label) defined in the schema (http://somedomain/class) must map a unique value. The value provided (teste) is already used by another instance."]
             self.assertEqual(json.loads(str(e.exception)), expected)
+
+
+class BuildInstanceDataTestCase(unittest.TestCase):
+
+    maxDiff = None
+
+    CLASS_OBJECT = {
+        "id": "http://on.to/City",
+        "title": "City",
+        "properties": {
+            "http://on.to/name": {"type": "string", "datatype": "http://www.w3.org/2001/XMLSchema#string"},
+            "http://on.to/population": {"type": "integer", "datatype": "http://www.w3.org/2001/XMLSchema#int"},
+            "http://on.to/country": {"type": "string", "range": {"type": "string", "format": "uri"}},
+            "http://on.to/neighbour": {"type": "array", "range": {"type": "string", "format": "uri"}}
+        }
+    }
+
+    def prepare_params(self, **params):
+        param_dict = dict(context_name="on", class_name="City", class_uri="http://on.to/City",
+                          instance_uri="http://on.to/City/York", **params)
+        return ParamDict(MockHandler(**param_dict), **param_dict)
+
+    def test_build_instance_data(self):
+        instance_data = {
+            "@context": {"on": "http://on.to/"},
+            "http://on.to/name": "York",
+            "http://on.to/population": True,
+            "http://on.to/country": {"@id": "http://on.to/England"},
+            "http://on.to/neighbour": ["http://on.to/Leeds"],
+            "http://on.to/unknown": "ignored"
+        }
+        expected = {
+            "_base_url": "http://mock.test.com/",
+            "_instance_prefix": "http://on.to/City/",
+            "_resource_id": "York",
+            "_type_title": "City",
+            "@id": "http://on.to/City/York",
+            "@type": "http://on.to/City",
+            "http://on.to/name": u"York",
+            "http://on.to/population": 1,
+            "http://on.to/country": {"@id": "http://on.to/England"},
+            "http://on.to/neighbour": [{"@id": "http://on.to/Leeds"}]
+        }
+        computed = build_instance_data(self.prepare_params(), instance_data, self.CLASS_OBJECT)
+        self.assertEqual(computed, expected)
+        self.assertIsInstance(computed["http://on.to/name"], unicode)
+        self.assertIsInstance(computed["http://on.to/population"], int)
+        self.assertIn("@context", instance_data)
+
+    def test_build_instance_data_without_meta_properties(self):
+        computed = build_instance_data(self.prepare_params(meta_properties="0"),
+                                       {"http://on.to/name": "York"}, self.CLASS_OBJECT)
+        self.assertEqual(computed, {"http://on.to/name": u"York"})
+
+    @patch("brainiak.event_bus.get_labels", return_value={"http://on.to/England": "England", "http://on.to/Leeds": "Leeds"})
+    def test_post_payload_is_the_put_payload(self, mocked_get_labels):
+        instance_data = {
+            "http://on.to/name": "York",
+            "http://on.to/population": 200000,
+            "http://on.to/country": "http://on.to/England",
+            "http://on.to/neighbour": ["http://on.to/Leeds"]
+        }
+        # what get_instance (sent on PUT) reads back from the triplestore
+        bindings = [
+            {"predicate": {"value": "http://on.to/name"}, "object": {"type": "literal", "value": "York"}},
+            {"predicate": {"value": "http://on.to/population"},
+             "object": {"type": "typed-literal", "value": "200000"}},
+            {"predicate": {"value": "http://on.to/country"}, "object": {"type": "uri", "value": "http://on.to/England"},
+             "object_label": {"value": "England"}},
+            {"predicate": {"value": "http://on.to/neighbour"}, "object": {"type": "uri", "value": "http://on.to/Leeds"},
+             "object_label": {"value": "Leeds"}}
+        ]
+        put_payload = assemble_instance_json(self.prepare_params(expand_object_properties="1"),
+                                             {"results": {"bindings": bindings}}, self.CLASS_OBJECT)
+
+        post_payload = build_instance_data(self.prepare_params(), instance_data, self.CLASS_OBJECT)
+        event = SemanticEvent(action="POST", klass="http://on.to/City", graph="http://on.to/",
+                              instance="http://on.to/City/York", instance_data=post_payload)
+        resolve_object_titles([event], {}, async=False)
+
+        self.assertEqual(post_payload, put_payload)
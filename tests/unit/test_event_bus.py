@@ -1,10 +1,15 @@
-from mock import patch
+import os
+import tempfile
+from mock import patch, Mock
 from unittest import TestCase
 
+from dad.event import SemanticEvent
 from dad.mom import MiddlewareError
+from stomp.exception import NotConnectedException
 
 from brainiak import event_bus
-from brainiak.event_bus import NotificationFailure
+from brainiak.event_bus import NotificationFailure, NotificationQueue, NotificationQueueFull
+from tests.mocks import InMemoryBroker
 
 
 class EventBusTestCase(TestCase):
@@ -28,3 +33,320 @@ class EventBusTestCase(TestCase):
     @patch("brainiak.event_bus.middleware")
     def test_notify_raises_exception(self, mocked_middleware, mocked_notify, mocked_settings, mocked_logger):
         self.assertRaises(NotificationFailure, event_bus.notify_bus, action="1", klass="2", graph="3", instance="4")
+
+
+class CacheInvalidationTestCase(TestCase):
+
+    def setUp(self):
+        self.original_callbacks = list(event_bus.invalidation_callbacks)
+
+    def tearDown(self):
+        event_bus.invalidation_callbacks[:] = self.original_callbacks
+
+    @patch("brainiak.event_bus.cache.purge_a_class")
+    @patch("brainiak.event_bus.cache.purge_an_instance")
+    def test_invalidate_cache_of_instance(self, mocked_purge_instance, mocked_purge_class):
+        event_bus.invalidate_cache({"action": "PUT", "klass": "2", "graph": "3", "instance": "4"})
+        mocked_purge_instance.assert_called_with("4")
+        self.assertFalse(mocked_purge_class.called)
+
+    @patch("brainiak.event_bus.cache.purge_a_class")
+    @patch("brainiak.event_bus.cache.purge_an_instance")
+    def test_invalidate_cache_of_class(self, mocked_purge_instance, mocked_purge_class):
+        event_bus.invalidate_cache({"action": "PUT", "klass": "2", "graph": "3", "instance": ""})
+        mocked_purge_class.assert_called_with("3", "2")
+        self.assertFalse(mocked_purge_instance.called)
+
+    @patch("brainiak.event_bus.cache.purge_an_instance")
+    def test_invalidate_cache_calls_registered_callbacks(self, mocked_purge_instance):
+        received = []
+        event_bus.on_invalidation(received.append)
+        event = {"action": "DELETE", "klass": "2", "graph": "3", "instance": "4"}
+        event_bus.invalidate_cache(event)
+        self.assertEqual(received, [event])
+
+    @patch("brainiak.event_bus.logger")
+    @patch("brainiak.event_bus.invalidate_cache")
+    def test_listener_ignores_malformed_message(self, mocked_invalidate, mocked_logger):
+        listener = event_bus.CacheInvalidationListener()
+        listener.on_message({}, "not json")
+        self.assertFalse(mocked_invalidate.called)
+        self.assertTrue(mocked_logger.error.called)
+
+    @patch("brainiak.event_bus.logger")
+    @patch("brainiak.event_bus.invalidate_cache", side_effect=Exception("mocked failure"))
+    def test_listener_survives_invalidation_failure(self, mocked_invalidate, mocked_logger):
+        listener = event_bus.CacheInvalidationListener()
+        listener.on_message({}, '{"instance": "4"}')
+        self.assertTrue(mocked_logger.error.called)
+
+    @patch("brainiak.event_bus.logger")
+    @patch("brainiak.event_bus.settings", EVENT_BUS_HOST="localhost", EVENT_BUS_PORT=61613,
+           NOTIFY_BUS=True, EVENT_BUS_SUBSCRIBE=True, EVENT_BUS_ASYNC=False, EVENT_BUS_INVALIDATION_TOPIC="brainiak.invalidation")
+    @patch("brainiak.event_bus.cache.purge_an_instance")
+    def test_write_on_one_node_invalidates_cache_on_subscriber(self, mocked_purge, mocked_settings, mocked_logger):
+        broker = InMemoryBroker()
+        with patch("stomp.Connection", broker.Connection):
+            event_bus.subscribe()
+            event_bus.initialize()
+            event_bus.notify_bus(action="PUT", klass="2", graph="3", instance="http://some/instance")
+
+        destinations = [destination for (destination, body) in broker.sent]
+        self.assertEqual(destinations, ["/queue/elasticsearch,solr,topic://brainiak.invalidation"])
+        mocked_purge.assert_called_once_with("http://some/instance")
+
+    @patch("brainiak.event_bus.logger")
+    @patch("brainiak.event_bus.stomp.Connection", side_effect=NotConnectedException())
+    def test_subscribe_failure_is_logged(self, mocked_connection, mocked_logger):
+        self.assertEqual(event_bus.subscribe(), None)
+        self.assertTrue(mocked_logger.error.called)
+
+
+class NotificationQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.sent = []
+        self.spool_filepath = tempfile.mktemp()
+
+    def tearDown(self):
+        if os.path.exists(self.spool_filepath):
+            os.remove(self.spool_filepath)
+
+    def event(self, instance):
+        return SemanticEvent(action="PUT", klass="2", graph="3", instance=instance)
+
+    def test_flush_sends_events_in_batches(self):
+        queue = NotificationQueue(self.sent.append, batch_size=2)
+        for instance in ["a", "b", "c"]:
+            queue.put(self.event(instance))
+
+        self.assertTrue(queue.flush())
+        self.assertEqual([e.arguments["instance"] for e in self.sent], ["a", "b"])
+        self.assertEqual(queue.pending(), 1)
+
+        queue.flush()
+        self.assertEqual([e.arguments["instance"] for e in self.sent], ["a", "b", "c"])
+
+    def test_put_raises_when_queue_is_full_and_there_is_no_spool(self):
+        queue = NotificationQueue(self.sent.append, max_size=1)
+        queue.put(self.event("a"))
+        self.assertRaises(NotificationQueueFull, queue.put, self.event("b"))
+
+    def test_put_spools_when_queue_is_full(self):
+        queue = NotificationQueue(self.sent.append, max_size=1, spool_filepath=self.spool_filepath)
+        queue.put(self.event("a"))
+        queue.put(self.event("b"))
+        self.assertEqual(queue.pending(), 1)
+        self.assertEqual(queue.spooled(), 1)
+
+    @patch("brainiak.event_bus.logger")
+    def test_send_retries_with_backoff(self, mocked_logger):
+        publish = Mock(side_effect=[MiddlewareError("mocked failure"), None])
+        queue = NotificationQueue(publish, max_retries=1, backoff=0.001)
+        queue.put(self.event("a"))
+        self.assertTrue(queue.flush())
+        self.assertEqual(publish.call_count, 2)
+
+    def test_backoff_delay_is_exponential_and_bounded(self):
+        queue = NotificationQueue(self.sent.append, backoff=1, max_backoff=5)
+        self.assertEqual([queue.backoff_delay(i) for i in range(4)], [1, 2, 4, 5])
+
+    @patch("brainiak.event_bus.logger")
+    def test_failed_events_are_spooled_and_resent_first(self, mocked_logger):
+        broker_is_down = [True]
+
+        def publish(event):
+            if broker_is_down[0]:
+                raise MiddlewareError("mocked failure")
+            self.sent.append(event)
+
+        queue = NotificationQueue(publish, max_retries=0, spool_filepath=self.spool_filepath)
+        queue.put(self.event("a"))
+        self.assertFalse(queue.flush())
+        self.assertEqual(queue.spooled(), 1)
+
+        broker_is_down[0] = False
+        queue.put(self.event("b"))
+        self.assertTrue(queue.flush())
+        self.assertEqual([e.arguments["instance"] for e in self.sent], ["a", "b"])
+        self.assertEqual(queue.spooled(), 0)
+
+    @patch("brainiak.event_bus.logger")
+    def test_spooled_events_are_kept_until_sent(self, mocked_logger):
+        publish = Mock(side_effect=MiddlewareError("mocked failure"))
+        queue = NotificationQueue(publish, max_retries=0, spool_filepath=self.spool_filepath)
+        queue.spool([self.event("a"), self.event("b")])
+        self.assertFalse(queue.flush())
+        self.assertEqual(queue.spooled(), 2)
+        self.assertFalse(queue.flush())
+        self.assertEqual(queue.spooled(), 2)
+
+    def test_events_spooled_while_sending_are_kept(self):
+        queue = NotificationQueue(lambda event: queue.spool([self.event("b")]),
+                                  spool_filepath=self.spool_filepath)
+        queue.spool([self.event("a")])
+        self.assertTrue(queue.flush())
+        spooled, lines = queue.unspool()
+        self.assertEqual([e.arguments["instance"] for e in spooled], ["b"])
+
+    @patch("brainiak.event_bus.logger")
+    def test_invalid_spooled_events_are_dropped(self, mocked_logger):
+        with open(self.spool_filepath, "w") as spool_file:
+            spool_file.write("not json\n")
+        queue = NotificationQueue(self.sent.append, spool_filepath=self.spool_filepath)
+        self.assertTrue(queue.flush())
+        self.assertEqual(self.sent, [])
+        self.assertEqual(queue.spooled(), 0)
+        self.assertTrue(mocked_logger.error.called)
+
+    @patch("brainiak.event_bus.logger")
+    def test_send_retries_any_failure(self, mocked_logger):
+        publish = Mock(side_effect=[IOError("mocked failure"), None])
+        queue = NotificationQueue(publish, max_retries=1, backoff=0.001)
+        queue.put(self.event("a"))
+        self.assertTrue(queue.flush())
+        self.assertEqual(publish.call_count, 2)
+
+    @patch("brainiak.event_bus.logger")
+    def test_batch_is_sent_when_prepare_fails(self, mocked_logger):
+        queue = NotificationQueue(self.sent.append, prepare=Mock(side_effect=Exception("mocked failure")))
+        queue.put(self.event("a"))
+        self.assertTrue(queue.flush())
+        self.assertEqual(len(self.sent), 1)
+        self.assertTrue(mocked_logger.error.called)
+
+    @patch("brainiak.event_bus.logger")
+    def test_flusher_survives_failures(self, mocked_logger):
+        queue = NotificationQueue(self.sent.append, backoff=0.001)
+
+        def flush(timeout=None):
+            if flush.calls == 0:
+                flush.calls += 1
+                raise Exception("mocked failure")
+            queue._stopped.set()
+        flush.calls = 0
+
+        with patch.object(queue, "flush", side_effect=flush) as mocked_flush:
+            queue._run()
+        self.assertEqual(mocked_flush.call_count, 2)
+        self.assertTrue(mocked_logger.error.called)
+
+    @patch("brainiak.event_bus.logger")
+    @patch("brainiak.event_bus.settings", NOTIFY_BUS=True)
+    @patch("brainiak.event_bus.notification_queue")
+    def test_notify_bus_enqueues_event(self, mocked_queue, mocked_settings, mocked_logger):
+        event_bus.notify_bus(action="1", klass="2", graph="3", instance="4")
+        self.assertTrue(mocked_queue.put.called)
+
+    @patch("brainiak.event_bus.logger")
+    @patch("brainiak.event_bus.settings", NOTIFY_BUS=True)
+    @patch("brainiak.event_bus.notification_queue")
+    def test_notify_bus_raises_when_queue_is_full(self, mocked_queue, mocked_settings, mocked_logger):
+        mocked_queue.put.side_effect = NotificationQueueFull("mocked failure")
+        self.assertRaises(NotificationFailure, event_bus.notify_bus, action="1", klass="2", graph="3", instance="4")
+
+    @patch("brainiak.event_bus.logger")
+    @patch("brainiak.event_bus.settings", NOTIFY_BUS=False)
+    @patch("brainiak.event_bus.notification_queue")
+    def test_notify_bus_logs_when_queue_is_full(self, mocked_queue, mocked_settings, mocked_logger):
+        mocked_queue.put.side_effect = NotificationQueueFull("mocked failure")
+        event_bus.notify_bus(action="1", klass="2", graph="3", instance="4")
+        self.assertTrue(mocked_logger.error.called)
+
+
+class ResolveObjectTitlesTestCase(TestCase):
+
+    @patch("brainiak.event_bus.get_triplestore_config", return_value={})
+    @patch("brainiak.event_bus.get_labels", return_value={"http://on.to/England": "England"})
+    def test_resolve_object_titles_in_batch(self, mocked_get_labels, mocked_get_triplestore_config):
+        events = [
+            SemanticEvent(action="POST", klass="2", graph="3", instance="a",
+                          instance_data={"http://on.to/country": {"@id": "http://on.to/England"}}),
+            SemanticEvent(action="POST", klass="2", graph="3", instance="b",
+                          instance_data={"http://on.to/neighbour": [{"@id": "http://on.to/Wales"}],
+                                         "http://on.to/name": "York"}),
+            SemanticEvent(action="DELETE", klass="2", graph="3", instance="c")
+        ]
+        event_bus.resolve_object_titles(events, async=False)
+
+        self.assertEqual(mocked_get_labels.call_count, 1)
+        uris = mocked_get_labels.call_args[0][0]
+        self.assertEqual(uris, set(["http://on.to/England", "http://on.to/Wales"]))
+        self.assertEqual(events[0].arguments["instance_data"]["http://on.to/country"],
+                         {"@id": "http://on.to/England", "title": "England"})
+        self.assertEqual(events[1].arguments["instance_data"]["http://on.to/neighbour"],
+                         [{"@id": "http://on.to/Wales"}])
+
+    @patch("brainiak.event_bus.get_triplestore_config")
+    @patch("brainiak.event_bus.get_labels", return_value={})
+    def test_resolve_object_titles_by_event_triplestore(self, mocked_get_labels, mocked_get_triplestore_config):
+        first_config = {"app_name": "First", "url": "http://first"}
+        second_config = {"app_name": "Second", "url": "http://second"}
+        events = []
+        for index, config in enumerate([first_config, second_config, first_config, None]):
+            event = SemanticEvent(action="POST", klass="2", graph="3", instance=str(index),
+                                  instance_data={"http://on.to/country": {"@id": "http://on.to/%d" % index}})
+            event.triplestore_config = config
+            events.append(event)
+        events.append(SemanticEvent(action="POST", klass="2", graph="3", instance="spooled",
+                                    instance_data={"http://on.to/country": {"@id": "http://on.to/spooled"}}))
+
+        event_bus.resolve_object_titles(events, async=False)
+
+        calls = [(call[0][0], call[0][1]) for call in mocked_get_labels.call_args_list]
+        self.assertEqual(calls, [
+            (set(["http://on.to/0", "http://on.to/2"]), first_config),
+            (set(["http://on.to/1"]), second_config),
+            (set(["http://on.to/3", "http://on.to/spooled"]), mocked_get_triplestore_config.return_value)
+        ])
+
+    @patch("brainiak.event_bus.logger")
+    @patch("brainiak.event_bus.settings", NOTIFY_BUS=True)
+    @patch("brainiak.event_bus.notification_queue")
+    def test_notify_bus_enqueues_the_request_triplestore(self, mocked_queue, mocked_settings, mocked_logger):
+        request_config = {"app_name": "Other", "url": "http://other"}
+        event_bus.notify_bus(action="POST", klass="2", graph="3", instance="a", triplestore_config=request_config)
+        event = mocked_queue.put.call_args[0][0]
+        self.assertIs(event.triplestore_config, request_config)
+        self.assertNotIn("triplestore_config", event.to_json())
+
+    @patch("brainiak.event_bus.get_labels")
+    def test_resolve_object_titles_without_objects_does_not_query(self, mocked_get_labels):
+        events = [SemanticEvent(action="POST", klass="2", graph="3", instance="a",
+                                instance_data={"http://on.to/name": "York"})]
+        event_bus.resolve_object_titles(events)
+        self.assertFalse(mocked_get_labels.called)
+
+    @patch("brainiak.event_bus.logger")
+    @patch("brainiak.event_bus.get_triplestore_config", return_value={})
+    @patch("brainiak.event_bus.get_labels", side_effect=Exception("mocked failure"))
+    def test_resolve_object_titles_failure_is_logged(self, mocked_get_labels, mocked_get_triplestore_config, mocked_logger):
+        events = [SemanticEvent(action="POST", klass="2", graph="3", instance="a",
+                                instance_data={"http://on.to/country": {"@id": "http://on.to/England"}})]
+        event_bus.resolve_object_titles(events)
+        self.assertTrue(mocked_logger.error.called)
+
+    @patch("brainiak.event_bus.logger")
+    @patch("brainiak.event_bus.settings", NOTIFY_BUS=True)
+    @patch("brainiak.event_bus.middleware")
+    @patch("brainiak.event_bus.get_triplestore_config")
+    @patch("brainiak.event_bus.get_labels", return_value={"http://on.to/England": "England"})
+    def test_notify_bus_resolves_titles_at_the_request_triplestore(self, mocked_get_labels, mocked_get_triplestore_config,
+                                                                   mocked_middleware, mocked_settings, mocked_logger):
+        request_config = {"app_name": "Other", "url": "http://other"}
+        event_bus.notify_bus(action="POST", klass="2", graph="3", instance="a",
+                             instance_data={"http://on.to/country": {"@id": "http://on.to/England"}},
+                             triplestore_config=request_config)
+        self.assertIs(mocked_get_labels.call_args[0][1], request_config)
+        self.assertFalse(mocked_get_triplestore_config.called)
+        event = mocked_middleware.notify.call_args[0][0]
+        self.assertNotIn("triplestore_config", event.arguments)
+        self.assertEqual(event.arguments["instance_data"]["http://on.to/country"]["title"], "England")
+
+    def test_queue_prepares_batch_before_publishing(self):
+        calls = []
+        queue = NotificationQueue(lambda event: calls.append("publish"),
+                                  prepare=lambda batch: calls.append("prepare"))
+        queue.put(SemanticEvent(action="DELETE", klass="2", graph="3", instance="a"))
+        queue.flush()
+        self.assertEqual(calls, ["prepare", "publish"])
@@ -3,7 +3,7 @@
 from unittest import TestCase
 from jsonschema import validate, ValidationError
 
-from brainiak.suggest.json_schema import SUGGEST_PARAM_SCHEMA
+from brainiak.suggest.json_schema import SUGGEST_PARAM_SCHEMA, SUGGEST_BATCH_PARAM_SCHEMA
 from brainiak.suggest import json_schema as suggest_json_schema
 
 
@@ -130,6 +130,21 @@ class TestSuggestParams(TestCase):
         validate(valid_case, SUGGEST_PARAM_SCHEMA)
 
 
+class TestSuggestBatchParams(TestCase):
+
+    def test_valid_batch(self):
+        valid_case = {"suggests": [{"search": {"pattern": "Rio", "target": "http://test/a"}},
+                                   {"search": {"pattern": "Bra", "target": "http://test/b"}, "response": {"required_fields": True}}]}
+        validate(valid_case, SUGGEST_BATCH_PARAM_SCHEMA)
+
+    def test_invalid_empty_batch(self):
+        self.assertRaises(ValidationError, validate, {"suggests": []}, SUGGEST_BATCH_PARAM_SCHEMA)
+
+    def test_invalid_batch_item(self):
+        invalid_case = {"suggests": [{"search": {"pattern": "Rio"}}]}
+        self.assertRaises(ValidationError, validate, invalid_case, SUGGEST_BATCH_PARAM_SCHEMA)
+
+
 class TestSuggestResponseJson(TestCase):
 
     def setUp(self):
@@ -3,9 +3,10 @@ import unittest
 from mock import patch
 
 from brainiak.collection.get_collection import Query, merge_by_id, build_json,\
-    cast_item, cast_items_values, build_map_property_to_type
+    cast_item, cast_items_values, build_map_property_to_type, query_filter_instances
+from brainiak.triplestore import SparqlResultSet
 from brainiak.utils.params import LIST_PARAMS, ParamDict
-from tests.mocks import MockRequest, MockHandler
+from tests.mocks import MockRequest, MockHandler, Params
 from tests.sparql import strip
 from tests.utils import URLTestCase
 
@@ -514,6 +515,15 @@ class ListQueryTestCase(unittest.TestCase):
         self.assertEqual(strip(computed), strip(expected))
 
 
+class QueryFilterInstancesTestCase(unittest.TestCase):
+
+    @patch("brainiak.collection.get_collection.triplestore.query_sparql", return_value=SparqlResultSet())
+    def test_instances_are_listed_column_wise(self, mocked_query_sparql):
+        params = Params(ListQueryTestCase.default_params)
+        self.assertIsInstance(query_filter_instances(params), SparqlResultSet)
+        self.assertEqual(mocked_query_sparql.call_args[1], {"result_set": True})
+
+
 class BuildJSONTestCase(URLTestCase):
 
     default_params = {
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from mock import patch
+
+from brainiak import settings
+from brainiak.prefixes import MemorizeContext
+from brainiak.schema import get_class, ontology_index
+from brainiak.schema.ontology_index import OntologyIndex, lang_matches, matches_lang_or_untagged
+from brainiak.suggest import suggest
+from brainiak.triplestore import SparqlResultSet
+from brainiak.type_mapper import DATATYPE_PROPERTY, OBJECT_PROPERTY
+from tests.mocks import Params
+
+
+GRAPH = u"http://test/"
+PERSON = u"http://test/Person"
+AUTHOR = u"http://test/Author"
+THING = u"http://www.w3.org/2002/07/owl#Thing"
+NAME = u"http://test/name"
+NICKNAME = u"http://test/nickname"
+WROTE = u"http://test/wrote"
+BOOK = u"http://test/Book"
+NOVEL = u"http://test/Novel"
+XSD_STRING = u"http://www.w3.org/2001/XMLSchema#string"
+
+
+def uri(value):
+    return {"type": "uri", "value": value}
+
+
+def literal(value, lang=None):
+    item = {"type": "literal", "value": value}
+    if lang:
+        item["xml:lang"] = lang
+    return item
+
+
+QUERY_RESULTS = {
+    "QUERY_INDEX_CLASSES": [
+        {"class": uri(klass), "graph": uri(GRAPH)} for klass in (PERSON, AUTHOR, BOOK, NOVEL, THING)
+    ],
+    "QUERY_INDEX_CLASS_LABELS": [
+        {"class": uri(PERSON), "graph": uri(GRAPH), "label": literal(u"Pessoa", "pt"), "comment": literal(u"Ser humano", "pt")},
+        {"class": uri(PERSON), "graph": uri(GRAPH), "label": literal(u"Person", "en")},
+        {"class": uri(AUTHOR), "graph": uri(GRAPH), "label": literal(u"Autor", "pt")},
+        {"class": uri(BOOK), "graph": uri(GRAPH), "label": literal(u"Livro", "pt")},
+        {"class": uri(NOVEL), "graph": uri(GRAPH), "label": literal(u"Romance", "pt")},
+    ],
+    "QUERY_INDEX_SUBCLASSES": [
+        {"class": uri(AUTHOR), "super_class": uri(PERSON)},
+        {"class": uri(PERSON), "super_class": uri(THING)},
+        {"class": uri(NOVEL), "super_class": uri(BOOK)},
+    ],
+    "QUERY_INDEX_RESTRICTIONS": [
+        {"class": uri(PERSON), "predicate": uri(NAME), "min": literal(u"1"), "range": uri(XSD_STRING)},
+        {"class": uri(AUTHOR), "predicate": uri(WROTE), "max": literal(u"5"), "range": uri(BOOK)},
+        {"class": uri(BOOK), "predicate": uri(NAME), "min": literal(u"1"), "range": uri(XSD_STRING)},
+    ],
+    "QUERY_INDEX_PROPERTIES": [
+        {"predicate": uri(NAME), "type": uri(DATATYPE_PROPERTY), "title": literal(u"Nome", "pt"), "unique_value": literal(u"1")},
+        {"predicate": uri(NAME), "type": uri(DATATYPE_PROPERTY), "title": literal(u"Name", "en"), "unique_value": literal(u"1")},
+        {"predicate": uri(NICKNAME), "type": uri(DATATYPE_PROPERTY), "title": literal(u"Apelido", "pt"), "super_property": uri(NAME)},
+        {"predicate": uri(WROTE), "type": uri(OBJECT_PROPERTY), "title": literal(u"Escreveu"), "predicate_comment": literal(u"Obras", "pt")},
+    ],
+    "QUERY_INDEX_DOMAINS": [
+        {"predicate": uri(NAME), "predicate_graph": uri(GRAPH), "domain_class": uri(PERSON)},
+        {"predicate": uri(WROTE), "predicate_graph": uri(GRAPH), "domain_class": uri(AUTHOR)},
+        {"predicate": uri(NAME), "predicate_graph": uri(GRAPH), "domain_class": uri(BOOK)},
+    ],
+    "QUERY_INDEX_RANGES": [
+        {"predicate": uri(NAME), "range": uri(XSD_STRING)},
+        {"predicate": uri(WROTE), "range": uri(BOOK)},
+    ],
+}
+
+
+def fake_query_sparql(query, triplestore_config, async=True, result_set=False, result_format="json"):
+    template_vars = {"uniqueness_property": settings.ANNOTATION_PROPERTY_HAS_UNIQUE_VALUE}
+    for name, bindings in QUERY_RESULTS.items():
+        if query == getattr(ontology_index, name) % template_vars:
+            result_dict = {"results": {"bindings": bindings}}
+            return SparqlResultSet.from_result_dict(result_dict) if result_set else result_dict
+    raise AssertionError(u"Unexpected query {0}".format(query))
+
+
+def build_index():
+    with patch("brainiak.schema.ontology_index.triplestore.query_sparql", side_effect=fake_query_sparql):
+        return OntologyIndex.load({"url": "http://localhost:8890/sparql-auth"})
+
+
+class LangMatchesTestCase(unittest.TestCase):
+
+    def test_lang_matches(self):
+        self.assertTrue(lang_matches(u"pt", u"pt"))
+        self.assertTrue(lang_matches(u"pt-BR", u"pt"))
+        self.assertFalse(lang_matches(u"en", u"pt"))
+        self.assertTrue(lang_matches(u"", u""))
+        self.assertFalse(lang_matches(u"pt", u""))
+        self.assertTrue(lang_matches(u"en", u"*"))
+
+    def test_matches_lang_or_untagged(self):
+        self.assertTrue(matches_lang_or_untagged(u"", u"pt"))
+        self.assertTrue(matches_lang_or_untagged(u"en", None))
+        self.assertFalse(matches_lang_or_untagged(u"en", u"pt"))
+
+
+class OntologyIndexTestCase(unittest.TestCase):
+
+    maxDiff = None
+
+    def setUp(self):
+        self.index = build_index()
+
+    def test_closures(self):
+        self.assertEqual(self.index.ancestors(AUTHOR), [AUTHOR, PERSON, THING])
+        self.assertEqual(self.index.descendants(BOOK), [BOOK, NOVEL])
+        self.assertEqual(self.index.superclasses(AUTHOR), [AUTHOR, PERSON, THING])
+        self.assertEqual(self.index.superclasses(u"http://unknown"), [])
+        self.assertEqual(self.index.subproperties_closure(NAME), [NICKNAME])
+        self.assertEqual(self.index.predicates_by_domain(PERSON), [NAME])
+
+    def test_class_schema(self):
+        result = self.index.class_schema(PERSON, GRAPH, u"pt")
+        self.assertEqual(result["results"]["bindings"],
+                         [{u"title": literal(u"Pessoa", "pt"), u"comment": literal(u"Ser humano", "pt")}])
+        self.assertEqual(self.index.class_schema(PERSON, u"http://other/", u"pt")["results"]["bindings"], [])
+
+    def test_cardinalities(self):
+        bindings = self.index.cardinalities([AUTHOR, PERSON])["results"]["bindings"]
+        self.assertEqual(bindings, [{"predicate": uri(WROTE), "max": literal(u"5"), "range": uri(BOOK)},
+                                    {"predicate": uri(NAME), "min": literal(u"1"), "range": uri(XSD_STRING)}])
+
+    def test_predicates_are_assembled_as_with_sparql(self):
+        superclasses = self.index.superclasses(AUTHOR)
+        bindings = self.index.predicates(superclasses, u"pt")["results"]["bindings"]
+        cardinalities = get_class._extract_cardinalities(self.index.cardinalities(superclasses)["results"]["bindings"], {})
+        predicates = get_class.convert_bindings_dict(MemorizeContext(normalize_uri=u"1"), bindings, cardinalities, superclasses)
+
+        self.assertEqual(predicates[NAME]["title"], u"Nome")
+        self.assertEqual(predicates[NAME]["required"], True)
+        self.assertEqual(predicates[NAME]["unique_value"], True)
+        self.assertEqual(predicates[WROTE]["range"], {u"@id": BOOK, u"graph": GRAPH, u"title": u"Livro",
+                                                      u"type": u"string", u"format": u"uri"})
+        self.assertEqual(predicates[WROTE]["description"], u"Obras")
+        self.assertEqual(predicates[WROTE]["type"], u"array")
+        self.assertEqual(predicates[WROTE]["class"], AUTHOR)
+
+    def test_predicate_ranges(self):
+        bindings = self.index.predicate_ranges(WROTE, u"pt")["results"]["bindings"]
+        self.assertEqual(bindings, [
+            {u"range": uri(BOOK), u"range_label": literal(u"Livro", "pt"), u"range_graph": uri(GRAPH)},
+            {u"range": uri(NOVEL), u"range_label": literal(u"Romance", "pt"), u"range_graph": uri(GRAPH)}
+        ])
+        self.assertEqual(self.index.predicate_ranges(u"http://unknown")["results"]["bindings"], [])
+
+
+class OntologyIndexUsageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        ontology_index._indexes.clear()
+        ontology_index._indexes["Brainiak"] = build_index()
+
+    def tearDown(self):
+        ontology_index._indexes.clear()
+
+    @patch("brainiak.schema.ontology_index.settings.ONTOLOGY_INDEX", True)
+    @patch("brainiak.schema.get_class.triplestore.query_sparql")
+    def test_schema_queries_use_index(self, mocked_query_sparql):
+        params = Params({"class_uri": AUTHOR, "graph_uri": GRAPH, "lang": u"pt"})
+        params.set_aux_param = lambda key, value: None
+        self.assertEqual(get_class.query_superclasses(params), [AUTHOR, PERSON, THING])
+        self.assertEqual(len(get_class.query_cardinalities(params)["results"]["bindings"]), 2)
+        self.assertEqual(get_class.query_class_schema(params)["results"]["bindings"], [{u"title": literal(u"Autor", "pt")}])
+        self.assertEqual(len(get_class.query_predicates(params, [AUTHOR, PERSON])["results"]["bindings"]), 2)
+        self.assertFalse(mocked_query_sparql.called)
+
+    @patch("brainiak.schema.ontology_index.settings.ONTOLOGY_INDEX", True)
+    @patch("brainiak.suggest.suggest.triplestore.query_sparql")
+    def test_suggest_ranges_use_index(self, mocked_query_sparql):
+        params = Params({"lang": u"pt"})
+        result = suggest._get_predicate_ranges(params, {"target": WROTE})
+        self.assertEqual(len(result["results"]["bindings"]), 2)
+        self.assertFalse(mocked_query_sparql.called)
+
+    @patch("brainiak.schema.ontology_index.settings.ONTOLOGY_INDEX", False)
+    def test_index_disabled(self):
+        self.assertEqual(ontology_index.get_ontology_index(Params({})), None)
+
+    def test_is_ontology_change(self):
+        self.assertTrue(ontology_index.is_ontology_change({"instance": u"http://test/x", "klass": ontology_index.OWL_CLASS}))
+        self.assertTrue(ontology_index.is_ontology_change({"klass": PERSON, "graph": GRAPH}))
+        self.assertTrue(ontology_index.is_ontology_change({"instance": NAME, "klass": u"http://other/Type"}))
+        self.assertFalse(ontology_index.is_ontology_change({"instance": u"http://test/john", "klass": PERSON, "graph": GRAPH}))
+
+    @patch("brainiak.schema.ontology_index.settings.ONTOLOGY_INDEX", True)
+    @patch("brainiak.schema.ontology_index.refresh")
+    def test_on_ontology_change_refreshes(self, mocked_refresh):
+        ontology_index.on_ontology_change({"instance": u"http://test/john", "klass": PERSON, "graph": GRAPH})
+        self.assertFalse(mocked_refresh.called)
+        ontology_index.on_ontology_change({"instance": NOVEL, "klass": ontology_index.OWL_CLASS, "graph": GRAPH})
+        mocked_refresh.assert_called_once_with("default")
+
+    @patch("brainiak.schema.ontology_index.logger")
+    @patch("brainiak.schema.ontology_index.get_triplestore_config", return_value={"app_name": "Other", "url": "http://other"})
+    def test_refresh_replaces_index_in_background(self, mocked_get_triplestore_config, mocked_logger):
+        with patch("brainiak.schema.ontology_index.triplestore.query_sparql", side_effect=fake_query_sparql):
+            self.assertTrue(ontology_index.refresh("other"))
+            for thread in ontology_index.threading.enumerate():
+                if thread.name == "ontology_index_refresh":
+                    thread.join()
+        self.assertIn("Other", ontology_index._indexes)
+        self.assertIn(u"Other: Ontology index | 5 classes | 3 predicates", ontology_index.status())
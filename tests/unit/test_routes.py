@@ -1,9 +1,9 @@
 from unittest import TestCase
 
 from brainiak.handlers import ClassHandler, VersionHandler, \
-    HealthcheckHandler, VirtuosoStatusHandler, InstanceHandler, SuggestHandler, \
+    HealthcheckHandler, VirtuosoStatusHandler, InstanceHandler, SuggestHandler, SuggestBatchHandler, \
     StoredQueryCollectionHandler, StoredQueryCRUDHandler, StoredQueryCRUDHandler, \
-    StoredQueryExecutionHandler
+    StoredQueryExecutionHandler, ProfileStatusHandler
 from brainiak.routes import ROUTES
 
 
@@ -24,11 +24,21 @@ class RouteTestCase(TestCase):
         VIRTUOSO_STATUS = '/_status/virtuoso'
         self.assertTrue(regex.match(VIRTUOSO_STATUS))
 
+    def test_status_profile(self):
+        regex = self._regex_for(ProfileStatusHandler)
+        self.assertTrue(regex.match('/_status/profile'))
+        self.assertTrue(regex.match('/_status/profile/'))
+
     def test_range_search(self):
         regex = self._regex_for(SuggestHandler)
         VIRTUOSO_STATUS = '/_suggest'
         self.assertTrue(regex.match(VIRTUOSO_STATUS))
 
+    def test_range_search_batch(self):
+        regex = self._regex_for(SuggestBatchHandler)
+        self.assertTrue(regex.match('/_suggest/_batch'))
+        self.assertFalse(regex.match('/_suggest'))
+
     def test_schema_resource(self):
         regex = self._regex_for(ClassHandler)
         VALID_SCHEMA_RESOURCE_SUFFIX = '/person/Gender/_schema'
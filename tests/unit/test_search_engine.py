@@ -1,5 +1,6 @@
 # coding:utf8
 
+import json
 import logging
 import time
 from unittest import TestCase
@@ -9,6 +10,7 @@ from mock import patch, Mock
 from tornado.httpclient import HTTPError as ClientHTTPError
 
 from brainiak import search_engine
+from brainiak.utils import circuit_breaker
 from tests.mocks import MockResponse
 
 
@@ -168,6 +170,92 @@ class SearchEngineTestCase(TestCase):
     def test_get_response_404_returns_none(self, mock_do_request):
         self.assertIsNone(search_engine._get_response({}))
 
+    @patch("brainiak.utils.circuit_breaker.log")
+    @patch("brainiak.utils.circuit_breaker.settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD", 2)
+    @patch("brainiak.search_engine._do_request",
+           side_effect=ClientHTTPError(500, message="error"))
+    def test_get_response_fails_fast_after_failures(self, mock_do_request, mocked_log):
+        circuit_breaker.circuit_breakers.clear()
+        try:
+            for i in range(2):
+                self.assertRaises(ClientHTTPError, search_engine._get_response, {})
+            self.assertRaises(circuit_breaker.CircuitOpenError, search_engine._get_response, {})
+            self.assertEqual(mock_do_request.call_count, 2)
+        finally:
+            circuit_breaker.circuit_breakers.clear()
+
+    @patch("brainiak.utils.circuit_breaker.log")
+    @patch("brainiak.search_engine._do_request", side_effect=ValueError("mocked failure"))
+    def test_get_response_releases_half_open_probe_on_any_error(self, mock_do_request, mocked_log):
+        circuit_breaker.circuit_breakers.clear()
+        try:
+            breaker = circuit_breaker.get_circuit_breaker("elasticsearch")
+            breaker.on_failure()
+            breaker.state = circuit_breaker.HALF_OPEN
+            self.assertRaises(ValueError, search_engine._get_response, {})
+            self.assertEqual(breaker.state, circuit_breaker.CLOSED)
+            self.assertFalse(breaker.probing)
+        finally:
+            circuit_breaker.circuit_breakers.clear()
+
+    @patch("brainiak.utils.circuit_breaker.log")
+    @patch("brainiak.search_engine._do_request", side_effect=ClientHTTPError(599, message="timeout"))
+    def test_get_response_timeout_is_a_failure(self, mock_do_request, mocked_log):
+        circuit_breaker.circuit_breakers.clear()
+        try:
+            self.assertRaises(ClientHTTPError, search_engine._get_response, {})
+            self.assertEqual(circuit_breaker.get_circuit_breaker("elasticsearch").consecutive_failures, 1)
+        finally:
+            circuit_breaker.circuit_breakers.clear()
+
+    @patch("brainiak.search_engine._get_response",
+           return_value=MockResponse("{}", 200))
+    def test_run_search_is_hedged(self, mock_get_response):
+        search_engine.run_search(body={})
+        self.assertEqual(mock_get_response.call_args[1], {"hedge": True})
+
+    @patch("brainiak.search_engine.settings.ELASTICSEARCH_HEDGE_ENDPOINT", None)
+    @patch("brainiak.utils.circuit_breaker.CircuitBreaker.hedge_delay", return_value=0.1)
+    @patch("brainiak.search_engine._do_request", return_value=MockResponse("{}", 200))
+    def test_get_response_is_not_hedged_without_another_endpoint(self, mock_do_request, mock_hedge_delay):
+        request_params = {"url": u"http://{0}/semantica.place/_search".format(search_engine.ELASTICSEARCH_ENDPOINT)}
+        search_engine._get_response(request_params, hedge=True)
+        self.assertEqual(mock_do_request.call_args[0], (request_params, None, None))
+
+    @patch("brainiak.utils.circuit_breaker.CircuitBreaker.hedge_delay", return_value=0.1)
+    @patch("brainiak.search_engine._do_request", return_value=MockResponse("{}", 200))
+    def test_get_response_is_not_hedged_to_the_same_endpoint(self, mock_do_request, mock_hedge_delay):
+        request_params = {"url": u"http://{0}/semantica.place/_search".format(search_engine.ELASTICSEARCH_ENDPOINT)}
+        with patch("brainiak.search_engine.settings.ELASTICSEARCH_HEDGE_ENDPOINT", search_engine.ELASTICSEARCH_ENDPOINT):
+            search_engine._get_response(request_params, hedge=True)
+        self.assertEqual(mock_do_request.call_args[0], (request_params, None, None))
+
+    @patch("brainiak.search_engine.settings.ELASTICSEARCH_HEDGE_ENDPOINT", "replica:9200")
+    @patch("brainiak.utils.circuit_breaker.CircuitBreaker.hedge_delay", return_value=0.1)
+    @patch("brainiak.search_engine._do_request", return_value=MockResponse("{}", 200))
+    def test_get_response_is_hedged_to_the_other_endpoint(self, mock_do_request, mock_hedge_delay):
+        request_params = {"url": u"http://{0}/semantica.place/_search".format(search_engine.ELASTICSEARCH_ENDPOINT)}
+        search_engine._get_response(request_params, hedge=True)
+        self.assertEqual(mock_do_request.call_args[0], (request_params, u"http://replica:9200/semantica.place/_search", 0.1))
+
+    @patch("brainiak.search_engine.settings.ELASTICSEARCH_HEDGE_ENDPOINT", "replica:9200")
+    @patch("brainiak.utils.circuit_breaker.CircuitBreaker.hedge_delay", return_value=None)
+    @patch("brainiak.search_engine._do_request", return_value=MockResponse("{}", 200))
+    def test_get_response_is_not_hedged_when_hedging_is_disabled(self, mock_do_request, mock_hedge_delay):
+        request_params = {"url": u"http://{0}/semantica.place/_search".format(search_engine.ELASTICSEARCH_ENDPOINT)}
+        search_engine._get_response(request_params, hedge=True)
+        self.assertEqual(mock_do_request.call_args[0], (request_params, None, None))
+
+    @patch("brainiak.log.logger.info")
+    @patch("brainiak.search_engine.greenlet_fetch_hedged", return_value=MockResponse("{}", 200))
+    def test_do_request_hedged(self, fetch_hedged_mock, mock_log_info):
+        request_params = {"url": "http://a-url.com/_search", "method": "GET"}
+        search_engine._do_request(request_params, "http://another-url.com/_search", 0.1)
+        request, hedged_request, delay = fetch_hedged_mock.call_args[0]
+        self.assertEqual(request.url, "http://a-url.com/_search")
+        self.assertEqual(hedged_request.url, "http://another-url.com/_search")
+        self.assertEqual(delay, 0.1)
+
     @patch("brainiak.log.logger.info")
     @patch("brainiak.search_engine.greenlet_fetch",
            return_value=MockResponse("{}", 200))
@@ -191,3 +279,116 @@ class SearchEngineTestCase(TestCase):
         response = search_engine._do_request(request_params)
         self.assertEquals(response.code, expected_code)
         mock_log_info.assert_called_with(expected_msg)
+
+
+class AnalyzeTestCase(TestCase):
+
+    def setUp(self):
+        search_engine.analyze_cache.clear()
+
+    def tearDown(self):
+        search_engine.analyze_cache.clear()
+
+    @patch("brainiak.search_engine.ELASTICSEARCH_ENDPOINT", "esearch.host")
+    def test_build_elasticsearch_analyze_url_with_analyzer(self):
+        expected_url = "http://esearch.host/_analyze?text=something&analyzer=my_analyzer"
+        response = search_engine._build_elasticsearch_analyze_url(target="something", analyzer="my_analyzer")
+        self.assertEquals(expected_url, response)
+
+    @patch("brainiak.search_engine.settings.ES_ANALYZE_LOCALLY", False)
+    @patch("brainiak.search_engine._get_response",
+           return_value=MockResponse('{"tokens": [{"token": "globo"}]}', 200))
+    def test_run_analyze_is_cached_by_analyzer_and_text(self, mock_get_response):
+        expected = {u"tokens": [{u"token": u"globo"}]}
+        self.assertEqual(search_engine.run_analyze(u"Globo"), expected)
+        self.assertEqual(search_engine.run_analyze(u"Globo"), expected)
+        self.assertEqual(mock_get_response.call_count, 1)
+        search_engine.run_analyze(u"Globo", analyzer="my_analyzer")
+        self.assertEqual(mock_get_response.call_count, 2)
+        self.assertIn("analyzer=my_analyzer", mock_get_response.call_args[0][0]["url"])
+
+    @patch("brainiak.search_engine.settings.ES_ANALYZE_LOCALLY", True)
+    @patch("brainiak.search_engine._get_response")
+    def test_run_analyze_locally(self, mock_get_response):
+        response = search_engine.run_analyze(u"Rio de Janeiro")
+        self.assertEqual([token["token"] for token in response["tokens"]], [u"rio", u"de", u"janeiro"])
+        self.assertFalse(mock_get_response.called)
+
+    @patch("brainiak.search_engine.settings.ES_ANALYZE_LOCALLY", True)
+    @patch("brainiak.search_engine._get_response",
+           return_value=MockResponse('{"tokens": []}', 200))
+    def test_run_analyze_locally_only_for_default_analyzer(self, mock_get_response):
+        search_engine.run_analyze(u"Rio", analyzer="my_analyzer")
+        self.assertTrue(mock_get_response.called)
+
+    def test_local_analyze_emulates_standard_analyzer(self):
+        response = search_engine.local_analyze("Copa-do-Mundo 2014, S\xc3\xa3o Paulo!", stopwords=[u"do"])
+        expected = [
+            {u"token": u"copa", u"start_offset": 0, u"end_offset": 4, u"type": u"<ALPHANUM>", u"position": 1},
+            {u"token": u"mundo", u"start_offset": 8, u"end_offset": 13, u"type": u"<ALPHANUM>", u"position": 3},
+            {u"token": u"2014", u"start_offset": 14, u"end_offset": 18, u"type": u"<NUM>", u"position": 4},
+            {u"token": u"s\xe3o", u"start_offset": 20, u"end_offset": 23, u"type": u"<ALPHANUM>", u"position": 5},
+            {u"token": u"paulo", u"start_offset": 24, u"end_offset": 29, u"type": u"<ALPHANUM>", u"position": 6}
+        ]
+        self.assertEqual(response, {u"tokens": expected})
+
+
+class MultiRequestTestCase(TestCase):
+
+    @patch("brainiak.search_engine.ELASTICSEARCH_ENDPOINT", "esearch.host")
+    @patch("brainiak.search_engine._get_response",
+           return_value=MockResponse('{"responses": [{"hits": {"total": 1}}, {"error": "IndexMissingException"}]}', 200))
+    def test_run_msearch(self, mock_get_response):
+        responses = search_engine.run_msearch([({"query": {"match_all": {}}}, ["semantica.a", "semantica.b"]),
+                                               ({"size": 1}, None)])
+        self.assertEqual(responses, [{"hits": {"total": 1}}, {"error": "IndexMissingException"}])
+        request_params = mock_get_response.call_args[0][0]
+        self.assertEqual(request_params["url"], u"http://esearch.host/_msearch")
+        lines = request_params["body"].split(u"\n")
+        self.assertEqual(lines[-1], u"")
+        self.assertEqual([json.loads(line) for line in lines[:-1]],
+                         [{"index": "semantica.a,semantica.b"}, {"query": {"match_all": {}}},
+                          {"index": "semantica.*"}, {"size": 1}])
+        self.assertEqual(mock_get_response.call_args[1], {"hedge": True})
+
+    @patch("brainiak.search_engine._get_response", return_value=None)
+    def test_run_msearch_not_found(self, mock_get_response):
+        responses = search_engine.run_msearch([({"size": 1}, ["semantica.a"]), ({"size": 1}, None)])
+        self.assertEqual(responses, [{"error": u"HTTP 404: Not Found"}, {"error": u"HTTP 404: Not Found"}])
+
+    @patch("brainiak.search_engine._get_response")
+    def test_run_msearch_empty(self, mock_get_response):
+        self.assertEqual(search_engine.run_msearch([]), [])
+        self.assertFalse(mock_get_response.called)
+
+    @patch("brainiak.search_engine.ELASTICSEARCH_ENDPOINT", "esearch.host")
+    @patch("brainiak.search_engine._get_response",
+           return_value=MockResponse('{"docs": [{"_id": "a", "exists": true, "_source": {}}, {"_id": "b", "found": false}]}', 200))
+    def test_get_instances(self, mock_get_response):
+        instances = search_engine.get_instances("index", "type", ["a", "b"])
+        self.assertEqual(instances, {"a": {"_id": "a", "exists": True, "_source": {}}, "b": None})
+        request_params = mock_get_response.call_args[0][0]
+        self.assertEqual(request_params["url"], u"http://esearch.host/index/type/_mget")
+        self.assertEqual(json.loads(request_params["body"]), {"ids": ["a", "b"]})
+
+    @patch("brainiak.search_engine._get_response",
+           return_value=MockResponse('{"items": [{"index": {"_id": "a", "ok": true}}, {"delete": {"_id": "b", "ok": true}}]}', 200))
+    def test_run_bulk(self, mock_get_response):
+        items = search_engine.run_bulk([("index", "i", "t", "a", {"name": "a"}),
+                                        ("delete", "i", "t", "b", None)])
+        self.assertEqual(len(items), 2)
+        lines = mock_get_response.call_args[0][0]["body"].strip().split(u"\n")
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{"index": {"_index": "i", "_type": "t", "_id": "a"}}, {"name": "a"},
+                          {"delete": {"_index": "i", "_type": "t", "_id": "b"}}])
+
+    @patch("brainiak.search_engine._get_response", return_value=None)
+    def test_run_bulk_raises_on_not_found(self, mock_get_response):
+        self.assertRaises(search_engine.ElasticSearchException, search_engine.run_bulk,
+                          [("delete", "i", "t", "b", None)])
+
+    @patch("brainiak.search_engine._get_response",
+           return_value=MockResponse('{"items": [{"index": {"_id": "a", "error": "MapperParsingException"}}]}', 200))
+    def test_run_bulk_raises_on_errors(self, mock_get_response):
+        self.assertRaises(search_engine.ElasticSearchException, search_engine.run_bulk,
+                          [("index", "i", "t", "a", {"name": "a"})])
@@ -3,6 +3,7 @@ from unittest import TestCase
 from tornado.web import HTTPError
 from mock import patch
 
+from brainiak import settings
 from brainiak.stored_query import crud
 
 
@@ -165,3 +166,58 @@ class StoredQueryCRUDTestCase(TestCase):
         client_id = "other_client_id"
         stored_query = {"client_id": "client_id"}
         self.assertRaises(HTTPError, crud.validate_client_id, client_id, stored_query)
+
+
+class StoredQueryCacheTestCase(TestCase):
+
+    def setUp(self):
+        crud._stored_queries_cache.clear()
+
+    def tearDown(self):
+        crud._stored_queries_cache.clear()
+
+    @patch("brainiak.stored_query.crud.get_stored_query", return_value={"sparql_template": "", "client_id": "client_id"})
+    def test_definitions_are_cached(self, mock_get_stored_query):
+        first = crud.get_cached_stored_query("query_id")
+        second = crud.get_cached_stored_query("query_id")
+        self.assertIs(first, second)
+        self.assertEqual(mock_get_stored_query.call_count, 1)
+
+    @patch("brainiak.stored_query.crud.get_stored_query", return_value=None)
+    def test_missing_definitions_are_not_cached(self, mock_get_stored_query):
+        crud.get_cached_stored_query("query_id")
+        crud.get_cached_stored_query("query_id")
+        self.assertEqual(mock_get_stored_query.call_count, 2)
+
+    @patch("brainiak.stored_query.crud.get_stored_query", return_value={"sparql_template": "", "client_id": "client_id"})
+    def test_definitions_expire(self, mock_get_stored_query):
+        with patch("brainiak.stored_query.crud.time.time", return_value=100):
+            crud.get_cached_stored_query("query_id")
+        with patch("brainiak.stored_query.crud.time.time", return_value=100 + settings.STORED_QUERY_CACHE_TTL + 1):
+            crud.get_cached_stored_query("query_id")
+        self.assertEqual(mock_get_stored_query.call_count, 2)
+
+    @patch("brainiak.stored_query.crud._allowed_query", return_value=True)
+    @patch("brainiak.stored_query.crud.save_instance")
+    @patch("brainiak.stored_query.crud.delete_instance")
+    @patch("brainiak.stored_query.crud.get_stored_query", return_value={"sparql_template": "", "client_id": "client_id"})
+    def test_definitions_are_forgotten_on_update_and_delete(self, mock_get_stored_query, mock_delete, mock_save, mock_allowed):
+        crud.get_cached_stored_query("query_id")
+        crud.store_query({"sparql_template": ""}, "query_id", "client_id")
+        self.assertNotIn("query_id", crud._stored_queries_cache)
+
+        crud.get_cached_stored_query("query_id")
+        crud.delete_stored_query("query_id", "client_id")
+        self.assertNotIn("query_id", crud._stored_queries_cache)
+
+    @patch("brainiak.stored_query.crud.settings.ENABLE_CACHE", True)
+    @patch("brainiak.stored_query.crud.cache.purge_query_results")
+    def test_forget_purges_results(self, mock_purge_query_results):
+        crud.forget_stored_query("query_id")
+        mock_purge_query_results.assert_called_once_with("query_id")
+
+    @patch("brainiak.stored_query.crud.settings.ENABLE_CACHE", False)
+    @patch("brainiak.stored_query.crud.cache.purge_query_results")
+    def test_forget_without_cache(self, mock_purge_query_results):
+        crud.forget_stored_query("query_id")
+        self.assertFalse(mock_purge_query_results.called)
@@ -1,11 +1,22 @@
+import json
 from mock import patch
 from unittest import TestCase
 
+from tornado.httpclient import HTTPError as ClientHTTPError
 from tornado.web import HTTPError
 
 from brainiak.stored_query import execution
 
 
+def streamed(result_dict):
+    "A fake query_sparql which sends result_dict to the streaming_callback, in two chunks"
+    def fake_query_sparql(query, triplestore_config, async=True, streaming_callback=None, result_format="json"):
+        body = json.dumps(result_dict)
+        streaming_callback(body[:len(body) // 2])
+        streaming_callback(body[len(body) // 2:])
+    return fake_query_sparql
+
+
 class StoredQueryExecuteTestCase(TestCase):
 
     def test_get_query_with_valid_params_in_request(self):
@@ -36,7 +47,7 @@ class StoredQueryExecuteTestCase(TestCase):
 
     @patch("brainiak.stored_query.execution.compress_keys_and_values",
            return_value=[])
-    @patch("brainiak.stored_query.execution.query_sparql")
+    @patch("brainiak.triplestore.query_sparql", side_effect=streamed({"results": {"bindings": []}}))
     @patch("brainiak.stored_query.execution.get_query",
            return_value="SELECT ?s FROM <http://my_graph.com/> {?s a owl:Class}")
     def test_execute_query_with_no_results(self,
@@ -67,3 +78,169 @@ class StoredQueryExecuteTestCase(TestCase):
 
         response = execution.execute_query(query_id, stored_query, QueryStringParams())
         self.assertEqual(expected_response, response)
+
+
+class QueryTemplateTestCase(TestCase):
+
+    def test_required_params(self):
+        template = execution.QueryTemplate("SELECT ?s FROM <%(graph_uri)s> {?s a <%(class_uri)s>; ?p 100%%} LIMIT %(limit)d # %(graph_uri)s")
+        self.assertEqual(template.required_params, ["graph_uri", "class_uri", "limit"])
+        self.assertEqual(template.render({"graph_uri": "g", "class_uri": "c", "limit": 1}),
+                         "SELECT ?s FROM <g> {?s a <c>; ?p 100%} LIMIT 1 # g")
+
+    def test_render_fails_fast_with_missing_key(self):
+        template = execution.QueryTemplate("SELECT ?s FROM <%(graph_uri)s> {?s a <%(class_uri)s>}")
+        with self.assertRaises(HTTPError) as error:
+            template.render({"graph_uri": "g"})
+        self.assertEqual(error.exception.status_code, 400)
+        self.assertIn("class_uri", error.exception.log_message)
+
+    def test_templates_are_parsed_once(self):
+        template = "SELECT ?s FROM <%(graph_uri)s> {?s ?p ?o}"
+        self.assertIs(execution.get_query_template(template), execution.get_query_template(template))
+
+
+class MemoizeQueryTestCase(TestCase):
+
+    @patch("brainiak.stored_query.execution.execute_query", return_value={"items": []})
+    @patch("brainiak.stored_query.execution.memoize")
+    def test_memoize_query(self, mock_memoize, mock_execute_query):
+        stored_query = {"sparql_template": "SELECT ?s {?s a <%(class_uri)s>}", "cache_ttl": 30}
+
+        class QueryStringParams(object):
+            arguments = {"class_uri": "http://test/Class"}
+
+        params = QueryStringParams()
+        execution.memoize_query("query_id", stored_query, params, "client_id")
+        kwargs = mock_memoize.call_args[1]
+        self.assertEqual(kwargs["ttl"], 30)
+        self.assertTrue(kwargs["key"].startswith(u"_query@@query_id@@"))
+        self.assertTrue(kwargs["key"].endswith(u"@@class_uri=http://test/Class@@client_id##query"))
+        self.assertEqual(mock_memoize.call_args[0][1](), {"items": []})
+        mock_execute_query.assert_called_once_with("query_id", stored_query, params)
+
+
+class QueryStringParams(dict):
+
+    def __init__(self, arguments, **params):
+        dict.__init__(self, **params)
+        self.arguments = arguments
+        self.triplestore_config = {"app_name": "my_app", "url": "url"}
+
+
+class PaginationTestCase(TestCase):
+
+    def test_no_pagination_by_default(self):
+        self.assertEqual(execution.get_page(QueryStringParams({"graph_uri": "g"})), None)
+
+    def test_page(self):
+        # ParamDict pages start at 0
+        params = QueryStringParams({"page": "3", "per_page": "5"}, page="2", per_page="5")
+        self.assertEqual(execution.get_page(params), (10, 5))
+
+    def test_cursor(self):
+        params = QueryStringParams({"cursor": execution.encode_cursor(30), "page": "1"}, page="0", per_page="5")
+        self.assertEqual(execution.get_page(params), (30, 5))
+
+    def test_invalid_cursor(self):
+        for cursor in ("!!", execution.encode_cursor(-1), "b2Zmc2V0OmE="):
+            params = QueryStringParams({"cursor": cursor})
+            self.assertRaises(HTTPError, execution.get_page, params)
+
+    def test_paginate_query_appends_limit(self):
+        query = u"SELECT ?s FROM <http://g/> {?s a owl:Class} ORDER BY ?s"
+        self.assertEqual(execution.paginate_query(query, 20, 10),
+                         u"SELECT ?s FROM <http://g/> {?s a owl:Class} ORDER BY ?s\nLIMIT 10 OFFSET 20")
+
+    def test_paginate_query_wraps_query_with_limit(self):
+        query = u"""DEFINE input:inference <http://ruleset>
+PREFIX owl: <http://www.w3.org/2002/07/owl#>
+SELECT DISTINCT ?s FROM <http://g/> FROM NAMED <http://h/> WHERE {?s a owl:Class} LIMIT 100"""
+        expected = u"""DEFINE input:inference <http://ruleset>
+PREFIX owl: <http://www.w3.org/2002/07/owl#>
+SELECT * FROM <http://g/> FROM NAMED <http://h/> WHERE {
+{ SELECT DISTINCT ?s   WHERE {?s a owl:Class} LIMIT 100 }
+}
+LIMIT 10 OFFSET 0"""
+        self.assertEqual(execution.paginate_query(query, 0, 10), expected)
+
+    def test_paginate_query_requires_select(self):
+        self.assertRaises(HTTPError, execution.paginate_query, u"ASK {?s a owl:Class}", 0, 10)
+
+    @patch("brainiak.triplestore.query_sparql")
+    def test_execute_query_paginated(self, mock_query_sparql):
+        mock_query_sparql.side_effect = streamed({"results": {"bindings": [{"s": {"type": "uri", "value": "http://test/%d" % i}} for i in range(3)]}})
+        stored_query = {"sparql_template": "SELECT ?s {?s a <%(class_uri)s>}"}
+        params = QueryStringParams({"class_uri": "http://test/C", "per_page": "2"}, per_page="2")
+
+        response = execution.execute_query("query_id", stored_query, params)
+
+        self.assertTrue(mock_query_sparql.call_args[0][0].endswith("LIMIT 3 OFFSET 0"))
+        self.assertEqual(response["items"], [{"s": "http://test/0"}, {"s": "http://test/1"}])
+        self.assertEqual(response["per_page"], 2)
+        self.assertEqual(execution.decode_cursor(response["next_cursor"]), 2)
+
+    @patch("brainiak.triplestore.query_sparql", side_effect=streamed({"results": {"bindings": [{"s": {"type": "uri", "value": "http://test/0"}}]}}))
+    def test_execute_query_last_page(self, mock_query_sparql):
+        stored_query = {"sparql_template": "SELECT ?s {?s a owl:Class}"}
+        params = QueryStringParams({"per_page": "2"}, per_page="2")
+        response = execution.execute_query("query_id", stored_query, params)
+        self.assertNotIn("next_cursor", response)
+
+
+class StreamQueryTestCase(TestCase):
+
+    @patch("brainiak.triplestore.query_sparql")
+    def test_stream_query(self, mock_query_sparql):
+        def fake_query_sparql(query, triplestore_config, async, streaming_callback, result_format):
+            streaming_callback('{"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri", "value": "http://test/0"}}, {"s": ')
+            streaming_callback('{"type": "uri", "value": "http://test/1"}}]}}')
+        mock_query_sparql.side_effect = fake_query_sparql
+        written = []
+        stored_query = {"sparql_template": "SELECT ?s {?s a owl:Class}"}
+
+        execution.stream_query("query_id", stored_query, QueryStringParams({"per_page": "2"}, per_page="2"), written.append)
+
+        self.assertEqual(written, [[{"s": "http://test/0"}], [{"s": "http://test/1"}], [{"end": True, "rows": 2}]])
+        self.assertTrue(mock_query_sparql.call_args[0][0].endswith("LIMIT 2 OFFSET 0"))
+
+    @patch("brainiak.stored_query.execution.log")
+    @patch("brainiak.triplestore.settings.SPARQL_RESULT_MAX_ROWS", 1)
+    @patch("brainiak.triplestore.query_sparql")
+    def test_stream_query_exceeding_the_limit_ends_with_an_error(self, mock_query_sparql, mock_log):
+        def fake_query_sparql(query, triplestore_config, async, streaming_callback, result_format):
+            streaming_callback('{"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri", "value": "http://test/0"}}, {"s": ')
+            streaming_callback('{"type": "uri", "value": "http://test/1"}}]}}')
+        mock_query_sparql.side_effect = fake_query_sparql
+        written = []
+        stored_query = {"sparql_template": "SELECT ?s {?s a owl:Class}"}
+
+        execution.stream_query("query_id", stored_query, QueryStringParams({}), written.append)
+
+        self.assertEqual(written[0], [{"s": "http://test/0"}])
+        self.assertEqual(len(written), 2)
+        self.assertIn(u"more than 1 rows", written[1][0]["error"])
+        self.assertTrue(mock_log.logger.error.called)
+
+    @patch("brainiak.stored_query.execution.log")
+    @patch("brainiak.triplestore.query_sparql")
+    def test_stream_query_failing_midway_ends_with_an_error(self, mock_query_sparql, mock_log):
+        def fake_query_sparql(query, triplestore_config, async, streaming_callback, result_format):
+            streaming_callback('{"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri", "value": "http://test/0"}}, {"s": ')
+            raise ClientHTTPError(599, "Connection closed")
+        mock_query_sparql.side_effect = fake_query_sparql
+        written = []
+        stored_query = {"sparql_template": "SELECT ?s {?s a owl:Class}"}
+
+        execution.stream_query("query_id", stored_query, QueryStringParams({}), written.append)
+
+        self.assertEqual(written, [[{"s": "http://test/0"}], [{"error": u"HTTP 599: Connection closed"}]])
+
+    @patch("brainiak.stored_query.execution.log")
+    @patch("brainiak.triplestore.query_sparql", side_effect=ClientHTTPError(500, "Internal Server Error"))
+    def test_stream_query_failing_before_any_row_raises(self, mock_query_sparql, mock_log):
+        written = []
+        stored_query = {"sparql_template": "SELECT ?s {?s a owl:Class}"}
+        self.assertRaises(ClientHTTPError, execution.stream_query,
+                          "query_id", stored_query, QueryStringParams({}), written.append)
+        self.assertEqual(written, [])
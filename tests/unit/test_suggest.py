@@ -3,6 +3,7 @@ from unittest import TestCase
 from mock import patch
 from tornado.web import HTTPError
 
+from brainiak import settings
 from brainiak.utils.params import ParamDict
 from brainiak.suggest import suggest
 from tests.mocks import MockHandler
@@ -576,6 +577,12 @@ SAMPLE_BUILD_ITEMS = [
 
 class ExtraSuggestTestCase(TestCase):
 
+    def setUp(self):
+        suggest.clear_predicate_ranges_cache()
+
+    def tearDown(self):
+        suggest.clear_predicate_ranges_cache()
+
     @patch("brainiak.suggest.suggest.resources.decorate_dict_with_pagination")
     @patch("brainiak.suggest.suggest._build_items", return_value=SAMPLE_BUILD_ITEMS)
     @patch("brainiak.suggest.suggest.run_search", return_value=SAMPLE_ES_RESPONSE)
@@ -653,3 +660,142 @@ class ExtraSuggestTestCase(TestCase):
             expected_error_msg = \
                 u"Either the predicate something does not exists or it does not have any rdfs:range defined in the triplestore"
             self.assertEqual(exception.exception, expected_error_msg)
+
+
+class PredicateRangesCacheTestCase(TestCase):
+
+    def setUp(self):
+        suggest.clear_predicate_ranges_cache()
+        self.query_params = ParamDict(MockHandler(), lang="pt")
+
+    def tearDown(self):
+        suggest.clear_predicate_ranges_cache()
+
+    @patch("brainiak.suggest.suggest._get_predicate_ranges", return_value=SAMPLE_RESPOSE_TO_GET_PREDICATE_RANGES)
+    def test_ranges_are_shared_across_requests(self, mock_get_predicate_ranges):
+        search_params = {"target": "http://semantica.globo.com/upper/isPartOf"}
+        first = suggest.get_cached_predicate_ranges(self.query_params, search_params)
+        second = suggest.get_cached_predicate_ranges(ParamDict(MockHandler(), lang="pt"), search_params)
+        self.assertIs(first, second)
+        self.assertEqual(mock_get_predicate_ranges.call_count, 1)
+
+        suggest.get_cached_predicate_ranges(ParamDict(MockHandler(), lang="en"), search_params)
+        self.assertEqual(mock_get_predicate_ranges.call_count, 2)
+
+    @patch("brainiak.suggest.suggest._get_predicate_ranges", return_value={u'results': {u'bindings': []}})
+    def test_empty_ranges_are_not_cached(self, mock_get_predicate_ranges):
+        search_params = {"target": "http://semantica.globo.com/upper/undefined"}
+        suggest.get_cached_predicate_ranges(self.query_params, search_params)
+        suggest.get_cached_predicate_ranges(self.query_params, search_params)
+        self.assertEqual(mock_get_predicate_ranges.call_count, 2)
+
+    @patch("brainiak.suggest.suggest._get_predicate_ranges", return_value=SAMPLE_RESPOSE_TO_GET_PREDICATE_RANGES)
+    def test_ranges_are_forgotten_when_ontology_changes(self, mock_get_predicate_ranges):
+        search_params = {"target": "http://semantica.globo.com/upper/isPartOf"}
+        suggest.get_cached_predicate_ranges(self.query_params, search_params)
+        suggest.on_ontology_change({"instance": "http://semantica.globo.com/place/City/rio", "klass": "http://semantica.globo.com/place/City"})
+        suggest.get_cached_predicate_ranges(self.query_params, search_params)
+        self.assertEqual(mock_get_predicate_ranges.call_count, 1)
+
+        suggest.on_ontology_change({"klass": "http://semantica.globo.com/place/City", "graph": "http://semantica.globo.com/place/"})
+        suggest.get_cached_predicate_ranges(self.query_params, search_params)
+        self.assertEqual(mock_get_predicate_ranges.call_count, 2)
+
+    @patch("brainiak.suggest.suggest._get_predicate_ranges", return_value=SAMPLE_RESPOSE_TO_GET_PREDICATE_RANGES)
+    def test_ranges_expire(self, mock_get_predicate_ranges):
+        search_params = {"target": "http://semantica.globo.com/upper/isPartOf"}
+        with patch("brainiak.suggest.suggest.time.time", return_value=100):
+            suggest.get_cached_predicate_ranges(self.query_params, search_params)
+        with patch("brainiak.suggest.suggest.time.time", return_value=100 + settings.SUGGEST_RANGES_CACHE_TTL + 1):
+            suggest.get_cached_predicate_ranges(self.query_params, search_params)
+        self.assertEqual(mock_get_predicate_ranges.call_count, 2)
+
+
+def fake_predicates_ranges(query_params, targets):
+    return dict((target, {u'results': {u'bindings': []}} if target == u"http://semantica.globo.com/upper/undefined"
+                 else SAMPLE_RESPOSE_TO_GET_PREDICATE_RANGES)
+                for target in targets)
+
+
+class SuggestBatchTestCase(TestCase):
+
+    def setUp(self):
+        suggest.clear_predicate_ranges_cache()
+
+    def tearDown(self):
+        suggest.clear_predicate_ranges_cache()
+
+    @patch("brainiak.suggest.suggest.resources.decorate_dict_with_pagination")
+    @patch("brainiak.suggest.suggest._build_items", return_value=SAMPLE_BUILD_ITEMS)
+    @patch("brainiak.suggest.suggest.run_msearch", return_value=[SAMPLE_ES_RESPONSE, {"error": "IndexMissingException"}])
+    @patch("brainiak.suggest.suggest.run_analyze", return_value={u'tokens': [{u'token': u'globoland'}]})
+    @patch("brainiak.suggest.suggest.get_subproperties", return_value=[])
+    @patch("brainiak.suggest.suggest._get_predicates_ranges", side_effect=fake_predicates_ranges)
+    def test_do_suggest_batch(self, mock_get_predicates_ranges, mock_get_subproperties, mock_run_analyze, mock_run_msearch, mock_build_items, mock_decorate):
+        query_params = ParamDict(MockHandler(), lang="pt", per_page="10", page="0")
+        batch_params = {
+            u"suggests": [
+                {u"search": {u"target": u"http://semantica.globo.com/upper/isPartOf", u"pattern": u"Globoland"}},
+                {u"search": {u"target": u"http://semantica.globo.com/upper/undefined", u"pattern": u"Globoland"}},
+                {u"search": {u"target": u"http://semantica.globo.com/upper/isPartOf", u"pattern": u"Rio"}}
+            ]
+        }
+
+        computed = suggest.do_suggest_batch(query_params, batch_params)
+
+        self.assertEqual(mock_get_predicates_ranges.call_count, 1)
+        self.assertEqual(sorted(mock_get_predicates_ranges.call_args[0][1]),
+                         [u"http://semantica.globo.com/upper/isPartOf", u"http://semantica.globo.com/upper/undefined"])
+        self.assertEqual(sorted(call[0][0] for call in mock_run_analyze.call_args_list), [u"Globoland", u"Rio"])
+        self.assertEqual(mock_run_msearch.call_count, 1)
+        searches = mock_run_msearch.call_args[0][0]
+        self.assertEqual(len(searches), 2)
+        self.assertEqual(searches[0][1], ["semantica.place"])
+
+        items = computed["items"]
+        self.assertEqual(items[0]["items"], SAMPLE_BUILD_ITEMS)
+        self.assertIn(u"undefined", items[1]["error"])
+        self.assertEqual(items[2], {"error": u"IndexMissingException"})
+
+    @patch("brainiak.suggest.suggest._get_predicates_ranges", side_effect=fake_predicates_ranges)
+    def test_cached_ranges_are_not_resolved_again(self, mock_get_predicates_ranges):
+        query_params = ParamDict(MockHandler(), lang="pt")
+        suggest.get_cached_predicates_ranges(query_params, [u"http://semantica.globo.com/upper/isPartOf"])
+        computed = suggest.get_cached_predicates_ranges(
+            query_params, [u"http://semantica.globo.com/upper/isPartOf", u"http://semantica.globo.com/upper/undefined"])
+
+        self.assertEqual(mock_get_predicates_ranges.call_args[0][1], [u"http://semantica.globo.com/upper/undefined"])
+        self.assertEqual(computed[u"http://semantica.globo.com/upper/isPartOf"], SAMPLE_RESPOSE_TO_GET_PREDICATE_RANGES)
+        self.assertEqual(computed[u"http://semantica.globo.com/upper/undefined"], {u'results': {u'bindings': []}})
+
+    @patch("brainiak.suggest.suggest.triplestore.query_sparql")
+    @patch("brainiak.suggest.suggest.get_ontology_index", return_value=None)
+    def test_ranges_of_all_targets_are_queried_at_once(self, mock_get_ontology_index, mock_query_sparql):
+        state = {u'type': u'uri', u'value': u'http://semantica.globo.com/place/State'}
+        graph = {u'type': u'uri', u'value': u'http://semantica.globo.com/place/'}
+        label = {u'type': u'literal', u'value': u'Estado', u'xml:lang': u'pt'}
+        mock_query_sparql.return_value = {u'results': {u'bindings': [{
+            u'target': {u'type': u'uri', u'value': u'http://semantica.globo.com/upper/isPartOf'},
+            u'range': state, u'range_graph': graph, u'range_label': label
+        }]}}
+        query_params = ParamDict(MockHandler(), lang="pt")
+
+        computed = suggest._get_predicates_ranges(
+            query_params, [u"http://semantica.globo.com/upper/isPartOf", u"http://semantica.globo.com/upper/undefined"])
+
+        self.assertEqual(mock_query_sparql.call_count, 1)
+        query = mock_query_sparql.call_args[0][0]
+        self.assertIn(u"FILTER (?target IN (<http://semantica.globo.com/upper/isPartOf>, <http://semantica.globo.com/upper/undefined>))", query)
+        expected = {
+            u"http://semantica.globo.com/upper/isPartOf": {u'results': {u'bindings': [
+                {u'range': state, u'range_graph': graph, u'range_label': label}]}},
+            u"http://semantica.globo.com/upper/undefined": {u'results': {u'bindings': []}}
+        }
+        self.assertEqual(computed, expected)
+
+    def test_search_error_message(self):
+        self.assertEqual(suggest._search_error_message(u"IndexMissingException[[semantica.place] missing]"),
+                         u"IndexMissingException[[semantica.place] missing]")
+        self.assertEqual(suggest._search_error_message({u"type": u"index_not_found_exception", u"reason": u"no such index"}),
+                         u"no such index")
+        self.assertEqual(suggest._search_error_message(None), suggest._(u"There were no search results."))
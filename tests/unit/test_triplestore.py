@@ -1,14 +1,18 @@
 # coding: utf-8
+from io import BytesIO
 import json
+import time
 import unittest
 
-from mock import patch
+from mock import patch, Mock
 from requests.auth import HTTPDigestAuth
 import simplejson
-from tornado.httpclient import HTTPError as ClientHTTPError
+from tornado.httpclient import HTTPError as ClientHTTPError, HTTPRequest, HTTPResponse
 from tornado.web import HTTPError
 
 from brainiak import triplestore
+from brainiak.utils import circuit_breaker
+from brainiak.utils.config_parser import TriplestoreConfig
 from tests.mocks import triplestore_config
 
 
@@ -39,11 +43,11 @@ class TriplestoreTestCase(unittest.TestCase):
     EXAMPLE_QUERY_URL_ENCODED = u"query=SELECT+%2A+%7B%3Fs+a+%3Fo%7D&format=application%2Fsparql-results%2Bjson"
 
     @patch("brainiak.triplestore.log.logger")
-    @patch("brainiak.triplestore.parse_section", return_value={"auth_username": "USER",
+    @patch("brainiak.triplestore.get_triplestore_config", return_value={"auth_username": "USER",
                                                                "auth_password": "PASSWORD",
                                                                "url": "url"})
     @patch("brainiak.triplestore.requests.request", return_value=MockResponse())
-    def test_both_without_auth_and_with_auth_work(self, mock_request, mock_parse_section, log):
+    def test_both_without_auth_and_with_auth_work(self, mock_request, mock_get_triplestore_config, log):
         received_msg = triplestore.status()
         msg1 = 'Virtuoso connection authenticated [USER:PASSWORD] | SUCCEED | url'
         msg2 = 'Virtuoso connection not-authenticated | SUCCEED | url'
@@ -51,11 +55,11 @@ class TriplestoreTestCase(unittest.TestCase):
         self.assertEqual(received_msg, expected_msg)
 
     @patch("brainiak.triplestore.log.logger")
-    @patch("brainiak.triplestore.parse_section", return_value={"auth_username": "USER",
+    @patch("brainiak.triplestore.get_triplestore_config", return_value={"auth_username": "USER",
                                                                "auth_password": "PASSWORD",
                                                                "url": "url"})
     @patch("brainiak.triplestore.requests.request", side_effect=[MockResponse(401), MockResponse()])
-    def test_without_auth_works_but_with_auth_doesnt(self, mock_parse_section, mock_request, mock_log):
+    def test_without_auth_works_but_with_auth_doesnt(self, mock_get_triplestore_config, mock_request, mock_log):
         received_msg = triplestore.status()
         msg1 = "Virtuoso connection authenticated [USER:PASSWORD] | FAILED | url | Status code: 401. Message: "
         msg2 = "Virtuoso connection not-authenticated | SUCCEED | url"
@@ -63,22 +67,22 @@ class TriplestoreTestCase(unittest.TestCase):
         self.assertEqual(received_msg, expected_msg)
 
     @patch("brainiak.triplestore.log.logger")
-    @patch("brainiak.triplestore.parse_section", return_value={"auth_username": "USER",
+    @patch("brainiak.triplestore.get_triplestore_config", return_value={"auth_username": "USER",
                                                                "auth_password": "PASSWORD",
                                                                "url": "url"})
     @patch("brainiak.triplestore.requests.request", side_effect=[MockResponse(), MockResponse(401)])
-    def test_without_auth_doesnt_work_but_with_auth_works(self, mock_request, mock_parse_section, mock_log):
+    def test_without_auth_doesnt_work_but_with_auth_works(self, mock_request, mock_get_triplestore_config, mock_log):
         received_msg = triplestore.status()
         msg1 = "Virtuoso connection authenticated [USER:PASSWORD] | SUCCEED | url"
         msg2 = "Virtuoso connection not-authenticated | FAILED | url | Status code: 401. Message: "
         expected_msg = "<br>".join([msg1, msg2])
         self.assertEqual(received_msg, expected_msg)
 
-    @patch("brainiak.triplestore.parse_section", return_value={"auth_username": "USER",
+    @patch("brainiak.triplestore.get_triplestore_config", return_value={"auth_username": "USER",
                                                                "auth_password": "PASSWORD",
                                                                "url": "url"})
     @patch("brainiak.triplestore.requests.request", return_value=MockResponse(401))
-    def test_both_without_auth_and_with_auth_dont_work(self, mock_request, mock_parse_section):
+    def test_both_without_auth_and_with_auth_dont_work(self, mock_request, mock_get_triplestore_config):
         received_msg = triplestore.status()
         msg1 = "Virtuoso connection authenticated [USER:PASSWORD] | FAILED | url | Status code: 401. Message: "
         msg2 = "Virtuoso connection not-authenticated | FAILED | url | Status code: 401. Message: "
@@ -118,19 +122,19 @@ class TriplestoreTestCase(unittest.TestCase):
                           tornado_response,
                           async=False)
 
-    @patch("brainiak.triplestore.parse_section", return_value={"auth_username": "USER",
+    @patch("brainiak.triplestore.get_triplestore_config", return_value={"auth_username": "USER",
                                                                "auth_password": "PASSWORD",
                                                                "url": "url"})
     @patch('brainiak.triplestore.greenlet_fetch', side_effect=ClientHTTPError(401, message=""))
-    def test_query_sparql_with_http_error_401(self, run_query, mock_parse_section):
+    def test_query_sparql_with_http_error_401(self, run_query, mock_get_triplestore_config):
         request_params = {"url": "http://aa"}
         self.assertRaises(HTTPError, triplestore.do_run_query, request_params, async=True)
 
-    @patch("brainiak.triplestore.parse_section", return_value={"auth_username": "USER",
+    @patch("brainiak.triplestore.get_triplestore_config", return_value={"auth_username": "USER",
                                                                "auth_password": "PASSWORD",
                                                                "url": "url"})
     @patch('brainiak.triplestore.greenlet_fetch', side_effect=ClientHTTPError(500, message=""))
-    def test_query_sparql_with_http_error_500(self, run_query, mock_parse_section):
+    def test_query_sparql_with_http_error_500(self, run_query, mock_get_triplestore_config):
         request_params = {"url": "http://aa"}
         self.assertRaises(ClientHTTPError, triplestore.do_run_query, request_params, async=True)
 
@@ -168,6 +172,25 @@ class TriplestoreTestCase(unittest.TestCase):
         response.pop("auth")  # object created inside _build_request_params
         self.assertEqual(response, expected_request_for_requests)
 
+    def test_build_request_params_uses_prebuilt_triplestore_config(self):
+        config = TriplestoreConfig(dict(self.TRIPLESTORE_CONFIG, app_name="Brainiak", max_queue="10").items())
+
+        async_params = triplestore._build_request_params(self.EXAMPLE_QUERY, config, async=True)
+        sync_params = triplestore._build_request_params(self.EXAMPLE_QUERY, config, async=False)
+
+        self.assertNotIn("app_name", async_params)
+        self.assertNotIn("max_queue", async_params)
+        self.assertEqual(async_params["auth_username"], self.TRIPLESTORE_CONFIG["auth_username"])
+        self.assertEqual((sync_params["auth"].username, sync_params["auth"].password),
+                         (self.TRIPLESTORE_CONFIG["auth_username"], self.TRIPLESTORE_CONFIG["auth_password"]))
+
+    def test_build_request_params_builds_a_digest_auth_per_request(self):
+        config = TriplestoreConfig(self.TRIPLESTORE_CONFIG.items())
+        first = triplestore._build_request_params(self.EXAMPLE_QUERY, config, async=False)["auth"]
+        second = triplestore._build_request_params(self.EXAMPLE_QUERY, config, async=False)["auth"]
+        self.assertIsInstance(first, HTTPDigestAuth)
+        self.assertIsNot(first, second)
+
     @patch('brainiak.triplestore.log.logger')
     @patch('brainiak.triplestore.do_run_query', return_value=(MockResponse(), 0))
     def test_query_sparql_without_error(self, run_query, mock_log):
@@ -180,3 +203,436 @@ class TriplestoreTestCase(unittest.TestCase):
         response = triplestore.query_sparql("", triplestore_config)
         self.assertEqual(greenlet_fetch.call_count, 1)
         self.assertEqual(response, {})
+
+    @patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse())
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_streaming(self, mocked_log, greenlet_fetch):
+        callback = Mock()
+        response = triplestore.query_sparql("", triplestore_config, streaming_callback=callback)
+        self.assertEqual(response, None)
+        greenlet_fetch.call_args[0][0].streaming_callback("chunk")
+        callback.assert_called_once_with("chunk")
+
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_in_tsv_returns_result_dict(self, mocked_log):
+        body = '?s\t?o\n<http://a>\t"A"@pt\n'
+        with patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse(body=body)):
+            result_dict = triplestore.query_sparql(u"SELECT * {?s ?p ?o}", triplestore_config, result_format="tsv")
+        self.assertEqual(result_dict, {"head": {"vars": ["s", "o"]}, "results": {"bindings": [
+            {"s": {"type": "uri", "value": "http://a"}, "o": {"type": "literal", "value": "A", "xml:lang": "pt"}}]}})
+
+    @patch('brainiak.triplestore.log')
+    @patch('brainiak.triplestore.requests.request', return_value=Mock(status_code=200, content='s\r\nhttp://a\r\n'))
+    def test_synchronous_query_sparql_in_csv(self, mocked_request, mocked_log):
+        result_dict = triplestore.query_sparql(u"SELECT ?s {?s ?p ?o}", triplestore_config, async=False, result_format="csv")
+        self.assertEqual(mocked_request.call_args[1]["data"]["format"], "text/csv")
+        self.assertEqual(result_dict["results"]["bindings"], [{"s": {"type": "uri", "value": "http://a"}}])
+
+
+class BindingsStreamTestCase(unittest.TestCase):
+
+    BINDINGS = [{"s": {"type": "uri", "value": "http://test/%d" % index}} for index in range(3)]
+    BODY = json.dumps({"head": {"vars": ["s"]}, "results": {"bindings": BINDINGS}})
+
+    def setUp(self):
+        circuit_breaker.circuit_breakers.clear()
+
+    def tearDown(self):
+        circuit_breaker.circuit_breakers.clear()
+
+    def fake_fetch(self, request):
+        "Send the body to the streaming_callback in chunks, stopping when it returns 0 (as pycurl does)"
+        for index in range(0, len(self.BODY), 10):
+            if request.streaming_callback(self.BODY[index:index + 10]) == 0:
+                raise ClientHTTPError(599, "Failed writing body")
+        return MockResponse(body="")
+
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_bindings(self, mocked_log):
+        consumed = []
+        with patch('brainiak.triplestore.greenlet_fetch', side_effect=self.fake_fetch):
+            rows = triplestore.query_sparql_bindings(u"SELECT ?s {?s a ?o}", triplestore_config, consumed.extend)
+        self.assertEqual(rows, 3)
+        self.assertEqual(consumed, self.BINDINGS)
+
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_bindings_aborts_oversized_results(self, mocked_log):
+        consumed = []
+        with patch('brainiak.triplestore.greenlet_fetch', side_effect=self.fake_fetch) as mocked_fetch:
+            with self.assertRaises(HTTPError) as context:
+                triplestore.query_sparql_bindings(u"SELECT ?s {?s a ?o}", triplestore_config, consumed.extend, max_rows=1)
+        self.assertEqual(context.exception.status_code, 400)
+        self.assertIn(u"more than 1 rows", context.exception.log_message)
+        self.assertEqual(consumed, self.BINDINGS[:1])
+        self.assertEqual(mocked_fetch.call_count, 1)
+        # the triplestore did not fail
+        self.assertEqual(circuit_breaker.circuit_breakers["triplestore:Brainiak"].consecutive_failures, 0)
+
+    @patch('brainiak.triplestore.settings.SPARQL_RESULT_MAX_BYTES', 50)
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_bindings_max_bytes_setting(self, mocked_log):
+        with patch('brainiak.triplestore.greenlet_fetch', side_effect=self.fake_fetch):
+            self.assertRaises(HTTPError, triplestore.query_sparql_bindings,
+                              u"SELECT ?s {?s a ?o}", triplestore_config, lambda bindings: None)
+
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_bindings_rejects_truncated_results(self, mocked_log):
+        consumed = []
+        self.BODY = self.BODY[:self.BODY.index('{"s"', self.BODY.index('http://test/1'))]
+        with patch('brainiak.triplestore.greenlet_fetch', side_effect=self.fake_fetch):
+            with self.assertRaises(HTTPError) as context:
+                triplestore.query_sparql_bindings(u"SELECT ?s {?s a ?o}", triplestore_config, consumed.extend)
+        self.assertEqual(context.exception.status_code, 500)
+        self.assertIn(u"2 rows read", context.exception.log_message)
+        self.assertEqual(consumed, self.BINDINGS[:2])
+
+    @patch('brainiak.triplestore.log')
+    @patch('brainiak.triplestore.requests.request')
+    def test_synchronous_query_is_streamed(self, mocked_request, mocked_log):
+        response = Mock(status_code=200)
+        response.iter_content.return_value = [self.BODY[:15], self.BODY[15:]]
+        mocked_request.return_value = response
+        consumed = []
+
+        rows = triplestore.query_sparql_bindings(u"SELECT ?s {?s a ?o}", triplestore_config, consumed.extend, async=False)
+
+        self.assertEqual(rows, 3)
+        self.assertEqual(consumed, self.BINDINGS)
+        self.assertTrue(mocked_request.call_args[1]["stream"])
+        self.assertTrue(response.close.called)
+
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_bindings_in_tsv(self, mocked_log):
+        consumed = []
+        self.BODY = '?s\n<http://test/0>\n<http://test/1>\n<http://test/2>'
+        with patch('brainiak.triplestore.greenlet_fetch', side_effect=self.fake_fetch) as mocked_fetch:
+            rows = triplestore.query_sparql_bindings(u"SELECT ?s {?s a ?o}", triplestore_config, consumed.extend, result_format="tsv")
+        self.assertIn("format=text%2Ftab-separated-values", mocked_fetch.call_args[0][0].body)
+        self.assertEqual(rows, 3)
+        self.assertEqual(consumed, self.BINDINGS)
+
+    @patch('brainiak.triplestore.log')
+    @patch('brainiak.triplestore.requests.request')
+    def test_synchronous_streamed_error(self, mocked_request, mocked_log):
+        mocked_request.return_value = Mock(status_code=500, reason="Internal Server Error")
+        self.assertRaises(ClientHTTPError, triplestore.query_sparql_bindings,
+                          u"SELECT ?s {?s a ?o}", triplestore_config, lambda bindings: None, async=False)
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+
+    TRIPLESTORE_CONFIG = {
+        "app_name": "Brainiak",
+        "url": "http://primary",
+        "replicas": "http://replica1, http://replica2",
+        "auth_mode": "digest",
+        "auth_username": "api-semantica",
+        "auth_password": "api-semantica"
+    }
+
+    def setUp(self):
+        triplestore._replica_pools.clear()
+        circuit_breaker.circuit_breakers.clear()
+
+    def tearDown(self):
+        triplestore._replica_pools.clear()
+        circuit_breaker.circuit_breakers.clear()
+
+    def test_is_update_query(self):
+        self.assertTrue(triplestore.is_update_query(u"INSERT DATA INTO <g> {<s> <p> <o>}"))
+        self.assertTrue(triplestore.is_update_query(u"PREFIX a: <http://a/>\nDELETE FROM <g> {<s> <p> <o>}"))
+        self.assertFalse(triplestore.is_update_query(u"SELECT * {?s a ?o}"))
+        self.assertFalse(triplestore.is_update_query(u"ASK {?s a <http://inserted/Class>}"))
+
+    def test_add_query_is_update(self):
+        self.assertTrue(triplestore.is_update_query(u"ADD <http://g1> TO <http://g2>"))
+        self.assertFalse(triplestore.is_update_query(u"SELECT ?address {?s <http://on.to/address> ?address}"))
+
+    def test_copy_query_is_update(self):
+        self.assertTrue(triplestore.is_update_query(u"copy silent default to <http://g2>"))
+        self.assertFalse(triplestore.is_update_query(u"SELECT ?copyright {?s <http://on.to/copyright> ?copyright}"))
+
+    def test_move_query_is_update(self):
+        self.assertTrue(triplestore.is_update_query(u"MOVE GRAPH <http://g1> TO GRAPH <http://g2>"))
+        self.assertFalse(triplestore.is_update_query(u"SELECT ?s {?s <http://on.to/removed> true}"))
+
+    def test_least_outstanding_replica_is_chosen(self):
+        pool = triplestore.ReplicaPool(["http://replica1", "http://replica2"])
+        first = pool.acquire()
+        second = pool.acquire()
+        self.assertNotEqual(first.url, second.url)
+        pool.release(first, 0.1)
+        self.assertEqual(pool.acquire().url, first.url)
+
+    def test_ewma_replica_is_chosen(self):
+        pool = triplestore.ReplicaPool(["http://replica1", "http://replica2"], strategy="ewma", ewma_weight=0.5)
+        slow, fast = pool.replicas
+        pool.release(pool.acquire(), 1.0)
+        pool.release(pool.acquire(), 0.1)
+        self.assertEqual(slow.latency, 1.0)
+        self.assertEqual(fast.latency, 0.1)
+        self.assertEqual(pool.acquire().url, fast.url)
+
+        pool.release(fast, 0.3)
+        self.assertAlmostEqual(fast.latency, 0.2)
+
+    @patch("brainiak.triplestore.log")
+    def test_failing_replica_is_ejected(self, mocked_log):
+        pool = triplestore.ReplicaPool(["http://replica1", "http://replica2"], max_failures=2)
+        bad, good = pool.replicas
+        for i in range(2):
+            bad.outstanding += 1
+            pool.release(bad, failed=True)
+
+        self.assertFalse(bad.is_healthy(time.time()))
+        self.assertEqual([pool.acquire().url for i in range(3)], [good.url] * 3)
+        self.assertIn(u"EJECTED | http://replica1", pool.status()[0])
+
+    @patch("brainiak.triplestore.log")
+    def test_all_replicas_ejected(self, mocked_log):
+        pool = triplestore.ReplicaPool(["http://replica1"], max_failures=1)
+        pool.release(pool.acquire(), failed=True)
+        self.assertEqual(pool.acquire(), None)
+
+    def test_unknown_strategy(self):
+        self.assertRaises(triplestore.VirtuosoException, triplestore.ReplicaPool, ["http://replica1"], strategy="random")
+
+    def test_replica_pool_is_shared_across_requests(self):
+        pool = triplestore.get_replica_pool(self.TRIPLESTORE_CONFIG)
+        self.assertEqual([r.url for r in pool.replicas], ["http://replica1", "http://replica2"])
+        self.assertIs(pool, triplestore.get_replica_pool(dict(self.TRIPLESTORE_CONFIG)))
+        self.assertEqual(triplestore.get_replica_pool(triplestore_config), None)
+
+    @patch('brainiak.triplestore.log')
+    @patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse())
+    def test_select_goes_to_replica_and_update_to_primary(self, greenlet_fetch, mocked_log):
+        triplestore.query_sparql(u"SELECT * {?s a ?o}", self.TRIPLESTORE_CONFIG)
+        self.assertEqual(greenlet_fetch.call_args[0][0].url, "http://replica1")
+
+        triplestore.query_sparql(u"INSERT DATA INTO <g> {<s> <p> <o>}", self.TRIPLESTORE_CONFIG)
+        self.assertEqual(greenlet_fetch.call_args[0][0].url, "http://primary")
+
+        pool = triplestore.get_replica_pool(self.TRIPLESTORE_CONFIG)
+        self.assertEqual([r.outstanding for r in pool.replicas], [0, 0])
+
+    @patch('brainiak.triplestore.log')
+    @patch('brainiak.triplestore.greenlet_fetch', side_effect=ClientHTTPError(599, message="timeout"))
+    def test_replica_failure_is_accounted(self, greenlet_fetch, mocked_log):
+        self.assertRaises(ClientHTTPError, triplestore.query_sparql, u"SELECT * {?s a ?o}", self.TRIPLESTORE_CONFIG)
+        pool = triplestore.get_replica_pool(self.TRIPLESTORE_CONFIG)
+        self.assertEqual(pool.replicas[0].consecutive_failures, 1)
+        self.assertEqual(pool.replicas[0].outstanding, 0)
+
+    @patch('brainiak.utils.circuit_breaker.log')
+    @patch('brainiak.triplestore.log')
+    @patch('brainiak.triplestore.greenlet_fetch', side_effect=ClientHTTPError(503, message="unavailable"))
+    def test_circuit_breaker_opens_after_failures(self, greenlet_fetch, mocked_log, mocked_breaker_log):
+        with patch("brainiak.utils.circuit_breaker.settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD", 2):
+            for i in range(2):
+                self.assertRaises(ClientHTTPError, triplestore.query_sparql, u"SELECT * {?s a ?o}", triplestore_config)
+        self.assertRaises(circuit_breaker.CircuitOpenError, triplestore.query_sparql, u"SELECT * {?s a ?o}", triplestore_config)
+        self.assertEqual(greenlet_fetch.call_count, 2)
+        breaker = circuit_breaker.circuit_breakers["triplestore:Brainiak"]
+        self.assertEqual(breaker.state, circuit_breaker.OPEN)
+        self.assertEqual(breaker.metrics["rejections"], 1)
+
+    @patch('brainiak.triplestore.log')
+    @patch('brainiak.triplestore.greenlet_fetch', side_effect=ClientHTTPError(400, message="bad query"))
+    def test_circuit_breaker_ignores_client_errors(self, greenlet_fetch, mocked_log):
+        for i in range(10):
+            self.assertRaises(ClientHTTPError, triplestore.query_sparql, u"SELECT * {?s a ?o}", triplestore_config)
+        self.assertEqual(circuit_breaker.circuit_breakers["triplestore:Brainiak"].state, circuit_breaker.CLOSED)
+
+    @patch('brainiak.utils.circuit_breaker.log')
+    @patch('brainiak.triplestore.get_replica_pool', side_effect=ValueError("invalid replicas"))
+    def test_half_open_probe_is_released_if_replica_routing_fails(self, mocked_get_replica_pool, mocked_log):
+        breaker = circuit_breaker.get_circuit_breaker("triplestore:Brainiak")
+        breaker.on_failure()
+        breaker.state = circuit_breaker.HALF_OPEN
+        self.assertRaises(ValueError, triplestore.query_sparql, u"SELECT * {?s a ?o}", triplestore_config)
+        self.assertEqual(breaker.state, circuit_breaker.CLOSED)
+        self.assertFalse(breaker.probing)
+
+    @patch('brainiak.triplestore.log')
+    @patch('brainiak.utils.circuit_breaker.settings.HEDGED_REQUESTS', True)
+    @patch('brainiak.utils.circuit_breaker.settings.HEDGE_MIN_DELAY', 0.05)
+    @patch('brainiak.triplestore.greenlet_fetch_hedged')
+    def test_select_is_hedged_to_another_replica(self, greenlet_fetch_hedged, mocked_log):
+        response = MockResponse()
+        response.request = HTTPRequest("http://replica2")
+        greenlet_fetch_hedged.return_value = response
+
+        breaker = circuit_breaker.get_circuit_breaker(u"triplestore:Brainiak")
+        for i in range(20):
+            breaker.latencies.record(0.01 * i)
+
+        triplestore.query_sparql(u"SELECT * {?s a ?o}", self.TRIPLESTORE_CONFIG)
+        request, hedged_request, delay = greenlet_fetch_hedged.call_args[0]
+        self.assertEqual(request.url, "http://replica1")
+        self.assertEqual(hedged_request.url, "http://replica2")
+        self.assertEqual(delay, 0.19)
+
+        pool = triplestore.get_replica_pool(self.TRIPLESTORE_CONFIG)
+        self.assertEqual([r.outstanding for r in pool.replicas], [0, 0])
+        # the winning response came from the hedged request: no latency for replica1
+        self.assertEqual(pool.replicas[0].latency, None)
+
+    @patch("brainiak.triplestore.log.logger")
+    @patch("brainiak.triplestore.get_triplestore_config", return_value={"auth_username": "USER",
+                                                               "auth_password": "PASSWORD",
+                                                               "url": "url",
+                                                               "replicas": "replica"})
+    @patch("brainiak.triplestore.requests.request", return_value=MockResponse())
+    def test_status_checks_primary_and_replicas(self, mock_request, mock_get_triplestore_config, log):
+        received_msg = triplestore.status()
+        self.assertIn(u"Virtuoso connection authenticated [USER:PASSWORD] | SUCCEED | url", received_msg)
+        self.assertIn(u"Virtuoso connection authenticated [USER:PASSWORD] | SUCCEED | replica", received_msg)
+        self.assertIn(u"Virtuoso replica [least_outstanding] | HEALTHY | replica", received_msg)
+        urls = [call[1]["url"] for call in mock_request.call_args_list]
+        self.assertEqual(urls, ["url", "url", "replica", "replica"])
+
+    @patch('brainiak.triplestore.log')
+    @patch('brainiak.utils.circuit_breaker.settings.HEDGED_REQUESTS', True)
+    @patch('brainiak.utils.circuit_breaker.settings.HEDGE_MIN_DELAY', 0.05)
+    @patch('brainiak.triplestore.greenlet_fetch_hedged')
+    def test_hedged_result_set_is_the_winner_one(self, greenlet_fetch_hedged, mocked_log):
+        def fetch_hedged(request, hedged_request, delay):
+            request.streaming_callback('{"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri", "value": "http://a"}}')
+            hedged_request.streaming_callback('{"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri", "value": "http://b"}}]}}')
+            return HTTPResponse(hedged_request, 200, buffer=BytesIO())
+        greenlet_fetch_hedged.side_effect = fetch_hedged
+
+        breaker = circuit_breaker.get_circuit_breaker(u"triplestore:Brainiak")
+        for i in range(20):
+            breaker.latencies.record(0.01 * i)
+
+        result_set = triplestore.query_sparql(u"SELECT * {?s a ?o}", self.TRIPLESTORE_CONFIG, result_set=True)
+        self.assertEqual(result_set.values("s"), [u"http://b"])
+
+    @patch('brainiak.triplestore.log')
+    @patch('brainiak.triplestore.greenlet_fetch', return_value=MockResponse())
+    def test_admission_options_are_not_sent(self, greenlet_fetch, mocked_log):
+        config = dict(triplestore_config, max_concurrent="2", rate_limit="10", rate_burst="20", max_queue="5")
+        triplestore.query_sparql(u"SELECT * {?s a ?o}", config)
+        self.assertEqual(greenlet_fetch.call_args[0][0].url, triplestore_config["url"])
+
+
+class SparqlResultSetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.result_set = triplestore.SparqlResultSet(["s", "p", "o"])
+        for s, p, o in [(u"http://a", u"http://name", u"A"),
+                        (u"http://a", u"http://name", u"A"),
+                        (u"http://b", u"http://name", None)]:
+            binding = {"s": {"type": "uri", "value": s}, "p": {"type": "uri", "value": p}}
+            if o is not None:
+                binding["o"] = {"type": "literal", "value": o}
+            self.result_set.append(binding)
+
+    def test_columns(self):
+        self.assertEqual(len(self.result_set), 3)
+        self.assertEqual(self.result_set.values("o"), [u"A", u"A", None])
+        self.assertEqual(self.result_set.values("inexistent"), [None, None, None])
+        self.assertEqual(self.result_set.columns["o"].types, ["literal", "literal", None])
+
+    def test_repeated_strings_are_shared(self):
+        values = self.result_set.values("p")
+        self.assertIs(values[0], values[2])
+
+    def test_projection_distinct_and_group_by(self):
+        self.assertEqual(self.result_set.project("s", "o"), [(u"http://a", u"A"), (u"http://a", u"A"), (u"http://b", None)])
+        self.assertEqual(self.result_set.distinct("s", "o"), [(u"http://a", u"A"), (u"http://b", None)])
+        self.assertEqual(self.result_set.group_by("s", "o"), {u"http://a": [(u"A",), (u"A",)], u"http://b": [(None,)]})
+        self.assertEqual(self.result_set.group_by("s").keys(), [u"http://a", u"http://b"])
+
+    def test_variables_not_in_head(self):
+        self.result_set.append({"g": {"type": "uri", "value": u"http://g"}})
+        self.assertEqual(self.result_set.values("g"), [None, None, None, u"http://g"])
+        self.assertEqual(self.result_set.row(3), {"g": {"type": "uri", "value": u"http://g"}})
+
+    def test_result_dict_compatibility(self):
+        result_dict = {"head": {"vars": ["s"]},
+                       "results": {"bindings": [{"s": {"type": "typed-literal", "value": u"1", "datatype": u"http://int"}}]}}
+        result_set = triplestore.SparqlResultSet.from_result_dict(result_dict)
+        self.assertEqual(result_set.to_result_dict(), result_dict)
+        self.assertEqual(result_set["results"]["bindings"], result_dict["results"]["bindings"])
+        ask = triplestore.SparqlResultSet.from_result_dict({"head": {"link": []}, "boolean": True})
+        self.assertEqual(ask.get("boolean"), True)
+
+    def test_result_dict_view_is_built_once(self):
+        bindings = self.result_set["results"]["bindings"]
+        self.assertIs(self.result_set["results"]["bindings"], bindings)
+        self.assertIn("results", self.result_set)
+        self.result_set.append({"s": {"type": "uri", "value": u"http://c"}})
+        self.assertEqual(len(self.result_set["results"]["bindings"]), len(bindings) + 1)
+
+    def fake_fetch(self, body, code=200):
+        "Send body to the streaming_callback in chunks, as tornado does"
+        def fetch(request):
+            for index in range(0, len(body), 10):
+                request.streaming_callback(body[index:index + 10])
+            response = HTTPResponse(request, code, buffer=BytesIO())
+            if code >= 400:
+                raise ClientHTTPError(code, response=response)
+            return response
+        return fetch
+
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_returns_result_set(self, mocked_log):
+        body = '{"head": {"link": [], "vars": ["s", "o"]}, "results": {"distinct": false, "bindings": [' + \
+            '{"s": {"type": "uri", "value": "http://a"}}, {"s": {"type": "uri", "value": "http://b"}}]}}'
+        with patch('brainiak.triplestore.greenlet_fetch', side_effect=self.fake_fetch(body)):
+            result_set = triplestore.query_sparql("SELECT ?s ?o {?s a ?o}", triplestore_config, result_set=True)
+        self.assertIsInstance(result_set, triplestore.SparqlResultSet)
+        self.assertEqual(result_set.vars, ["s", "o"])
+        self.assertEqual(result_set.values("s"), [u"http://a", u"http://b"])
+        self.assertEqual(result_set.to_result_dict(), {"head": {"vars": ["s", "o"]}, "results": {"bindings": [
+            {"s": {"type": "uri", "value": "http://a"}}, {"s": {"type": "uri", "value": "http://b"}}]}})
+
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_returns_empty_result_set(self, mocked_log):
+        body = '{"head": {"vars": ["s"]}, "results": {"bindings": []}}'
+        with patch('brainiak.triplestore.greenlet_fetch', side_effect=self.fake_fetch(body)):
+            result_set = triplestore.query_sparql("SELECT ?s {?s a ?o}", triplestore_config, result_set=True)
+        self.assertEqual(result_set.to_result_dict(), json.loads(body))
+
+    def test_result_set_is_filled_as_the_response_arrives(self):
+        stream = triplestore.ResultSetStream()
+        stream('{"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri", "value": "http://a"}}, {"s"')
+        self.assertEqual(stream.result_set.values("s"), [u"http://a"])
+        # the body is not kept once the bindings are found
+        self.assertEqual(stream.chunks, None)
+        stream(': {"type": "uri", "value": "http://b"}}]}}')
+        self.assertIs(stream.result(), stream.result_set)
+        self.assertEqual(stream.result_set.values("s"), [u"http://a", u"http://b"])
+
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_returns_ask_result_set(self, mocked_log):
+        body = '{"head": {"link": []}, "boolean": true}'
+        with patch('brainiak.triplestore.greenlet_fetch', side_effect=self.fake_fetch(body)):
+            result_set = triplestore.query_sparql("ASK {?s a ?o}", triplestore_config, result_set=True)
+        self.assertEqual(result_set.get("boolean"), True)
+
+    @patch('brainiak.triplestore.log')
+    def test_query_sparql_result_set_in_tsv(self, mocked_log):
+        body = '?s\n<http://a>\n<http://b>'
+        with patch('brainiak.triplestore.greenlet_fetch', side_effect=self.fake_fetch(body)):
+            result_set = triplestore.query_sparql("SELECT ?s {?s a ?o}", triplestore_config, result_set=True,
+                                                  result_format="tsv")
+        self.assertEqual(result_set.values("s"), [u"http://a", u"http://b"])
+
+    @patch('brainiak.triplestore.log')
+    def test_truncated_result_set_raises(self, mocked_log):
+        body = '{"head": {"vars": ["s"]}, "results": {"bindings": [{"s": {"type": "uri", "value": "http://a"}}, {"s": {'
+        with patch('brainiak.triplestore.greenlet_fetch', side_effect=self.fake_fetch(body)):
+            with self.assertRaises(HTTPError) as context:
+                triplestore.query_sparql("SELECT ?s {?s a ?o}", triplestore_config, result_set=True)
+        self.assertEqual(context.exception.status_code, 500)
+
+    @patch('brainiak.triplestore.log')
+    def test_result_set_error_keeps_the_response_body(self, mocked_log):
+        body = "Virtuoso 37000 Error SP030: SPARQL compiler"
+        with patch('brainiak.triplestore.greenlet_fetch', side_effect=self.fake_fetch(body, code=400)):
+            with self.assertRaises(ClientHTTPError) as context:
+                triplestore.query_sparql("SELECT ?s {?s a ?o", triplestore_config, result_set=True)
+        self.assertEqual(context.exception.response.body, body)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from mock import patch, Mock
+from tornado.web import HTTPError
+
+from brainiak.greenlet_tornado import greenlet_asynchronous, greenlet_set_scheduler
+from brainiak.utils import admission
+from brainiak.utils.admission import AdmissionController, ClientScheduler, TokenBucket
+from brainiak.utils.config_parser import ConfigParserNoSectionError
+from tests.mocks import MockHandler
+
+
+DEFAULT_LIMITS = {"max_concurrent": 1, "rate_limit": 0, "rate_burst": 0, "max_queue": 1}
+
+
+class TokenBucketTestCase(unittest.TestCase):
+
+    @patch("brainiak.utils.admission.time.time", return_value=100)
+    def test_take_and_refill(self, mocked_time):
+        bucket = TokenBucket(rate=2, burst=2)
+        self.assertTrue(bucket.take())
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+        mocked_time.return_value = 100.5
+        self.assertTrue(bucket.take())
+        self.assertFalse(bucket.take())
+        mocked_time.return_value = 200
+        self.assertEqual([bucket.take() for i in range(3)], [True, True, False])
+
+
+class ClientSchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.started = []
+
+    def start(self, name):
+        return lambda: self.started.append(name)
+
+    @patch("brainiak.utils.admission.IOLoop")
+    def test_queue_and_shedding(self, mocked_ioloop):
+        scheduler = ClientScheduler("default", max_concurrent=1, max_queue=1)
+        scheduler.submit(self.start("first"))
+        scheduler.submit(self.start("second"))
+        with self.assertRaises(HTTPError) as context:
+            scheduler.submit(self.start("third"))
+        self.assertEqual(context.exception.status_code, 503)
+        self.assertEqual(self.started, ["first"])
+        self.assertEqual(len(scheduler.queue), 1)
+
+        scheduler.done()
+        callback, start = mocked_ioloop.instance.return_value.add_callback.call_args[0]
+        callback(start)
+        self.assertEqual(self.started, ["first", "second"])
+        self.assertEqual(scheduler.running, 1)
+        self.assertEqual(scheduler.metrics, {"admitted": 2, "throttled": 0, "shed": 1})
+        self.assertEqual(scheduler.status(),
+                         u"Admission default | running: 1/1 | queued: 0/1 | admitted: 2 | throttled: 0 | shed: 1")
+
+    @patch("brainiak.utils.admission.IOLoop")
+    def test_queued_request_keeps_the_slot_until_started(self, mocked_ioloop):
+        scheduler = ClientScheduler("default", max_concurrent=1, max_queue=2)
+        scheduler.submit(self.start("first"))
+        scheduler.submit(self.start("second"))
+        scheduler.done()
+        # submitted before the IOLoop starts the second one
+        scheduler.submit(self.start("third"))
+        self.assertEqual(self.started, ["first"])
+        self.assertEqual(scheduler.running, 1)
+        self.assertEqual(len(scheduler.queue), 1)
+
+        callback, start = mocked_ioloop.instance.return_value.add_callback.call_args[0]
+        callback(start)
+        self.assertEqual(self.started, ["first", "second"])
+        self.assertEqual(scheduler.running, 1)
+
+        scheduler.done()
+        callback, start = mocked_ioloop.instance.return_value.add_callback.call_args[0]
+        callback(start)
+        scheduler.done()
+        self.assertEqual(self.started, ["first", "second", "third"])
+        self.assertEqual(scheduler.running, 0)
+
+    @patch("brainiak.utils.admission.time.time", return_value=100)
+    def test_rate_limit(self, mocked_time):
+        scheduler = ClientScheduler("other", rate_limit=1)
+        scheduler.submit(self.start("first"))
+        with self.assertRaises(HTTPError) as context:
+            scheduler.submit(self.start("second"))
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertEqual(self.started, ["first"])
+
+    def test_unlimited(self):
+        scheduler = ClientScheduler("default", max_concurrent=0, max_queue=0)
+        for i in range(10):
+            scheduler.submit(self.start(i))
+        self.assertEqual(len(self.started), 10)
+
+
+class AdmissionControllerTestCase(unittest.TestCase):
+
+    @patch("brainiak.utils.admission.get_triplestore_config", return_value={"app_name": "Other", "max_concurrent": "2", "rate_limit": "7.5"})
+    def test_limits_from_triplestore_ini(self, mocked_get_triplestore_config):
+        limits = admission.get_limits("other")
+        self.assertEqual(limits["max_concurrent"], 2)
+        self.assertEqual(limits["rate_limit"], 7.5)
+        self.assertEqual(limits["max_queue"], admission.settings.ADMISSION_MAX_QUEUE)
+        mocked_get_triplestore_config.assert_called_with("other")
+
+    @patch("brainiak.utils.admission.log")
+    @patch("brainiak.utils.admission.get_limits")
+    def test_unknown_client_id_uses_default(self, mocked_get_limits, mocked_log):
+        def get_limits(client_id):
+            if client_id != "default":
+                raise ConfigParserNoSectionError()
+            return DEFAULT_LIMITS
+        mocked_get_limits.side_effect = get_limits
+        controller = AdmissionController()
+        self.assertIs(controller.get_scheduler("unknown"), controller.get_scheduler("default"))
+        self.assertEqual(controller.schedulers.keys(), ["default"])
+
+    @patch("brainiak.utils.admission.log")
+    @patch("brainiak.utils.admission.get_limits", return_value=DEFAULT_LIMITS)
+    def test_greenlet_asynchronous_is_admission_controlled(self, mocked_get_limits, mocked_log):
+        calls = []
+
+        class Handler(MockHandler):
+
+            application = Mock(_wsgi=False)
+
+            def _stack_context_handle_exception(self, *args):
+                calls.append("error")
+
+            def finish(self):
+                calls.append("finish")
+
+            @greenlet_asynchronous
+            def get(self):
+                calls.append("get")
+
+        controller = AdmissionController()
+        greenlet_set_scheduler(controller)
+        try:
+            Handler(headers={"X-Brainiak-Client-Id": "other"}).get()
+        finally:
+            greenlet_set_scheduler(None)
+
+        self.assertEqual(calls, ["get", "finish"])
+        scheduler = controller.schedulers["other"]
+        self.assertEqual(scheduler.running, 0)
+        self.assertEqual(scheduler.metrics["admitted"], 1)
@@ -5,7 +5,8 @@ import redis
 from mock import patch, Mock
 
 from brainiak.utils.cache import build_key_for_class, CacheError, connect, memoize, ping, \
-    purge_by_path, safe_redis, status_message, build_instance_key, get_usage_message
+    purge_by_path, safe_redis, status_message, build_instance_key, get_usage_message, LRUCache, \
+    build_key_for_query_result, purge_query_results
 from brainiak.utils.params import ParamDict
 from tests.mocks import MockRequest, MockHandler
 
@@ -99,6 +100,15 @@ class MemoizeTestCase(unittest.TestCase):
         self.assertEqual(answer['status'], "Dishes cleaned up")
         self.assertEqual(redis_get.call_count, 1)
 
+    @patch("brainiak.utils.cache.settings", ENABLE_CACHE=True)
+    @patch("brainiak.utils.cache.create", return_value=True)
+    @patch("brainiak.utils.cache.retrieve", return_value=None)
+    def test_memoize_with_ttl(self, redis_get, redis_set, settings):
+        answer = memoize(Mock(), lambda: {"status": "Laundry done"}, key="key", ttl=30)
+        self.assertEqual(answer["meta"]["cache"], "MISS")
+        self.assertEqual(redis_set.call_args[0][0], "key")
+        self.assertEqual(redis_set.call_args[0][2], 30)
+
 
 class GeneralFunctionsTestCase(unittest.TestCase):
 
@@ -290,3 +300,48 @@ class CacheUtilsTestCase(unittest.TestCase):
         self.assertFalse(mock_purge.called)
         self.assertTrue(mock_delete.called)
         mock_delete.assert_called_with(u"graph@@class##type")
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        self.assertEqual(lru.get("a"), 1)
+        lru.set("c", 3)
+        self.assertNotIn("b", lru)
+        self.assertEqual(lru.get("a"), 1)
+        self.assertEqual(lru.get("c"), 3)
+        self.assertEqual(len(lru), 2)
+
+    def test_counts_hits_and_misses(self):
+        lru = LRUCache(2)
+        lru.set("a", 1)
+        lru.get("a")
+        self.assertEqual(lru.get("b", "default"), "default")
+        self.assertEqual((lru.hits, lru.misses), (1, 1))
+
+    def test_size_zero_disables(self):
+        lru = LRUCache(0)
+        lru.set("a", 1)
+        self.assertEqual(lru.get("a"), None)
+        self.assertEqual(len(lru), 0)
+
+
+class QueryResultKeyTestCase(unittest.TestCase):
+
+    def test_build_key_for_query_result(self):
+        key = build_key_for_query_result(u"my_query", u"SELECT %(a)s", {u"b": u"2", u"a": u"1"}, u"client")
+        self.assertTrue(key.startswith(u"_query@@my_query@@"))
+        self.assertTrue(key.endswith(u"@@a=1&b=2@@client##query"))
+
+    def test_key_changes_with_template(self):
+        first = build_key_for_query_result(u"my_query", u"SELECT %(a)s", {}, u"client")
+        second = build_key_for_query_result(u"my_query", u"SELECT DISTINCT %(a)s", {}, u"client")
+        self.assertNotEqual(first, second)
+
+    @patch("brainiak.utils.cache.purge")
+    def test_purge_query_results(self, mock_purge):
+        purge_query_results(u"my_query")
+        mock_purge.assert_called_once_with(u"_query@@my_query@@")
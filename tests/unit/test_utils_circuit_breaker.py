@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import greenlet
+import requests
+from mock import patch, Mock
+from tornado.httpclient import HTTPError as ClientHTTPError
+
+from brainiak import greenlet_tornado
+from brainiak.utils import circuit_breaker
+from brainiak.utils.circuit_breaker import CircuitBreaker, CircuitOpenError, LatencyTracker, CLOSED, OPEN, HALF_OPEN
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        circuit_breaker.circuit_breakers.clear()
+
+    def tearDown(self):
+        circuit_breaker.circuit_breakers.clear()
+
+    @patch("brainiak.utils.circuit_breaker.log")
+    def test_opens_after_consecutive_failures(self, mocked_log):
+        breaker = CircuitBreaker("backend", failure_threshold=2)
+        breaker.before_call()
+        breaker.on_failure()
+        breaker.before_call()
+        breaker.on_success()
+        breaker.before_call()
+        breaker.on_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.before_call()
+        breaker.on_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+        self.assertEqual(breaker.metrics, {"calls": 4, "successes": 1, "failures": 3, "rejections": 1})
+
+    def test_open_error_is_503(self):
+        error = CircuitOpenError("backend", 3)
+        self.assertEqual(error.status_code, 503)
+        self.assertIn(u"Backend backend is unavailable", error.log_message)
+
+    @patch("brainiak.utils.circuit_breaker.log")
+    @patch("brainiak.utils.circuit_breaker.time.time")
+    def test_half_open_lets_a_single_probe(self, mocked_time, mocked_log):
+        mocked_time.return_value = 100
+        breaker = CircuitBreaker("backend", failure_threshold=1, recovery_seconds=10)
+        breaker.on_failure()
+        mocked_time.return_value = 109
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+
+        mocked_time.return_value = 110
+        breaker.before_call()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+
+        breaker.on_success()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.before_call()
+
+    @patch("brainiak.utils.circuit_breaker.log")
+    @patch("brainiak.utils.circuit_breaker.time.time")
+    def test_stuck_probe_expires_after_recovery_seconds(self, mocked_time, mocked_log):
+        mocked_time.return_value = 100
+        breaker = CircuitBreaker("backend", failure_threshold=1, recovery_seconds=10)
+        breaker.on_failure()
+        mocked_time.return_value = 110
+        breaker.before_call()
+        # the probe never reports back
+        mocked_time.return_value = 119
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+        mocked_time.return_value = 120
+        breaker.before_call()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertEqual(breaker.probe_started_at, 120)
+        self.assertRaises(CircuitOpenError, breaker.before_call)
+
+    @patch("brainiak.utils.circuit_breaker.log")
+    @patch("brainiak.utils.circuit_breaker.time.time")
+    def test_failed_probe_opens_again(self, mocked_time, mocked_log):
+        mocked_time.return_value = 100
+        breaker = CircuitBreaker("backend", failure_threshold=3, recovery_seconds=10)
+        for i in range(3):
+            breaker.on_failure()
+        mocked_time.return_value = 120
+        breaker.before_call()
+        breaker.on_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.opened_at, 120)
+
+    def test_is_backend_failure(self):
+        self.assertTrue(circuit_breaker.is_backend_failure(ClientHTTPError(599)))
+        self.assertTrue(circuit_breaker.is_backend_failure(ClientHTTPError(503)))
+        self.assertTrue(circuit_breaker.is_backend_failure(requests.ConnectionError()))
+        self.assertFalse(circuit_breaker.is_backend_failure(ClientHTTPError(404)))
+        self.assertFalse(circuit_breaker.is_backend_failure(ValueError()))
+
+    def test_latency_percentile(self):
+        tracker = LatencyTracker(size=100)
+        self.assertEqual(tracker.percentile(95), None)
+        for i in range(200):
+            tracker.record(i)
+        self.assertEqual(tracker.percentile(95), 195)
+        self.assertEqual(tracker.percentile(50), 150)
+
+    @patch("brainiak.utils.circuit_breaker.settings.HEDGE_MIN_DELAY", 0.5)
+    @patch("brainiak.utils.circuit_breaker.settings.HEDGED_REQUESTS", True)
+    def test_hedge_delay(self):
+        breaker = CircuitBreaker("backend")
+        self.assertEqual(breaker.hedge_delay(), None)
+        for i in range(20):
+            breaker.on_success(0.1)
+        self.assertEqual(breaker.hedge_delay(), 0.5)
+        breaker.on_success(2)
+        breaker.on_success(2)
+        self.assertEqual(breaker.hedge_delay(), 2)
+
+    @patch("brainiak.utils.circuit_breaker.settings.HEDGED_REQUESTS", False)
+    def test_hedge_delay_disabled(self):
+        breaker = CircuitBreaker("backend")
+        for i in range(20):
+            breaker.on_success(0.1)
+        self.assertEqual(breaker.hedge_delay(), None)
+
+    def test_breakers_are_shared_and_reported(self):
+        breaker = circuit_breaker.get_circuit_breaker("elasticsearch")
+        self.assertIs(breaker, circuit_breaker.get_circuit_breaker("elasticsearch"))
+        breaker.on_success(0.25)
+        self.assertEqual(circuit_breaker.status(),
+                         u"Circuit breaker elasticsearch | CLOSED | calls: 0 | failures: 0 | "
+                         u"rejections: 0 | consecutive failures: 0 | p95: 250.0ms")
+
+
+class MockFetchResponse(object):
+
+    def __init__(self, url, code=200):
+        self.request = Mock(url=url)
+        self.error = ClientHTTPError(code) if code >= 400 else None
+
+    def rethrow(self):
+        if self.error:
+            raise self.error
+
+
+class HedgedFetchTestCase(unittest.TestCase):
+    """
+    The requests are not sent: the fetch callbacks and the hedge timeout
+    are fired by hand, from the "IOLoop" (parent) greenlet.
+    """
+
+    def setUp(self):
+        self.callbacks = {}
+        self.http_client = Mock()
+        self.http_client.fetch.side_effect = lambda request, callback: self.callbacks.__setitem__(request, callback)
+        self.io_loop = Mock()
+        self.io_loop.add_timeout.side_effect = lambda deadline, callback: callback
+        self.result = {}
+
+        patchers = [patch("brainiak.greenlet_tornado.tornado.httpclient.AsyncHTTPClient", return_value=self.http_client),
+                    patch("brainiak.greenlet_tornado._io_loop", self.io_loop)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fetch(self):
+        try:
+            self.result["response"] = greenlet_tornado.greenlet_fetch_hedged("primary", "hedged", 0.1)
+        except ClientHTTPError as e:
+            self.result["error_code"] = e.code
+
+    def start(self):
+        gr = greenlet.greenlet(self.fetch)
+        gr.switch()
+        return gr
+
+    def hedge(self):
+        self.io_loop.add_timeout.call_args[0][1]()
+
+    def test_fast_primary_cancels_hedge(self):
+        self.start()
+        self.callbacks["primary"](MockFetchResponse("primary"))
+        self.assertEqual(self.result["response"].request.url, "primary")
+        self.assertTrue(self.io_loop.remove_timeout.called)
+        self.assertNotIn("hedged", self.callbacks)
+
+    def test_hedged_response_wins(self):
+        self.start()
+        self.hedge()
+        self.callbacks["hedged"](MockFetchResponse("hedged"))
+        self.assertEqual(self.result["response"].request.url, "hedged")
+        # the late primary response is ignored
+        self.callbacks["primary"](MockFetchResponse("primary"))
+        self.assertEqual(self.result["response"].request.url, "hedged")
+
+    def test_failed_primary_waits_for_hedge(self):
+        self.start()
+        self.hedge()
+        self.callbacks["primary"](MockFetchResponse("primary", 503))
+        self.assertEqual(self.result, {})
+        self.callbacks["hedged"](MockFetchResponse("hedged"))
+        self.assertEqual(self.result["response"].request.url, "hedged")
+
+    def test_both_fail(self):
+        self.start()
+        self.hedge()
+        self.callbacks["primary"](MockFetchResponse("primary", 503))
+        self.callbacks["hedged"](MockFetchResponse("hedged", 599))
+        self.assertEqual(self.result["error_code"], 599)
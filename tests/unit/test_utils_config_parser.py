@@ -1,5 +1,12 @@
+import os
+import shutil
+import tempfile
 from unittest import TestCase
-from brainiak.utils.config_parser import ConfigParserNoSectionError, parse_section
+
+from mock import patch
+
+from brainiak.utils.config_parser import ConfigParserNoSectionError, TriplestoreConfig, \
+    TriplestoreConfigRegistry, parse_section
 
 
 class ConfigParserTestCase(TestCase):
@@ -29,3 +36,80 @@ class ConfigParserTestCase(TestCase):
 
     def test_parse_inexistent_section(self):
         self.assertRaises(ConfigParserNoSectionError, parse_section, "xubiru")
+
+
+INI = """
+[default]
+app_name = Brainiak
+url = http://localhost:8890/sparql-auth
+auth_mode = digest
+auth_username = dba
+auth_password = dba
+replicas = http://replica:8890/sparql-auth
+"""
+
+
+class TriplestoreConfigRegistryTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "triplestore.ini")
+        self.write(INI)
+        self.registry = TriplestoreConfigRegistry(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, content, modified_at=1000):
+        with open(self.filename, "w") as ini:
+            ini.write(content)
+        os.utime(self.filename, (modified_at, modified_at))
+
+    def test_triplestore_config_prebuilds_request_options_and_credentials(self):
+        config = TriplestoreConfig([("app_name", "Brainiak"), ("url", "http://a"),
+                                    ("auth_mode", "digest"), ("auth_username", "u"), ("auth_password", "p")])
+        self.assertEqual(config["app_name"], "Brainiak")
+        self.assertEqual(config.request_options, {"url": "http://a", "auth_mode": "digest",
+                                                  "auth_username": "u", "auth_password": "p"})
+        self.assertEqual(config.auth_credentials, ("u", "p"))
+        self.assertEqual(TriplestoreConfig([("url", "http://a")]).auth_credentials, None)
+
+    def test_sections_are_parsed_once(self):
+        config = self.registry.get("default")
+        self.assertEqual(config["url"], "http://localhost:8890/sparql-auth")
+        self.assertNotIn("replicas", config.request_options)
+        with patch("brainiak.utils.config_parser.ConfigParser") as mocked_parser:
+            self.assertIs(self.registry.get("default"), config)
+            self.assertFalse(mocked_parser.called)
+
+    def test_inexistent_section(self):
+        self.assertRaises(ConfigParserNoSectionError, self.registry.get, "xubiru")
+
+    @patch("brainiak.utils.config_parser.settings.TRIPLESTORE_CONFIG_CHECK_INTERVAL", 0)
+    def test_modified_file_is_parsed_again(self):
+        self.registry.get("default")
+        self.write(INI.replace("dba", "other"), modified_at=2000)
+        self.assertEqual(self.registry.get("default")["auth_username"], "other")
+
+    @patch("brainiak.utils.config_parser.settings.TRIPLESTORE_CONFIG_CHECK_INTERVAL", 3600)
+    def test_modification_is_checked_after_interval(self):
+        self.registry.get("default")
+        self.write(INI.replace("dba", "other"), modified_at=2000)
+        self.assertEqual(self.registry.get("default")["auth_username"], "dba")
+        self.registry.reload()
+        self.assertEqual(self.registry.get("default")["auth_username"], "other")
+
+    @patch("brainiak.utils.config_parser.logger")
+    @patch("brainiak.utils.config_parser.settings.TRIPLESTORE_CONFIG_CHECK_INTERVAL", 0)
+    def test_previous_sections_are_kept_if_file_is_invalid(self, mocked_logger):
+        config = self.registry.get("default")
+        self.write("invalid", modified_at=2000)
+        self.assertIs(self.registry.get("default"), config)
+        self.assertTrue(mocked_logger.error.called)
+
+    @patch("brainiak.utils.config_parser.logger")
+    @patch("brainiak.utils.config_parser.settings.TRIPLESTORE_CONFIG_CHECK_INTERVAL", 0)
+    def test_previous_sections_are_kept_if_file_is_removed(self, mocked_logger):
+        config = self.registry.get("default")
+        os.remove(self.filename)
+        self.assertIs(self.registry.get("default"), config)
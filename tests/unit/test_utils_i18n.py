@@ -1,5 +1,8 @@
 import unittest
 
+import greenlet
+from mock import patch
+
 from brainiak.utils import i18n
 
 
@@ -17,3 +20,64 @@ class TranslationTestCase(unittest.TestCase):
         translated_string = i18n.translate(u"WORKING", lang="en")
         expected_string = u"WORKING"
         self.assertEqual(translated_string, expected_string)
+
+
+class TranslationCatalogsTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        i18n.reload_translations()
+
+    def test_catalogs_are_loaded_once(self):
+        i18n.reload_translations()
+        with patch("brainiak.utils.i18n.locale.load_gettext_translations") as mocked_load:
+            for i in range(3):
+                self.assertEqual(i18n.translate(u"WORKING", lang="pt"), u"FUNCIONANDO")
+            self.assertFalse(mocked_load.called)
+
+    def test_messages_are_memoized_per_language(self):
+        i18n.reload_translations()
+        i18n.translate(u"WORKING", lang="pt")
+        i18n.translate(u"WORKING", lang="en")
+        self.assertEqual(i18n._messages[("pt", u"WORKING")], u"FUNCIONANDO")
+        self.assertEqual(i18n._messages[("en", u"WORKING")], u"WORKING")
+        self.assertIs(i18n.get_locale("pt"), i18n.get_locale("pt"))
+
+    def test_locales_are_cached_by_supported_code(self):
+        i18n.reload_translations()
+        self.assertIs(i18n.get_locale("pt-br"), i18n.get_locale("pt"))
+        self.assertEqual(i18n.get_locale("en").code, "en_US")
+        for index in range(100):
+            self.assertIs(i18n.get_locale("unknown%d" % index), i18n.get_locale("pt"))
+        self.assertEqual(sorted(i18n._locales), ["en_US", "pt_BR"])
+
+    def test_unsupported_language_falls_back_to_the_default(self):
+        self.assertEqual(i18n.translate(u"WORKING", lang="xx"), u"FUNCIONANDO")
+
+    @patch("brainiak.utils.i18n.MAX_MEMOIZED_MESSAGES", 1)
+    def test_memoized_messages_are_bounded(self):
+        i18n.reload_translations()
+        i18n.translate(u"WORKING", lang="pt")
+        self.assertEqual(i18n.translate(u"Message formatted before translation 1", lang="pt"),
+                         u"Message formatted before translation 1")
+        self.assertEqual(len(i18n._messages), 1)
+
+    def test_reload_forgets_memoized_messages(self):
+        i18n.translate(u"WORKING", lang="pt")
+        i18n.reload_translations()
+        self.assertEqual(i18n._messages, {})
+        self.assertEqual(i18n.translate(u"WORKING", lang="pt"), u"FUNCIONANDO")
+
+
+class RequestLanguageTestCase(unittest.TestCase):
+
+    def test_request_language_is_used_inside_request_greenlets(self):
+        def request():
+            i18n.set_request_language("en")
+            return i18n._(u"WORKING")
+
+        self.assertEqual(greenlet.greenlet(request).switch(), u"WORKING")
+        self.assertEqual(i18n._(u"WORKING"), u"FUNCIONANDO")
+
+    def test_request_language_is_ignored_outside_requests(self):
+        i18n.set_request_language("en")
+        self.assertEqual(i18n.get_request_language(), None)
@@ -86,6 +86,12 @@ class ParamsTestCase(TestCase):
         param_dict = params.ParamDict(handler, page="1", per_page="2")
         self.assertEqual(param_dict.arguments, {"page": "1", "per_page": "2"})
 
+    def test_arguments_without_profile(self):
+        handler = MockHandler(querystring="page=1&_profile=1")
+        param_dict = params.ParamDict(handler, page="1")
+        self.assertEqual(param_dict.arguments, {"page": "1"})
+        self.assertNotIn("_profile", param_dict)
+
     def test_arguments_o_o1_o2_o3(self):
         handler = MockHandler(querystring="o=0&o1=1&o2=2&o3=3")
         param_dict = params.ParamDict(handler)
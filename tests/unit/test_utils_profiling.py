@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+import unittest
+
+import greenlet
+from mock import patch, Mock
+
+from brainiak.utils import profiling
+from brainiak.utils.profiling import ProfilerBusyError, ProfilingForbiddenError, RequestProfile, SamplingProfiler
+
+
+def busy(seconds):
+    finish = time.time() + seconds
+    while time.time() < finish:
+        pass
+
+
+class ProfilingAuthorizationTestCase(unittest.TestCase):
+
+    @patch("brainiak.utils.profiling.settings.PROFILE_TOKEN", None)
+    def test_disabled_without_token(self):
+        request = Mock(headers={"X-Brainiak-Profile-Token": "None"})
+        with self.assertRaises(ProfilingForbiddenError) as context:
+            profiling.check_authorization(request)
+        self.assertEqual(context.exception.status_code, 403)
+        self.assertIn(u"settings.PROFILE_TOKEN is not set", context.exception.log_message)
+
+    @patch("brainiak.utils.profiling.settings.PROFILE_TOKEN", "secret")
+    def test_wrong_or_missing_token(self):
+        self.assertRaises(ProfilingForbiddenError, profiling.check_authorization, Mock(headers={}))
+        self.assertRaises(ProfilingForbiddenError, profiling.check_authorization,
+                          Mock(headers={"X-Brainiak-Profile-Token": "secreT"}))
+
+    @patch("brainiak.utils.profiling.settings.PROFILE_TOKEN", "secret")
+    def test_valid_token(self):
+        profiling.check_authorization(Mock(headers={"X-Brainiak-Profile-Token": "secret"}))
+
+
+class SamplingProfilerTestCase(unittest.TestCase):
+
+    def test_collapse(self):
+        def inner():
+            return profiling.collapse(sys._getframe())
+        stack = inner()
+        self.assertTrue(stack.endswith(
+            "tests.unit.test_utils_profiling:test_collapse;tests.unit.test_utils_profiling:inner"))
+
+    def test_collapsed_stacks_are_sorted_by_count(self):
+        profiler = SamplingProfiler(0.001)
+        profiler.stacks.update({"a;b": 1, "a;c": 3})
+        self.assertEqual(profiler.collapsed(), "a;c 3\na;b 1\n")
+
+    def test_samples_cpu_time(self):
+        profiler = SamplingProfiler(0.001)
+        profiler.start()
+        try:
+            busy(0.1)
+        finally:
+            profiler.stop()
+        self.assertTrue(profiler.samples > 0)
+        self.assertTrue(any("test_utils_profiling:busy" in stack for stack in profiler.stacks))
+
+    def test_sample_sleeps_and_returns_collapsed_stacks(self):
+        collapsed = profiling.sample(0.1, busy, interval=0.001)
+        self.assertIn("test_utils_profiling:busy", collapsed)
+
+    def test_only_one_sample_at_a_time(self):
+        def nested_sample(seconds):
+            self.assertRaises(ProfilerBusyError, profiling.sample, seconds, busy)
+        profiling.sample(0.01, nested_sample)
+        # released afterwards
+        profiling.sample(0.01, busy)
+
+    def test_busy_error_is_409(self):
+        error = ProfilerBusyError(3)
+        self.assertEqual(error.status_code, 409)
+        self.assertIn(u"Try again in 3 seconds", error.log_message)
+
+
+class RequestProfileTestCase(unittest.TestCase):
+
+    def test_report(self):
+        request_profile = RequestProfile()
+        request_profile.start()
+        busy(0.01)
+        request_profile.stop()
+        report = request_profile.report(limit=5)
+        self.assertIn("Ordered by: cumulative time", report)
+        self.assertIn("(busy)", report)
+
+    def test_empty_report(self):
+        self.assertEqual(RequestProfile().report(), "")
+
+    @unittest.skipUnless(hasattr(greenlet, "settrace"), "greenlet.settrace is not available")
+    def test_follow_profiles_only_the_request_greenlet(self):
+        def other_request():
+            busy(0.01)
+
+        def request():
+            busy(0.01)
+            greenlet.getcurrent().parent.switch()
+            busy(0.01)
+
+        request_profile = RequestProfile()
+        request_profile.start()
+        request_greenlet = greenlet.greenlet(request)
+        request_profile.follow(request_greenlet)
+        request_greenlet.switch()
+        greenlet.greenlet(other_request).switch()
+        request_greenlet.switch()
+        request_profile.stop()
+
+        report = request_profile.report()
+        self.assertIn("(request)", report)
+        self.assertNotIn("(other_request)", report)
+        self.assertEqual(len(profiling._followed), 0)
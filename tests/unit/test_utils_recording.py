@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import unittest
+
+from mock import patch, Mock
+from tornado.httpclient import HTTPError as ClientHTTPError
+
+from brainiak import search_engine, triplestore
+from brainiak.utils import circuit_breaker, recording
+from brainiak.utils.recording import BackendRecorder, RecordingCallback, get_recorder, read_recording
+from tests.mocks import triplestore_config
+
+
+class RecordingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        circuit_breaker.circuit_breakers.clear()
+        recording_file, self.filepath = tempfile.mkstemp(suffix=".jsonl")
+        os.close(recording_file)
+        self.settings_patcher = patch("brainiak.utils.recording.settings.BACKEND_RECORDING_FILEPATH", self.filepath)
+        self.settings_patcher.start()
+
+    def tearDown(self):
+        self.settings_patcher.stop()
+        os.remove(self.filepath)
+        circuit_breaker.circuit_breakers.clear()
+
+    def test_record_appends_json_lines(self):
+        recorder = BackendRecorder(self.filepath)
+        recorder.record(recording.TRIPLESTORE, {"query": u"SELECT ?s {?s a ?o}"}, 200, '{"head": {}}', 10.0, 0.5)
+        recorder.record(recording.ELASTICSEARCH, {"body": u"{}"}, 404, u"Não", 11.0, 0.25)
+        self.assertEqual(read_recording(self.filepath), [
+            {"backend": u"triplestore", "query": u"SELECT ?s {?s a ?o}", "status": 200,
+             "response": u'{"head": {}}', "started": 10.0, "latency": 0.5},
+            {"backend": u"elasticsearch", "body": u"{}", "status": 404,
+             "response": u"Não", "started": 11.0, "latency": 0.25}])
+
+    @patch("brainiak.utils.recording.log")
+    def test_record_logs_io_errors(self, mocked_log):
+        BackendRecorder("/inexistent/directory/recording.jsonl").record(recording.TRIPLESTORE, {}, 200, "", 0, 0)
+        self.assertEqual(mocked_log.logger.error.call_count, 1)
+
+    def test_get_recorder(self):
+        self.assertEqual(get_recorder().filepath, self.filepath)
+        self.assertIs(get_recorder(), get_recorder())
+        with patch("brainiak.utils.recording.settings.BACKEND_RECORDING_FILEPATH", None):
+            self.assertIsNone(get_recorder())
+
+    def test_recording_callback_keeps_chunks(self):
+        callback = Mock(return_value=0, exceeded=None)
+        recording_callback = RecordingCallback(callback)
+        self.assertEqual(recording_callback("a"), 0)
+        recording_callback("b")
+        self.assertEqual(recording_callback.body(), "ab")
+        self.assertIsNone(recording_callback.exceeded)
+
+    @patch("brainiak.triplestore.log")
+    @patch("brainiak.triplestore.greenlet_fetch", return_value=Mock(code=200, body='{"boolean": true}'))
+    def test_query_sparql_is_recorded(self, greenlet_fetch, mocked_log):
+        triplestore.query_sparql(u"ASK {?s a ?o}", triplestore_config)
+        [entry] = read_recording(self.filepath)
+        self.assertEqual(entry["backend"], u"triplestore")
+        self.assertEqual(entry["method"], u"POST")
+        self.assertEqual(entry["url"], triplestore_config["url"])
+        self.assertEqual(entry["query"], u"ASK {?s a ?o}")
+        self.assertEqual(entry["format"], u"application/sparql-results+json")
+        self.assertEqual(entry["status"], 200)
+        self.assertEqual(entry["response"], u'{"boolean": true}')
+
+    @patch("brainiak.triplestore.log")
+    def test_streamed_query_sparql_is_recorded(self, mocked_log):
+        def fake_fetch(request):
+            request.streaming_callback('{"head": ')
+            request.streaming_callback('{}}')
+            return Mock(code=200, body="")
+        consumer = Mock()
+        with patch("brainiak.triplestore.greenlet_fetch", side_effect=fake_fetch):
+            triplestore.query_sparql(u"SELECT * {?s ?p ?o}", triplestore_config, streaming_callback=consumer)
+        self.assertEqual(consumer.call_count, 2)
+        self.assertEqual(read_recording(self.filepath)[0]["response"], u'{"head": {}}')
+
+    @patch("brainiak.triplestore.log")
+    @patch("brainiak.triplestore.greenlet_fetch", side_effect=ClientHTTPError(599, "Timeout"))
+    def test_failed_query_sparql_is_recorded(self, greenlet_fetch, mocked_log):
+        self.assertRaises(ClientHTTPError, triplestore.query_sparql, u"ASK {?s a ?o}", triplestore_config)
+        [entry] = read_recording(self.filepath)
+        self.assertEqual(entry["status"], 599)
+        self.assertEqual(entry["response"], u"")
+
+    @patch("brainiak.search_engine.log")
+    @patch("brainiak.search_engine.greenlet_fetch", return_value=Mock(code=200, body='{"hits": {}}'))
+    def test_elasticsearch_request_is_recorded(self, greenlet_fetch, mocked_log):
+        search_engine._do_request({"url": u"http://es/semantica.*/_search", "method": "POST", "body": u'{"query": {}}'})
+        [entry] = read_recording(self.filepath)
+        self.assertEqual(entry["backend"], u"elasticsearch")
+        self.assertEqual(entry["url"], u"http://es/semantica.*/_search")
+        self.assertEqual(entry["body"], u'{"query": {}}')
+        self.assertEqual(entry["status"], 200)
+        self.assertEqual(entry["response"], u'{"hits": {}}')
+
+    @patch("brainiak.search_engine.log")
+    def test_failed_elasticsearch_request_is_recorded(self, mocked_log):
+        error = ClientHTTPError(404, response=Mock(body='{"found": false}'))
+        with patch("brainiak.search_engine.greenlet_fetch", side_effect=error):
+            self.assertRaises(ClientHTTPError, search_engine._do_request,
+                              {"url": u"http://es/index/type/id", "method": "GET"})
+        [entry] = read_recording(self.filepath)
+        self.assertEqual(entry["status"], 404)
+        self.assertEqual(entry["body"], u"")
+        self.assertEqual(entry["response"], u'{"found": false}')
+
+    @patch("brainiak.triplestore.log")
+    @patch("brainiak.triplestore.greenlet_fetch", return_value=Mock(code=200, body="{}"))
+    def test_nothing_is_recorded_by_default(self, greenlet_fetch, mocked_log):
+        with patch("brainiak.utils.recording.settings.BACKEND_RECORDING_FILEPATH", None):
+            triplestore.query_sparql(u"ASK {?s a ?o}", triplestore_config)
+        self.assertEqual(read_recording(self.filepath), [])
@@ -1,6 +1,9 @@
 import logging
+import threading
 from unittest import TestCase
 import uuid
+
+import greenlet
 from mock import patch
 
 from brainiak.prefixes import MemorizeContext
@@ -1171,3 +1174,167 @@ class RdfTypeValidationTestCase(TestCase):
 
         result = is_rdf_type_invalid(query_params, instance_data)
         self.assertIn("Incompatible values for rdf:type", result)
+
+
+class GetLabelsTestCase(TestCase):
+
+    def test_get_labels_without_uris_does_not_query(self):
+        with patch("brainiak.utils.sparql.query_sparql") as mocked_query:
+            self.assertEqual(get_labels([], triplestore_config), {})
+            self.assertFalse(mocked_query.called)
+
+    @patch("brainiak.utils.sparql.settings", DEFAULT_LANG="pt")
+    def test_get_labels_prefers_default_language(self, mocked_settings):
+        result_dict = {"results": {"bindings": [
+            {"uri": {"type": "uri", "value": "http://on.to/Rio"}, "label": {"type": "literal", "xml:lang": "pt", "value": "Rio"}},
+            {"uri": {"type": "uri", "value": "http://on.to/Rio"}, "label": {"type": "literal", "xml:lang": "en", "value": "River"}},
+            {"uri": {"type": "uri", "value": "http://on.to/Oslo"}, "label": {"type": "literal", "value": "Oslo"}}
+        ]}}
+        with patch("brainiak.utils.sparql.query_sparql", return_value=result_dict) as mocked_query:
+            labels = get_labels(["http://on.to/Rio", "http://on.to/Oslo"], triplestore_config)
+
+        self.assertEqual(labels, {"http://on.to/Rio": "Rio", "http://on.to/Oslo": "Oslo"})
+        self.assertEqual(mocked_query.call_count, 1)
+        query = mocked_query.call_args[0][0]
+        self.assertIn("<http://on.to/Rio>, <http://on.to/Oslo>", query)
+
+
+class SubPropertiesCacheTestCase(TestCase):
+
+    SUBPROPERTIES_RESULT = {"results": {"bindings": [
+        {"property": {"type": "uri", "value": "http://on.to/name"}, "super_property": {"type": "uri", "value": RDFS_LABEL}},
+        {"property": {"type": "uri", "value": "http://on.to/nickname"}, "super_property": {"type": "uri", "value": "http://on.to/name"}},
+        {"property": {"type": "uri", "value": "http://on.to/part"}, "super_property": {"type": "uri", "value": "http://on.to/whole"}}
+    ]}}
+
+    def setUp(self):
+        self.label_properties = list(LABEL_PROPERTIES)
+
+    def tearDown(self):
+        LABEL_PROPERTIES[:] = self.label_properties
+
+    @patch("brainiak.utils.sparql.config_parser.get_triplestore_config", return_value=triplestore_config)
+    def test_closures_are_loaded_once(self, mocked_get_triplestore_config):
+        cache = SubPropertiesCache(ttl=60)
+        with patch("brainiak.utils.sparql.query_sparql", return_value=self.SUBPROPERTIES_RESULT) as mocked_query:
+            self.assertEqual(cache.get(RDFS_LABEL), ["http://on.to/name", "http://on.to/nickname"])
+            self.assertEqual(cache.get("http://on.to/whole"), ["http://on.to/part"])
+            self.assertEqual(cache.get("http://on.to/part"), [])
+        self.assertEqual(mocked_query.call_count, 1)
+        self.assertEqual(LABEL_PROPERTIES, [RDFS_LABEL, "http://on.to/name", "http://on.to/nickname"])
+
+    def join_refresh(self):
+        for thread in threading.enumerate():
+            if thread.name == "subproperties_refresh":
+                thread.join()
+
+    @patch("brainiak.utils.sparql.config_parser.get_triplestore_config", return_value=triplestore_config)
+    def test_closures_are_reloaded_in_background_after_ttl_or_expire(self, mocked_get_triplestore_config):
+        cache = SubPropertiesCache(ttl=60)
+        with patch("brainiak.utils.sparql.query_sparql", return_value=self.SUBPROPERTIES_RESULT) as mocked_query:
+            with patch("brainiak.utils.sparql.time.time", return_value=100):
+                cache.get(RDFS_LABEL)
+                self.assertEqual(mocked_query.call_args[1], {"async": False})
+            with patch("brainiak.utils.sparql.time.time", return_value=161):
+                cache.get(RDFS_LABEL)
+                self.join_refresh()
+            self.assertEqual(mocked_query.call_count, 2)
+            cache.expire()
+            cache.get(RDFS_LABEL)
+            self.join_refresh()
+            self.assertEqual(mocked_query.call_count, 3)
+
+    @patch("brainiak.utils.sparql.config_parser.get_triplestore_config", return_value=triplestore_config)
+    def test_stale_closures_are_served_while_reloading(self, mocked_get_triplestore_config):
+        cache = SubPropertiesCache(ttl=60)
+        with patch("brainiak.utils.sparql.query_sparql", return_value=self.SUBPROPERTIES_RESULT):
+            cache.get(RDFS_LABEL)
+        cache.expire()
+        reloading = threading.Event()
+        reloaded = threading.Event()
+
+        def slow_query(*args, **kw):
+            reloading.set()
+            reloaded.wait()
+            return {"results": {"bindings": []}}
+
+        with patch("brainiak.utils.sparql.query_sparql", side_effect=slow_query) as mocked_query:
+            self.assertEqual(cache.get(RDFS_LABEL), ["http://on.to/name", "http://on.to/nickname"])
+            reloading.wait()
+            self.assertEqual(cache.get(RDFS_LABEL), ["http://on.to/name", "http://on.to/nickname"])
+            reloaded.set()
+            self.join_refresh()
+        self.assertEqual(mocked_query.call_count, 1)
+        self.assertEqual(cache.get(RDFS_LABEL), [])
+
+    @patch("brainiak.utils.sparql.config_parser.get_triplestore_config", return_value=triplestore_config)
+    def test_first_load_in_request_greenlet_is_asynchronous(self, mocked_get_triplestore_config):
+        cache = SubPropertiesCache(ttl=60)
+        with patch("brainiak.utils.sparql.query_sparql", return_value=self.SUBPROPERTIES_RESULT) as mocked_query:
+            greenlet.greenlet(lambda: cache.get(RDFS_LABEL)).switch()
+        self.assertEqual(mocked_query.call_args[1], {"async": True})
+
+    @patch("brainiak.utils.sparql.logger")
+    @patch("brainiak.utils.sparql.config_parser.get_triplestore_config", return_value=triplestore_config)
+    def test_stale_closures_are_kept_if_reload_fails(self, mocked_get_triplestore_config, mocked_logger):
+        cache = SubPropertiesCache(ttl=60)
+        with patch("brainiak.utils.sparql.query_sparql", return_value=self.SUBPROPERTIES_RESULT):
+            cache.get(RDFS_LABEL)
+        cache.expire()
+        with patch("brainiak.utils.sparql.query_sparql", side_effect=Exception("Virtuoso is down")):
+            self.assertEqual(cache.get(RDFS_LABEL), ["http://on.to/name", "http://on.to/nickname"])
+            self.join_refresh()
+        self.assertEqual(cache.get(RDFS_LABEL), ["http://on.to/name", "http://on.to/nickname"])
+        self.assertTrue(mocked_logger.error.called)
+
+    @patch("brainiak.utils.sparql.subproperties_cache")
+    def test_on_ontology_change_expires_closures(self, mocked_cache):
+        on_ontology_change({"instance": "http://on.to/john", "klass": "http://on.to/Person", "graph": "http://on.to/"})
+        self.assertFalse(mocked_cache.expire.called)
+        on_ontology_change({"instance": "http://on.to/name", "klass": "http://www.w3.org/2002/07/owl#DatatypeProperty"})
+        self.assertTrue(mocked_cache.expire.called)
+
+
+class SparqlResultSetHelpersTestCase(TestCase):
+
+    maxDiff = None
+
+    RESULT_DICT = {
+        "head": {"vars": ["predicate", "object", "super_property"]},
+        "results": {"bindings": [
+            {"predicate": {"type": "uri", "value": "http://xmlns.com/foaf/0.1/name"},
+             "object": {"type": "literal", "value": "John", "xml:lang": "en"},
+             "super_property": {"type": "uri", "value": "http://www.w3.org/2000/01/rdf-schema#label"}},
+            {"predicate": {"type": "uri", "value": "http://xmlns.com/foaf/0.1/knows"},
+             "object": {"type": "uri", "value": "http://xmlns.com/foaf/0.1/Person"}},
+            {"predicate": {"type": "uri", "value": "http://xmlns.com/foaf/0.1/age"},
+             "object": {"type": "typed-literal", "value": "42", "datatype": "http://www.w3.org/2001/XMLSchema#int"}}
+        ]}
+    }
+
+    def setUp(self):
+        self.result_set = SparqlResultSet.from_result_dict(self.RESULT_DICT)
+
+    def test_result_set_keeps_bindings(self):
+        self.assertEqual(list(self.result_set), self.RESULT_DICT["results"]["bindings"])
+        self.assertEqual(self.result_set["results"]["bindings"], self.RESULT_DICT["results"]["bindings"])
+
+    def test_helpers_give_the_same_results(self):
+        for function, args in [(filter_values, ("object",)),
+                               (get_one_value, ("super_property",)),
+                               (get_one_value, ("inexistent",)),
+                               (is_result_empty, ())]:
+            self.assertEqual(function(self.result_set, *args), function(self.RESULT_DICT, *args))
+        self.assertEqual(bindings_to_dict("predicate", self.result_set), bindings_to_dict("predicate", self.RESULT_DICT))
+        self.assertEqual(get_super_properties(self.result_set), get_super_properties(self.RESULT_DICT["results"]["bindings"]))
+
+    def test_compress_keys_and_values_gives_the_same_results(self):
+        for kwargs in [{}, {"keymap": {"predicate": "@id"}, "ignore_keys": ["super_property"]}, {"do_expand_uri": True}]:
+            kwargs["context"] = MemorizeContext()
+            expected = compress_keys_and_values(self.RESULT_DICT, **kwargs)
+            kwargs["context"] = MemorizeContext()
+            self.assertEqual(compress_keys_and_values(self.result_set, **kwargs), expected)
+
+    def test_empty_result_set(self):
+        self.assertTrue(is_result_empty(SparqlResultSet(["s"])))
+        self.assertEqual(filter_values(SparqlResultSet(["s"]), "s"), [])
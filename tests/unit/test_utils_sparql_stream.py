@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+import unittest
+
+from brainiak.utils.sparql_stream import BindingsParser, CSVBindingsParser, ResultLimitExceeded, TabularBindingsParser, \
+    TSVBindingsParser, parse_csv_term, parse_result, parse_tsv_term
+
+
+RESULT = {
+    "head": {"link": [], "vars": ["s", "label"]},
+    "results": {
+        "distinct": False,
+        "ordered": True,
+        "bindings": [
+            {"s": {"type": "uri", "value": "http://test/1"}, "label": {"type": "literal", "xml:lang": "pt", "value": u"São Paulo"}},
+            {"s": {"type": "uri", "value": "http://test/2"}, "label": {"type": "literal", "value": u"Quote \" and braces {}[] and \\ backslash"}},
+            {"s": {"type": "uri", "value": "http://test/3"}}
+        ]
+    }
+}
+
+
+class BindingsParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.body = json.dumps(RESULT, ensure_ascii=False).encode("utf-8")
+
+    def test_whole_body(self):
+        parser = BindingsParser()
+        self.assertEqual(parser.feed(self.body), RESULT["results"]["bindings"])
+        self.assertTrue(parser.finished)
+        self.assertEqual(parser.bytes_read, len(self.body))
+        self.assertEqual(parser.vars, ["s", "label"])
+
+    def test_chunks_split_anywhere(self):
+        # every split point, including inside strings, escapes and multi-byte characters
+        for split in range(1, len(self.body)):
+            parser = BindingsParser()
+            items = parser.feed(self.body[:split]) + parser.feed(self.body[split:])
+            self.assertEqual(items, RESULT["results"]["bindings"], split)
+            self.assertTrue(parser.finished)
+            self.assertEqual(parser.vars, ["s", "label"], split)
+
+    def test_byte_by_byte(self):
+        parser = BindingsParser()
+        items = []
+        for index in range(len(self.body)):
+            items.extend(parser.feed(self.body[index]))
+        self.assertEqual(items, RESULT["results"]["bindings"])
+
+    def test_buffer_does_not_keep_parsed_bindings(self):
+        parser = BindingsParser()
+        parser.feed(self.body[:self.body.index('"http://test/3"')])
+        self.assertTrue(parser._buffer.startswith(u'{"s"'))
+
+    def test_not_a_result(self):
+        parser = BindingsParser()
+        self.assertEqual(parser.feed("Virtuoso 37000 Error SP030: SPARQL compiler"), [])
+        self.assertFalse(parser.bindings_found)
+        self.assertFalse(parser.finished)
+
+    def test_empty_bindings(self):
+        parser = BindingsParser()
+        self.assertEqual(parser.feed('{"head": {"vars": ["bindings"]}, "results": {"bindings": []}}'), [])
+        self.assertTrue(parser.finished)
+
+    def test_literals_which_look_like_the_end_of_bindings(self):
+        bindings = [{"s": {"type": "literal", "value": u'%d"}}, {"s": "}}]' % index}} for index in range(20)]
+        body = json.dumps({"head": {"vars": ["s"]}, "results": {"bindings": bindings}})
+        for split in range(1, len(body), 7):
+            parser = BindingsParser()
+            self.assertEqual(parser.feed(body[:split]) + parser.feed(body[split:]), bindings, split)
+            self.assertTrue(parser.finished)
+
+    def test_escape_before_a_buffer_cut(self):
+        chunks = ['{', '"head":{"vars":["s"]},"results":{"bindings":[{',
+                  '"s":{"type":"literal","value":"\\\\"}},{', '"s":{"type":"literal","value":""}}]}}']
+        parser = BindingsParser()
+        items = []
+        for chunk in chunks:
+            items.extend(parser.feed(chunk))
+        self.assertEqual(items, [{"s": {"type": "literal", "value": u"\\"}}, {"s": {"type": "literal", "value": u""}}])
+        self.assertTrue(parser.finished)
+
+    def test_escapes_in_random_chunks(self):
+        values = [u"\\", u'\"', u"a\\", u'"}}, {', u"\\\\", u"", u'\\"}}]', u"{", u"ç\\"]
+        generator = random.Random(44)
+        for attempt in range(200):
+            bindings = [{"s": {"type": "literal", "value": generator.choice(values) + generator.choice(values)}}
+                        for index in range(generator.randint(0, 8))]
+            body = json.dumps({"head": {"vars": ["s"]}, "results": {"bindings": bindings}}, ensure_ascii=False).encode("utf-8")
+            splits = sorted(generator.sample(range(1, len(body)), min(len(body) - 1, generator.randint(1, 6))))
+            parser = BindingsParser()
+            items = []
+            for start, end in zip([0] + splits, splits + [len(body)]):
+                items.extend(parser.feed(body[start:end]))
+            self.assertEqual(items, bindings, (body, splits))
+            self.assertTrue(parser.finished, (body, splits))
+
+    def test_many_bindings_per_chunk(self):
+        bindings = RESULT["results"]["bindings"] * 100
+        body = json.dumps({"head": {"vars": ["s", "label"]}, "results": {"bindings": bindings}})
+        parser = BindingsParser()
+        items = []
+        for index in range(0, len(body), 1000):
+            items.extend(parser.feed(body[index:index + 1000]))
+        self.assertEqual(items, bindings)
+        self.assertEqual(parser.rows_read, 300)
+
+    def test_max_rows(self):
+        parser = BindingsParser(max_rows=len(RESULT["results"]["bindings"]))
+        self.assertEqual(parser.feed(self.body), RESULT["results"]["bindings"])
+        parser = BindingsParser(max_rows=2)
+        self.assertRaises(ResultLimitExceeded, parser.feed, self.body)
+        self.assertEqual(parser.rows_read, 3)
+
+    def test_max_bytes(self):
+        parser = BindingsParser(max_bytes=20)
+        parser.feed(self.body[:20])
+        self.assertRaises(ResultLimitExceeded, parser.feed, self.body[20:])
+
+
+# RESULT, as SPARQL 1.1 TSV and CSV results
+TSV = u'?s\t?label\n<http://test/1>\t"São Paulo"@pt\n<http://test/2>\t"Quote \\" and braces {}[] and \\\\ backslash"\n<http://test/3>\t\n'.encode("utf-8")
+CSV = u's,label\r\nhttp://test/1,São Paulo\r\nhttp://test/2,"Quote "" and braces {}[] and \\ backslash"\r\nhttp://test/3,\r\n'.encode("utf-8")
+
+
+class TabularBindingsParserTestCase(unittest.TestCase):
+
+    maxDiff = None
+
+    def test_tsv_keeps_bindings(self):
+        self.assertEqual(parse_result(TSV, "tsv"), {"head": {"vars": ["s", "label"]}, "results": {"bindings": RESULT["results"]["bindings"]}})
+
+    def test_tsv_chunks_split_anywhere(self):
+        for split in range(1, len(TSV)):
+            parser = TSVBindingsParser()
+            items = parser.feed(TSV[:split]) + parser.feed(TSV[split:]) + parser.close()
+            self.assertEqual(items, RESULT["results"]["bindings"], split)
+            self.assertTrue(parser.finished)
+            self.assertEqual(parser.vars, ["s", "label"], split)
+
+    def test_tsv_without_final_newline(self):
+        parser = TSVBindingsParser()
+        self.assertEqual(len(parser.feed(TSV.rstrip("\n"))), 2)
+        self.assertEqual(parser.close(), [RESULT["results"]["bindings"][2]])
+
+    def test_tsv_terms(self):
+        self.assertEqual(parse_tsv_term(u""), None)
+        self.assertEqual(parse_tsv_term(u"_:b0"), {"type": "bnode", "value": u"b0"})
+        self.assertEqual(parse_tsv_term(u'"1"^^<http://www.w3.org/2001/XMLSchema#int>'),
+                         {"type": "typed-literal", "value": u"1", "datatype": u"http://www.w3.org/2001/XMLSchema#int"})
+        self.assertEqual(parse_tsv_term(u"-1.5")["datatype"], u"http://www.w3.org/2001/XMLSchema#decimal")
+        self.assertEqual(parse_tsv_term(u"1E3")["datatype"], u"http://www.w3.org/2001/XMLSchema#double")
+        self.assertEqual(parse_tsv_term(u"true")["datatype"], u"http://www.w3.org/2001/XMLSchema#boolean")
+        self.assertEqual(parse_tsv_term(u'"a\\tb\\n\\u00e9"')["value"], u"a\tb\n\xe9")
+
+    def test_repeated_terms_are_shared(self):
+        parser = TSVBindingsParser()
+        first, second = parser.feed("?s\n<http://a>\n<http://a>\n")
+        self.assertIs(first["s"], second["s"])
+
+    def test_csv_keeps_values(self):
+        expected = [{"s": {"type": "uri", "value": u"http://test/1"}, "label": {"type": "literal", "value": u"São Paulo"}},
+                    {"s": {"type": "uri", "value": u"http://test/2"}, "label": {"type": "literal", "value": u"Quote \" and braces {}[] and \\ backslash"}},
+                    {"s": {"type": "uri", "value": u"http://test/3"}}]
+        self.assertEqual(parse_result(CSV, "csv")["results"]["bindings"], expected)
+
+    def test_csv_chunks_split_anywhere(self):
+        body = 's,text\r\nhttp://a,"multi\r\nline, ""quoted"""\r\nhttp://b,plain'
+        expected = parse_result(body, "csv")["results"]["bindings"]
+        self.assertEqual(expected[0]["text"]["value"], u'multi\r\nline, "quoted"')
+        for split in range(1, len(body)):
+            parser = CSVBindingsParser()
+            self.assertEqual(parser.feed(body[:split]) + parser.feed(body[split:]) + parser.close(), expected, split)
+
+    def test_csv_terms(self):
+        self.assertEqual(parse_csv_term(u"urn:isbn:123")["type"], "uri")
+        self.assertEqual(parse_csv_term(u"_:b1"), {"type": "bnode", "value": u"b1"})
+        self.assertEqual(parse_csv_term(u"two words: no")["type"], "literal")
+
+    def test_format_is_given_by_functions(self):
+        parser = TabularBindingsParser(lambda text: (text.split(u";")[:-1], text.split(u";")[-1]),
+                                       lambda record: record.split(u"|"), parse_csv_term)
+        self.assertEqual(parser.feed("s|o;http://a|A;http://b"), [{"s": {"type": "uri", "value": u"http://a"},
+                                                                  "o": {"type": "literal", "value": u"A"}}])
+        self.assertEqual(parser.close(), [{"s": {"type": "uri", "value": u"http://b"}}])
+
+    def test_limits(self):
+        self.assertRaises(ResultLimitExceeded, TSVBindingsParser(max_rows=2).feed, TSV)
+        self.assertRaises(ResultLimitExceeded, CSVBindingsParser(max_bytes=10).feed, CSV)